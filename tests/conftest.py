@@ -0,0 +1,157 @@
+import os
+import random
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+# الوحدة في جذر المستودع، ومجلد tests نفسه لـ "from conftest import ..." مع أي --import-mode
+sys.path[:0] = [os.path.dirname(TESTS_DIR), TESTS_DIR]
+
+import timeTableCode as T  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def close_pool():
+    yield
+    T.ConnectionPool().close_all()
+
+
+def build_catalog(path, backend_class=T.SqliteBackend, scheduled=True, **sizes):
+    """كتالوج SQLite وهمي صغير بعد كل الـ migrations؛ يضبط المجمع عليه"""
+    sizes = {'departments': 3, 'lecturers': 40, 'courses': 60, 'locations': 12, **sizes}
+    backend = backend_class(str(path))
+    conn = backend.connect()
+    backend.prepare(conn, target_version=0)
+    T.build_synthetic_catalog(conn, scheduled=scheduled, **sizes)
+    applied = T.SchemaMigrator(backend).migrate(conn)
+    conn.close()
+    T.ConnectionPool().configure(backend)
+    return backend, applied
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    """(backend, Database) على كتالوج بمواعيد"""
+    backend, _ = build_catalog(tmp_path / 'catalog.db')
+    return backend, T.Database()
+
+
+# ========== جداول وهمية في الذاكرة: معرفات كاملة --> بلا ReferenceCache ولا قاعدة بيانات ==========
+
+TEST_DAYS = ["السبت", "الأحد", "الإثنين", "الثلاثاء", "الأربعاء"]
+TEST_HOURS = list(range(8, 20))
+
+
+def random_schedule(seed, departments=3, levels=2, courses=12, lecturers=8, rooms=6, groups=90):
+    """(schedule_data بصيغة SchedulePlacerPage.build_schedule_data، [(Location_ID, name, capacity)])
+
+    بلا أي فحص --> فيه تعارضات مكان ومحاضر وطلاب عمداً. المادة لها محاضر واحد، فتتكرر المحاضرة
+    المشتركة (نفس المادة والمحاضر) في نفس المكان. المحاضرة المشتركة صف لكل قسم بنفس Group_ID.
+    """
+    rng = random.Random(seed)
+    places = [(i, f"قاعة {i}", rng.choice([None, 25, 40, 60, 120])) for i in range(1, rooms + 1)]
+    schedule_data, schedule_id = {}, 0
+    for group_id in range(1, groups + 1):
+        course_id = rng.randint(1, courses)
+        lecturer_id = course_id % lecturers + 1
+        level_id = rng.randint(1, levels)
+        lecture = rng.random() < 0.4
+        dept_ids = rng.sample(range(1, departments + 1), rng.randint(1, departments) if lecture else 1)
+        names = [f"قسم {dept_id}" for dept_id in dept_ids]
+        day = rng.choice(TEST_DAYS)
+        start = rng.choice(TEST_HOURS[:-3])
+        end = start + rng.randint(1, 3)
+        location_id, place, _ = rng.choice(places)
+        group_number = None if lecture else rng.randint(1, 3)
+        for dept_id, name in zip(dept_ids, names):
+            schedule_id += 1
+            year = f"المستوى {level_id}"
+            info = schedule_data.setdefault(f"{name}_{year}", {'dept': name, 'year': year, 'schedule': {}})
+            info['schedule'].setdefault(day, []).append({
+                'start': start, 'end': end, 'place': place, 'schedule_id': schedule_id,
+                'group': {
+                    'subject': f"مادة {course_id}", 'instructor': f"محاضر {lecturer_id}",
+                    'Group_Type': 'lecture' if lecture else 'practical', 'group_number': group_number,
+                    'group_id': group_id, 'departments': names, 'year_level': year, 'dept_id': dept_id,
+                    'course_id': course_id, 'level_id': level_id, 'lecturer_id': lecturer_id,
+                    'location_id': location_id, 'is_shared': len(names) > 1,
+                },
+            })
+    return schedule_data, places
+
+
+def all_appointments(schedule_data):
+    """[(مفتاح الجدول، اليوم، الموعد)] لكل صفوف schedule_data"""
+    return [(key, day, appt) for key, info in schedule_data.items()
+            for day, appointments in info['schedule'].items() for appt in appointments]
+
+
+def random_problem(seed, rooms=6, lecturers=10, departments=3, levels=2, sessions=60, fixed=40):
+    """(rooms, fixed, sessions) لـ TimetableSolver بصيغة Database.get_solver_problem/build_solver_sessions
+
+    fixed صفوف عشوائية (صف لكل قسم) قد تتعارض فيما بينها؛ الفحص يخص الحجوزات الجديدة فقط
+    """
+    rng = random.Random(seed)
+    places = [(i, f"قاعة {i}", rng.choice([None, 30, 60, 120])) for i in range(1, rooms + 1)]
+    fixed_rows = []
+    for _ in range(fixed):
+        start = rng.choice(T.DAY_HOURS[:-2])
+        lecture = rng.random() < 0.3
+        fixed_rows.append((rng.choice(T.WEEK_DAYS), start, start + rng.randint(1, 2), rng.randint(1, rooms),
+                           rng.randint(1, lecturers), rng.randint(1, levels), rng.randint(1, departments),
+                           'lecture' if lecture else 'practical', None if lecture else rng.randint(1, 3)))
+    problem = []
+    for group_id in range(1, sessions + 1):
+        lecture = rng.random() < 0.4
+        dept_ids = rng.sample(range(1, departments + 1), rng.randint(1, departments) if lecture else 1)
+        problem.append({
+            'group_id': group_id, 'label': f"مجموعة {group_id}",
+            'Group_Type': 'lecture' if lecture else 'practical',
+            'group_number': None if lecture else rng.randint(1, 3),
+            'course_id': group_id, 'lecturer_id': rng.randint(1, lecturers), 'level_id': rng.randint(1, levels),
+            'dept_ids': dept_ids, 'duration': rng.randint(1, 3), 'size': 60 * len(dept_ids) if lecture else 25,
+        })
+    return places, fixed_rows, problem
+
+
+def booking(day, start, end, location_id, lecturer_id, cohorts, group_type, group_number, new=True):
+    return {'day': day, 'start': start, 'end': end, 'location_id': location_id, 'lecturer_id': lecturer_id,
+            'cohorts': set(cohorts), 'Group_Type': group_type, 'group_number': group_number, 'new': new}
+
+
+def session_booking(session, day, start, end, location_id):
+    return booking(day, start, end, location_id, session['lecturer_id'],
+                   [(dept_id, session['level_id']) for dept_id in session['dept_ids']],
+                   session['Group_Type'], session['group_number'])
+
+
+def bookings(fixed, placements):
+    """كل الحجوزات الثابتة والجديدة بصيغة واحدة؛ صفوف المحاضرة المشتركة الثابتة حجز واحد"""
+    result = {}
+    for day, start, end, location_id, lecturer_id, level_id, dept_id, group_type, group_number in fixed:
+        key = (day, start, end, location_id, lecturer_id) if group_type == 'lecture' else object()
+        if key not in result:
+            result[key] = booking(day, start, end, location_id, lecturer_id, (), group_type, group_number, new=False)
+        result[key]['cohorts'].add((dept_id, level_id))
+    return list(result.values()) + [session_booking(session, day, start, end, location_id)
+                                    for session, day, start, end, location_id in placements]
+
+
+def clash(a, b):
+    """نوع التعارض بين حجزين ('room' / 'lecturer' / 'cohort') أو None"""
+    if a['day'] != b['day'] or not (a['start'] < b['end'] and b['start'] < a['end']):
+        return None
+    if a['location_id'] == b['location_id']:
+        return 'room'
+    if a['lecturer_id'] == b['lecturer_id']:
+        return 'lecturer'
+    if a['cohorts'] & b['cohorts'] and T.cohorts_clash(a, b):
+        return 'cohort'
+    return None
+
+
+def new_clashes(all_bookings):
+    """التعارضات التي يدخل فيها حجز جديد واحد على الأقل"""
+    return [(kind, a, b) for i, a in enumerate(all_bookings) for b in all_bookings[i + 1:]
+            if (a['new'] or b['new']) and (kind := clash(a, b))]
@@ -0,0 +1,73 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import timeTableCode as T
+from conftest import build_catalog
+
+
+@pytest.fixture
+def pool(tmp_path, monkeypatch):
+    """مجمع من اتصالين بانتظار قصير على كتالوج بلا مواعيد"""
+    build_catalog(tmp_path / 'pool.db', scheduled=False)
+    pool = T.ConnectionPool()
+    monkeypatch.setattr(pool, 'max_size', 2)
+    monkeypatch.setattr(pool, 'acquire_timeout', 0.2)
+    monkeypatch.setattr(pool, 'stats', dict.fromkeys(pool.stats, 0))
+    return pool
+
+
+def test_exhausted_pool_times_out_then_reuses_released_connections(pool):
+    first, second = pool.acquire(), pool.acquire()
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        pool.acquire()
+    assert time.monotonic() - started >= 0.2
+    assert pool.stats['waits'] == 1 and pool.stats['created'] == 2
+
+    raw = first._raw
+    first.close()
+    first.close()  # الإغلاق الثاني لا يعيد الاتصال مرتين
+    again = pool.acquire()
+    assert again._raw is raw and pool.stats['created'] == 2
+    again.close()
+    second.close()
+
+
+def test_waiting_acquire_wakes_when_a_connection_is_released(pool):
+    pool.acquire_timeout = 5  # الـ fixture يعيد القيمة الأصلية
+    held = [pool.acquire(), pool.acquire()]
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+    waiter.start()
+    time.sleep(0.05)
+    assert not got
+    held.pop().close()
+    waiter.join(2)
+    assert got and pool.stats['waits'] == 1
+    got[0].close()
+    held[0].close()
+
+
+def test_reconfigure_discards_connections_of_the_old_database(pool, tmp_path):
+    idle, busy = pool.acquire(), pool.acquire()
+    old_raw = busy._raw
+    idle.close()
+
+    # الاتصال الخامل يُغلق فوراً، والمشغول عند رجوعه
+    build_catalog(tmp_path / 'other.db', scheduled=False, locations=4)
+    assert pool.stats['reconnects'] == 1 and pool.stats['discarded'] == 1
+    busy.execute("SELECT 1")
+    busy.close()
+    assert pool.stats['discarded'] == 2
+    with pytest.raises(sqlite3.ProgrammingError):
+        old_raw.execute("SELECT 1")
+
+    conn = pool.acquire()
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM Location").fetchone()[0] == 4
+    finally:
+        conn.close()
+    assert pool.stats['created'] == 3
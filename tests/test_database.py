@@ -0,0 +1,198 @@
+import sqlite3
+
+import pytest
+
+import timeTableCode as T
+from conftest import build_catalog
+
+
+def count(db, query, params=()):
+    return db.fetchone(query, params)[0]
+
+
+def add_course(db, name, level_id=1):
+    """مادة جديدة بلا مجموعات عبر save_record --> Course_ID"""
+    course_id = count(db, "SELECT MAX(Course_ID) FROM Courses") + 1
+    db.save_record('Courses', 'Course_ID', ['Course_ID', 'Course_name', 'code', 'Lecture_hours', 'Levels_ID'],
+                   [course_id, name, f"NEW{course_id}", 2, level_id], 'add')
+    return course_id
+
+
+def add_lecture(db, course_id, department_ids, lecturer_id=5, level_id=1):
+    """مجموعة نظرية للمادة مربوطة بالأقسام --> Group_ID"""
+    db.add_course_groups((department_ids[0], level_id, course_id, lecturer_id, 2, 2), course_id, department_ids, [])
+    return count(db, "SELECT Group_ID FROM Groups WHERE Course_ID = ? AND Group_Type = 'lecture'", (course_id,))
+
+
+@pytest.fixture
+def new_course(catalog):
+    """مادة جديدة بلا مجموعات في المستوى 1"""
+    _, db = catalog
+    return db, add_course(db, "مادة جديدة")
+
+
+def test_add_course_groups_links_departments_in_one_transaction(new_course):
+    db, course_id = new_course
+    lecture = (1, 1, course_id, 5, 2, 2)
+    practicals = [(1, 1, course_id, 6, 2, 1), (2, 1, course_id, 7, 2, 1), (2, 1, course_id, 8, 2, 2)]
+    db.add_course_groups(lecture, course_id, [1, 2], practicals)
+
+    assert db.get_lecture_departments(1, course_id, [1, 2, 3]) == ["قسم 1"]
+    assert db.get_lecture_departments(2, course_id, [1, 2, 3]) == []
+    assert {row[0] for row in db.fetchall("SELECT Department_ID FROM Course_Department WHERE Course_ID = ?",
+                                          (course_id,))} == {1, 2}
+    assert [db.count_practical_groups(course_id, d) for d in (1, 2, 3)] == [1, 2, 0]
+
+    # صف عملي ناقص --> لا يبقى شيء من المعاملة
+    other = course_id + 1
+    db.save_record('Courses', 'Course_ID', ['Course_ID', 'Course_name', 'Levels_ID'], [other, "مادة أخرى", 1], 'add')
+    with pytest.raises(Exception):
+        db.add_course_groups((3, 1, other, 5, 2, 2), other, [3], [(3, 1, other, 6, 2)])
+    assert count(db, "SELECT COUNT(*) FROM Groups WHERE Course_ID = ?", (other,)) == 0
+    assert count(db, "SELECT COUNT(*) FROM Course_Department WHERE Course_ID = ?", (other,)) == 0
+
+
+def test_group_schedules_and_delete_course_groups(new_course):
+    db, course_id = new_course
+    db.add_course_groups((1, 1, course_id, 5, 2, 2), course_id, [1, 2], [(1, 1, course_id, 6, 2, 1)])
+    lecture_id, practical_id = [row[0] for row in db.fetchall(
+        "SELECT Group_ID FROM Groups WHERE Course_ID = ? ORDER BY Group_ID", (course_id,))]
+    assert db.get_group_schedules(course_id, 1, 5, 'lecture') == []
+
+    db.place_schedule(lecture_id, 1, 1, "الجمعة", 8, 10)
+    db.place_schedule(practical_id, 1, 1, "الجمعة", 10, 12)
+    level = T.ReferenceCache().name_of('Levels', 1)
+    assert [tuple(row) for row in db.get_group_schedules(course_id, 1, 5, 'lecture')] == [("قسم 1", level)]
+    assert [tuple(row) for row in db.get_group_schedules(course_id, 1, 6, 'practical', 1)] == [("قسم 1", level)]
+    assert db.get_group_schedules(course_id, 1, 6, 'practical', 2) == []
+
+    db.delete_course_groups(course_id, 1)
+    assert count(db, "SELECT COUNT(*) FROM Groups WHERE Course_ID = ?", (course_id,)) == 0
+    assert count(db, "SELECT COUNT(*) FROM Schedule WHERE Group_ID IN (?, ?)", (lecture_id, practical_id)) == 0
+    assert count(db, "SELECT COUNT(*) FROM Course_Department WHERE Course_ID = ?", (course_id,)) == 0
+
+
+def test_save_record_and_add_department(catalog):
+    _, db = catalog
+    db.save_record('Location', 'Location_ID', ['Location_ID', 'Location_name', 'capacity'], [500, "معمل", 30], 'add')
+    db.save_record('Location', 'Location_ID', ['Location_name', 'capacity'], ["معمل كبير", 45], 'update', 500)
+    assert tuple(db.fetchone("SELECT Location_name, capacity FROM Location WHERE Location_ID = 500")) == ("معمل كبير", 45)
+    db.save_record('Location', 'Location_ID', [], [], 'delete', 500)
+    assert db.fetchone("SELECT 1 FROM Location WHERE Location_ID = 500") is None
+
+    assert db.add_department(50, "قسم جديد")
+    assert not db.add_department(50, "قسم مكرر")
+    assert db.fetchall("SELECT Department_name FROM Department WHERE Department_ID = 50")[0][0] == "قسم جديد"
+
+
+class FailingBackend(T.SqliteBackend):
+    """يفشل إدراج صف القسم 2 --> بعد إدراج صف القسم 1 في نفس المعاملة"""
+
+    def insert_schedule(self, cursor, values):
+        if values[0] == 2:
+            raise sqlite3.OperationalError("disk I/O error")
+        return super().insert_schedule(cursor, values)
+
+
+@pytest.fixture
+def shared_lecture(new_course):
+    """محاضرة مشتركة (قسم 1 وقسم 2، المحاضر 5) في قاعة 1 يوم الجمعة 8-10؛ الجمعة خالية في الكتالوج"""
+    db, course_id = new_course
+    lecture_id = add_lecture(db, course_id, [1, 2])
+    conflicts, inserted = db.place_schedule(lecture_id, 1, 1, "الجمعة", 8, 10, shared=True)
+    assert conflicts == [] and [row[1:] for row in inserted] == [(1, "قسم 1"), (2, "قسم 2")]
+    return db, lecture_id
+
+
+def test_room_conflict_with_a_shared_lecture_is_reported_once(shared_lecture):
+    db, _ = shared_lecture
+    # محاضرة مادة أخرى بمحاضر ومستوى وقسم مختلفين --> تعارض المكان فقط
+    other_id = add_lecture(db, add_course(db, "مادة أخرى", 2), [3], lecturer_id=6, level_id=2)
+    before = count(db, "SELECT COUNT(*) FROM Schedule")
+
+    conflicts, inserted = db.place_schedule(other_id, 3, 1, "الجمعة", 9, 11)
+    assert inserted == []
+    assert [(row[0], row[3], row[4], row[5], row[6], row[7], row[8]) for row in conflicts] == [
+        ('room', "قسم 1، قسم 2", "مادة جديدة", "قاعة 1", "الجمعة", 8, 10)]
+    assert count(db, "SELECT COUNT(*) FROM Schedule") == before
+
+    # نفس المكان بعد انتهاء المحاضرة --> يُحجز
+    conflicts, inserted = db.place_schedule(other_id, 3, 1, "الجمعة", 10, 12)
+    assert conflicts == [] and len(inserted) == 1
+
+
+def test_same_lecture_shares_the_room_but_not_the_lecturer(shared_lecture):
+    db, lecture_id = shared_lecture
+    # نفس المادة والمحاضر في نفس القاعة مستثناة من تعارض المكان، لكن المحاضر ما زال مشغولاً
+    conflicts, inserted = db.place_schedule(lecture_id, 3, 1, "الجمعة", 8, 10)
+    assert inserted == []
+    assert [(row[0], row[3]) for row in conflicts] == [('lecturer', "قسم 1، قسم 2")]
+
+
+def test_failed_insert_leaves_no_partial_rows(tmp_path):
+    build_catalog(tmp_path / 'failing.db', FailingBackend)
+    db = T.Database()
+    lecture_id = add_lecture(db, add_course(db, "مادة جديدة"), [1, 2])
+
+    with pytest.raises(sqlite3.OperationalError):
+        db.place_schedule(lecture_id, 1, 1, "الجمعة", 8, 10, shared=True)
+    assert count(db, "SELECT COUNT(*) FROM Schedule WHERE Group_ID = ?", (lecture_id,)) == 0
+    # الاتصال رجع للمجمع بلا معاملة معلقة
+    conflicts, inserted = db.place_schedule(lecture_id, 1, 1, "الجمعة", 8, 10)
+    assert conflicts == [] and len(inserted) == 1
+
+
+def test_schedule_changes_after_a_mark(new_course, monkeypatch):
+    db, course_id = new_course
+    mark = db.current_change_mark()
+    assert db.get_schedule_changes(mark) == (set(), [], {}, mark)
+
+    lecture_id = add_lecture(db, course_id, [1, 2])
+    _, inserted = db.place_schedule(lecture_id, 1, 1, "الجمعة", 8, 10, shared=True)
+    placed = {row[0] for row in inserted}
+    changed, rows, shared, placed_mark = db.get_schedule_changes(mark)
+    assert changed == placed and {row[16] for row in rows} == placed and placed_mark > mark
+    assert shared == {course_id: ["قسم 1", "قسم 2"]}
+    assert db.get_schedule_changes(placed_mark) == (set(), [], {}, placed_mark)
+
+    # المحذوف يبقى في changed_ids بلا صفوف --> يُزال من العرض
+    assert db.delete_schedule(lecture_id, "الجمعة", 8, 10) == 2
+    changed, rows, shared, deleted_mark = db.get_schedule_changes(placed_mark)
+    assert changed == placed and rows == [] and shared == {} and deleted_mark > placed_mark
+    assert db.get_schedule_changes(mark)[:2] == (placed, [])
+
+    # تغييرات كثيرة، أو علامة بعد آخر تغيير (سجل أُعيد إنشاؤه) --> تحميل كامل
+    monkeypatch.setattr(T.Database, 'MAX_DELTA_ROWS', 1)
+    assert db.get_schedule_changes(mark) is None
+    assert db.get_schedule_changes(deleted_mark + 1) is None
+
+
+def test_placements_built_on_a_stale_view_are_rejected(shared_lecture):
+    db, lecture_id = shared_lecture
+    other_id = add_lecture(db, add_course(db, "مادة أخرى", 2), [3], lecturer_id=6, level_id=2)
+    mark = db.current_change_mark()
+    # مستخدم آخر يحجز نفس القاعة يوم الجمعة بعد آخر مزامنة
+    db.place_schedule(lecture_id, 3, 1, "الجمعة", 12, 14)
+    before = count(db, "SELECT COUNT(*) FROM Schedule")
+
+    conflicts, inserted = db.place_schedule(other_id, 3, 1, "الجمعة", 15, 17, since=mark)
+    assert inserted == [] and [(row[0], row[3], row[6], row[7]) for row in conflicts] == [
+        ('stale', "قسم 3", "الجمعة", 12)]
+    assert count(db, "SELECT COUNT(*) FROM Schedule") == before
+    # تغيير في نفس اليوم لا يمس المكان أو المحاضر أو الطلاب لا يرفض الحجز
+    conflicts, inserted = db.place_schedule(other_id, 3, 2, "الجمعة", 15, 17, since=mark)
+    assert conflicts == [] and len(inserted) == 1
+    # مواعيد هذا الجهاز نفسه بعد العلامة تغيير لنفس المجموعة، إلا لو مُررت في known_ids
+    known = [row[0] for row in inserted]
+    conflicts, _ = db.place_schedule(other_id, 3, 2, "الجمعة", 17, 18, since=mark)
+    assert [row[1] for row in conflicts] == known
+    conflicts, inserted = db.place_schedule(other_id, 3, 2, "الجمعة", 17, 18, since=mark, known_ids=known)
+    assert conflicts == [] and len(inserted) == 1
+
+    # التوزيع التلقائي مبني على لقطة الكلية كاملة --> أي تغيير بعدها يرفض الكل
+    session = {'group_id': other_id, 'dept_ids': [3]}
+    before = count(db, "SELECT COUNT(*) FROM Schedule")
+    with pytest.raises(ValueError):
+        db.save_placements([(session, "الجمعة", 18, 19, 3)], since=mark)
+    assert count(db, "SELECT COUNT(*) FROM Schedule") == before
+    assert db.save_placements([(session, "الجمعة", 18, 19, 3)], since=db.current_change_mark()) == 1
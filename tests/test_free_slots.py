@@ -0,0 +1,106 @@
+import pytest
+
+import timeTableCode as T
+from conftest import TEST_DAYS, TEST_HOURS, all_appointments, random_schedule
+
+pytest.importorskip('numpy')
+
+
+def scan_free_slots(schedule_data, group, rooms, days, times, duration):
+    """{(day, start, Location_ID)} بفحص كل موعد لكل خلية"""
+    cohort_keys = {f"{dept}_{group['year_level']}" for dept in group['departments']}
+    booked = all_appointments(schedule_data)
+
+    def busy(day, start, end, location_id):
+        for key, booked_day, appt in booked:
+            other = appt['group']
+            if booked_day != day or not (appt['start'] < end and appt['end'] > start):
+                continue
+            same_lecture = (group['Group_Type'] == 'lecture' and other['Group_Type'] == 'lecture'
+                            and other['course_id'] == group['course_id']
+                            and other['lecturer_id'] == group['lecturer_id'])
+            if other['location_id'] == location_id and not same_lecture:
+                return True
+            if other['lecturer_id'] == group['lecturer_id']:
+                return True
+            if key in cohort_keys and T.cohorts_clash(group, other):
+                return True
+        return False
+
+    return {(day, times[first], room[0])
+            for room in rooms for day in days for first in range(len(times) - duration)
+            if not busy(day, times[first], times[first + duration], room[0])}
+
+
+def group(**fields):
+    base = {'subject': "مادة 4", 'instructor': "محاضر 7", 'Group_Type': 'practical', 'group_number': 1,
+            'departments': ["قسم 1"], 'year_level': "المستوى 1", 'dept_id': 1,
+            'course_id': 4, 'level_id': 1, 'lecturer_id': 7}
+    return {**base, **fields}
+
+
+def appointment(start, end, location_id, **fields):
+    return {'start': start, 'end': end, 'place': f"قاعة {location_id}",
+            'group': group(location_id=location_id, **fields)}
+
+
+ROOMS = [(1, "قاعة 1", 40), (2, "قاعة 2", None), (3, "قاعة 3", 20)]
+SMALL_SCHEDULE = {
+    # نفس القسم/المستوى في 9-11 بالقاعة 1، والمحاضر 7 مشغول في 11-12 مع قسم آخر بالقاعة 2
+    "قسم 1_المستوى 1": {'dept': "قسم 1", 'year': "المستوى 1", 'schedule': {"السبت": [
+        appointment(9, 11, 1, lecturer_id=5, course_id=3)]}},
+    "قسم 2_المستوى 1": {'dept': "قسم 2", 'year': "المستوى 1", 'schedule': {"السبت": [
+        appointment(11, 12, 2, departments=["قسم 2"], dept_id=2, course_id=9)]}},
+}
+
+
+def free(slots):
+    return [(slot['place'], slot['start']) for slot in slots]
+
+
+def test_small_schedule_and_capacity_order():
+    slots = T.find_free_slots(SMALL_SCHEDULE, group(), ROOMS, ["السبت"], [8, 9, 10, 11, 12], 1, 30)
+    assert free(slots) == [("قاعة 1", 8), ("قاعة 2", 8), ("قاعة 3", 8)]
+    assert [slot['fits'] for slot in slots] == [True, False, False]
+    assert all(slot['day'] == "السبت" and slot['end'] == 9 for slot in slots)
+
+
+def test_parallel_practical_group_ignores_other_group_numbers():
+    slots = T.find_free_slots(SMALL_SCHEDULE, group(group_number=2), ROOMS, ["السبت"], [8, 9, 10, 11, 12], 1, 30)
+    assert free(slots) == [("قاعة 1", 8), ("قاعة 2", 8), ("قاعة 2", 9), ("قاعة 2", 10),
+                           ("قاعة 3", 8), ("قاعة 3", 9), ("قاعة 3", 10)]
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+@pytest.mark.parametrize('duration', [1, 2, 3])
+def test_random_schedules_match_a_scan(seed, duration):
+    schedule_data, rooms = random_schedule(seed)
+    groups = [dict(appt['group']) for _, _, appt in all_appointments(schedule_data)]
+    for candidate in groups[::9]:
+        slots = T.find_free_slots(schedule_data, candidate, rooms, TEST_DAYS, TEST_HOURS, duration, 40)
+        found = [(slot['day'], slot['start'], slot['location_id']) for slot in slots]
+        assert len(found) == len(set(found))
+        assert set(found) == scan_free_slots(schedule_data, candidate, rooms, TEST_DAYS, TEST_HOURS, duration)
+        assert all(slot['end'] - slot['start'] == duration for slot in slots)
+
+
+def test_slots_are_ordered_by_capacity_fit():
+    schedule_data, rooms = random_schedule(4)
+    rooms = rooms + [(99, "بدون سعة", None)]
+    slots = T.find_free_slots(schedule_data, group(lecturer_id=99), rooms, TEST_DAYS, TEST_HOURS, 2, 40)
+    assert slots
+
+    def rank(slot):
+        capacity = slot['capacity'] or 0
+        tier = 1 if capacity <= 0 else (0 if capacity >= 40 else 2)
+        return tier, abs(capacity - 40)
+
+    assert [rank(slot) for slot in slots] == sorted(rank(slot) for slot in slots)
+    assert all(slot['fits'] == (rank(slot)[0] == 0) for slot in slots)
+
+
+def test_no_rooms_or_too_long_duration():
+    assert T.find_free_slots(SMALL_SCHEDULE, group(), [], ["السبت"], [8, 9, 10], 1, 30) == []
+    assert T.find_free_slots(SMALL_SCHEDULE, group(), ROOMS, ["السبت"], [8, 9, 10], 3, 30) == []
+    slots = T.find_free_slots({}, group(), ROOMS, TEST_DAYS, TEST_HOURS, 2, 30)
+    assert len(slots) == len(ROOMS) * len(TEST_DAYS) * (len(TEST_HOURS) - 2)
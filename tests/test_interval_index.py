@@ -0,0 +1,133 @@
+import random
+
+import timeTableCode as T
+from conftest import TEST_DAYS, TEST_HOURS, all_appointments, random_schedule
+
+
+def ids(appointments):
+    return sorted(id(appt) for appt in appointments)
+
+
+def probes():
+    for day in TEST_DAYS:
+        for start in TEST_HOURS[:-1]:
+            for end in range(start + 1, min(start + 3, TEST_HOURS[-1]) + 1):
+                yield day, start, end
+
+
+def overlapping(appointments, day, start, end):
+    return [appt for appt_day, appt in appointments if appt_day == day and appt['start'] < end and appt['end'] > start]
+
+
+def indexed(seed):
+    schedule_data, _ = random_schedule(seed)
+    index = T.ScheduleIndex()
+    index.rebuild(schedule_data)
+    return [(day, appt) for _, day, appt in all_appointments(schedule_data)], index
+
+
+def test_interval_index_matches_a_scan_after_adds_and_removes():
+    rng = random.Random(5)
+    index = T.IntervalIndex()
+    items = []
+    for n in range(300):
+        start = rng.randint(0, 40)
+        # بعض الفترات الطويلة جداً تغطي معظم المفتاح
+        item = (rng.choice('ab'), start, start + (rng.randint(20, 40) if n % 25 == 0 else rng.randint(1, 4)), n)
+        index.add(*item[:3], item)
+        items.append(item)
+    for item in rng.sample(items, 120):
+        assert index.remove(item[0], item)
+        items.remove(item)
+    assert not index.remove('a', ('a', 0, 1, -1))
+    assert index.overlaps('missing', 0, 100) == []
+
+    for key in 'abc':
+        for start in range(0, 50):
+            for end in range(start + 1, start + 5):
+                expected = {item for item in items if item[0] == key and item[1] < end and item[2] > start}
+                assert set(index.overlaps(key, start, end)) == expected
+
+
+def test_touching_intervals_do_not_overlap():
+    index = T.IntervalIndex()
+    index.add('k', 9, 11, 'first')
+    index.add('k', 11, 12, 'second')
+    assert index.overlaps('k', 11, 12) == ['second']
+    assert index.overlaps('k', 8, 9) == []
+    assert sorted(index.overlaps('k', 10, 12)) == ['first', 'second']
+
+
+def test_half_hours_fall_in_the_covering_hour_buckets():
+    index = T.IntervalIndex()
+    index.add('k', 9.5, 10.5, 'half')
+    assert index.overlaps('k', 10, 11) == ['half'] and index.overlaps('k', 9, 9.5) == []
+    assert index.overlaps('k', 10.5, 12) == [] and index.overlaps('k', 10.25, 10.75) == ['half']
+    assert index.remove('k', 'half') and index.overlaps('k', 8, 12) == []
+
+
+def test_room_and_lecturer_conflicts_match_a_scan():
+    appointments, index = indexed(1)
+    locations = {appt['group']['location_id'] for _, appt in appointments}
+    lecturers = {appt['group']['lecturer_id'] for _, appt in appointments}
+    for day, start, end in probes():
+        busy = overlapping(appointments, day, start, end)
+        for location_id in locations:
+            expected = [appt for appt in busy if appt['group']['location_id'] == location_id]
+            assert ids(index.place_conflicts(location_id, day, start, end)) == ids(expected)
+        for lecturer_id in lecturers:
+            expected = [appt for appt in busy if appt['group']['lecturer_id'] == lecturer_id]
+            assert ids(index.lecturer_conflicts(lecturer_id, day, start, end)) == ids(expected)
+
+
+def test_shared_lecture_is_not_a_room_conflict_with_itself():
+    appointments, index = indexed(2)
+    lectures = [appt['group'] for _, appt in appointments if appt['group']['Group_Type'] == 'lecture']
+    assert lectures
+    for group in lectures:
+        for day, start, end in probes():
+            expected = [appt for appt in overlapping(appointments, day, start, end)
+                        if appt['group']['location_id'] == group['location_id']
+                        and not (appt['group']['Group_Type'] == 'lecture'
+                                 and appt['group']['course_id'] == group['course_id']
+                                 and appt['group']['lecturer_id'] == group['lecturer_id'])]
+            found = index.place_conflicts(group['location_id'], day, start, end,
+                                          group['course_id'], group['lecturer_id'])
+            assert ids(found) == ids(expected)
+
+
+def test_cohort_conflicts_match_a_scan():
+    appointments, index = indexed(4)
+    groups = [appt['group'] for _, appt in appointments]
+    for day, start, end in probes():
+        busy = overlapping(appointments, day, start, end)
+        for group in groups[::5]:
+            dept_ids = [group['dept_id']]
+            # بدون مجموعة: كل مواعيد القسم/المستوى
+            expected = [appt for appt in busy
+                        if appt['group']['dept_id'] in dept_ids and appt['group']['level_id'] == group['level_id']]
+            assert ids(index.cohort_conflicts(dept_ids, group['level_id'], day, start, end)) == ids(expected)
+            # مع المجموعة: العملي لا يتعارض مع رقم مجموعة عملية آخر
+            expected = [appt for appt in expected if T.cohorts_clash(group, appt['group'])]
+            assert ids(index.cohort_conflicts(dept_ids, group['level_id'], day, start, end, group)) == ids(expected)
+        # المحاضرة المشتركة: كل أقسامها معاً
+        expected = [appt for appt in busy if appt['group']['dept_id'] in (1, 2) and appt['group']['level_id'] == 1]
+        assert ids(index.cohort_conflicts([1, 2], 1, day, start, end)) == ids(expected)
+
+
+def test_parallel_practical_groups_do_not_clash():
+    lecture = {'Group_Type': 'lecture', 'group_number': None}
+    first, second = ({'Group_Type': 'practical', 'group_number': n} for n in (1, 2))
+    assert T.cohorts_clash(lecture, first) and T.cohorts_clash(second, lecture)
+    assert T.cohorts_clash(first, dict(first)) and not T.cohorts_clash(first, second)
+
+
+def test_removed_appointment_is_no_longer_reported():
+    appointments, index = indexed(3)
+    day, appt = appointments[0]
+    group = appt['group']
+    assert appt in index.lecturer_conflicts(group['lecturer_id'], day, appt['start'], appt['end'])
+    index.remove(day, appt)
+    assert appt not in index.lecturer_conflicts(group['lecturer_id'], day, appt['start'], appt['end'])
+    assert appt not in index.place_conflicts(group['location_id'], day, appt['start'], appt['end'])
+    assert appt not in index.cohort_conflicts([group['dept_id']], group['level_id'], day, appt['start'], appt['end'])
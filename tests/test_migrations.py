@@ -0,0 +1,68 @@
+import pytest
+
+import timeTableCode as T
+from conftest import build_catalog
+
+ALL_VERSIONS = [number for number, _, _ in T.MIGRATIONS]
+
+
+def versions(backend):
+    conn = backend.connect()
+    try:
+        return {row[0] for row in conn.execute("SELECT Version FROM Schema_Version")}
+    finally:
+        conn.close()
+
+
+def test_all_migrations_apply_once(tmp_path):
+    backend, applied = build_catalog(tmp_path / 'full.db')
+    assert applied == ALL_VERSIONS
+    assert backend.has_full_name_column
+    conn = backend.connect()
+    assert T.SchemaMigrator(backend).migrate(conn) == []
+    conn.close()
+
+
+def test_failed_full_name_alter_still_applies_later_migrations(tmp_path):
+    backend, applied = build_catalog(tmp_path / 'no_alter.db', T.NoAlterSqliteBackend)
+    assert applied == ALL_VERSIONS[1:]
+    assert backend.schema_version == ALL_VERSIONS[-1]
+    assert not backend.has_full_name_column
+    assert any("Schema migration 1" in warning for warning in T.QueryStats().warnings)
+
+    conn = backend.connect()
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    conn.close()
+    assert {name for name, _, _, _ in T.HOT_QUERY_INDEXES} <= indexes
+
+    # الاستعلامات بالاسم تعمل بالدمج F_name || ' ' || L_name
+    db = T.Database()
+    assert "Full_name" not in backend.full_name('lec')
+    assert db.get_lecturer_id("محاضر1 عائلة1") == 1
+    assert [name for _, name in db.get_teachers()][:1] == ["محاضر1 عائلة1"]
+    db.get_teacher_schedule(1)
+
+
+def test_skipped_full_name_migration_is_retried_when_alter_is_allowed(tmp_path):
+    path = tmp_path / 'retry.db'
+    build_catalog(path, T.NoAlterSqliteBackend)
+    backend = T.SqliteBackend(str(path))
+    conn = backend.connect()
+    assert T.SchemaMigrator(backend).migrate(conn) == [1]
+    conn.close()
+    assert backend.has_full_name_column
+    assert versions(backend) == set(ALL_VERSIONS)
+
+
+def test_required_migration_failure_stops_the_ones_after_it(tmp_path, monkeypatch):
+    def broken(self):
+        raise T.sqlite3.OperationalError("CREATE TRIGGER permission denied")
+    monkeypatch.setattr(T.SqliteBackend, 'change_tracking_sql', broken)
+    backend = T.SqliteBackend(str(tmp_path / 'broken.db'))
+    conn = backend.connect()
+    backend.prepare(conn, target_version=0)
+    with pytest.raises(T.sqlite3.OperationalError):
+        T.SchemaMigrator(backend).migrate(conn)
+    conn.close()
+    assert versions(backend) == {1, 2}
+    assert backend.schema_version == 2
@@ -0,0 +1,34 @@
+import timeTableCode as T
+from conftest import build_catalog
+
+
+def test_tables_load_once_until_invalidated(catalog):
+    _, db = catalog
+    cache = T.ReferenceCache()
+    cache.invalidate()
+    loads, version = cache.loads, cache.version
+    assert cache.names('Department') == ["قسم 1", "قسم 2", "قسم 3"]
+    assert cache.id_of('Department', " قسم 2 ") == 2 and cache.name_of('Department', 3) == "قسم 3"
+    assert cache.id_of('Department', None) is None
+    assert cache.loads == loads + 1
+
+    # الكتابة لا تمر بالذاكرة --> القيمة القديمة حتى invalidate للجدول نفسه فقط
+    db.add_department(50, "قسم جديد")
+    cache.names('Levels')
+    assert cache.id_of('Department', "قسم جديد") is None and cache.loads == loads + 2
+    cache.invalidate('Department')
+    assert cache.version == version + 1
+    assert cache.id_of('Department', "قسم جديد") == 50
+    cache.names('Levels')
+    assert cache.loads == loads + 3
+
+
+def test_switching_the_database_resets_every_table(tmp_path):
+    build_catalog(tmp_path / 'first.db')
+    cache = T.ReferenceCache()
+    assert len(cache.rows('Location')) == 12 and len(cache.names('Lecturer')) == 40
+
+    # إعدادات جديدة من صفحة السيرفر: نفس الجداول بلا invalidate
+    build_catalog(tmp_path / 'second.db', lecturers=20, locations=4)
+    version = cache.version
+    assert len(cache.rows('Location')) == 4 and len(cache.names('Lecturer')) == 20 and cache.version == version
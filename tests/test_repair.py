@@ -0,0 +1,65 @@
+import pytest
+
+import timeTableCode as T
+from conftest import clash, random_problem, session_booking
+
+
+def current_timetable(seed, **sizes):
+    """جدول حالي بلا تعارضات: حصص random_problem موزعة بالمحلّل ثم بصيغة build_repair_sessions"""
+    rooms, _, problem = random_problem(seed, fixed=0, **sizes)
+    placements, unplaced = T.TimetableSolver(rooms, []).solve(problem)
+    assert not unplaced
+    sessions = [dict(session, day=day, start=start, end=end, location_id=location_id)
+                for session, day, start, end, location_id in placements]
+    return sessions, rooms
+
+
+def check_repair(sessions, rooms, constraint, **limits):
+    repair = T.TimetableRepair(sessions, rooms, constraint)
+    affected = [i for i in range(len(sessions)) if repair.violates(i)]
+    moves, failed, stats = repair.run(**limits)
+    assert stats['affected'] == len(affected) > 0
+    assert not stats['timed_out']
+
+    failed_ids = {id(session) for session, _ in failed}
+    final, changed = [], 0
+    for i, session in enumerate(sessions):
+        if id(session) in failed_ids:
+            continue
+        day, start, end, location_id = repair.position[i]
+        assert not repair.violates(i)
+        assert end - start == session['duration'] and location_id in {room[0] for room in rooms}
+        final.append(session_booking(session, day, start, end, location_id))
+        changed += (day, start, end, location_id) != (session['day'], session['start'], session['end'],
+                                                       session['location_id'])
+    assert len(moves) == changed <= stats['affected'] + stats['displaced']
+    assert [(a, b) for i, a in enumerate(final) for b in final[i + 1:] if clash(a, b)] == []
+    return moves, failed, stats
+
+
+@pytest.mark.parametrize('seed', [1, 2])
+def test_closing_a_room_moves_only_its_sessions(seed):
+    sessions, rooms = current_timetable(seed)
+    closed = max(rooms, key=lambda room: sum(s['location_id'] == room[0] for s in sessions))[0]
+    moves, failed, stats = check_repair(sessions, rooms, {'kind': 'room', 'id': closed, 'days': None,
+                                                          'start': 8, 'end': 19}, time_limit=10)
+    assert not failed and stats['displaced'] == 0
+    assert {id(session) for session, _ in moves} == {id(s) for s in sessions if s['location_id'] == closed}
+
+
+def test_lecturer_unavailable_on_some_days():
+    sessions, rooms = current_timetable(3)
+    lecturer_id = max({s['lecturer_id'] for s in sessions},
+                      key=lambda lecturer: sum(s['lecturer_id'] == lecturer for s in sessions))
+    days = sorted({s['day'] for s in sessions if s['lecturer_id'] == lecturer_id})[:2]
+    check_repair(sessions, rooms, {'kind': 'lecturer', 'id': lecturer_id, 'days': days, 'start': 8, 'end': 19},
+                 time_limit=10)
+
+
+def test_closing_a_busy_slot_ejects_without_clashes():
+    # أماكن قليلة --> ساعات الذروة ممتلئة والنقل يحتاج إزاحة حصص أخرى
+    sessions, rooms = current_timetable(4, rooms=2, sessions=70)
+    moves, failed, stats = check_repair(sessions, rooms, {'kind': 'slot', 'id': None, 'days': None,
+                                                          'start': 10, 'end': 12}, time_limit=20)
+    assert moves
+    assert all(reason for _, reason in failed)
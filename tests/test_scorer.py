@@ -0,0 +1,96 @@
+import random
+
+import pytest
+
+import timeTableCode as T
+from conftest import random_problem, random_schedule
+
+pytest.importorskip('numpy')
+
+SETTINGS = dict(T.read_scheduling_settings(), lecturer_daily_hours=4, late_hour=15)
+
+
+def brute_force_penalties(sessions, positions, rooms, settings=SETTINGS, days=T.WEEK_DAYS):
+    """نفس مقاييس TimetableScorer.METRICS بحلقات مباشرة على الساعات"""
+    capacity = {room[0]: room[2] or 0 for room in rooms}
+    late_hour = settings['late_hour']
+    cohort_hours, lecturer_hours = {}, {}
+    waste = overflow = late = 0
+    for session, (day, start, end, location_id) in zip(sessions, positions):
+        cohorts = session.get('cohorts') or [(dept_id, session['level_id']) for dept_id in session['dept_ids']]
+        for cohort in cohorts:
+            cohort_hours.setdefault((cohort, day), set()).update(range(start, end))
+        hours = lecturer_hours.setdefault(session['lecturer_id'], dict.fromkeys(days, 0))
+        hours[day] += end - start
+        room = capacity.get(location_id, 0)
+        if room > 0:
+            waste += max(room - session['size'], 0) * (end - start)
+            overflow += max(session['size'] - room, 0) * (end - start)
+        late += sum(1 for hour in range(start, end) if hour >= late_hour)
+    gaps = sum(max(busy) - min(busy) + 1 - len(busy) for busy in cohort_hours.values())
+    overload = sum(max(hours - settings['lecturer_daily_hours'], 0)
+                   for week in lecturer_hours.values() for hours in week.values())
+    spread = sum(max(week.values()) - sum(week.values()) / len(days) for week in lecturer_hours.values())
+    return [gaps, overload, spread, waste, overflow, late]
+
+
+def random_positions(sessions, rooms, rng):
+    """مواقع عشوائية بنفس المدد (مع مكان غير معروف أحياناً) --> فراغات وتحميل زائد ومتأخر"""
+    result = []
+    for session in sessions:
+        first = rng.choice(T.DAY_HOURS[:len(T.DAY_HOURS) - session['duration']])
+        location_id = rng.choice(rooms)[0] if rng.random() > 0.1 else -1
+        result.append((rng.choice(T.WEEK_DAYS), first, first + session['duration'], location_id))
+    return result
+
+
+def check(sessions, positions, rooms):
+    scorer = T.TimetableScorer(sessions, rooms, settings=SETTINGS)
+    expected = brute_force_penalties(sessions, positions, rooms)
+    assert list(scorer.penalties(*scorer.encode(positions))) == pytest.approx(expected)
+    _, total = scorer.breakdown(*scorer.encode(positions))
+    assert total == pytest.approx(sum(value * weight for value, (_, _, weight) in zip(expected, T.TimetableScorer.METRICS)))
+    assert scorer.score(*scorer.encode(positions)) == pytest.approx(total)
+    return expected
+
+
+def test_small_timetable_by_hand():
+    rooms = [(1, "قاعة 1", 40), (2, "قاعة 2", None)]
+    sessions = [{'lecturer_id': 1, 'cohorts': [('c', 1)], 'size': 30},
+                {'lecturer_id': 1, 'cohorts': [('c', 1)], 'size': 50},
+                {'lecturer_id': 2, 'cohorts': [('d', 1)], 'size': 25}]
+    positions = [("السبت", 8, 10, 1), ("السبت", 12, 15, 1), ("الأحد", 15, 18, 2)]
+    scorer = T.TimetableScorer(sessions, rooms, settings=SETTINGS)
+    # فراغ 10-12، المحاضر 1 خمس ساعات يوم السبت، 10 مقاعد فارغة × 2، 10 طلاب بلا مقاعد × 3، ثلاث ساعات بعد 15
+    spread = (5 - 5 / 7) + (3 - 3 / 7)
+    assert list(scorer.penalties(*scorer.encode(positions))) == pytest.approx([2, 1, spread, 20, 30, 3])
+    assert scorer.score(*scorer.encode(positions)) == pytest.approx(6 + 2 + spread + 0.2 + 3 + 3)
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_scorer_matches_brute_force_on_random_positions(seed):
+    rooms, _, sessions = random_problem(seed)
+    positions = random_positions(sessions, rooms, random.Random(seed))
+    gaps, overload, spread, waste, overflow, late = check(sessions, positions, rooms)
+    assert gaps and overload and spread and waste and overflow and late
+
+
+def test_timetable_quality_scores_fixed_and_placed_sessions():
+    rooms, fixed, sessions = random_problem(4)
+    placements, _ = T.TimetableSolver(rooms, fixed).solve(sessions)
+    scored, keys = T.scoring_sessions_from_fixed(fixed, SETTINGS)
+    scored += [session for session, *_ in placements]
+    # مفتاح الصفوف الثابتة (day, start, end, Location_ID, Lecturer_ID)
+    positions = [key[:4] for key in keys] + [(day, start, end, location_id) for _, day, start, end, location_id in placements]
+    expected = brute_force_penalties(scored, positions, rooms)
+    total = sum(value * weight for value, (_, _, weight) in zip(expected, T.TimetableScorer.METRICS))
+    assert T.timetable_quality(rooms, fixed, placements, SETTINGS) == pytest.approx(total)
+
+
+def test_scorer_on_page_schedule_data():
+    schedule_data, rooms = random_schedule(5)
+    sessions, positions = T.scoring_sessions_from_schedule(schedule_data, SETTINGS)
+    # المحاضرة المشتركة صف لكل قسم بنفس Group_ID والموعد --> حصة واحدة بطلاب كل الأقسام
+    assert len(sessions) == len({(appt['group']['group_id'], day) for info in schedule_data.values()
+                                 for day, appointments in info['schedule'].items() for appt in appointments})
+    check(sessions, positions, rooms)
@@ -0,0 +1,58 @@
+import random
+
+import timeTableCode as T
+
+WORDS = ["محمد", "مُحمّد", "أحمد", "احمد", "علي", "عليان", "مدرسة", "مدرس", "برمجة", "برمجيات", "قواعد", "بيانات"]
+
+
+def random_index(seed, size=300):
+    rng = random.Random(seed)
+    index = T.SearchIndex()
+    for key in range(size):
+        index.add(key, " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))))
+    return index, rng
+
+
+def test_scoring_only_given_keys_matches_the_full_index():
+    index, rng = random_index(1)
+    for query in ["م", "مح", "محم", "احمد", "بر م", "علي مد", "قو", "xyz", " ,"]:
+        keys = rng.sample(range(300), 120)
+        expected = {key: score for key, score in index.scores(query).items() if key in keys}
+        assert index.scores(query, keys=keys) == expected
+
+
+def test_normalize_arabic():
+    assert [T.normalize_arabic(word) for word in ["أحمد", "إسلام", "آمال", "ٱلله", "مدرسة", "مصطفى"]] == [
+        "احمد", "اسلام", "امال", "الله", "مدرسه", "مصطفي"]
+    # التشكيل والتطويل والحروف اللاتينية الكبيرة
+    assert T.normalize_arabic("مُدَرِّسٌ") == T.normalize_arabic("مـــدرس") == "مدرس"
+    assert T.normalize_arabic("Lab B12") == "lab b12"
+    assert T.SearchIndex.tokenize("قاعة (أ)، مُختبر-2") == ["قاعه", "ا", "مختبر", "2"]
+
+
+def test_exact_words_rank_above_prefixes():
+    index = T.SearchIndex()
+    index.add(1, "قواعد بيانات مدرسة")
+    index.add(2, "مُدرّس البرمجة")
+    index.add(3, "مدرسة البرمجيات")
+    index.add(4, "أحمد علي")
+    # كلمة كاملة + بداية النص، ثم بادئة + بداية النص، ثم بادئة فقط
+    assert index.search("مدرس") == [2, 3, 1]
+    assert index.search("مدرس", limit=1) == [2]
+    # كل كلمات البحث لازمة، وكل كلمة تكفيها بادئة
+    assert index.search("مدرسة البر") == [3]
+    assert index.search("البرمج") == [2, 3]
+    assert index.search("إحمد عل") == [4] and index.search("احمد x") == []
+    assert index.search("") == [] and index.search("، ") == []
+
+
+def test_sync_reindexes_only_what_changed():
+    index = T.SearchIndex()
+    index.sync([(1, "مدرس"), (2, "مدرس"), (3, "مدرسة")])
+    # تساوي النقاط --> ترتيب الإضافة
+    assert index.search("مدرس") == [1, 2, 3]
+    index.sync([(1, "مدرس"), (2, "برمجة"), (4, "مدرس")])
+    assert index.search("مدرس") == [1, 4] and index.search("برمج") == [2]
+    assert index.prefix_terms("مدرس") == ["مدرس"]
+    index.clear()
+    assert index.search("مدرس") == [] and index.prefix_terms("") == []
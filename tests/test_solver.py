@@ -0,0 +1,84 @@
+import random
+
+import pytest
+
+import timeTableCode as T
+from conftest import bookings, clash, new_clashes, random_problem, session_booking
+
+
+def check_solution(rooms, fixed, sessions, placements, unplaced):
+    placed_ids = [session['group_id'] for session, *_ in placements]
+    unplaced_ids = [session['group_id'] for session, _ in unplaced]
+    assert sorted(placed_ids + unplaced_ids) == sorted(session['group_id'] for session in sessions)
+
+    room_ids = {room[0] for room in rooms}
+    for session, day, start, end, location_id in placements:
+        assert day in T.WEEK_DAYS and location_id in room_ids
+        assert start in T.DAY_HOURS and end == start + session['duration'] and end <= T.DAY_HOURS[-1]
+
+    all_bookings = bookings(fixed, placements)
+    assert new_clashes(all_bookings) == []
+    return all_bookings
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_solver_places_sessions_without_clashes(seed):
+    rooms, fixed, sessions = random_problem(seed)
+    placements, unplaced = T.TimetableSolver(rooms, fixed).solve(sessions)
+    check_solution(rooms, fixed, sessions, placements, unplaced)
+    assert not unplaced
+
+
+def test_unplaced_sessions_really_have_no_free_slot():
+    rooms, fixed, sessions = random_problem(4, rooms=2, sessions=140)
+    placements, unplaced = T.TimetableSolver(rooms, fixed).solve(sessions)
+    all_bookings = check_solution(rooms, fixed, sessions, placements, unplaced)
+    assert placements and unplaced
+
+    # الجشع لا يعود للحصة بعد رفضها، والحجوزات اللاحقة تزيد الإشغال فقط --> لا موعد حر في النهاية
+    for session, reason in unplaced:
+        assert reason
+        for day in T.WEEK_DAYS:
+            for start in T.DAY_HOURS[:len(T.DAY_HOURS) - session['duration']]:
+                for location_id, _, _ in rooms:
+                    candidate = session_booking(session, day, start, start + session['duration'], location_id)
+                    assert any(clash(candidate, other) for other in all_bookings)
+
+
+def test_solver_reports_impossible_durations():
+    rooms, fixed, sessions = random_problem(5)
+    session = dict(sessions[0], duration=len(T.DAY_HOURS))
+    placements, unplaced = T.TimetableSolver(rooms, fixed).solve([session])
+    assert placements == [] and "أطول من اليوم الدراسي" in unplaced[0][1]
+    placements, unplaced = T.TimetableSolver([], fixed).solve(sessions[:1])
+    assert unplaced[0][1] == "لا توجد أماكن مسجلة"
+
+
+@pytest.mark.parametrize('seed', [1, 2])
+def test_randomized_orders_stay_feasible(seed):
+    rooms, fixed, sessions = random_problem(seed)
+    solver = T.TimetableSolver(rooms, fixed)
+    rng = random.Random(seed)
+    placements, unplaced = solver.solve(sessions, solver.randomized_order(sessions, rng), rng)
+    check_solution(rooms, fixed, sessions, placements, unplaced)
+
+
+def test_portfolio_returns_a_feasible_complete_solution():
+    rooms, fixed, sessions = random_problem(6)
+    messages = []
+    placements, unplaced, stats = T.solve_portfolio(rooms, fixed, sessions, workers=2, seeds=2, restarts=3,
+                                                    time_limit=60, progress=lambda *m: messages.append(m))
+    check_solution(rooms, fixed, sessions, placements, unplaced)
+    assert not unplaced
+    assert stats['winner'] in (0, 1) and stats['attempts'] >= 1 and stats['elapsed'] > 0
+    assert messages and all(m[0] in (0, 1) for m in messages)
+
+
+def test_portfolio_is_never_worse_than_the_greedy_order():
+    rooms, fixed, sessions = random_problem(4, rooms=2, sessions=140)
+    _, greedy_unplaced = T.TimetableSolver(rooms, fixed).solve(sessions)
+    placements, unplaced, _ = T.solve_portfolio(rooms, fixed, sessions, workers=2, seeds=2, restarts=3,
+                                                time_limit=60)
+    check_solution(rooms, fixed, sessions, placements, unplaced)
+    assert 0 < len(unplaced) <= len(greedy_unplaced)
+    assert all(reason for _, reason in unplaced)
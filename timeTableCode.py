@@ -1,17 +1,41 @@
 # coding: utf-8
 import tkinter as tk
+import tkinter.font
 from tkinter import ttk, messagebox
 from PIL import Image, ImageTk
 import customtkinter as ctk
-import pyodbc
 import subprocess
 import tempfile
 from PIL import ImageGrab
 import os
 import configparser 
-import win32print
-import win32api
 import datetime
+import threading
+import bisect
+import re
+import time
+import sqlite3
+import queue
+import sys
+import random
+import multiprocessing
+import logging
+from logging.handlers import RotatingFileHandler
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+# pyodbc و pywin32 غير متاحين دائماً (مثلاً على Linux) --> نعمل بقاعدة SQLite المحلية
+try:
+    import pyodbc
+except ImportError:
+    pyodbc = None
+try:
+    import win32print
+    import win32api
+except ImportError:
+    win32print = win32api = None
+
+# أخطاء قاعدة البيانات لكل الـ backends المدعومة
+DB_ERRORS = (sqlite3.Error,) + ((pyodbc.Error,) if pyodbc else ())
 
 # Color Palette
 HEADER_FRAME = "#2c3e50"
@@ -30,6 +54,100 @@ class BasePage(tk.Frame):
         self.parent = parent
         self.return_callback = return_callback
         self.configure(bg='#f0f0f0')
+        self._loading_count = 0
+        self.loading_label = None
+        self.status_label = None
+        self._status_job = None
+        self._last_status_error = None
+
+    def run_in_background(self, work, on_success, on_error=None, timeout=None, message="جاري التحميل..."):
+        """تشغيل work (بدون أي Tk) في الخلفية وتسليم النتيجة لـ on_success على خيط الواجهة"""
+        self.show_loading(message)
+
+        def done(result):
+            self.hide_loading()
+            on_success(result)
+
+        def failed(error):
+            self.hide_loading()
+            (on_error or self.show_background_error)(error)
+
+        return DataService().submit(self, work, done, failed, timeout)
+
+    def start_change_polling(self, seen_mark, on_change):
+        """كل بضع ثوان: سؤال الخادم عن رمز التغيير فقط، واستدعاء on_change(mark) لو تحرك عن seen_mark()
+
+        الصفحة المخفية لا تسأل؛ ولا يُرسل سؤال جديد قبل رجوع السابق
+        """
+        interval = max(1, int(read_scheduling_settings()['change_poll_seconds'] * 1000))
+        self._change_poll = None
+
+        def check(mark):
+            seen = seen_mark()
+            if mark is not None and seen is not None and mark != seen:
+                on_change(mark)
+
+        def tick():
+            if not self.winfo_exists():
+                return
+            pending = self._change_poll is not None and not (self._change_poll.done or self._change_poll.cancelled)
+            if self.winfo_ismapped() and not pending:
+                self._change_poll = DataService().submit(
+                    self, Database().current_change_mark, check,
+                    lambda e: self.show_status(f"تعذر فحص تغييرات الجداول: {e}", error=True))
+            self.after(interval, tick)
+
+        self.after(interval, tick)
+
+    def cancel_background_work(self):
+        """إلغاء طلبات الصفحة المعلقة عند الانتقال لصفحة أخرى"""
+        DataService().cancel_owner(self)
+        self._loading_count = 1
+        self.hide_loading()
+
+    def show_loading(self, message="جاري التحميل..."):
+        self._loading_count += 1
+        if self.loading_label is None:
+            self.loading_label = tk.Label(self, bg="#fff3cd", fg="#856404", font=('Arial', 11, 'bold'), padx=10)
+        self.loading_label.config(text=message)
+        self.loading_label.place(relx=0.0, rely=0.0, anchor='nw')
+        self.loading_label.lift()
+
+    def hide_loading(self):
+        self._loading_count = max(0, self._loading_count - 1)
+        if self._loading_count == 0 and self.loading_label is not None:
+            self.loading_label.place_forget()
+
+    def show_status(self, message, error=False, duration=6000):
+        """رسالة قصيرة أسفل الصفحة (نتيجة تحميل، مزامنة، خطأ في الخلفية)؛ الأخطاء تُسجل أيضاً في QueryStats"""
+        if not self.winfo_exists():
+            return
+        if self.status_label is None:
+            self.status_label = tk.Label(self, font=('Arial', 10), padx=10)
+        if error:
+            self.status_label.config(text=message, bg="#f8d7da", fg="#721c24")
+            if message != self._last_status_error:  # الفحص الدوري لا يكرر نفس الخطأ في السجل
+                QueryStats().warning("%s: %s", type(self).__name__, message)
+            self._last_status_error = message
+        else:
+            self.status_label.config(text=message, bg="#d4edda", fg="#155724")
+            self._last_status_error = None
+        self.status_label.place(relx=0.0, rely=1.0, anchor='sw')
+        self.status_label.lift()
+        if self._status_job is not None:
+            self.after_cancel(self._status_job)
+        self._status_job = self.after(duration, self.hide_status)
+
+    def hide_status(self):
+        self._status_job = None
+        if self.status_label is not None:
+            self.status_label.place_forget()
+
+    def show_background_error(self, error):
+        if isinstance(error, TimeoutError):
+            messagebox.showerror("خطأ", f"انتهت مهلة الاستعلام:\n{str(error)}")
+        else:
+            messagebox.showerror("خطأ", f"حدث خطأ في جلب البيانات: {str(error)}")
 
 # data_manager
 class DataManager:
@@ -44,1300 +162,3337 @@ class DataManager:
     def clear_data(self):
         self.schedule_data = {}  # لحفظ الجداول
         self.groups_data = []    # لحفظ المجموعات
+        self.schedule_sync_mark = None  # آخر Change_ID تمت مزامنته في schedule_data
+        self.schedule_sync_key = None   # (backend, إصدار الذاكرة المرجعية) وقت المزامنة
+        self.own_schedule_ids = set()   # مواعيد أضافها هذا الجهاز ولم تصل بعد في مزامنة
+
+# storage backends
+class StorageBackend:
+    """Base class for the storage backends; also builds the dialect-specific SQL fragments"""
+    name = None
+    has_full_name_column = False  # Lecturer.Full_name محسوب ومفهرس
+    schema_version = 0
+    migration_error = None  # آخر migration فشلت عند التجهيز (تُعرض عند بدء البرنامج)
+    _prepared = False
+    _prepare_lock = threading.Lock()
+
+    def key(self):
+        """يتغير عند تغيير الإعدادات --> المجمع يعيد الاتصال"""
+        raise NotImplementedError
+
+    def connect(self):
+        raise NotImplementedError
+
+    def describe(self):
+        return ""
+
+    def prepare(self, conn, target_version=None):
+        """تجهيز قاعدة البيانات مرة واحدة عند أول اتصال: الجداول ثم الـ migrations"""
+        with self._prepare_lock:
+            if self._prepared:
+                return
+            self.create_schema(conn)
+            try:
+                SchemaMigrator(self).migrate(conn, target_version)
+            except DB_ERRORS as e:
+                # بدون صلاحية CREATE INDEX يعمل البرنامج بدون الفهارس
+                self.migration_error = e
+                QueryStats().warning("Schema migration failed: %s", e)
+            self.has_full_name_column = self.has_column(conn.cursor(), 'Lecturer', 'Full_name')
+            self._prepared = True
+
+    def create_schema(self, conn):
+        """جداول SQL Server تُنشأ من سكربت قاعدة البيانات نفسها"""
+
+    def has_column(self, cursor, table, column):
+        cursor.execute("SELECT COUNT(*) FROM sys.columns WHERE object_id = OBJECT_ID(?) AND name = ?", (table, column))
+        return cursor.fetchone()[0] > 0
+
+    def schema_version_table_sql(self):
+        return """
+            IF OBJECT_ID('Schema_Version') IS NULL
+            CREATE TABLE Schema_Version (
+                Version INT PRIMARY KEY,
+                Description NVARCHAR(200),
+                Applied_At DATETIME DEFAULT GETDATE()
+            )
+        """
 
-class GroupsCreation(BasePage):
-    """Class for the schedule entry page"""
-    def __init__(self, parent, return_callback):
-        super().__init__(parent, return_callback)
-        self.data_manager = DataManager()
-        self.groups = self.data_manager.groups_data
-        self.editing_group_index = None
-        self.original_group_data = None
-        
-        # إعداد اتصال قاعدة البيانات
-        self.SERVER = '.'
-        self.DATABASE = 'project'
-        
-        # تحميل البيانات من قاعدة البيانات
-        self.year_levels = self.load_year_levels_from_db()
-        self.departments = self.load_departments_from_db()
-        self.instructors = self.load_instructors_from_db()
-        self.subjects = self.load_subjects_from_db()
-         
-        self.practical_groups_count_container = None
-        self.practical_instructor_container = None
-        self.dept_groups_count_spinboxes = {}
-        
-        self.setup_ui()
-        self.load_groups_from_db()
-
-
-    def connect_db(self):
-        try:
-            # الحصول على إعدادات الاتصال من الصفحة الرئيسية
-            main_page = self.master.master if isinstance(self.master, tk.Toplevel) else self.master
-            if hasattr(main_page, 'db_server') and hasattr(main_page, 'db_name'):
-                self.SERVER = main_page.db_server
-                self.DATABASE = main_page.db_name
-            
-            conn = pyodbc.connect(
-                f'DRIVER={{SQL Server}};SERVER={self.SERVER};'
-                f'DATABASE={self.DATABASE};Trusted_Connection=yes;'
+    def create_index_sql(self, name, table, columns, include=()):
+        sql = f"CREATE INDEX {name} ON {table} ({', '.join(columns)})"
+        if include:
+            sql += f" INCLUDE ({', '.join(include)})"
+        return f"IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = '{name}') {sql}"
+
+    def full_name_column_sql(self):
+        return "ALTER TABLE Lecturer ADD Full_name AS (F_name + ' ' + L_name) PERSISTED"
+
+    def change_tracking_sql(self):
+        """سجل تغييرات Schedule يملؤه trigger --> كل جهاز يجلب ما بعد آخر Change_ID رآه"""
+        trigger = """
+            CREATE TRIGGER TR_Schedule_Changes ON Schedule AFTER INSERT, UPDATE, DELETE AS
+            BEGIN
+                SET NOCOUNT ON;
+                INSERT INTO Schedule_Changes (Schedule_ID, Operation)
+                SELECT i.Schedule_ID, CASE WHEN EXISTS (SELECT 1 FROM deleted) THEN 'U' ELSE 'I' END
+                FROM inserted i;
+                INSERT INTO Schedule_Changes (Schedule_ID, Operation)
+                SELECT d.Schedule_ID, 'D' FROM deleted d
+                WHERE NOT EXISTS (SELECT 1 FROM inserted i WHERE i.Schedule_ID = d.Schedule_ID);
+            END
+        """
+        return [
+            """
+            IF OBJECT_ID('Schedule_Changes') IS NULL
+            CREATE TABLE Schedule_Changes (
+                Change_ID BIGINT IDENTITY(1,1) PRIMARY KEY,
+                Schedule_ID INT NOT NULL,
+                Operation CHAR(1) NOT NULL,
+                Changed_At DATETIME DEFAULT GETDATE()
             )
-            return conn
-        except pyodbc.Error as e:
-            messagebox.showerror("خطأ في الاتصال", f"فشل الاتصال بقاعدة البيانات:\n{str(e)}")
-            return None
-        except Exception as e:
-            messagebox.showerror("خطأ", f"حدث خطأ غير متوقع: {str(e)}")
-            return None
-    
-        
-    def load_year_levels_from_db(self):
-        conn = self.connect_db()
-        if not conn:
-            return ["الأولى", "الثانية", "الثالثة", "الرابعة"]  # قيم افتراضية في حالة فشل الاتصال
-        
-        try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT Levels_name FROM Levels ORDER BY Levels_ID")
-            return [row[0] for row in cursor.fetchall()]
-        except Exception as e:
-            messagebox.showerror("خطأ", f"فشل تحميل المستويات: {str(e)}")
-            return ["الأولى", "الثانية", "الثالثة", "الرابعة"]
-        finally:
-            conn.close()
+            """,
+            # CREATE TRIGGER لازم يكون أول جملة في الـ batch
+            "IF OBJECT_ID('TR_Schedule_Changes') IS NULL EXEC('" + trigger.replace("'", "''") + "')"
+        ]
 
-    def load_departments_from_db(self):
-        """تحميل الأقسام من قاعدة البيانات"""
-        conn = self.connect_db()
-        if not conn:
-            return ["الرياضيات", "الحاسب علوم", "فيزياءوعلوم الحاسب"]
-        
+    # أعمدة نتيجة الحجز: (kind, Schedule_ID, Department_ID, Department_name, Course_name, Location_name, day, start, end)
+    # kind = 'lecturer' | 'room' | 'cohort' للتعارضات، 'inserted' للصفوف المضافة
+    PLACEMENT_CONFLICTS_SQL = """
+        SELECT x.kind, s.Schedule_ID, s.Department_ID, d.Department_name, c.Course_name, l.Location_name,
+               s.day, s.start_time, s.end_time
+        FROM (
+            SELECT 'lecturer' AS kind, s.Schedule_ID
+            FROM Schedule s JOIN Groups g ON s.Group_ID = g.Group_ID
+            WHERE g.Lecturer_ID = ? AND s.day = ? AND NOT (s.end_time <= ? OR s.start_time >= ?)
+            UNION ALL
+            SELECT 'room', s.Schedule_ID
+            FROM Schedule s JOIN Groups g ON s.Group_ID = g.Group_ID
+            WHERE s.Location_ID = ? AND s.day = ? AND NOT (s.end_time <= ? OR s.start_time >= ?)
+            AND NOT (? = 'lecture' AND g.Group_Type = 'lecture' AND g.Course_ID = ? AND g.Lecturer_ID = ?)
+            UNION ALL
+            SELECT 'cohort', s.Schedule_ID
+            FROM Schedule s JOIN Groups g ON s.Group_ID = g.Group_ID
+            WHERE g.Levels_ID = ? AND s.Department_ID IN ({departments})
+            AND s.day = ? AND NOT (s.end_time <= ? OR s.start_time >= ?)
+            AND (g.Group_Type = 'lecture' OR ? = 'lecture' OR g.Group_Number = ?)
+        ) x
+        JOIN Schedule s ON x.Schedule_ID = s.Schedule_ID
+        JOIN Groups g ON s.Group_ID = g.Group_ID
+        JOIN Courses c ON g.Course_ID = c.Course_ID
+        JOIN Location l ON s.Location_ID = l.Location_ID
+        JOIN Department d ON s.Department_ID = d.Department_ID
+    """
+
+    # مواعيد غيرها مستخدم آخر بعد آخر مزامنة لهذا الجهاز وتخص نفس المجموعة، أو نفس اليوم
+    # لنفس المكان/المحاضر/الطلاب --> الحجز مبني على عرض قديم (المحذوف لا يهم: يحرر فقط)
+    STALE_VIEW_SQL = """
+        SELECT DISTINCT 'stale', s.Schedule_ID, s.Department_ID, d.Department_name, c.Course_name, l.Location_name,
+               s.day, s.start_time, s.end_time
+        FROM Schedule_Changes ch
+        JOIN Schedule s ON ch.Schedule_ID = s.Schedule_ID
+        JOIN Groups g ON s.Group_ID = g.Group_ID
+        JOIN Courses c ON g.Course_ID = c.Course_ID
+        JOIN Location l ON s.Location_ID = l.Location_ID
+        JOIN Department d ON s.Department_ID = d.Department_ID
+        WHERE ch.Change_ID > ? {known}
+        AND (s.Group_ID = ? OR (s.day = ? AND (
+             s.Location_ID = ? OR g.Lecturer_ID = ?
+             OR (g.Levels_ID = ? AND s.Department_ID IN ({departments})))))
+    """
+
+    def begin_placement(self, conn, cursor):
+        """قفل يمنع حجزين متزامنين من المرور بين الفحص والإدراج"""
+        cursor.execute("EXEC sp_getapplock @Resource = 'Schedule_Placement', @LockMode = 'Exclusive', "
+                       "@LockOwner = 'Transaction', @LockTimeout = 10000")
+
+    def insert_schedule(self, cursor, values):
+        cursor.execute("""
+            SET NOCOUNT ON;
+            INSERT INTO Schedule (Department_ID, Group_ID, Location_ID, day, start_time, end_time)
+            VALUES (?, ?, ?, ?, ?, ?);
+            SELECT CAST(SCOPE_IDENTITY() AS INT);
+        """, values)
+        return cursor.fetchone()[0]
+
+    def place_schedule(self, conn, group_id, department_id, location_id, day, start, end, shared=False,
+                       since=None, known_ids=()):
+        """فحص تعارضات المحاضر/المكان/الطلاب ثم إدراج صفوف كل الأقسام في معاملة واحدة مقفلة
+
+        since: آخر Change_ID رآه الجهاز --> أي تغيير بعده يخص نفس الموارد يرفض الحجز بصفوف 'stale'
+        (known_ids: مواعيد أضافها هذا الجهاز نفسه بعد since فلا تُعد تغييراً من غيره)
+        يرجع صفوف التعارض (ولا يُدرج شيئاً)، أو صفوف 'inserted' بعد الـ commit
+        """
+        cursor = conn.cursor()
         try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT Department_name FROM Department ORDER BY Department_ID")
-            return [row[0] for row in cursor.fetchall()]
-        except Exception as e:
-            messagebox.showerror("خطأ", f"فشل تحميل الأقسام: {str(e)}")
-            return ["الرياضيات", "الحاسب علوم", "فيزياءوعلوم الحاسب"]
-        finally:
-            conn.close()
+            self.begin_placement(conn, cursor)
+            cursor.execute("SELECT Course_ID, Lecturer_ID, Levels_ID, Group_Type, Group_Number FROM Groups WHERE Group_ID = ?",
+                           (group_id,))
+            row = cursor.fetchone()
+            if row is None:
+                raise ValueError("المجموعة غير موجودة في قاعدة البيانات")
+            course_id, lecturer_id, level_id, group_type, group_number = row
+
+            department_ids = []
+            if shared and group_type == 'lecture':
+                cursor.execute("SELECT Department_ID FROM Course_Department WHERE Course_ID = ? ORDER BY Department_ID",
+                               (course_id,))
+                department_ids = [r[0] for r in cursor.fetchall()]
+            department_ids = department_ids or [department_id]
+            departments = ','.join('?' * len(department_ids))
+
+            if since is not None and self.schema_version >= 3:
+                known_ids = list(known_ids)
+                known = f"AND ch.Schedule_ID NOT IN ({','.join('?' * len(known_ids))})" if known_ids else ""
+                cursor.execute(self.STALE_VIEW_SQL.format(known=known, departments=departments), (
+                    since, *known_ids, group_id, day, location_id, lecturer_id, level_id, *department_ids))
+                stale = cursor.fetchall()
+                if stale:
+                    conn.rollback()
+                    return stale
+
+            cursor.execute(self.PLACEMENT_CONFLICTS_SQL.format(departments=departments), (
+                lecturer_id, day, start, end,
+                location_id, day, start, end, group_type, course_id, lecturer_id,
+                level_id, *department_ids, day, start, end, group_type, group_number))
+            conflicts = cursor.fetchall()
+            if conflicts:
+                conn.rollback()
+                return conflicts
+
+            inserted = [self.insert_schedule(cursor, (dept_id, group_id, location_id, day, start, end))
+                        for dept_id in department_ids]
+            cursor.execute(f"""
+                SELECT 'inserted', s.Schedule_ID, s.Department_ID, d.Department_name, NULL, NULL,
+                       s.day, s.start_time, s.end_time
+                FROM Schedule s JOIN Department d ON s.Department_ID = d.Department_ID
+                WHERE s.Schedule_ID IN ({','.join('?' * len(inserted))})
+                ORDER BY s.Department_ID
+            """, inserted)
+            rows = cursor.fetchall()
+            conn.commit()
+            return rows
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def placement_procedure_sql(self):
+        """نفس place_schedule كإجراء مخزن --> رحلة واحدة للخادم"""
+        procedure = """
+            CREATE PROCEDURE usp_Place_Schedule
+                @Group_ID INT, @Department_ID INT, @Location_ID INT,
+                @day NVARCHAR(20), @start_time INT, @end_time INT, @Shared BIT,
+                @Since BIGINT = NULL, @Known_IDs NVARCHAR(MAX) = NULL
+            AS
+            BEGIN
+                SET NOCOUNT ON;
+                SET XACT_ABORT ON;
+                -- pyodbc بدون autocommit يفتح معاملة ضمنية قبل EXEC: نعمل داخلها بنقطة حفظ
+                -- (ROLLBACK كامل هنا يصفر @@TRANCOUNT --> الخطأ 266 بدل نتيجة التعارض)
+                DECLARE @Own_Transaction BIT = CASE WHEN @@TRANCOUNT = 0 THEN 1 ELSE 0 END;
+                IF @Own_Transaction = 1
+                    BEGIN TRANSACTION;
+                ELSE
+                    SAVE TRANSACTION Place_Schedule;
+                EXEC sp_getapplock @Resource = 'Schedule_Placement', @LockMode = 'Exclusive',
+                     @LockOwner = 'Transaction', @LockTimeout = 10000;
+
+                DECLARE @Course_ID INT, @Lecturer_ID INT, @Levels_ID INT, @Group_Type NVARCHAR(20), @Group_Number INT;
+                SELECT @Course_ID = Course_ID, @Lecturer_ID = Lecturer_ID, @Levels_ID = Levels_ID,
+                       @Group_Type = Group_Type, @Group_Number = Group_Number
+                FROM Groups WHERE Group_ID = @Group_ID;
+
+                DECLARE @Departments TABLE (Department_ID INT PRIMARY KEY);
+                IF @Shared = 1 AND @Group_Type = 'lecture'
+                    INSERT INTO @Departments SELECT Department_ID FROM Course_Department WHERE Course_ID = @Course_ID;
+                IF NOT EXISTS (SELECT 1 FROM @Departments)
+                    INSERT INTO @Departments VALUES (@Department_ID);
+
+                IF @Since IS NOT NULL
+                BEGIN
+                    DECLARE @Stale TABLE (Schedule_ID INT PRIMARY KEY);
+                    INSERT INTO @Stale
+                    SELECT DISTINCT s.Schedule_ID
+                    FROM Schedule_Changes ch
+                    JOIN Schedule s ON ch.Schedule_ID = s.Schedule_ID
+                    JOIN Groups g ON s.Group_ID = g.Group_ID
+                    WHERE ch.Change_ID > @Since
+                    AND (@Known_IDs IS NULL OR ch.Schedule_ID NOT IN (
+                         SELECT CAST(value AS INT) FROM STRING_SPLIT(@Known_IDs, ',')))
+                    AND (s.Group_ID = @Group_ID OR (s.day = @day AND (
+                         s.Location_ID = @Location_ID OR g.Lecturer_ID = @Lecturer_ID
+                         OR (g.Levels_ID = @Levels_ID AND s.Department_ID IN (SELECT Department_ID FROM @Departments)))));
+
+                    IF EXISTS (SELECT 1 FROM @Stale)
+                    BEGIN
+                        IF @Own_Transaction = 1 ROLLBACK TRANSACTION; ELSE ROLLBACK TRANSACTION Place_Schedule;
+                        SELECT 'stale', s.Schedule_ID, s.Department_ID, d.Department_name, c.Course_name, l.Location_name,
+                               s.day, s.start_time, s.end_time
+                        FROM @Stale x
+                        JOIN Schedule s ON x.Schedule_ID = s.Schedule_ID
+                        JOIN Groups g ON s.Group_ID = g.Group_ID
+                        JOIN Courses c ON g.Course_ID = c.Course_ID
+                        JOIN Location l ON s.Location_ID = l.Location_ID
+                        JOIN Department d ON s.Department_ID = d.Department_ID;
+                        RETURN;
+                    END
+                END
+
+                DECLARE @Conflicts TABLE (Kind VARCHAR(10), Schedule_ID INT);
+                INSERT INTO @Conflicts
+                SELECT 'lecturer', s.Schedule_ID
+                FROM Schedule s JOIN Groups g ON s.Group_ID = g.Group_ID
+                WHERE g.Lecturer_ID = @Lecturer_ID AND s.day = @day
+                AND NOT (s.end_time <= @start_time OR s.start_time >= @end_time)
+                UNION ALL
+                SELECT 'room', s.Schedule_ID
+                FROM Schedule s JOIN Groups g ON s.Group_ID = g.Group_ID
+                WHERE s.Location_ID = @Location_ID AND s.day = @day
+                AND NOT (s.end_time <= @start_time OR s.start_time >= @end_time)
+                AND NOT (@Group_Type = 'lecture' AND g.Group_Type = 'lecture'
+                         AND g.Course_ID = @Course_ID AND g.Lecturer_ID = @Lecturer_ID)
+                UNION ALL
+                SELECT 'cohort', s.Schedule_ID
+                FROM Schedule s JOIN Groups g ON s.Group_ID = g.Group_ID
+                WHERE g.Levels_ID = @Levels_ID AND s.Department_ID IN (SELECT Department_ID FROM @Departments)
+                AND s.day = @day AND NOT (s.end_time <= @start_time OR s.start_time >= @end_time)
+                AND (g.Group_Type = 'lecture' OR @Group_Type = 'lecture' OR g.Group_Number = @Group_Number);
+
+                IF EXISTS (SELECT 1 FROM @Conflicts)
+                BEGIN
+                    IF @Own_Transaction = 1 ROLLBACK TRANSACTION; ELSE ROLLBACK TRANSACTION Place_Schedule;
+                    SELECT x.Kind, s.Schedule_ID, s.Department_ID, d.Department_name, c.Course_name, l.Location_name,
+                           s.day, s.start_time, s.end_time
+                    FROM @Conflicts x
+                    JOIN Schedule s ON x.Schedule_ID = s.Schedule_ID
+                    JOIN Groups g ON s.Group_ID = g.Group_ID
+                    JOIN Courses c ON g.Course_ID = c.Course_ID
+                    JOIN Location l ON s.Location_ID = l.Location_ID
+                    JOIN Department d ON s.Department_ID = d.Department_ID;
+                    RETURN;
+                END
+
+                DECLARE @Inserted TABLE (Schedule_ID INT, Department_ID INT);
+                INSERT INTO Schedule (Department_ID, Group_ID, Location_ID, day, start_time, end_time)
+                OUTPUT INSERTED.Schedule_ID, INSERTED.Department_ID INTO @Inserted
+                SELECT Department_ID, @Group_ID, @Location_ID, @day, @start_time, @end_time FROM @Departments;
+                -- داخل معاملة المستدعي: الحفظ والقفل يُحرران عند commit من بايثون
+                IF @Own_Transaction = 1
+                    COMMIT TRANSACTION;
+
+                SELECT 'inserted', i.Schedule_ID, i.Department_ID, d.Department_name, NULL, NULL,
+                       @day, @start_time, @end_time
+                FROM @Inserted i JOIN Department d ON i.Department_ID = d.Department_ID
+                ORDER BY i.Department_ID;
+            END
+        """
+        # يُعاد إنشاؤه كاملاً عند تغيير توقيعه (migration جديدة تستدعي نفس الدالة)
+        return [
+            "IF OBJECT_ID('usp_Place_Schedule') IS NOT NULL DROP PROCEDURE usp_Place_Schedule",
+            "EXEC('" + procedure.replace("'", "''") + "')"
+        ]
 
-    def load_instructors_from_db(self):
-        conn = self.connect_db()
-        if not conn:
-            return ['هبة', 'رجب']
-        
-        try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT F_name + ' ' + L_name AS Full_name FROM Lecturer ORDER BY Lecturer_ID")
-            return [row[0] for row in cursor.fetchall()]
-        except Exception as e:
-            messagebox.showerror("خطأ", f"فشل تحميل المحاضرين: {str(e)}")
-            return ['هبة', 'رجب']
-        finally:
-            conn.close()
+    def full_name(self, alias=None):
+        prefix = f"{alias}." if alias else ""
+        if self.has_full_name_column:
+            return f"{prefix}Full_name"
+        return f"{prefix}F_name + ' ' + {prefix}L_name"
 
-    def load_subjects_from_db(self):
-        """تحميل المواد من قاعدة البيانات"""
-        conn = self.connect_db()
-        if not conn:
-            return ['عربي', 'انجليزي', 'فيزياء', 'كيمياء']
-        
-        try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT Course_name FROM Courses ORDER BY Course_ID")
-            return [row[0] for row in cursor.fetchall()]
-        except Exception as e:
-            messagebox.showerror("خطأ", f"فشل تحميل المواد: {str(e)}")
-            return ['عربي', 'انجليزي', 'فيزياء', 'كيمياء']
-        finally:
-            conn.close()
+    def string_agg(self, expr, separator):
+        return f"STRING_AGG({expr}, '{separator}')"
 
-    def setup_ui(self):
-        
-        # Setup use interface
+    def isnull(self, expr, default):
+        return f"ISNULL({expr}, {default})"
 
-        top_frame = tk.LabelFrame(
-            self,
-            text=" اضافة مجموعة",
-            padx=10,
-            pady=10,
-            labelanchor='ne',
-            bg="white",  # Background color
-            bd=2,  # Border width
-            relief=tk.SOLID,  # Border style
-            fg="black",
-            font=('Arial', 15)
-        )
-        top_frame.pack(fill="both", padx=20, pady=10, side="right")
-        
-        # Create a canvas and scrollbar
-        canvas = tk.Canvas(top_frame, bg="white", highlightthickness=0)
-        scrollbar = ttk.Scrollbar(top_frame, orient=tk.VERTICAL, command=canvas.yview)
-    
-        # Pack scrollbar first so it doesn't move
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        canvas.configure(yscrollcommand=scrollbar.set)
-    
-        # Create an inner frame to hold all widgets
-        inner_frame = tk.Frame(canvas, bg="white")
-        canvas.create_window((0, 0), window=inner_frame, anchor="nw")
-        
-        def configure_scrollregion(event):
-            canvas.itemconfig("all", width=event.width)
-            canvas.configure(scrollregion=canvas.bbox("all"))
-        
-        
-        canvas.bind("<Configure>", configure_scrollregion)
-        inner_frame.bind("<Configure>", configure_scrollregion)
-    
-        # Department container - now in inner_frame instead of top_frame
-        self.dept_container = tk.Frame(inner_frame, bg="white")
-        self.dept_container.pack(fill=tk.X, padx=5, pady=5, anchor='e')
+    def table_exists_query(self):
+        return "SELECT COUNT(*) FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_NAME = ?"
 
-        # Department Row
-        self.dept_comboboxes = []
-        self.add_dept_row()
+    def is_duplicate_error(self, error):
+        return False
 
-        # Add more than one department
-        self.add_dept_btn = ttk.Button(inner_frame, text="إضافة قسم",command=lambda: [self.add_dept_row(), canvas.configure(scrollregion=canvas.bbox("all"))])
-        # self.add_dept_btn = ttk.Button(inner_frame, text="إضافة قسم", command=self.add_dept_row)
-        self.add_dept_btn.pack(pady=(0, 5), padx=5, anchor='e')
+    def executemany(self, cursor, query, rows):
+        """إرسال كل الصفوف كمصفوفة معاملات واحدة"""
+        if rows:
+            cursor.executemany(query, rows)
 
-        # Year
-        year_frame = tk.Frame(inner_frame, bg="white")
-        year_frame.pack(fill=tk.X, pady=5)
-        tk.Label(year_frame, text=": المستوي", font=('Arial Unicode MS', 12, 'bold'), bg="white").pack(side=tk.RIGHT, padx=5)
-        self.year_combobox = ttk.Combobox(year_frame, values=self.year_levels, width=32, state="readonly", style="Custom.TCombobox")
-        self.year_combobox.pack(side=tk.RIGHT, fill=tk.X, expand=False, padx=10)
 
-        # Subject
-        subject_frame = tk.Frame(inner_frame, bg="white")
-        subject_frame.pack(fill=tk.X, pady=5)
-        tk.Label(subject_frame, text=": المادة", font=('Arial Unicode MS', 12, 'bold'), bg="white").pack(side=tk.RIGHT, padx=5)
-        self.subject_entry = ttk.Combobox(subject_frame, values=self.subjects, justify='right', width=32, state="readonly", style="Custom.TCombobox")
-        self.subject_entry.pack(side=tk.RIGHT, fill=tk.X, expand=False, padx=25, pady=10)
-    
-        # lecturer
-        lecturer_frame = tk.Frame(inner_frame, bg="white")
-        lecturer_frame.pack(fill=tk.X, pady=5)
-        tk.Label(
-            lecturer_frame, 
-            text=": المحاضر",
-            bg="white",
-            fg="black",
-            font=('Arial', 12, 'bold')
-        ).pack(side=tk.RIGHT, padx=5)
-        self.instructor_entry = ttk.Combobox(lecturer_frame, justify='right', values=self.instructors, width=32, state='readonly', style="Custom.TCombobox")
-        self.instructor_entry.pack(side=tk.RIGHT, fill=tk.X, expand=False, padx=15, pady=15)
-    
-        # Hours input
-        self.setup_hours_inputs(inner_frame)
-        
-        
+class SqlServerBackend(StorageBackend):
+    """SQL Server through pyodbc (الإعداد الأصلي للبرنامج)"""
+    name = 'sqlserver'
 
+    def __init__(self, server='.', database='project'):
+        self.server = server
+        self.database = database
 
-       # combobox style
-        style = ttk.Style()
-        style.theme_use('clam')
-        style.configure("Custom.TCombobox",
-                    padding=5)  
-        
+    def key(self):
+        return (self.name, self.server, self.database)
 
-        # Adding groups control buttons
-        btn_frame = tk.Frame(inner_frame,bg="white")
-        btn_frame.pack(pady=5, anchor='e')
+    def describe(self):
+        return f"SQL Server: {self.server}/{self.database}"
 
-        self.add_group_btn = ttk.Button(btn_frame, text="إضافة مجموعة", command=self.add_group)
-        self.add_group_btn.pack(side=tk.RIGHT, padx=5)
-        
-        groups_frame = tk.LabelFrame(
-            self,
-            text=" المجموعات الموجودة",
-            bg="white",
-            fg="black",
-            bd=2,
-            relief="solid",
-            labelanchor="ne",
-            padx=10, 
-            pady=10,
-            font=('Arial', 15)
+    def connect(self):
+        if pyodbc is None:
+            raise RuntimeError("مكتبة pyodbc غير مثبتة، استخدم SQLite أو قم بتثبيت: pip install pyodbc")
+        return pyodbc.connect(
+            f'DRIVER={{SQL Server}};SERVER={self.server};'
+            f'DATABASE={self.database};Trusted_Connection=yes;'
         )
-        groups_frame.pack(pady=20, padx=20, fill="both", expand=True)
 
-        # Search bar
-        search_frame = tk.Frame(groups_frame , bg="white")
-        search_frame.pack(fill=tk.X, padx=5, pady=5)
+    def is_duplicate_error(self, error):
+        return '2627' in str(error)
 
-        tk.Label(search_frame, text=": بحث", bg="white").pack(side=tk.RIGHT, padx=5)
-        self.group_search_entry = ttk.Entry(search_frame, justify='right')
-        self.group_search_entry.pack(side=tk.RIGHT, padx=5, fill=tk.X, expand=True)
-        self.group_search_entry.bind("<KeyRelease>", self.filter_group_list)
+    def place_schedule(self, conn, group_id, department_id, location_id, day, start, end, shared=False,
+                       since=None, known_ids=()):
+        if self.schema_version < 6:
+            # الإصدارات الأقدم من الإجراء تعمل ROLLBACK كامل داخل معاملة pyodbc (الخطأ 266)
+            return super().place_schedule(conn, group_id, department_id, location_id, day, start, end, shared,
+                                          since, known_ids)
+        cursor = conn.cursor()
+        try:
+            cursor.execute("EXEC usp_Place_Schedule ?, ?, ?, ?, ?, ?, ?, ?, ?",
+                           (group_id, department_id, location_id, day, start, end, 1 if shared else 0,
+                            since, ','.join(str(i) for i in known_ids) or None))
+            rows = cursor.fetchall()
+            conn.commit()
+            return rows
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def executemany(self, cursor, query, rows):
+        # fast_executemany يرسل المصفوفة كلها في رحلة واحدة بدلاً من رحلة لكل صف
+        if rows:
+            cursor.fast_executemany = True
+            cursor.executemany(query, rows)
+
+
+class SqliteBackend(StorageBackend):
+    """Embedded single-file database with the same schema (للتثبيت على جهاز واحد وللاختبار)"""
+    name = 'sqlite'
+
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS Levels (
+            Levels_ID INTEGER PRIMARY KEY,
+            Levels_name TEXT NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS Department (
+            Department_ID INTEGER PRIMARY KEY,
+            Department_name TEXT NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS Lecturer (
+            Lecturer_ID INTEGER PRIMARY KEY,
+            F_name TEXT NOT NULL,
+            L_name TEXT NOT NULL,
+            Department_ID INTEGER REFERENCES Department(Department_ID)
+        )""",
+        """CREATE TABLE IF NOT EXISTS Courses (
+            Course_ID INTEGER PRIMARY KEY,
+            Course_name TEXT NOT NULL,
+            code TEXT,
+            Lecture_hours INTEGER,
+            Levels_ID INTEGER REFERENCES Levels(Levels_ID),
+            Practical_hours INTEGER,
+            Exercise_hours INTEGER
+        )""",
+        """CREATE TABLE IF NOT EXISTS Location (
+            Location_ID INTEGER PRIMARY KEY,
+            Location_name TEXT NOT NULL,
+            capacity INTEGER
+        )""",
+        """CREATE TABLE IF NOT EXISTS Course_Department (
+            Course_ID INTEGER NOT NULL REFERENCES Courses(Course_ID),
+            Department_ID INTEGER NOT NULL REFERENCES Department(Department_ID),
+            PRIMARY KEY (Course_ID, Department_ID)
+        )""",
+        """CREATE TABLE IF NOT EXISTS Groups (
+            Group_ID INTEGER PRIMARY KEY AUTOINCREMENT,
+            Department_ID INTEGER REFERENCES Department(Department_ID),
+            Levels_ID INTEGER REFERENCES Levels(Levels_ID),
+            Course_ID INTEGER REFERENCES Courses(Course_ID),
+            Lecturer_ID INTEGER REFERENCES Lecturer(Lecturer_ID),
+            Theory_Hours INTEGER,
+            Practical_Hours INTEGER,
+            Practical_Groups_Count INTEGER,
+            Group_Number INTEGER,
+            Group_Type TEXT NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS Schedule (
+            Schedule_ID INTEGER PRIMARY KEY AUTOINCREMENT,
+            Department_ID INTEGER REFERENCES Department(Department_ID),
+            Group_ID INTEGER REFERENCES Groups(Group_ID),
+            Location_ID INTEGER REFERENCES Location(Location_ID),
+            day TEXT NOT NULL,
+            start_time INTEGER NOT NULL,
+            end_time INTEGER NOT NULL
+        )"""
+    ]
+
+    # المستويات لا تُدخل من صفحة إدارة البيانات
+    DEFAULT_LEVELS = [
+        (1, "المستوي الأول"),
+        (2, "المستوي الثاني"),
+        (3, "المستوي الثالث"),
+        (4, "المستوي الرابع")
+    ]
+
+    def __init__(self, path='timetable.db'):
+        self.path = path
+
+    def key(self):
+        return (self.name, os.path.abspath(self.path))
+
+    def describe(self):
+        return f"SQLite: {self.path}"
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    def create_schema(self, conn):
+        cursor = conn.cursor()
+        for statement in self.SCHEMA:
+            cursor.execute(statement)
+        cursor.execute("SELECT COUNT(*) FROM Levels")
+        if cursor.fetchone()[0] == 0:
+            cursor.executemany("INSERT INTO Levels (Levels_ID, Levels_name) VALUES (?, ?)", self.DEFAULT_LEVELS)
+        conn.commit()
+
+    def has_column(self, cursor, table, column):
+        cursor.execute("SELECT COUNT(*) FROM pragma_table_xinfo(?) WHERE name = ?", (table, column))
+        return cursor.fetchone()[0] > 0
+
+    def schema_version_table_sql(self):
+        return """
+            CREATE TABLE IF NOT EXISTS Schema_Version (
+                Version INTEGER PRIMARY KEY,
+                Description TEXT,
+                Applied_At TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        """
 
-        # groups list
-        list_container = ttk.Frame(groups_frame)
-        list_container.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+    def create_index_sql(self, name, table, columns, include=()):
+        # SQLite لا يدعم INCLUDE --> الأعمدة الإضافية تدخل في المفتاح لتبقى الفهرسة مغطية
+        return f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(tuple(columns) + tuple(include))})"
+
+    def full_name_column_sql(self):
+        return "ALTER TABLE Lecturer ADD COLUMN Full_name TEXT GENERATED ALWAYS AS (F_name || ' ' || L_name) VIRTUAL"
+
+    def change_tracking_sql(self):
+        return [
+            """CREATE TABLE IF NOT EXISTS Schedule_Changes (
+                Change_ID INTEGER PRIMARY KEY AUTOINCREMENT,
+                Schedule_ID INTEGER NOT NULL,
+                Operation TEXT NOT NULL,
+                Changed_At TEXT DEFAULT CURRENT_TIMESTAMP
+            )""",
+            """CREATE TRIGGER IF NOT EXISTS TR_Schedule_Changes_Insert AFTER INSERT ON Schedule BEGIN
+                INSERT INTO Schedule_Changes (Schedule_ID, Operation) VALUES (NEW.Schedule_ID, 'I');
+            END""",
+            """CREATE TRIGGER IF NOT EXISTS TR_Schedule_Changes_Update AFTER UPDATE ON Schedule BEGIN
+                INSERT INTO Schedule_Changes (Schedule_ID, Operation) VALUES (NEW.Schedule_ID, 'U');
+            END""",
+            """CREATE TRIGGER IF NOT EXISTS TR_Schedule_Changes_Delete AFTER DELETE ON Schedule BEGIN
+                INSERT INTO Schedule_Changes (Schedule_ID, Operation) VALUES (OLD.Schedule_ID, 'D');
+            END""",
+        ]
 
-        scrollbar = ttk.Scrollbar(list_container, orient=tk.VERTICAL)
-        scrollbar.pack(side=tk.LEFT, fill=tk.Y)
+    def full_name(self, alias=None):
+        prefix = f"{alias}." if alias else ""
+        if self.has_full_name_column:
+            return f"{prefix}Full_name"
+        return f"{prefix}F_name || ' ' || {prefix}L_name"
 
-        self.group_listbox = tk.Listbox(
-            list_container, 
-            yscrollcommand=scrollbar.set,
-            font=("Traditional Arabic", 14),
-            justify='right',
-            
-        )
-        self.group_listbox.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
-        
-        scrollbar.config(command=self.group_listbox.yview)
+    def string_agg(self, expr, separator):
+        return f"GROUP_CONCAT({expr}, '{separator}')"
 
-        # delete button
-        btn_frame = tk.Frame(groups_frame,bg="white")
-        btn_frame.pack(pady=5, anchor='e')
+    def isnull(self, expr, default):
+        return f"IFNULL({expr}, {default})"
 
-        delete_btn = ttk.Button(btn_frame, text="حذف المحدد", command=self.delete_group_with_warning)
-        delete_btn.pack(side=tk.RIGHT, padx=5)
-        
-        # Return to main page button 
-        back_button = ttk.Button(
-            self, 
-            text="العودة للرئيسية", 
-            command=self.return_callback,
-            style='Rounded.TButton'
-        )
-        back_button.pack(pady=20)
-        
+    def table_exists_query(self):
+        return "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = ?"
 
+    def is_duplicate_error(self, error):
+        return isinstance(error, sqlite3.IntegrityError) and 'UNIQUE' in str(error)
 
-    def delete_group_with_warning(self):
-        """عرض تحذير قبل الحذف"""
-        selected = self.group_listbox.curselection()
-        if not selected:
-            messagebox.showerror("خطأ", "الرجاء تحديد مجموعة للحذف!")
-            return
-        
-        index = selected[0]
-        if index >= len(self.groups):
-            return
-        
-        group_to_delete = self.groups[index]
-        
-        # عرض تحذير عام أولاً
-        warning_msg = "سيتم حذف هذه المجموعة من قاعدة البيانات وجميع الجداول المرتبطة بها!\n"
-        warning_msg += f"المادة: {group_to_delete['subject']}\n"
-        warning_msg += f"المحاضر: {group_to_delete['instructor']}\n"
-        warning_msg += f"النوع: {'نظرية' if group_to_delete['Group_Type'] == 'lecture' else 'عملي'}"
-        
-        if group_to_delete['Group_Type'] == 'practical':
-            warning_msg += f" (المجموعة {group_to_delete.get('group_number', 1)})"
-        
-        if messagebox.askyesno("تحذير مهم", warning_msg + "\n\nهل تريد الاستمرار في الحذف؟"):
-            self.delete_group()
-            
-    def setup_hours_inputs(self, parent_frame):
-        # spinbox style
-        style = ttk.Style()
-        style.theme_use('clam')
+    def begin_placement(self, conn, cursor):
+        # IMMEDIATE يأخذ قفل الكتابة من البداية --> لا يمر حجز آخر بين الفحص والإدراج
+        if conn.in_transaction:
+            conn.rollback()
+        cursor.execute("BEGIN IMMEDIATE")
 
-        style.configure("Large.TSpinbox", 
-                    padding=4,
-                    arrowsize=15,
-                    bordercolor="gray",  # Add border for better visibility
-                    relief="solid",      # Border style
-                    font=('Arial', 10)) # Ensures consistent text size
+    def insert_schedule(self, cursor, values):
+        cursor.execute("""
+            INSERT INTO Schedule (Department_ID, Group_ID, Location_ID, day, start_time, end_time)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, values)
+        return cursor.lastrowid
 
-        hours_frame = tk.Frame(parent_frame, bg="white")
-        hours_frame.pack(fill=tk.X, pady=5)
+    def placement_procedure_sql(self):
+        return []  # لا إجراءات مخزنة في SQLite --> place_schedule العامة
 
-        # theory hours
-        theory_frame = tk.Frame(hours_frame, bg="white")
-        theory_frame.pack(side=tk.RIGHT, padx=5)
-        tk.Label(theory_frame, text=" ساعات النظري", font=('Arial Unicode MS', 11, 'bold'), bg="white").pack(side=tk.RIGHT)
-        self.theory_hours = ttk.Spinbox(theory_frame, from_=1, to=10, width=5, style="Large.TSpinbox")
-        self.theory_hours.set(1)
-        self.theory_hours.pack(side=tk.RIGHT, padx=5)
-
-        # practical hours
-        practical_frame = tk.Frame(hours_frame, bg="white")
-        practical_frame.pack(side=tk.RIGHT, padx=5)
-        tk.Label(practical_frame, text=" ساعات العملي", font=('Arial Unicode MS', 11, 'bold'), bg="white").pack(side=tk.RIGHT)
-        self.practical_hours = ttk.Spinbox(practical_frame, from_=0, to=4, width=5, style="Large.TSpinbox")
-        self.practical_hours.set(0)
-        self.practical_hours.pack(side=tk.RIGHT)
-
-        # تم إزالة حقل عدد المجموعات العام (practical_groups_count) لأنه لم يعد مستخدمًا
-        # حيث تم استبداله بعدد مجموعات لكل قسم في dept_groups_count_spinboxes
 
-        # ربط الأحداث
-        self.practical_hours.bind("<KeyRelease>", self.toggle_practical_fields)
-        self.practical_hours.bind("<ButtonRelease>", self.toggle_practical_fields)
+def make_backend(settings):
+    """إنشاء الـ backend المناسب من إعدادات config.ini"""
+    if settings.get('backend') == 'sqlite':
+        return SqliteBackend(settings.get('sqlite_path') or 'timetable.db')
+    return SqlServerBackend(settings.get('server', '.'), settings.get('database', 'project'))
 
-    def toggle_practical_fields(self, event=None):
-        # التحقق من وجود الحاويات
-        if not hasattr(self, 'practical_groups_count_container') or not hasattr(self, 'practical_instructor_container'):
-            return
 
-        # إخفاء الحاويات القديمة
-        self.practical_groups_count_container.pack_forget()
-        for widget in self.practical_groups_count_container.winfo_children():
-            widget.destroy()
-        
-        self.practical_instructor_container.pack_forget()
-        for widget in self.practical_instructor_container.winfo_children():
-            widget.destroy()
+def db_backend():
+    """الـ backend الحالي (لبناء أجزاء SQL الخاصة بكل نوع قاعدة بيانات)"""
+    return ConnectionPool().backend
 
-        try:
-            practical_hours = int(self.practical_hours.get())
-            if practical_hours > 0:
-                current_instructors = self.load_instructors_from_db()
-                
-                # إنشاء واجهة عدد المجموعات لكل قسم
-                tk.Label(
-                    self.practical_groups_count_container,
-                    text="عدد المجموعات العملي لكل قسم:",
-                    bg="white",
-                    font=('Arial Unicode MS', 11, 'bold')
-                ).pack(anchor='e', padx=5, pady=5)
-                
-                groups_count_frame = tk.Frame(self.practical_groups_count_container, bg="white")
-                groups_count_frame.pack(fill=tk.X, padx=5, pady=5, anchor='e')
-                
-                self.dept_groups_count_spinboxes = {}
-                
-                for dept_cb in self.dept_comboboxes:
-                    dept = dept_cb.get()
-                    if not dept:
-                        continue
-                    
-                    dept_frame = tk.Frame(groups_count_frame, bg="white")
-                    dept_frame.pack(fill=tk.X, pady=2, anchor='e')
-                    
-                    tk.Label(dept_frame, text=f"{dept}:", bg="white").pack(side=tk.RIGHT, padx=5)
-                    spinbox = ttk.Spinbox(dept_frame, from_=1, to=20, width=5, style="Large.TSpinbox")
-                    spinbox.set(1)
-                    spinbox.pack(side=tk.RIGHT, padx=5)
-                    self.dept_groups_count_spinboxes[dept] = spinbox
-                
-                self.practical_groups_count_container.pack(fill=tk.X, pady=5)
-                
-                for spinbox in self.dept_groups_count_spinboxes.values():
-                    spinbox.bind("<KeyRelease>", lambda e: self.update_practical_instructors_ui(current_instructors))
-                    spinbox.bind("<ButtonRelease>", lambda e: self.update_practical_instructors_ui(current_instructors))
-                
-                self.update_practical_instructors_ui(current_instructors)
-        
-        except ValueError:
-            self.practical_groups_count_container.pack_forget()
-            self.practical_instructor_container.pack_forget()
 
-    # دالة جديدة: تحديث واجهة محاضري العملي
-    def update_practical_instructors_ui(self, instructors_list):
-        for widget in self.practical_instructor_container.winfo_children():
-            widget.destroy()
-        
-        for dept, spinbox in self.dept_groups_count_spinboxes.items():
-            try:
-                groups_count = int(spinbox.get())
-            except ValueError:
-                groups_count = 1
-            
-            dept_frame = tk.LabelFrame(
-                self.practical_instructor_container,
-                text=f"محاضر العملي - {dept}",
-                padx=5,
-                pady=5,
-                bg="white", 
-                fg="black",
-                bd=2,
-                relief="solid",
-                labelanchor="ne", 
-                font=('Arial', 10)
-            )
-            dept_frame.pack(fill=tk.X, pady=5, padx=5, anchor='e')
-            
-            for group_num in range(1, groups_count + 1):
-                group_frame = tk.Frame(dept_frame, bg="white")
-                group_frame.pack(fill=tk.X, pady=2)
-                
-                tk.Label(group_frame, text=f"محاضر المجموعة {group_num}:", bg="white").pack(side=tk.RIGHT, padx=5)
-                entry = ttk.Combobox(group_frame, values=instructors_list, state="readonly", width=32, style="Custom.TCombobox")
-                entry.pack(side=tk.RIGHT, fill=tk.X, expand=True, padx=5)
-        
-        self.practical_instructor_container.pack(fill=tk.X, pady=5)
+# schema migrations
+def migrate_full_name_column(backend, cursor):
+    if not backend.has_column(cursor, 'Lecturer', 'Full_name'):
+        cursor.execute(backend.full_name_column_sql())
+    cursor.execute(backend.create_index_sql('IX_Lecturer_Full_name', 'Lecturer', ['Full_name']))
 
-    def get_practical_instructors(self):
-        practical_instructors = {}
-        try:
-            if int(self.practical_hours.get()) > 0:
-                # لكل قسم في dept_groups_count_spinboxes
-                for dept, spinbox in self.dept_groups_count_spinboxes.items():
-                    try:
-                        groups_count = int(spinbox.get())
-                    except ValueError:
-                        groups_count = 1
-                    
-                    practical_instructors[dept] = []
-                    
-                    # البحث عن إطار القسم المناسب
-                    found = False
-                    for dept_frame in self.practical_instructor_container.winfo_children():
-                        if isinstance(dept_frame, tk.LabelFrame) and dept_frame.cget('text').endswith(dept):
-                            found = True
-                            entry_frames = [child for child in dept_frame.winfo_children() if isinstance(child, tk.Frame)]
-                            
-                            for group_num in range(groups_count):
-                                if group_num < len(entry_frames):
-                                    entry = entry_frames[group_num].winfo_children()[1]  # حقل Combobox
-                                    instructor = entry.get().strip()
-                                    if not instructor: 
-                                        raise ValueError(f"يجب إدخال محاضر العملي للمجموعة {group_num+1} في قسم {dept}")
-                                    
-                                    if instructor not in self.instructors:
-                                        raise ValueError(f"المحاضر {instructor} غير موجود في قائمة المحاضرين")
-                                        
-                                    practical_instructors[dept].append(instructor)
-                                else:
-                                    practical_instructors[dept].append("")
-                            break
-                    
-                    if not found:
-                        raise ValueError(f"لم يتم العثور على واجهة المحاضرين للقسم {dept}")
-        
-        except (ValueError, IndexError) as e:
-            raise ValueError(str(e))
-        
-        return practical_instructors
 
-    # def add_group(self):
-    #     """إضافة مجموعة جديدة مع الربط الصحيح بين المادة والأقسام"""
-    #     try:
-    #         selected_depts = [cb.get() for cb in self.dept_comboboxes if cb.get()]
-    #         if not selected_depts:
-    #             raise ValueError("يجب اختيار قسم واحد على الأقل")
+# الفهارس التي تحتاجها استعلامات التعارضات والعرض والحذف
+HOT_QUERY_INDEXES = [
+    # is_place_reserved / save_schedule: المكان + اليوم + مدى الوقت
+    ('IX_Schedule_Location_Slot', 'Schedule', ['Location_ID', 'day', 'start_time', 'end_time'], ['Group_ID']),
+    # الحذف وNOT EXISTS في filter_groups
+    ('IX_Schedule_Group', 'Schedule', ['Group_ID', 'Department_ID'], []),
+    # جداول الأقسام
+    ('IX_Schedule_Department', 'Schedule', ['Department_ID', 'day', 'start_time'], ['Group_ID', 'Location_ID']),
+    # تعارضات المحاضر
+    ('IX_Groups_Lecturer', 'Groups', ['Lecturer_ID'], ['Group_ID']),
+    # المجموعات العملية للمادة والمستوى
+    ('IX_Groups_Course_Level_Type', 'Groups', ['Course_ID', 'Levels_ID', 'Group_Type'], ['Group_ID']),
+    # filter_groups وجداول الأقسام
+    ('IX_Groups_Department_Level', 'Groups', ['Department_ID', 'Levels_ID'], ['Group_ID']),
+]
 
-    #         year_level = self.year_combobox.get()
-    #         instructor = self.instructor_entry.get().strip()
-    #         subject = self.subject_entry.get().strip()
-    #         theory_hours = int(self.theory_hours.get())
-    #         practical_hours = int(self.practical_hours.get())
-    #         practical_groups_count = int(self.practical_groups_count.get()) if practical_hours > 0 else 1
 
-    #         if not all([year_level, instructor, subject]):
-    #             raise ValueError("جميع الحقول المميزة بعلامة (*) مطلوبة")
+def migrate_hot_query_indexes(backend, cursor):
+    for name, table, columns, include in HOT_QUERY_INDEXES:
+        cursor.execute(backend.create_index_sql(name, table, columns, include))
 
-    #         self.validate_group_uniqueness(selected_depts, year_level, subject, theory_hours, practical_hours)
 
-    #         practical_instructors = self.get_practical_instructors() if practical_hours > 0 else {}
+def migrate_schedule_change_tracking(backend, cursor):
+    for statement in backend.change_tracking_sql():
+        cursor.execute(statement)
 
-    #         conn = self.connect_db()
-    #         if not conn:
-    #             raise ValueError("فشل الاتصال بقاعدة البيانات")
 
-    #         cursor = conn.cursor()
+def migrate_placement_procedure(backend, cursor):
+    for statement in backend.placement_procedure_sql():
+        cursor.execute(statement)
 
-    #         try:
-    #             cursor.execute("SELECT Course_ID FROM Courses WHERE Course_name=?", (subject,))
-    #             course_id = cursor.fetchone()[0]
 
-    #             cursor.execute("SELECT Lecturer_ID FROM Lecturer WHERE F_name + ' ' + L_name=?", (instructor,))
-    #             lecturer_id = cursor.fetchone()[0]
+# (version, description, step) --> لا تعدل migration بعد نشرها، أضف واحدة جديدة
+MIGRATIONS = [
+    (1, "Lecturer.Full_name computed + indexed", migrate_full_name_column),
+    (2, "Indexes for conflict checks, schedule views and deletes", migrate_hot_query_indexes),
+    (3, "Schedule_Changes log for delta sync", migrate_schedule_change_tracking),
+    (4, "usp_Place_Schedule atomic check-and-insert", migrate_placement_procedure),
+    (5, "usp_Place_Schedule rejects placements made from a stale view", migrate_placement_procedure),
+    (6, "usp_Place_Schedule uses a savepoint inside the caller's transaction", migrate_placement_procedure),
+]
 
-    #             cursor.execute("SELECT Levels_ID FROM Levels WHERE Levels_name=?", (year_level,))
-    #             level_id = cursor.fetchone()[0]
+# فشلها لا يوقف الباقي (لا تعتمد عليها migration أخرى)؛ لا تُسجل فتُعاد محاولتها في التشغيل التالي.
+# Full_name يحتاج صلاحية ALTER --> بدونه full_name() تستخدم F_name + ' ' + L_name
+OPTIONAL_MIGRATIONS = {1}
 
-    #             cursor.execute("""
-    #                 INSERT INTO Groups (
-    #                     Department_ID, Levels_ID, Course_ID, Lecturer_ID,
-    #                     Theory_Hours, Practical_Hours, Practical_Groups_Count, Group_Type
-    #                 ) VALUES (?, ?, ?, ?, ?, ?, ?, 'lecture')
-    #             """, (self.get_department_id(selected_depts[0]), level_id, course_id, lecturer_id,
-    #                 theory_hours, practical_hours, practical_groups_count))
 
-    #             for dept_name in selected_depts:
-    #                 dept_id = self.get_department_id(dept_name)
-                    
-    #                 cursor.execute("""
-    #                     SELECT 1 FROM Course_Department 
-    #                     WHERE Course_ID = ? AND Department_ID = ?
-    #                 """, (course_id, dept_id))
-                    
-    #                 if not cursor.fetchone():
-    #                     cursor.execute("""
-    #                         INSERT INTO Course_Department (Course_ID, Department_ID) 
-    #                         VALUES (?, ?)
-    #                     """, (course_id, dept_id))
+class SchemaMigrator:
+    """Applies MIGRATIONS in order and records each one in Schema_Version"""
+    def __init__(self, backend):
+        self.backend = backend
 
-    #             if practical_hours > 0:
-    #                 for dept_name, instructors in practical_instructors.items():
-    #                     dept_id = self.get_department_id(dept_name)
-    #                     for group_num, instructor_name in enumerate(instructors, 1):
-    #                         cursor.execute("""
-    #                             INSERT INTO Groups (
-    #                                 Department_ID, Levels_ID, Course_ID, Lecturer_ID,
-    #                                 Theory_Hours, Practical_Hours, Group_Number, Group_Type
-    #                             ) VALUES (?, ?, ?, ?, 0, ?, ?, 'practical')
-    #                         """, (dept_id, level_id, course_id, 
-    #                             self.get_lecturer_id(instructor_name),
-    #                             practical_hours, group_num))
+    def applied_versions(self, cursor):
+        cursor.execute(self.backend.schema_version_table_sql())
+        cursor.execute("SELECT Version FROM Schema_Version")
+        return {row[0] for row in cursor.fetchall()}
 
-    #             conn.commit()
+    def migrate(self, conn, target_version=None):
+        """يطبق الـ migrations الناقصة فقط؛ تشغيله أكثر من مرة لا يغير شيئاً
 
-    #             self.update_ui_after_add(
-    #                 selected_depts, year_level, instructor, subject,
-    #                 theory_hours, practical_hours, practical_instructors,
-    #                 practical_groups_count
-    #             )
+        كل migration في معاملة مستقلة. فشل migration اختيارية (OPTIONAL_MIGRATIONS) يُسجل في QueryStats
+        ويكمل الباقي؛ فشل غيرها يوقف ما بعدها (قد تعتمد عليها) ويُرفع للمستدعي.
+        """
+        cursor = conn.cursor()
+        done = self.applied_versions(cursor)
+        conn.commit()
+        self.backend.schema_version = max(done, default=0)
+        applied = []
+        try:
+            for number, description, step in MIGRATIONS:
+                if number in done or (target_version is not None and number > target_version):
+                    continue
+                try:
+                    step(self.backend, cursor)
+                    cursor.execute("INSERT INTO Schema_Version (Version, Description) VALUES (?, ?)", (number, description))
+                    conn.commit()
+                except DB_ERRORS as e:
+                    conn.rollback()
+                    if number not in OPTIONAL_MIGRATIONS:
+                        raise
+                    QueryStats().warning("Schema migration %d (%s) skipped: %s", number, description, e)
+                    continue
+                done.add(number)
+                applied.append(number)
+                self.backend.schema_version = max(done)
+        finally:
+            self.backend.has_full_name_column = self.backend.has_column(cursor, 'Lecturer', 'Full_name')
+        return applied
 
-    #             messagebox.showinfo("نجاح", "تمت إضافة المجموعة وربطها بالأقسام بنجاح")
 
-    #         except pyodbc.Error as e:
-    #             conn.rollback()
-    #             raise ValueError(f"خطأ في قاعدة البيانات: {str(e)}")
-    #         finally:
-    #             conn.close()
+# query timing
+class QueryStats:
+    """Times every statement run through the pool, per page, with a rotating slow-query log"""
+    _instance = None
+    PAGES = ('GroupsCreation', 'SchedulePlacerPage', 'DataEntryPage', 'StudyTablesPage')
 
-    #     except ValueError as e:
-    #         messagebox.showerror("خطأ", str(e))
-    #     except Exception as e:
-    #         messagebox.showerror("خطأ غير متوقع", f"حدث خطأ: {str(e)}")
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._setup()
+        return cls._instance
 
-    def add_group(self):
-        """إضافة مجموعة جديدة مع الربط الصحيح بين المادة والأقسام"""
+    def _setup(self):
+        self.enabled = True
+        self.slow_ms = 200
+        self.log_path = None
+        self.logger = logging.getLogger('timetable.slow_queries')
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self._lock = threading.Lock()
+        self.totals = {}  # (page, method, sql) -> [count, total_s, max_s, rows]
+        self.warnings = []  # آخر المشاكل غير القاتلة (تظهر في نافذة الإحصائيات)
+        self.context = threading.local()  # الصفحة صاحبة العمل الجاري في خيط الخلفية
+
+    def configure(self, slow_ms=None, log_path=None, max_bytes=1_000_000, backups=3):
+        if slow_ms is not None:
+            self.slow_ms = slow_ms
+        if log_path and log_path != self.log_path:
+            for handler in list(self.logger.handlers):
+                self.logger.removeHandler(handler)
+                handler.close()
+            try:
+                handler = RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8')
+            except OSError as e:
+                self.warning("Cannot open slow query log %s: %s", log_path, e)
+                return
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            self.logger.addHandler(handler)
+            self.log_path = log_path
+
+    @staticmethod
+    def caller():
+        """(الصفحة, الدالة) لأول إطار خارج طبقة قاعدة البيانات"""
+        frame = sys._getframe(2)
+        method = None
+        while frame is not None:
+            owner = frame.f_locals.get('self')
+            name = type(owner).__name__ if owner is not None else None
+            if name not in ('TimedCursor', 'PooledConnection', 'ConnectionPool', 'QueryStats') \
+                    and not isinstance(owner, StorageBackend):
+                if method is None and not (name == 'Database' and frame.f_code.co_name in ('fetchall', 'fetchone')):
+                    method = f"{name}.{frame.f_code.co_name}" if name else frame.f_code.co_name
+                if name in QueryStats.PAGES:
+                    return name, method
+            frame = frame.f_back
+        return getattr(QueryStats().context, 'page', None) or 'other', method or '?'
+
+    def record(self, sql, params, elapsed, rows, page, method):
+        sql = ' '.join(sql.split())
+        with self._lock:
+            entry = self.totals.setdefault((page, method, sql), [0, 0.0, 0.0, 0])
+            entry[0] += 1
+            entry[1] += elapsed
+            entry[2] = max(entry[2], elapsed)
+            entry[3] += max(rows, 0)
+        if elapsed * 1000 >= self.slow_ms and self.logger.handlers:
+            self.logger.info("%.1fms rows=%d %s/%s | %s | params=%r",
+                             elapsed * 1000, rows, page, method, sql, params)
+
+    def warning(self, message, *args):
+        """مشكلة لا توقف البرنامج (migration فشلت، خطأ في الخلفية): سجل الاستعلامات + نافذة الإحصائيات"""
+        text = message % args if args else message
+        with self._lock:
+            self.warnings = (self.warnings + [f"{datetime.datetime.now():%H:%M:%S} {text}"])[-50:]
+        self.logger.warning(text)
+
+    def top(self, page=None, limit=10):
+        """أعلى الاستعلامات حسب الوقت الكلي: [(page, method, sql, count, total, max, rows)]"""
+        with self._lock:
+            items = [(k[0], k[1], k[2], *v) for k, v in self.totals.items() if page is None or k[0] == page]
+        return sorted(items, key=lambda item: item[4], reverse=True)[:limit]
+
+    def summary_text(self, limit=5):
+        lines = []
+        with self._lock:
+            warnings = list(self.warnings)
+        if warnings:
+            lines.append("== تحذيرات ==")
+            lines.extend(warnings)
+            lines.append("")
+        for page in self.PAGES + ('other',):
+            top = self.top(page, limit)
+            if not top:
+                continue
+            lines.append(f"== {page} ==")
+            for _, method, sql, count, total, worst, rows in top:
+                lines.append(f"{total * 1000:9.1f}ms  x{count:<4} max {worst * 1000:.1f}ms  rows {rows}  {method}")
+                lines.append(f"    {sql[:150]}")
+            lines.append("")
+        return "\n".join(lines) or "لا توجد استعلامات مسجلة بعد"
+
+    def reset(self):
+        with self._lock:
+            self.totals.clear()
+
+
+class TimedCursor:
+    """Cursor wrapper: times execute + fetch of each statement and reports it to QueryStats"""
+    def __init__(self, raw):
+        object.__setattr__(self, '_raw', raw)
+        object.__setattr__(self, '_current', None)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __setattr__(self, name, value):
+        # fast_executemany وغيرها تُضبط على الـ cursor الحقيقي
+        setattr(self._raw, name, value)
+
+    def __iter__(self):
+        for row in self._raw:
+            self._add_rows(1)
+            yield row
+
+    def _start(self, sql, params):
+        self.finish()
+        page, method = QueryStats.caller()
+        object.__setattr__(self, '_current', [sql, params, 0.0, 0, page, method])
+
+    def _timed(self, func, *args):
+        started = time.perf_counter()
         try:
-            selected_depts = [cb.get() for cb in self.dept_comboboxes if cb.get()]
-            if not selected_depts:
-                raise ValueError("يجب اختيار قسم واحد على الأقل")
+            return func(*args)
+        finally:
+            if self._current is not None:
+                self._current[2] += time.perf_counter() - started
+
+    def _add_rows(self, count):
+        if self._current is not None:
+            self._current[3] += count
+
+    def execute(self, sql, *params):
+        self._start(sql, params[0] if len(params) == 1 else params)
+        self._timed(self._raw.execute, sql, *params)
+        if self._raw.rowcount is not None and self._raw.rowcount > 0:
+            self._add_rows(self._raw.rowcount)
+        return self
+
+    def executemany(self, sql, rows):
+        rows = list(rows)
+        self._start(sql, f"<{len(rows)} rows>")
+        self._timed(self._raw.executemany, sql, rows)
+        self._add_rows(len(rows))
+        return self
+
+    def fetchone(self):
+        row = self._timed(self._raw.fetchone)
+        if row is not None:
+            self._add_rows(1)
+        return row
+
+    def fetchall(self):
+        rows = self._timed(self._raw.fetchall)
+        self._add_rows(len(rows))
+        self.finish()
+        return rows
+
+    def fetchmany(self, *size):
+        rows = self._timed(self._raw.fetchmany, *size)
+        self._add_rows(len(rows))
+        return rows
+
+    def finish(self):
+        current = self._current
+        if current is not None:
+            object.__setattr__(self, '_current', None)
+            QueryStats().record(*current)
+
+    def close(self):
+        self.finish()
+        self._raw.close()
+
+
+# connection pool
+class PooledConnection:
+    """Handle for a pooled connection; close() gives it back to the pool instead of closing it"""
+    def __init__(self, pool, raw, generation):
+        self._pool = pool
+        self._raw = raw
+        self._generation = generation
+        self._released = False
+        self._cursors = []
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def cursor(self):
+        cursor = self._raw.cursor()
+        if not QueryStats().enabled:
+            return cursor
+        cursor = TimedCursor(cursor)
+        self._cursors.append(cursor)
+        return cursor
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        for cursor in self._cursors:
+            cursor.finish()
+        self._cursors = []
+        self._pool.release(self._raw, self._generation)
 
-            year_level = self.year_combobox.get()
-            instructor = self.instructor_entry.get().strip()
-            subject = self.subject_entry.get().strip()
-            theory_hours = int(self.theory_hours.get())
-            practical_hours = int(self.practical_hours.get())
+    def __del__(self):
+        # نسيان close() لا يجب أن يستهلك مكاناً في المجمع للأبد
+        try:
+            self.close()
+        except Exception:
+            pass
 
-            if not all([year_level, instructor, subject]):
-                raise ValueError("جميع الحقول المميزة بعلامة (*) مطلوبة")
 
-            self.validate_group_uniqueness(selected_depts, year_level, subject, theory_hours, practical_hours)
+class ConnectionPool:
+    """Process-wide bounded pool of database connections shared by every page"""
+    _instance = None
 
-            # احصل على عدد المجموعات لكل قسم من الواجهة الجديدة
-            dept_groups_count = {}
-            if practical_hours > 0:
-                for dept, spinbox in self.dept_groups_count_spinboxes.items():
-                    try:
-                        groups_count = int(spinbox.get())
-                        dept_groups_count[dept] = groups_count
-                    except ValueError:
-                        raise ValueError(f"عدد المجموعات غير صالح للقسم {dept}")
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._setup()
+        return cls._instance
 
-            practical_instructors = self.get_practical_instructors() if practical_hours > 0 else {}
+    def _setup(self):
+        self.backend = SqlServerBackend()
+        self.max_size = 5
+        self.acquire_timeout = 15     # ثواني الانتظار عند امتلاء المجمع
+        self.ping_after = 30          # فحص الاتصال إذا ظل خاملاً أكثر من ذلك
+        self._idle = []               # [(connection, last_used)]
+        self._in_use = 0
+        self._generation = 0
+        self.configured = False
+        self._cond = threading.Condition(threading.RLock())
+        self.stats = {
+            'checkouts': 0,   # كل طلب اتصال
+            'waits': 0,       # طلبات انتظرت لامتلاء المجمع
+            'wait_time': 0.0,
+            'created': 0,     # اتصالات جديدة فعلية بالسيرفر
+            'discarded': 0,   # اتصالات تالفة أو قديمة تم إغلاقها
+            'reconnects': 0   # مرات تغيير إعدادات السيرفر
+        }
 
-            conn = self.connect_db()
-            if not conn:
-                raise ValueError("فشل الاتصال بقاعدة البيانات")
+    def configure(self, backend, max_size=None):
+        """تغيير إعدادات الاتصال؛ الاتصالات القديمة تُغلق ولا تُعاد للمجمع"""
+        with self._cond:
+            self.configured = True
+            if max_size:
+                self.max_size = max_size
+            if backend.key() == self.backend.key():
+                return
+            self.backend = backend
+            self._generation += 1
+            self.stats['reconnects'] += 1
+            self._discard_idle()
+            self._cond.notify_all()
+
+    def acquire(self):
+        """Check out a connection, waiting up to acquire_timeout when the pool is exhausted"""
+        with self._cond:
+            self.stats['checkouts'] += 1
+            wait_start = None
+            while not self._idle and self._in_use >= self.max_size:
+                if wait_start is None:
+                    wait_start = time.monotonic()
+                    self.stats['waits'] += 1
+                remaining = self.acquire_timeout - (time.monotonic() - wait_start)
+                if remaining <= 0:
+                    self.stats['wait_time'] += time.monotonic() - wait_start
+                    raise TimeoutError("جميع اتصالات قاعدة البيانات مشغولة، حاول مرة أخرى")
+                self._cond.wait(remaining)
+            if wait_start is not None:
+                self.stats['wait_time'] += time.monotonic() - wait_start
+
+            raw, last_used = self._idle.pop() if self._idle else (None, None)
+            self._in_use += 1
+            generation = self._generation
+            backend = self.backend
+
+        # الاتصال والفحص خارج القفل حتى لا يتعطل باقي المستخدمين
+        try:
+            if raw is not None and time.monotonic() - last_used >= self.ping_after:
+                if not self._is_alive(raw):
+                    self._close_quietly(raw)
+                    raw = None
+            if raw is None:
+                raw = backend.connect()
+                try:
+                    backend.prepare(raw)
+                except Exception:
+                    raw.close()
+                    raise
+                with self._cond:
+                    self.stats['created'] += 1
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return PooledConnection(self, raw, generation)
+
+    def release(self, raw, generation):
+        healthy = True
+        try:
+            # إنهاء أي معاملة مفتوحة قبل إعادة استخدام الاتصال
+            raw.rollback()
+        except Exception:
+            healthy = False
+
+        with self._cond:
+            self._in_use -= 1
+            if healthy and generation == self._generation and len(self._idle) < self.max_size:
+                self._idle.append((raw, time.monotonic()))
+                raw = None
+            self._cond.notify()
+        if raw is not None:
+            self._close_quietly(raw)
+
+    def close_all(self):
+        with self._cond:
+            self._generation += 1
+            self._discard_idle()
+
+    def _discard_idle(self):
+        for raw, _ in self._idle:
+            self._close_quietly(raw)
+        self._idle = []
+
+    def _is_alive(self, raw):
+        try:
+            cursor = raw.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except Exception:
+            return False
 
-            cursor = conn.cursor()
+    def _close_quietly(self, raw):
+        with self._cond:
+            self.stats['discarded'] += 1
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def stats_text(self):
+        with self._cond:
+            s = dict(self.stats)
+            in_use, idle = self._in_use, len(self._idle)
+        return (f"{self.backend.describe()} (إصدار المخطط: {self.backend.schema_version})\n"
+                f"طلبات الاتصال: {s['checkouts']} | اتصالات جديدة: {s['created']} | "
+                f"انتظار: {s['waits']} ({s['wait_time']:.2f} ث)\n"
+                f"مستخدمة الآن: {in_use} | خاملة: {idle} | الحد الأقصى: {self.max_size}")
+
+# background data service
+class DataRequest:
+    """Handle for work submitted to the DataService"""
+    def __init__(self, owner, on_success, on_error, timeout):
+        self.owner = owner
+        self.on_success = on_success
+        self.on_error = on_error
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.future = None
+        self.cancelled = False
+        self.done = False
+
+    def cancel(self):
+        self.cancelled = True
+        if self.future is not None:
+            self.future.cancel()
+
+
+class DataService:
+    """Runs database work on worker threads; callbacks always come back on the Tk thread"""
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._setup()
+        return cls._instance
+
+    def _setup(self):
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="db-worker")
+        self.default_timeout = 30     # ثواني
+        self.poll_interval = 50       # ms
+        self._results = queue.Queue() # يُملأ من خيوط العمل فقط
+        self._pending = []            # يُستخدم من خيط الواجهة فقط
+        self._root = None
+        self._polling = False
+
+    def submit(self, owner, work, on_success, on_error, timeout=None):
+        request = DataRequest(owner, on_success, on_error, timeout or self.default_timeout)
+        request.future = self.executor.submit(self._run, request, work)
+        self._pending.append(request)
+        self._root = owner.winfo_toplevel()
+        if not self._polling:
+            self._polling = True
+            self._root.after(self.poll_interval, self._poll)
+        return request
+
+    def _run(self, request, work):
+        # خيط العمل: لا يلمس أي عنصر Tk
+        if request.cancelled:
+            return
+        context = QueryStats().context
+        context.page = type(request.owner).__name__
+        try:
+            self._results.put((request, work(), None))
+        except Exception as e:
+            self._results.put((request, None, e))
+        finally:
+            context.page = None
 
+    def _poll(self):
+        while True:
             try:
-                # الحصول على معرفات المواد والمحاضرين والمستويات
-                cursor.execute("SELECT Course_ID FROM Courses WHERE Course_name=?", (subject,))
-                course_id = cursor.fetchone()[0]
+                request, result, error = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._finish(request, result, error)
 
-                cursor.execute("SELECT Lecturer_ID FROM Lecturer WHERE F_name + ' ' + L_name=?", (instructor,))
-                lecturer_id = cursor.fetchone()[0]
+        now = time.monotonic()
+        for request in list(self._pending):
+            if request.deadline is not None and now > request.deadline:
+                request.cancel()
+                self._finish(request, None, TimeoutError("لم يرد السيرفر في الوقت المحدد"), force=True)
+        self._pending = [request for request in self._pending if not request.cancelled]
 
-                cursor.execute("SELECT Levels_ID FROM Levels WHERE Levels_name=?", (year_level,))
-                level_id = cursor.fetchone()[0]
+        if self._pending:
+            self._root.after(self.poll_interval, self._poll)
+        else:
+            self._polling = False
 
-                # إضافة المجموعة النظرية (لا يوجد عدد مجموعات في هذه النسخة)
-                cursor.execute("""
-                    INSERT INTO Groups (
-                        Department_ID, Levels_ID, Course_ID, Lecturer_ID,
-                        Theory_Hours, Practical_Hours, Group_Type
-                    ) VALUES (?, ?, ?, ?, ?, ?, 'lecture')
-                """, (self.get_department_id(selected_depts[0]), level_id, course_id, lecturer_id,
-                    theory_hours, practical_hours))
-
-                # ربط المادة بالأقسام المختارة
-                for dept_name in selected_depts:
-                    dept_id = self.get_department_id(dept_name)
-                    
-                    # التحقق من وجود الربط مسبقاً
-                    cursor.execute("""
-                        SELECT 1 FROM Course_Department 
-                        WHERE Course_ID = ? AND Department_ID = ?
-                    """, (course_id, dept_id))
-                    
-                    if not cursor.fetchone():
-                        cursor.execute("""
-                            INSERT INTO Course_Department (Course_ID, Department_ID) 
-                            VALUES (?, ?)
-                        """, (course_id, dept_id))
-
-                # إضافة المجموعات العملية لكل قسم
-                if practical_hours > 0:
-                    for dept_name, instructors in practical_instructors.items():
-                        dept_id = self.get_department_id(dept_name)
-                        groups_count = dept_groups_count.get(dept_name, 1)
-                        
-                        # التأكد من تطابق عدد المحاضرين مع عدد المجموعات
-                        if len(instructors) != groups_count:
-                            raise ValueError(f"عدد المحاضرين لا يتطابق مع عدد المجموعات للقسم {dept_name}")
-                        
-                        for group_num, instructor_name in enumerate(instructors, 1):
-                            cursor.execute("""
-                                INSERT INTO Groups (
-                                    Department_ID, Levels_ID, Course_ID, Lecturer_ID,
-                                    Theory_Hours, Practical_Hours, Group_Number, Group_Type
-                                ) VALUES (?, ?, ?, ?, 0, ?, ?, 'practical')
-                            """, (dept_id, level_id, course_id, 
-                                self.get_lecturer_id(instructor_name),
-                                practical_hours, group_num))
-
-                conn.commit()
-
-                # تحديث واجهة المستخدم بعد الإضافة
-                self.update_ui_after_add(
-                    selected_depts, year_level, instructor, subject,
-                    theory_hours, practical_hours, practical_instructors,
-                    dept_groups_count
-                )
+    def _finish(self, request, result, error, force=False):
+        if request.done or (request.cancelled and not force):
+            return
+        request.done = True
+        if request in self._pending:
+            self._pending.remove(request)
+        try:
+            if error is None:
+                request.on_success(result)
+            else:
+                request.on_error(error)
+        except Exception as e:
+            QueryStats().warning("Background callback of %s failed: %r", type(request.owner).__name__, e)
+            messagebox.showerror("خطأ", f"حدث خطأ غير متوقع أثناء عرض البيانات:\n{str(e)}")
 
-                messagebox.showinfo("نجاح", "تمت إضافة المجموعة وربطها بالأقسام بنجاح")
+    def cancel_owner(self, owner):
+        for request in list(self._pending):
+            if request.owner is owner:
+                request.cancel()
+                self._pending.remove(request)
 
-            except pyodbc.Error as e:
-                conn.rollback()
-                raise ValueError(f"خطأ في قاعدة البيانات: {str(e)}")
-            finally:
-                conn.close()
+    def shutdown(self):
+        for request in self._pending:
+            request.cancel()
+        self._pending = []
+        self.executor.shutdown(wait=False, cancel_futures=True)
 
-        except ValueError as e:
-            messagebox.showerror("خطأ", str(e))
-        except Exception as e:
-            messagebox.showerror("خطأ غير متوقع", f"حدث خطأ: {str(e)}")
 
-    # def get_department_id(self, dept_name):
-    #     conn = self.connect_db()
-    #     try:
-    #         cursor = conn.cursor()
-    #         cursor.execute("SELECT Department_ID FROM Department WHERE Department_name=?", (dept_name,))
-    #         result = cursor.fetchone()
-    #         if result:
-    #             return result[0]
-    #         else:
-    #             raise ValueError(f"القسم {dept_name} غير موجود في قاعدة البيانات")
-    #     finally:
-    #         conn.close()
+# reference data cache
+class ReferenceCache:
+    """In-memory copy of the small lookup tables; DataEntryPage invalidates it after writes"""
+    _instance = None
 
-    def get_department_id(self, department_name):
-        try:
-            db = Database()
-            query = "SELECT Department_ID FROM Department WHERE Department_name = ?"
-            db.cursor.execute(query, (department_name,))
-            result = db.cursor.fetchone()
-            return result[0] if result else None
-        except Exception as e:
-            messagebox.showerror("خطأ", f"حدث خطأ في جلب معرف القسم: {str(e)}")
-            return None
-        finally:
-            db.connection.close()
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._setup()
+        return cls._instance
 
-    def get_lecturer_id(self, lecturer_name):
-        conn = self.connect_db()
+    def _setup(self):
+        self._lock = threading.RLock()
+        self._tables = {}   # table -> {'rows', 'by_name', 'by_id'}
+        self._backend_key = None
+        self.version = 0    # يزيد مع كل invalidate
+        self.loads = 0
+
+    @staticmethod
+    def columns(table):
+        """(id, name, extra...) لكل جدول مرجعي"""
+        return {
+            'Levels': ('Levels_ID', 'Levels_name'),
+            'Department': ('Department_ID', 'Department_name'),
+            'Lecturer': ('Lecturer_ID', db_backend().full_name()),
+            'Courses': ('Course_ID', 'Course_name'),
+            'Location': ('Location_ID', 'Location_name', db_backend().isnull('capacity', 0)),
+        }[table]
+
+    def _load(self, table):
+        columns = self.columns(table)
+        conn = ConnectionPool().acquire()
         try:
             cursor = conn.cursor()
-            cursor.execute("SELECT Lecturer_ID FROM Lecturer WHERE F_name + ' ' + L_name=?", (lecturer_name,))
-            result = cursor.fetchone()
-            if result:
-                return result[0]
-            else:
-                raise ValueError(f"المحاضر {lecturer_name} غير موجود في قاعدة البيانات")
+            cursor.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY {columns[0]}")
+            rows = [tuple(row) for row in cursor.fetchall()]
         finally:
             conn.close()
+        self.loads += 1
+        return {
+            'rows': rows,
+            'by_name': {str(row[1]).strip(): row[0] for row in rows},
+            'by_id': {row[0]: row[1] for row in rows},
+        }
 
-    def validate_group_uniqueness(self, selected_depts, year_level, subject, theory_hours, practical_hours):
-        conn = self.connect_db()
-        cursor = conn.cursor()
-        
-        for dept in selected_depts:
-            cursor.execute("""
-                SELECT 1 FROM Groups g
-                JOIN Department d ON g.Department_ID = d.Department_ID
-                JOIN Levels l ON g.Levels_ID = l.Levels_ID
-                JOIN Courses c ON g.Course_ID = c.Course_ID
-                WHERE l.Levels_name = ?
-                AND c.Course_name = ?
-                AND d.Department_name = ?
-                AND g.Group_Type = 'lecture'
-            """, (year_level, subject, dept))
-            
-            if cursor.fetchone():
-                conn.close()
-                raise ValueError(f"المادة {subject} مضافه بالفعل للقسم {dept} والمستوى {year_level}")
-        
-        conn.close()
+    def _get(self, table):
+        with self._lock:
+            backend_key = db_backend().key()
+            if backend_key != self._backend_key:
+                # تم تغيير السيرفر من الإعدادات
+                self._tables = {}
+                self._backend_key = backend_key
+            if table not in self._tables:
+                self._tables[table] = self._load(table)
+            return self._tables[table]
+
+    def rows(self, table):
+        """[(id, name, ...)] مرتبة بالـ ID"""
+        return list(self._get(table)['rows'])
+
+    def names(self, table):
+        return [row[1] for row in self._get(table)['rows']]
+
+    def id_of(self, table, name):
+        if name is None:
+            return None
+        return self._get(table)['by_name'].get(str(name).strip())
 
-    def update_groups_list(self, new_groups):
-        """طريقة مركزية لتحديث قائمة المجموعات"""
-        self.groups = new_groups
-        self.refresh_group_list()
-        self.data_manager.groups_data = self.groups
+    def name_of(self, table, record_id):
+        return self._get(table)['by_id'].get(record_id)
 
-    def update_ui_after_add(self, departments, year_level, instructor, subject,
-                        theory_hours, practical_hours, practical_instructors,
-                        practical_groups_count):
-        lecture_group = {
-            'departments': departments,
-            'year_level': year_level,
-            'instructor': instructor,
-            'subject': subject,
-            'theory_hours': theory_hours,
-            'practical_hours': practical_hours,
-            'practical_instructors': practical_instructors,
-            'Group_Type': 'lecture',
-            'duration': theory_hours,
-            'practical_groups_count': practical_groups_count
-        }
-        
-        self.groups.append(lecture_group)
-        
-        if practical_hours > 0:
-            for dept, instructors in practical_instructors.items():
-                for group_num, instructor in enumerate(instructors, start=1):
-                    practical_group = {
-                        'departments': [dept],
-                        'year_level': year_level,
-                        'instructor': instructor,
-                        'subject': subject,
-                        'theory_hours': 0,
-                        'practical_hours': practical_hours,
-                        'practical_instructors': {},
-                        'Group_Type': 'practical',
-                        'duration': practical_hours,
-                        'group_number': group_num
-                    }
-                    self.groups.append(practical_group)
+    def invalidate(self, table=None):
+        with self._lock:
+            if table is None:
+                self._tables = {}
+            else:
+                self._tables.pop(table, None)
+            self.version += 1
 
-        self.refresh_group_list()
-        self.clear_input_fields()
 
-    # display the grous --> practical or theory
-    def format_group_display(self, group):
-        depts = "، ".join(group['departments'])
-        
-        if group['Group_Type'] == 'practical':
-            group_num = f" (المجموعة {group.get('group_number', 1)})" if 'group_number' in group else ""
-            return f"{depts} | {group['year_level']} | {group['subject']} | عملي{group_num} | {group['instructor']} | {group['practical_hours']}ساعة"
-        else:
-            return f"{depts} | {group['year_level']} | {group['subject']} | {group['instructor']} | {group['theory_hours']}ساعة"
-        
-    def validate_departments(self, selected_depts):
-        """التحقق من عدم تكرار الأقسام"""
-        if len(selected_depts) != len(set(selected_depts)):
-            raise ValueError("لا يمكن اختيار نفس القسم أكثر من مرة")
-        if not selected_depts:
-            raise ValueError("يجب اختيار قسم واحد على الأقل")
-        return True
+def resolve_group_ids(group):
+    """(course_id, level_id, lecturer_id) للمجموعة؛ الأسماء تُحل من الذاكرة مرة واحدة ثم تُحفظ في القاموس"""
+    cache = ReferenceCache()
+    if group.get('course_id') is None:
+        group['course_id'] = cache.id_of('Courses', group.get('subject'))
+    if group.get('level_id') is None:
+        group['level_id'] = cache.id_of('Levels', group.get('year_level'))
+    if group.get('lecturer_id') is None:
+        group['lecturer_id'] = cache.id_of('Lecturer', group.get('instructor'))
+    return group['course_id'], group['level_id'], group['lecturer_id']
 
-    def check_duplicate_departments(self, event=None):
-        try:
-            selected_depts = []
-            for cb in self.dept_comboboxes:
-                dept = cb.get()
-                if dept:
-                    selected_depts.append(dept)
-            
-            if len(selected_depts) != len(set(selected_depts)):
-                messagebox.showerror("خطأ", "لا يمكن اختيار نفس القسم أكثر من مرة")
-                # Reset the last changed combobox
-                if event:
-                    event.widget.set('')
-        except Exception:
-            pass  
-    
-    def clear_input_fields(self):
-        # Clear department selection (keep at least one row)
-        for widget in self.dept_container.winfo_children():
-            widget.destroy()
-        self.dept_comboboxes = []
-        self.add_dept_row()
-        
-        # Clear other fields
-        self.year_combobox.set('')
-        self.subject_entry.set('')
-        self.instructor_entry.set('')
-        self.theory_hours.set(1)
-        self.practical_hours.set(0)
-        # self.practical_groups_count.set(1)
-        self.toggle_practical_fields()
-        self.group_search_entry.delete(0, tk.END)
 
-    def filter_group_list(self, event=None):
-        search_term = self.group_search_entry.get().lower()
-        self.group_listbox.delete(0, tk.END)
-        
-        for group in self.groups:
-            display_text = self.format_group_display(group)
-            if search_term in display_text.lower():
-                self.group_listbox.insert(tk.END, display_text)
+ARABIC_DIACRITICS = re.compile('[\u064B-\u0652\u0670\u0640]')  # التشكيل والتطويل
+ARABIC_LETTER_MAP = str.maketrans({'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا', 'ة': 'ه', 'ى': 'ي'})
 
-    def refresh_group_list(self):
-        self.group_listbox.delete(0, tk.END)
-        for group in sorted(self.groups, key=lambda g: (g['departments'][0], g['year_level'], g['instructor'])):
-            self.group_listbox.insert(tk.END, self.format_group_display(group))
 
-    # add more than one department ---> row
-    def add_dept_row(self):
-        row_frame = tk.Frame(self.dept_container,bg="white")
-        row_frame.pack(fill=tk.X, pady=2, anchor='e')
-        
-        # Add "القسم" label before the combobox
-        tk.Label(row_frame, text=": القسم",font=('Arial Unicode MS', 11,'bold'),bg="white").pack(side=tk.RIGHT, padx=5)
-        
-        dept_combobox = ttk.Combobox(row_frame, values=self.departments, state="readonly",width=32,style="Custom.TCombobox")
-        dept_combobox.pack(side=tk.RIGHT, padx=5)
-        dept_combobox.bind("<<ComboboxSelected>>", self.check_duplicate_departments)
-        self.dept_comboboxes.append(dept_combobox)
-        
-        # Only show delete button for additional rows (not the first one)
-        if len(self.dept_comboboxes) > 1:
-            remove_btn = ttk.Button(row_frame, text="حذف", 
-                                 command=lambda: self.remove_depart_row(row_frame, dept_combobox))
-            remove_btn.pack(side=tk.RIGHT, padx=5)
+def normalize_arabic(text):
+    """توحيد الهمزات والتاء المربوطة والياء وحذف التشكيل --> "مُدرّس" و"مدرس" متطابقتان"""
+    return ARABIC_DIACRITICS.sub('', str(text)).translate(ARABIC_LETTER_MAP).lower()
 
-    def remove_depart_row(self, row_frame, combobox):
-        """Remove a department row"""
-        if len(self.dept_comboboxes) > 1:
-            row_frame.destroy()
-            self.dept_comboboxes.remove(combobox)
-            # Update practical instructors UI if needed
-            if int(self.practical_hours.get()) > 0:
-                self.toggle_practical_fields()
 
-    def load_groups_from_db(self):
-        """تحميل المجموعات من قاعدة البيانات مع الأقسام الإضافية"""
-        conn = self.connect_db()
-        if not conn:
-            messagebox.showerror("خطأ", "فشل الاتصال بقاعدة البيانات")
+class SearchIndex:
+    """فهرس كلمات مقلوب: كلمة --> مفاتيح السجلات، مع مطابقة البادئة وترتيب النتائج"""
+    def __init__(self):
+        self.postings = {}   # token -> set(keys)
+        self.docs = {}       # key -> (text, tokens, seq)
+        self._terms = None   # الكلمات مرتبة (تُبنى عند أول بحث بعد أي تعديل)
+        self._seq = 0
+
+    @staticmethod
+    def tokenize(text):
+        return re.findall(r'\w+', normalize_arabic(text))
+
+    def add(self, key, text):
+        if key in self.docs:
+            if self.docs[key][0] == text:
+                return
+            self.remove(key)
+        tokens = self.tokenize(text)
+        self._seq += 1
+        self.docs[key] = (text, tokens, self._seq)
+        for token in set(tokens):
+            if token not in self.postings:
+                self.postings[token] = set()
+                self._terms = None
+            self.postings[token].add(key)
+
+    def remove(self, key):
+        doc = self.docs.pop(key, None)
+        if doc is None:
             return
-            
-        try:
-            cursor = conn.cursor()
-            self.groups = [] 
-            
-            cursor.execute("""
-                SELECT 
-                    g.Group_ID, 
-                    c.Course_name, 
-                    l.Levels_name, 
-                    d.Department_name,
-                    lec.F_name + ' ' + lec.L_name AS Lecturer_Name,
-                    g.Theory_Hours, 
-                    g.Practical_Hours, 
-                    g.Group_Number,
-                    g.Group_Type,
-                    g.Practical_Groups_Count
-                FROM Groups g
-                JOIN Courses c ON g.Course_ID = c.Course_ID
-                JOIN Levels l ON g.Levels_ID = l.Levels_ID
-                JOIN Lecturer lec ON g.Lecturer_ID = lec.Lecturer_ID
-                JOIN Department d ON g.Department_ID = d.Department_ID
-                ORDER BY g.Group_Type, c.Course_name, l.Levels_name
-            """)
-            
-            all_groups = cursor.fetchall()
-            
-            for group in all_groups:
-                if group[8] == 'lecture':
-                    cursor.execute("""
-                        SELECT d.Department_name 
-                        FROM Course_Department cd
-                        JOIN Department d ON cd.Department_ID = d.Department_ID
-                        WHERE cd.Course_ID = (
-                            SELECT Course_ID FROM Courses WHERE Course_name = ?
-                        )
-                    """, (group[1],))
-                    departments = [row[0] for row in cursor.fetchall()]
-                else:
-                    departments = [group[3]]
-                
-                group_data = {
-                    'departments': departments,
-                    'year_level': group[2],
-                    'instructor': group[4],
-                    'subject': group[1],
-                    'theory_hours': group[5],
-                    'practical_hours': group[6],
-                    'Group_Type': group[8],
-                    'duration': group[5] if group[8] == 'lecture' else group[6],
-                    'group_number': group[7] if group[8] == 'practical' else None,
-                    'practical_groups_count': group[9] if group[8] == 'lecture' else None,
-                    'practical_instructors': {}
-                }
-                
-                if group[8] == 'lecture':
-                    cursor.execute("""
-                        SELECT d.Department_name, lec.F_name + ' ' + lec.L_name AS Instructor_Name
-                        FROM Groups g
-                        JOIN Lecturer lec ON g.Lecturer_ID = lec.Lecturer_ID
-                        JOIN Department d ON g.Department_ID = d.Department_ID
-                        WHERE g.Course_ID = (SELECT Course_ID FROM Courses WHERE Course_name=?)
-                        AND g.Levels_ID = (SELECT Levels_ID FROM Levels WHERE Levels_name=?)
-                        AND g.Group_Type = 'practical'
-                        ORDER BY g.Group_Number
-                    """, (group[1], group[2]))
-                    
-                    practical_instructors = {}
-                    for row in cursor.fetchall():
-                        dept = row[0]
-                        instructor = row[1]
-                        if dept not in practical_instructors:
-                            practical_instructors[dept] = []
-                        practical_instructors[dept].append(instructor)
-                    
-                    group_data['practical_instructors'] = practical_instructors
-                    
-                    self.groups.append(group_data)
+        for token in set(doc[1]):
+            keys = self.postings.get(token)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.postings[token]
+                    self._terms = None
+
+    def sync(self, items):
+        """مزامنة مع [(key, text)]: يُعاد فهرسة الجديد والمتغير فقط ويُحذف ما اختفى"""
+        items = dict(items)
+        for key in [k for k in self.docs if k not in items]:
+            self.remove(key)
+        for key, text in items.items():
+            self.add(key, text)
+
+    def clear(self):
+        self.__init__()
+
+    def prefix_terms(self, prefix):
+        if self._terms is None:
+            self._terms = sorted(self.postings)
+        start = bisect.bisect_left(self._terms, prefix)
+        end = bisect.bisect_left(self._terms, prefix + '\uffff')
+        return self._terms[start:end]
+
+    @staticmethod
+    def term_score(query_token, term):
+        return 3 if term == query_token else 1 + len(query_token) / len(term)
+
+    def scores_within(self, query_tokens, keys):
+        """نفس scores لكن بفحص كلمات السجلات keys فقط (تضييق نتائج سابقة بدل كل الفهرس)"""
+        result = {}
+        for key in keys:
+            doc = self.docs.get(key)
+            if doc is None:
+                continue
+            total = 0
+            for query_token in query_tokens:
+                best = max((self.term_score(query_token, term) for term in doc[1] if term.startswith(query_token)),
+                           default=0)
+                if not best:
+                    break
+                total += best
+            else:
+                result[key] = total
+        return result
+
+    def scores(self, query, keys=None):
+        """{key: score} للسجلات التي تطابق كل كلمات البحث (كلمة كاملة أعلى من بادئة)؛ keys --> هذه المفاتيح فقط"""
+        query_tokens = set(self.tokenize(query))
+        if not query_tokens:
+            return {}
+        if keys is not None:
+            result = self.scores_within(query_tokens, keys)
+        else:
+            result = None
+            for query_token in query_tokens:
+                token_scores = {}
+                for term in self.prefix_terms(query_token):
+                    score = self.term_score(query_token, term)
+                    for key in self.postings[term]:
+                        if score > token_scores.get(key, 0):
+                            token_scores[key] = score
+                if result is None:
+                    result = token_scores
                 else:
-                    self.groups.append(group_data)
-            
-            self.refresh_group_list()
-            self.data_manager.groups_data = self.groups
-            
-        except pyodbc.Error as e:
-            messagebox.showerror("خطأ في قاعدة البيانات", f"فشل تحميل المجموعات: {str(e)}")
-        finally:
-            conn.close()
-
-    def check_group_in_schedules(self, group):
-        """التحقق مما إذا كانت المجموعة موجودة في أي جدول"""
-        conn = self.connect_db()
-        if not conn:
-            return []
-        
-        try:
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT DISTINCT d.Department_name, lv.Levels_name
-                FROM schedule s
-                JOIN groups g ON s.group_id = g.group_id
-                JOIN department d ON g.Department_ID = d.Department_ID
-                JOIN levels lv ON g.Levels_ID = lv.Levels_ID
-                JOIN courses c ON g.Course_ID = c.Course_ID
-                JOIN lecturer lec ON g.Lecturer_ID = lec.Lecturer_ID
-                WHERE c.Course_name = ?
-                AND lv.Levels_name = ?
-                AND lec.F_name + ' ' + lec.L_name = ?
-                AND g.Group_Type = ?
-                AND (g.Group_Number = ? OR ? IS NULL)
-            """, (
-                group['subject'],
-                group['year_level'],
-                group['instructor'],
-                group['Group_Type'],
-                group.get('group_number'),
-                1 if group['Group_Type'] == 'lecture' else None
-            ))
-            
-            return cursor.fetchall()
-            
-        except pyodbc.Error as e:
-            messagebox.showerror("خطأ في قاعدة البيانات", f"فشل التحقق من الجداول: {str(e)}")
-            return []
-        finally:
-            conn.close()
-
-    def delete_group(self):
-        """حذف مجموعة مع حذف جميع علاقاتها في Course_Department"""
-        selected = self.group_listbox.curselection()
-        if not selected:
-            messagebox.showerror("خطأ", "الرجاء تحديد مجموعة للحذف!")
-            return
-
-        index = selected[0]
-        if index >= len(self.groups):
-            return
-
-        group_to_delete = self.groups[index]
-
-        # تأكيد الحذف
-        confirm_msg = f"هل أنت متأكد من حذف المجموعة التالية؟\n\n"
-        confirm_msg += f"المادة: {group_to_delete['subject']}\n"
-        confirm_msg += f"المستوى: {group_to_delete['year_level']}\n"
-        confirm_msg += f"الأقسام: {', '.join(group_to_delete['departments'])}"
-        
-        if not messagebox.askyesno("تأكيد الحذف", confirm_msg):
-            return
+                    result = {key: score + token_scores[key] for key, score in result.items() if key in token_scores}
+                if not result:
+                    return {}
+        if not result:
+            return {}
+        # بداية النص تطابق أول كلمة بحث --> أولوية
+        first = self.tokenize(query)[0]
+        for key in result:
+            tokens = self.docs[key][1]
+            if tokens and tokens[0].startswith(first):
+                result[key] += 1
+        return result
+
+    def search(self, query, limit=None):
+        """المفاتيح مرتبة بالأفضلية ثم بترتيب الإضافة"""
+        scores = self.scores(query)
+        keys = sorted(scores, key=lambda k: (-scores[k], self.docs[k][2]))
+        return keys[:limit] if limit else keys
+
+
+class IntervalIndex:
+    """فترات [start, end) لكل مفتاح في سلال بالساعة (ساعات الجدول أعداد صحيحة قليلة 8-19)
+
+    الإضافة والحذف بعدد ساعات الفترة، والتداخل يقرأ سلال ساعات الاستعلام فقط --> بدون مسح لكل الفترات
+    """
+    def __init__(self):
+        self.buckets = {}  # key -> ({id(item): (start, end, item)}, {hour: {id(item): item}})
+
+    @staticmethod
+    def _hours(start, end):
+        return range(int(start // 1), int(-(-end // 1)))
+
+    def add(self, key, start, end, item):
+        entries, hours = self.buckets.setdefault(key, ({}, {}))
+        entries[id(item)] = (start, end, item)
+        for hour in self._hours(start, end):
+            hours.setdefault(hour, {})[id(item)] = item
+
+    def remove(self, key, item):
+        bucket = self.buckets.get(key)
+        entry = bucket[0].pop(id(item), None) if bucket else None
+        if entry is None:
+            return False
+        hours = bucket[1]
+        for hour in self._hours(entry[0], entry[1]):
+            items = hours.get(hour)
+            if items is not None:
+                items.pop(id(item), None)
+                if not items:
+                    del hours[hour]
+        return True
 
-        conn = None
-        try:
-            conn = self.connect_db()
-            cursor = conn.cursor()
+    def overlaps(self, key, start, end):
+        bucket = self.buckets.get(key)
+        if not bucket:
+            return []
+        entries, hours = bucket
+        found = {}
+        for hour in self._hours(start, end):
+            found.update(hours.get(hour, {}))
+        return [item for item_id, item in found.items()
+                if entries[item_id][0] < end and entries[item_id][1] > start]
 
-            cursor.execute("SELECT Course_ID FROM Courses WHERE Course_name=?", (group_to_delete['subject'],))
-            course_id = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT Levels_ID FROM Levels WHERE Levels_name=?", (group_to_delete['year_level'],))
-            level_id = cursor.fetchone()[0]
+    def clear(self):
+        self.buckets = {}
 
-            cursor.execute("""
-                DELETE FROM Course_Department 
-                WHERE Course_ID = ?
-            """, (course_id,))
 
-            cursor.execute("""
-                DELETE FROM Schedule
-                WHERE Group_ID IN (
-                    SELECT Group_ID FROM Groups
-                    WHERE Course_ID = ? AND Levels_ID = ?
-                )
-            """, (course_id, level_id))
+class ScheduleIndex:
+    """فهارس المواعيد المحملة: (المكان، اليوم) و(المحاضر، اليوم) و(القسم، المستوى، اليوم) --> فحص التعارض بدون قاعدة البيانات"""
+    def __init__(self):
+        self.by_location = IntervalIndex()
+        self.by_lecturer = IntervalIndex()
+        self.by_cohort = IntervalIndex()
+
+    @staticmethod
+    def location_of(appt):
+        location_id = appt['group'].get('location_id')
+        if location_id is None:
+            location_id = ReferenceCache().id_of('Location', appt['place'])
+        return location_id
+
+    @staticmethod
+    def cohort_of(appt):
+        group = appt['group']
+        if group.get('dept_id') is None:
+            group['dept_id'] = ReferenceCache().id_of('Department', (group.get('departments') or [None])[0])
+        return group['dept_id'], resolve_group_ids(group)[1]
+
+    def rebuild(self, schedule_data):
+        self.by_location.clear()
+        self.by_lecturer.clear()
+        self.by_cohort.clear()
+        for info in schedule_data.values():
+            for day, appointments in info['schedule'].items():
+                for appt in appointments:
+                    self.add(day, appt)
+
+    def add(self, day, appt):
+        _, _, lecturer_id = resolve_group_ids(appt['group'])
+        self.by_location.add((self.location_of(appt), day), appt['start'], appt['end'], appt)
+        self.by_lecturer.add((lecturer_id, day), appt['start'], appt['end'], appt)
+        self.by_cohort.add(self.cohort_of(appt) + (day,), appt['start'], appt['end'], appt)
+
+    def remove(self, day, appt):
+        self.by_location.remove((self.location_of(appt), day), appt)
+        self.by_lecturer.remove((appt['group'].get('lecturer_id'), day), appt)
+        self.by_cohort.remove(self.cohort_of(appt) + (day,), appt)
+
+    def place_conflicts(self, location_id, day, start, end, shared_course_id=None, shared_lecturer_id=None):
+        """المواعيد المتداخلة في المكان؛ نفس المحاضرة المشتركة (مادة + محاضر) لا تعتبر تعارضاً"""
+        return [
+            appt for appt in self.by_location.overlaps((location_id, day), start, end)
+            if not (shared_course_id is not None
+                    and appt['group']['Group_Type'] == 'lecture'
+                    and appt['group'].get('course_id') == shared_course_id
+                    and appt['group'].get('lecturer_id') == shared_lecturer_id)
+        ]
 
-            cursor.execute("""
-                DELETE FROM Groups 
-                WHERE Course_ID = ? AND Levels_ID = ?
-                AND Group_Type = 'practical'
-            """, (course_id, level_id))
+    def lecturer_conflicts(self, lecturer_id, day, start, end):
+        return self.by_lecturer.overlaps((lecturer_id, day), start, end)
 
-            cursor.execute("""
-                DELETE FROM Groups 
-                WHERE Course_ID = ? AND Levels_ID = ?
-                AND Group_Type = 'lecture'
-            """, (course_id, level_id))
+    def cohort_conflicts(self, department_ids, level_id, day, start, end, group=None):
+        """مواعيد طلاب القسم/المستوى (أو كل أقسام المحاضرة المشتركة) المتداخلة مع الفترة"""
+        conflicts = []
+        for department_id in department_ids:
+            conflicts.extend(self.by_cohort.overlaps((department_id, level_id, day), start, end))
+        if group is not None:
+            conflicts = [appt for appt in conflicts if cohorts_clash(group, appt['group'])]
+        return conflicts
 
-            conn.commit()
 
-            self.groups = [g for g in self.groups if not (
-                g['subject'] == group_to_delete['subject'] and 
-                g['year_level'] == group_to_delete['year_level']
-            )]
-            
-            self.refresh_group_list()
-            messagebox.showinfo("نجاح", "تم الحذف بنجاح مع جميع العلاقات المرتبطة")
+def cohorts_clash(group, other):
+    """نفس القسم/المستوى: المحاضرة تتعارض مع كل شيء، والعملي مع نفس رقم المجموعة فقط (المجموعات العملية تعمل بالتوازي)"""
+    if group['Group_Type'] == 'lecture' or other['Group_Type'] == 'lecture':
+        return True
+    return group.get('group_number') == other.get('group_number')
+
+
+def expected_group_size(group, settings=None):
+    """عدد الطلاب المتوقع للمجموعة (لا يوجد عدد فعلي في القاعدة) --> من [SCHEDULING] في config.ini"""
+    settings = settings or read_scheduling_settings()
+    if group['Group_Type'] == 'practical':
+        return settings['practical_group_size']
+    # المحاضرة المشتركة تجمع طلاب كل أقسامها
+    return settings['lecture_group_size'] * max(len(group.get('departments') or ()), 1)
+
+
+def find_free_slots(schedule_data, group, rooms, days, times, duration, group_size):
+    """كل (يوم، بداية، مكان) يكون فيها المكان والمحاضر والقسم/المستوى فارغين طوال المدة
+
+    rooms: [(Location_ID, name, capacity)]. الترتيب: الأماكن التي تسع المجموعة بأقل فائض،
+    ثم مجهولة السعة، ثم الأصغر من المطلوب. يحتاج numpy (ImportError لو غير مثبت).
+    """
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+
+    slot_starts = np.array(times[:-1])
+    slot_ends = np.array(times[1:])
+    day_pos = {day: i for i, day in enumerate(days)}
+    room_pos = {room[0]: i for i, room in enumerate(rooms)}
+    course_id, _, lecturer_id = resolve_group_ids(group)
+    is_lecture = group['Group_Type'] == 'lecture'
+    cohort_keys = {f"{dept}_{group['year_level']}" for dept in group.get('departments') or ()}
+
+    # مواعيد كل بُعد كمصفوفات (الصف، اليوم، البداية، النهاية) ثم إشغال بدون حلقات على الخلايا
+    room_rows, lecturer_rows, cohort_rows = [], [], []
+    for key, info in schedule_data.items():
+        for day, appointments in info['schedule'].items():
+            d = day_pos.get(day)
+            if d is None:
+                continue
+            for appt in appointments:
+                existing = appt['group']
+                interval = (d, appt['start'], appt['end'])
+                _, _, existing_lecturer = resolve_group_ids(existing)
+                same_lecture = (is_lecture and existing['Group_Type'] == 'lecture'
+                                and existing.get('course_id') == course_id and existing_lecturer == lecturer_id)
+                room = room_pos.get(ScheduleIndex.location_of(appt))
+                if room is not None and not same_lecture:
+                    room_rows.append((room,) + interval)
+                if existing_lecturer == lecturer_id:
+                    lecturer_rows.append((0,) + interval)
+                if key in cohort_keys and cohorts_clash(group, existing):
+                    cohort_rows.append((0,) + interval)
+
+    def occupancy(rows, entities):
+        busy = np.zeros((entities, len(days), len(slot_starts)), dtype=bool)
+        if rows:
+            data = np.array(rows, dtype=float)
+            masks = (slot_starts[None, :] < data[:, 3:4]) & (slot_ends[None, :] > data[:, 2:3])
+            np.logical_or.at(busy, (data[:, 0].astype(int), data[:, 1].astype(int)), masks)
+        return busy
+
+    free = ~occupancy(room_rows, len(rooms)) & ~occupancy(lecturer_rows, 1) & ~occupancy(cohort_rows, 1)
+    if not rooms or duration < 1 or duration > free.shape[2]:
+        return []
+    feasible = sliding_window_view(free, duration, axis=2).all(axis=-1)  # rooms × days × starts
+
+    capacity = np.array([room[2] or 0 for room in rooms])
+    slack = capacity - group_size
+    tier = np.where(capacity <= 0, 1, np.where(slack >= 0, 0, 2))
+    r, d, s = np.nonzero(feasible)
+    order = np.lexsort((s, d, np.abs(slack)[r], tier[r]))
+    return [
+        {
+            'day': days[d[i]],
+            'start': times[s[i]],
+            'end': times[s[i] + duration],
+            'location_id': rooms[r[i]][0],
+            'place': rooms[r[i]][1],
+            'capacity': rooms[r[i]][2],
+            'fits': bool(tier[r[i]] == 0),
+        }
+        for i in order
+    ]
+
+
+# شبكة الأسبوع التي يعرضها الجدول: الأيام × ساعات 8-19
+WEEK_DAYS = ["السبت", "الأحد", "الإثنين", "الثلاثاء", "الأربعاء", "الخميس", "الجمعة"]
+DAY_HOURS = [8, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18, 19]
+
+
+def build_solver_sessions(group_rows, course_departments, settings=None):
+    """حصة واحدة لكل مجموعة غير موزعة؛ المحاضرة المشتركة حصة واحدة لكل أقسام Course_Department
+
+    group_rows: صفوف Database.get_solver_problem، course_departments: {Course_ID: [Department_ID]}
+    """
+    settings = settings or read_scheduling_settings()
+    sessions = []
+    for (group_id, subject, instructor, group_type, group_number, dept_id, dept_name,
+         level_id, level_name, theory_hours, practical_hours, course_id, lecturer_id) in group_rows:
+        dept_ids = [dept_id]
+        if group_type == 'lecture' and len(course_departments.get(course_id, ())) > 1:
+            dept_ids = list(course_departments[course_id])
+        if group_type == 'lecture':
+            duration = int(theory_hours) if theory_hours else 1
+            size = settings['lecture_group_size'] * len(dept_ids)
+        else:
+            duration = int(practical_hours) if practical_hours else 1
+            size = settings['practical_group_size']
+        label = f"{subject} - {instructor}"
+        if group_type == 'practical':
+            label += f" (المجموعة {group_number})"
+        sessions.append({
+            'group_id': group_id,
+            'label': f"{label} | {dept_name} - {level_name}",
+            'Group_Type': group_type,
+            'group_number': group_number,
+            'course_id': course_id,
+            'lecturer_id': lecturer_id,
+            'level_id': level_id,
+            'dept_ids': dept_ids,
+            'duration': duration,
+            'size': size,
+        })
+    return sessions
+
+
+class TimetableSolver:
+    """توزيع تلقائي بالبناء الجشع: الأصعب أولاً، ثم أول (يوم، ساعة) يكون فيه المحاضر والطلاب فارغين ومكان مناسب
+
+    يعمل على معرفات فقط وبتات إشغال لكل (مورد، يوم) --> بدون Tk ولا قاعدة بيانات
+    rooms: [(Location_ID, name, capacity)]
+    fixed: [(day, start, end, Location_ID, Lecturer_ID, Levels_ID, Department_ID, Group_Type, Group_Number)]
+    """
+    REASONS = (('blocked', "الوقت غير متاح"), ('lecturer', "المحاضر مشغول"),
+               ('cohort', "الطلاب لديهم موعد"), ('room', "لا يوجد مكان متاح"))
+
+    def __init__(self, rooms, fixed, days=WEEK_DAYS, times=DAY_HOURS):
+        self.rooms = list(rooms)
+        self.days = list(days)
+        self.times = list(times)
+        self.slots = len(self.times) - 1
+        self.room_busy = {}      # (Location_ID, day) -> bits
+        self.lecturer_busy = {}  # (Lecturer_ID, day) -> bits
+        self.cohort_any = {}     # (Department_ID, Levels_ID, day) -> bits لكل المواعيد
+        self.cohort_lecture = {} # (Department_ID, Levels_ID, day) -> bits للمحاضرات فقط
+        self.cohort_group = {}   # (Department_ID, Levels_ID, day, Group_Number) -> bits للعملي
+        self.cohort_numbers = {} # (Department_ID, Levels_ID, day) -> أرقام المجموعات العملية المشغولة
+        self.blocked = {}        # day -> bits غير متاحة للجميع
+        self._room_order = {}
+        for day, start, end, location_id, lecturer_id, level_id, dept_id, group_type, group_number in fixed:
+            bits = self.interval_bits(start, end)
+            if bits:
+                self.occupy(day, bits, location_id, lecturer_id, level_id, [dept_id], group_type, group_number)
+
+    def interval_bits(self, start, end):
+        """بت لكل فترة ساعة يغطيها [start, end)"""
+        bits = 0
+        for i in range(self.slots):
+            if start < self.times[i + 1] and end > self.times[i]:
+                bits |= 1 << i
+        return bits
+
+    def occupy(self, day, bits, location_id, lecturer_id, level_id, dept_ids, group_type, group_number):
+        self.room_busy[(location_id, day)] = self.room_busy.get((location_id, day), 0) | bits
+        self.lecturer_busy[(lecturer_id, day)] = self.lecturer_busy.get((lecturer_id, day), 0) | bits
+        for dept_id in dept_ids:
+            key = (dept_id, level_id, day)
+            self.cohort_any[key] = self.cohort_any.get(key, 0) | bits
+            if group_type == 'lecture':
+                self.cohort_lecture[key] = self.cohort_lecture.get(key, 0) | bits
+            else:
+                self.cohort_group[key + (group_number,)] = self.cohort_group.get(key + (group_number,), 0) | bits
+                self.cohort_numbers.setdefault(key, set()).add(group_number)
+
+    def release(self, day, bits, location_id, lecturer_id, level_id, dept_ids, group_type, group_number):
+        """عكس occupy لحصة من جدول بلا تعارضات (العملي المتوازي يُعاد تجميعه في cohort_any)"""
+        self.room_busy[(location_id, day)] = self.room_busy.get((location_id, day), 0) & ~bits
+        self.lecturer_busy[(lecturer_id, day)] = self.lecturer_busy.get((lecturer_id, day), 0) & ~bits
+        for dept_id in dept_ids:
+            key = (dept_id, level_id, day)
+            if group_type == 'lecture':
+                self.cohort_lecture[key] = self.cohort_lecture.get(key, 0) & ~bits
+            else:
+                self.cohort_group[key + (group_number,)] = self.cohort_group.get(key + (group_number,), 0) & ~bits
+            busy = self.cohort_lecture.get(key, 0)
+            for number in self.cohort_numbers.get(key, ()):
+                busy |= self.cohort_group.get(key + (number,), 0)
+            self.cohort_any[key] = busy
+
+    def copy(self):
+        """نسخة مستقلة الإشغال (لتجربة إزاحة دون إعادة بناء الحل)"""
+        clone = TimetableSolver.__new__(TimetableSolver)
+        clone.__dict__.update(self.__dict__)
+        for name in ('room_busy', 'lecturer_busy', 'cohort_any', 'cohort_lecture', 'cohort_group', 'blocked'):
+            setattr(clone, name, dict(getattr(self, name)))
+        clone.cohort_numbers = {key: set(numbers) for key, numbers in self.cohort_numbers.items()}
+        return clone
+
+    def block(self, kind, entity_id, days, start, end):
+        """إغلاق فترة: 'room' لمكان، 'lecturer' لمحاضر، 'slot' للجميع (days=None --> كل الأيام)"""
+        bits = self.interval_bits(start, end)
+        for day in days or self.days:
+            if kind == 'room':
+                self.room_busy[(entity_id, day)] = self.room_busy.get((entity_id, day), 0) | bits
+            elif kind == 'lecturer':
+                self.lecturer_busy[(entity_id, day)] = self.lecturer_busy.get((entity_id, day), 0) | bits
+            else:
+                self.blocked[day] = self.blocked.get(day, 0) | bits
+
+    def cohort_busy(self, session, day):
+        """بتات تتعارض مع طلاب الحصة (نفس قاعدة cohorts_clash)"""
+        busy = 0
+        for dept_id in session['dept_ids']:
+            key = (dept_id, session['level_id'], day)
+            if session['Group_Type'] == 'lecture':
+                busy |= self.cohort_any.get(key, 0)
+            else:
+                busy |= self.cohort_lecture.get(key, 0) | self.cohort_group.get(key + (session['group_number'],), 0)
+        return busy
+
+    def rooms_for(self, size):
+        """الأماكن مرتبة مثل find_free_slots: تسع المجموعة بأقل فائض، ثم مجهولة السعة، ثم الأصغر"""
+        if size not in self._room_order:
+            def fit(room):
+                capacity = room[2] or 0
+                if capacity <= 0:
+                    return (1, 0)
+                return (0 if capacity >= size else 2, abs(capacity - size))
+            self._room_order[size] = sorted(self.rooms, key=fit)
+        return self._room_order[size]
+
+    def default_order(self, sessions):
+        """الأصعب أولاً: محاضرات مشتركة بأقسام أكثر، ثم الأطول، ثم محاضر عليه ساعات أكثر"""
+        load = {}
+        for session in sessions:
+            load[session['lecturer_id']] = load.get(session['lecturer_id'], 0) + session['duration']
+        return sorted(sessions, key=lambda s: (-len(s['dept_ids']), -s['duration'],
+                                               -load[s['lecturer_id']], s['group_id']))
+
+    def randomized_order(self, sessions, rng):
+        """ترتيب الصعوبة نفسه مع ضوضاء عشوائية --> كل بذرة تستكشف ترتيباً مختلفاً"""
+        load = {}
+        for session in sessions:
+            load[session['lecturer_id']] = load.get(session['lecturer_id'], 0) + session['duration']
+        top = max(load.values(), default=1)
+        return sorted(sessions, key=lambda s: -(4 * len(s['dept_ids']) + 2 * s['duration']
+                                                + 2 * load[s['lecturer_id']] / top) * rng.uniform(0.6, 1.4))
+
+    def day_order(self, session, rng=None):
+        """الأيام الأقل ازدحاماً لطلاب الحصة ثم للمحاضر أولاً --> توزيع على الأسبوع (rng يكسر التعادل)"""
+        def load(day):
+            cohort = sum(bin(self.cohort_any.get((d, session['level_id'], day), 0)).count('1')
+                         for d in session['dept_ids'])
+            return cohort, bin(self.lecturer_busy.get((session['lecturer_id'], day), 0)).count('1'), \
+                rng.random() if rng else 0
+        return sorted(self.days, key=load)
+
+    def place(self, session, rng=None, prefer=None):
+        """(day, start, Location_ID) أول موعد صالح، أو (None, {سبب: عدد المواعيد المرفوضة به})
+
+        prefer=(day, start): يُجرب هذا الموعد أولاً ثم باقي نفس اليوم (أقل تغيير للطلاب عند الإصلاح)
+        """
+        duration = session['duration']
+        reasons = {kind: 0 for kind, _ in self.REASONS}
+        if duration < 1 or duration > self.slots:
+            return None, reasons
+        mask = (1 << duration) - 1
+        rooms = self.rooms_for(session['size'])
+        days = self.day_order(session, rng)
+        starts = list(range(self.slots - duration + 1))
+        preferred_first = None
+        if prefer is not None and prefer[0] in days and prefer[1] in self.times:
+            days = [prefer[0]] + [day for day in days if day != prefer[0]]
+            preferred_first = self.times.index(prefer[1])
+        for day in days:
+            lecturer = self.lecturer_busy.get((session['lecturer_id'], day), 0)
+            cohort = self.cohort_busy(session, day)
+            blocked = self.blocked.get(day, 0)
+            order = starts
+            if day == days[0] and preferred_first in starts:
+                order = sorted(starts, key=lambda first: abs(first - preferred_first))
+            for first in order:
+                bits = mask << first
+                if blocked & bits:
+                    reasons['blocked'] += 1
+                    continue
+                if lecturer & bits:
+                    reasons['lecturer'] += 1
+                    continue
+                if cohort & bits:
+                    reasons['cohort'] += 1
+                    continue
+                for location_id, _, _ in rooms:
+                    if not self.room_busy.get((location_id, day), 0) & bits:
+                        self.occupy(day, bits, location_id, session['lecturer_id'], session['level_id'],
+                                    session['dept_ids'], session['Group_Type'], session['group_number'])
+                        return (day, self.times[first], location_id), reasons
+                reasons['room'] += 1
+        return None, reasons
+
+    def describe_reasons(self, session, reasons):
+        if session['duration'] < 1 or session['duration'] > self.slots:
+            return f"المدة ({session['duration']} ساعة) أطول من اليوم الدراسي"
+        if not self.rooms:
+            return "لا توجد أماكن مسجلة"
+        return "، ".join(f"{label} في {reasons[kind]} موعد" for kind, label in self.REASONS if reasons[kind])
+
+    def solve(self, sessions, order=None, rng=None):
+        """(placements, unplaced): placements = [(session, day, start, end, Location_ID)]، unplaced = [(session, السبب)]"""
+        placements, unplaced = [], []
+        for session in (order if order is not None else self.default_order(sessions)):
+            slot, reasons = self.place(session, rng)
+            if slot is None:
+                unplaced.append((session, self.describe_reasons(session, reasons)))
+            else:
+                day, start, location_id = slot
+                placements.append((session, day, start, start + session['duration'], location_id))
+        return placements, unplaced
+
+
+# حالة عمليات محفظة الحل (تُضبط مرة واحدة لكل عملية من initializer)
+_portfolio = {}
+
+
+def _init_portfolio_worker(progress, stop, problem):
+    _portfolio['progress'] = progress
+    _portfolio['stop'] = stop
+    _portfolio['problem'] = problem
+
+
+def _portfolio_worker(seed, restarts):
+    """عامل واحد: ترتيب خاص ببذرته ثم إعادة تشغيل تقدّم المجموعات التي فشلت (squeaky wheel)
+
+    cost = (غير الموزعة، ساعاتها، عقوبة TimetableScorer)
+    يرجع (seed, attempts, cost, placements, unplaced) بمعرفات المجموعات فقط لتقليل النقل بين العمليات
+    """
+    rooms, fixed, sessions = _portfolio['problem']
+    stop, progress = _portfolio['stop'], _portfolio['progress']
+    settings = read_scheduling_settings()
+    rng = random.Random(seed)
+    best, order, attempts = None, None, 0
+    for attempt in range(max(restarts, 1)):
+        if stop.is_set():
+            break
+        solver = TimetableSolver(rooms, fixed)
+        if order is None:
+            order = solver.default_order(sessions) if seed == 0 else solver.randomized_order(sessions, rng)
+        placements, unplaced = solver.solve(sessions, order, rng if seed else None)
+        attempts += 1
+        cost = (len(unplaced), sum(session['duration'] for session, _ in unplaced))
+        if best is None or cost <= best[0][:2]:
+            # نفس عدد غير الموزعة --> جودة الجدول (القيود المرنة) تحسم
+            cost += (timetable_quality(rooms, fixed, placements, settings) or 0,)
+        if best is None or cost < best[0]:
+            best = (cost,
+                    [(session['group_id'], day, start, end, location_id) for session, day, start, end, location_id in placements],
+                    [(session['group_id'], reason) for session, reason in unplaced])
+        progress.put((seed, attempt + 1, cost[0], best[0][0]))
+        if not unplaced:
+            stop.set()  # حل كامل --> باقي العمال يتوقفون
+            break
+        failed = {session['group_id'] for session, _ in unplaced}
+        order = [s for s in order if s['group_id'] in failed] + [s for s in order if s['group_id'] not in failed]
+    if best is None:
+        return seed, attempts, None, [], []
+    return (seed, attempts) + best
+
+
+def solve_portfolio(rooms, fixed, sessions, workers=None, seeds=None, restarts=20, time_limit=None, progress=None):
+    """تشغيل seeds عاملاً مستقلاً (بذور وترتيبات مختلفة) على workers عملية؛ أول حل كامل يفوز والباقي يُلغى
+
+    progress(seed, attempt, unplaced, best_unplaced) تُستدعى من خيط الاستدعاء (وليس خيط الواجهة).
+    يرجع (placements, unplaced, stats) بنفس شكل TimetableSolver.solve.
+    """
+    workers = max(1, workers or os.cpu_count() or 1)
+    seeds = seeds or workers
+    # spawn في كل الأنظمة: fork لعملية فيها Tk وخيوط غير آمن
+    context = multiprocessing.get_context('spawn')
+    channel, stop = context.Queue(), context.Event()
+    deadline = time.monotonic() + time_limit if time_limit else None
+    by_id = {session['group_id']: session for session in sessions}
+    best, started = None, time.perf_counter()
+    stats = {'workers': workers, 'seeds': seeds, 'attempts': 0, 'winner': None}
+
+    def drain():
+        while True:
+            try:
+                message = channel.get_nowait()
+            except queue.Empty:
+                return
+            if progress:
+                progress(*message)
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_portfolio_worker,
+                             initargs=(channel, stop, (rooms, fixed, sessions))) as pool:
+        pending = {pool.submit(_portfolio_worker, seed, restarts) for seed in range(seeds)}
+        while pending:
+            done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+            drain()
+            for future in done:
+                if future.cancelled():
+                    continue
+                seed, attempts, cost, placements, unplaced = future.result()
+                stats['attempts'] += attempts
+                if cost is not None and (best is None or cost < best[0]):
+                    best = (cost, placements, unplaced)
+                    stats['winner'] = seed
+            if (best is not None and best[0][0] == 0) or (deadline and time.monotonic() > deadline):
+                stop.set()
+            if stop.is_set():
+                for future in pending:
+                    future.cancel()  # لم تبدأ بعد؛ الجارية تتوقف عند المحاولة التالية
+        drain()
+    stats['elapsed'] = time.perf_counter() - started
+    if best is None:
+        return [], [], stats
+    _, placements, unplaced = best
+    return ([(by_id[group_id], day, start, end, location_id) for group_id, day, start, end, location_id in placements],
+            [(by_id[group_id], reason) for group_id, reason in unplaced], stats)
+
+
+class TimetableScorer:
+    """جودة الجدول (قيود مرنة): عقوبات بمصفوفات numpy --> أقل = أفضل
+
+    sessions: [{'lecturer_id', 'size', 'cohorts': [...]}] أو بصيغة الحل ('dept_ids' + 'level_id').
+    يُبنى مرة واحدة ثم يُقيّم أي توزيع لنفس الحصص كمصفوفات (يوم، أول فترة، نهاية، مكان) بدون حلقات بايثون.
+    يحتاج numpy (ImportError لو غير مثبت).
+    """
+    METRICS = (
+        ('gaps', "ساعات فراغ الطلاب بين المواعيد", 3.0),
+        ('overload', "ساعات المحاضر فوق الحد اليومي", 2.0),
+        ('spread', "تركيز ساعات المحاضر في يوم (أعلى يوم - متوسط الأسبوع)", 1.0),
+        ('waste', "مقاعد فارغة × ساعة", 0.01),
+        ('overflow', "طلاب بلا مقاعد × ساعة", 0.1),
+        ('late', "ساعات بعد الموعد المتأخر", 1.0),
+    )
+
+    def __init__(self, sessions, rooms, days=WEEK_DAYS, times=DAY_HOURS, settings=None):
+        import numpy as np
+        settings = settings or read_scheduling_settings()
+        self.days = list(days)
+        self.times = list(times)
+        self.slots = len(self.times) - 1
+        self.day_pos = {day: i for i, day in enumerate(self.days)}
+        self.time_pos = {hour: i for i, hour in enumerate(self.times)}
+        self.room_pos = {room[0]: i for i, room in enumerate(rooms)}
+        # آخر خانة لمكان غير معروف (سعة 0 --> لا يدخل في عقوبات السعة)
+        self.capacity = np.array([room[2] or 0 for room in rooms] + [0], dtype=float)
+        self.weights = np.array([weight for _, _, weight in self.METRICS])
+        self.daily_limit = settings['lecturer_daily_hours']
+        self.late_first = bisect.bisect_left(self.times, settings['late_hour'])
+
+        lecturers, cohorts = {}, {}
+        lecturer_rows, cohort_sessions, cohort_rows = [], [], []
+        for i, session in enumerate(sessions):
+            lecturer_rows.append(lecturers.setdefault(session['lecturer_id'], len(lecturers)))
+            for cohort in session.get('cohorts') or [(dept_id, session['level_id']) for dept_id in session['dept_ids']]:
+                cohort_sessions.append(i)
+                cohort_rows.append(cohorts.setdefault(cohort, len(cohorts)))
+        self.lecturer = np.array(lecturer_rows, dtype=np.intp)
+        self.cohort_session = np.array(cohort_sessions, dtype=np.intp)
+        self.cohort = np.array(cohort_rows, dtype=np.intp)
+        self.size = np.array([session['size'] for session in sessions], dtype=float)
+        self.lecturer_count = len(lecturers)
+        self.cohort_count = len(cohorts)
+
+    def encode(self, positions):
+        """[(day, start, end, Location_ID)] بترتيب الحصص --> (day, start, end, room) مصفوفات فهارس"""
+        import numpy as np
+        unknown = len(self.capacity) - 1
+        day = np.array([self.day_pos[p[0]] for p in positions], dtype=np.intp)
+        start = np.array([self.time_pos[p[1]] for p in positions], dtype=np.intp)
+        end = np.array([self.time_pos[p[2]] for p in positions], dtype=np.intp)
+        room = np.array([self.room_pos.get(p[3], unknown) for p in positions], dtype=np.intp)
+        return day, start, end, room
+
+    def penalties(self, day, start, end, room):
+        """القيم الخام لكل مقياس في METRICS"""
+        import numpy as np
+        days, slots = len(self.days), self.slots
+        duration = end - start
+
+        # فراغات الطلاب: إشغال (قسم/مستوى، يوم) × فترات عبر فروق تراكمية ثم (آخر - أول + 1) - المشغول
+        rows = self.cohort * days + day[self.cohort_session]
+        width = slots + 1
+        cells = self.cohort_count * days * width
+        marks = (np.bincount(rows * width + start[self.cohort_session], minlength=cells)
+                 - np.bincount(rows * width + end[self.cohort_session], minlength=cells))
+        busy = marks.reshape(-1, width).cumsum(axis=1)[:, :slots] > 0
+        used = busy.any(axis=1)
+        first = busy.argmax(axis=1)
+        last = slots - 1 - busy[:, ::-1].argmax(axis=1)
+        gaps = ((last - first + 1) - busy.sum(axis=1))[used].sum()
+
+        hours = np.bincount(self.lecturer * days + day, weights=duration,
+                            minlength=self.lecturer_count * days).reshape(-1, days)
+        overload = np.maximum(hours - self.daily_limit, 0).sum()
+        spread = (hours.max(axis=1) - hours.mean(axis=1)).sum() if self.lecturer_count else 0.0
+
+        capacity = self.capacity[room]
+        known = capacity > 0
+        waste = (np.maximum(capacity - self.size, 0) * duration)[known].sum()
+        overflow = (np.maximum(self.size - capacity, 0) * duration)[known].sum()
+
+        late = np.maximum(end - np.maximum(start, self.late_first), 0).sum()
+        return np.array([gaps, overload, spread, waste, overflow, late], dtype=float)
+
+    def score(self, day, start, end, room):
+        return float(self.weights @ self.penalties(day, start, end, room))
+
+    def breakdown(self, day, start, end, room):
+        """[(الوصف، القيمة، الوزن، العقوبة)] ثم المجموع"""
+        values = self.penalties(day, start, end, room)
+        rows = [(label, float(value), weight, float(value * weight))
+                for (_, label, weight), value in zip(self.METRICS, values)]
+        return rows, sum(row[3] for row in rows)
+
+
+def scoring_sessions_from_fixed(fixed, settings):
+    """صفوف fixed (صف لكل قسم) --> (حصص للتقييم، مواقعها): المحاضرة المشتركة حصة واحدة لكل أقسامها"""
+    sessions = {}
+    for day, start, end, location_id, lecturer_id, level_id, dept_id, group_type, group_number in fixed:
+        key = (day, start, end, location_id, lecturer_id)
+        session = sessions.get(key)
+        if session is None:
+            session = sessions[key] = {'lecturer_id': lecturer_id, 'cohorts': [], 'Group_Type': group_type}
+        session['cohorts'].append((dept_id, level_id))
+    for session in sessions.values():
+        if session['Group_Type'] == 'lecture':
+            session['size'] = settings['lecture_group_size'] * len(session['cohorts'])
+        else:
+            session['size'] = settings['practical_group_size']
+    return list(sessions.values()), list(sessions)
 
-        except pyodbc.Error as e:
-            if conn:
-                conn.rollback()
-            messagebox.showerror("خطأ", f"فشل الحذف: {str(e)}")
-        finally:
-            if conn:
-                conn.close()
 
-    def delete_appointment_and_group(self, day, start_time):
-        """حذف موعد من الجدول وقاعدة البيانات وإزالة المجموعة من الـ groups"""
-        if not self.current_schedule_key:
-            return
+def scoring_sessions_from_schedule(schedule_data, settings=None):
+    """schedule_data الصفحة --> (حصص للتقييم، مواقعها (day, start, end, Location_ID))"""
+    settings = settings or read_scheduling_settings()
+    sessions = {}
+    for key, info in schedule_data.items():
+        for day, appointments in info['schedule'].items():
+            for appt in appointments:
+                group = appt['group']
+                _, _, lecturer_id = resolve_group_ids(group)
+                position = (day, appt['start'], appt['end'], ScheduleIndex.location_of(appt))
+                session_key = (group.get('group_id'),) + position
+                session = sessions.get(session_key)
+                if session is None:
+                    session = sessions[session_key] = {'lecturer_id': lecturer_id, 'cohorts': [],
+                                                       'size': expected_group_size(group, settings)}
+                session['cohorts'].append(key)
+    return list(sessions.values()), [key[1:] for key in sessions]
+
+
+def timetable_quality(rooms, fixed, placements, settings=None):
+    """عقوبة القيود المرنة للمواعيد الثابتة + placements ([(session, day, start, end, Location_ID)])، أو None بدون numpy"""
+    settings = settings or read_scheduling_settings()
+    try:
+        sessions, positions = scoring_sessions_from_fixed(fixed, settings)
+        sessions += [session for session, *_ in placements]
+        positions += [(day, start, end, location_id) for _, day, start, end, location_id in placements]
+        scorer = TimetableScorer(sessions, rooms, settings=settings)
+    except ImportError:
+        return None
+    return scorer.score(*scorer.encode(positions))
+
+
+def build_repair_sessions(rows, settings=None):
+    """حصص الجدول الحالي من صفوف Database.get_repair_problem: صفوف المحاضرة المشتركة (نفس المجموعة والموعد) حصة واحدة"""
+    settings = settings or read_scheduling_settings()
+    sessions = {}
+    for (schedule_id, group_id, dept_id, location_id, day, start, end, lecturer_id, level_id, group_type,
+         group_number, course_id, subject, instructor, dept_name, level_name, place) in rows:
+        key = (group_id, day, start, end, location_id)
+        session = sessions.get(key)
+        if session is None:
+            label = f"{subject} - {instructor}"
+            if group_type == 'practical':
+                label += f" (المجموعة {group_number})"
+            session = sessions[key] = {
+                'group_id': group_id,
+                'label': f"{label} | {dept_name} - {level_name}",
+                'Group_Type': group_type,
+                'group_number': group_number,
+                'course_id': course_id,
+                'lecturer_id': lecturer_id,
+                'level_id': level_id,
+                'dept_ids': [],
+                'schedule_ids': [],
+                'duration': end - start,
+                'day': day,
+                'start': start,
+                'end': end,
+                'location_id': location_id,
+                'place': place,
+            }
+        session['dept_ids'].append(dept_id)
+        session['schedule_ids'].append(schedule_id)
+    for session in sessions.values():
+        if session['Group_Type'] == 'lecture':
+            session['size'] = settings['lecture_group_size'] * len(session['dept_ids'])
+        else:
+            session['size'] = settings['practical_group_size']
+    return list(sessions.values())
+
+
+class TimetableRepair:
+    """إصلاح بأقل تغيير بعد إغلاق مكان أو وقت أو تقليص إتاحة محاضر
+
+    constraint: {'kind': 'room'|'lecturer'|'slot', 'id': Location_ID/Lecturer_ID/None,
+                 'days': [أيام] أو None للكل, 'start': ساعة, 'end': ساعة}
+    1) تُنقل الحصص التي تخالف القيد فقط (نفس الموعد في مكان آخر أولاً) وكل ما عداها ثابت
+    2) الحصة التي لا تجد موعداً تُزيح أقل عدد من الحصص الأخرى (حتى max_eject) ضمن مهلة زمنية
+    """
+    def __init__(self, sessions, rooms, constraint, days=WEEK_DAYS, times=DAY_HOURS):
+        self.sessions = sessions
+        self.rooms = list(rooms)
+        self.constraint = constraint
+        self.days = list(days)
+        self.times = list(times)
+        self.position = {i: (s['day'], s['start'], s['end'], s['location_id']) for i, s in enumerate(sessions)}
+        self.unplaced = set()  # حصص خرجت من موقعها ولم تجد غيره بعد
+
+    def in_constraint(self, day, start, end):
+        c = self.constraint
+        return (not c['days'] or day in c['days']) and start < c['end'] and end > c['start']
+
+    def violates(self, index):
+        day, start, end, location_id = self.position[index]
+        if not self.in_constraint(day, start, end):
+            return False
+        kind = self.constraint['kind']
+        if kind == 'room':
+            return location_id == self.constraint['id']
+        if kind == 'lecturer':
+            return self.sessions[index]['lecturer_id'] == self.constraint['id']
+        return True
 
-        conn = self.connect_db()
-        if not conn:
-            return
+    def solver_without(self, excluded):
+        """حل على كل الحصص في مواقعها الحالية عدا excluded، مع إغلاق القيد"""
+        fixed = [
+            (day, start, end, location_id, session['lecturer_id'], session['level_id'], dept_id,
+             session['Group_Type'], session['group_number'])
+            for i, session in enumerate(self.sessions) if i not in excluded and i not in self.unplaced
+            for day, start, end, location_id in (self.position[i],)
+            for dept_id in session['dept_ids']
+        ]
+        solver = TimetableSolver(self.rooms, fixed, self.days, self.times)
+        c = self.constraint
+        solver.block(c['kind'], c['id'], c['days'], c['start'], c['end'])
+        return solver
+
+    def blockers(self, index, day, start, end, rooms):
+        """(Location_ID, {حصص يجب إزاحتها}) لأرخص مكان في هذا الموعد، أو None لو القيد يغلقه"""
+        session = self.sessions[index]
+        kind = self.constraint['kind']
+        closed = self.in_constraint(day, start, end)
+        if closed and (kind == 'slot' or (kind == 'lecturer' and session['lecturer_id'] == self.constraint['id'])):
+            return None
+        people, room_occupants = set(), {}
+        for other, (o_day, o_start, o_end, o_location) in self.position.items():
+            if other == index or other in self.unplaced or o_day != day or not (o_start < end and start < o_end):
+                continue
+            o = self.sessions[other]
+            if o['lecturer_id'] == session['lecturer_id'] or (
+                    o['level_id'] == session['level_id'] and set(o['dept_ids']) & set(session['dept_ids'])
+                    and cohorts_clash(session, o)):
+                people.add(other)
+            room_occupants.setdefault(o_location, set()).add(other)
+        best = None
+        for location_id, _, _ in rooms:
+            if closed and kind == 'room' and location_id == self.constraint['id']:
+                continue
+            occupants = room_occupants.get(location_id, set()) - people
+            if best is None or len(occupants) < len(best[1]):
+                best = (location_id, occupants)
+                if not occupants:
+                    break
+        if best is None:
+            return None
+        return best[0], people | best[1]
+
+    def eject(self, index, moved, max_eject, deadline):
+        """وضع الحصة بإزاحة أقل عدد من الحصص التي لم تتحرك بعد؛ True لو نجح"""
+        session = self.sessions[index]
+        duration = session['duration']
+        rooms = TimetableSolver(self.rooms, [], self.days, self.times).rooms_for(session['size'])
+        original_day, original_start = session['day'], session['start']
+        candidates = []
+        for day in self.days:
+            for first in range(len(self.times) - duration):
+                start = self.times[first]
+                found = self.blockers(index, day, start, start + duration, rooms)
+                if found is None or len(found[1]) > max_eject:
+                    continue
+                location_id, displaced = found
+                closeness = (day != original_day, abs(start - original_start))
+                candidates.append((len(displaced - moved), len(displaced), closeness, day, first, location_id, displaced))
+        candidates.sort(key=lambda c: c[:3])
+
+        base = self.solver_without({index})
+        for _, _, _, day, first, location_id, displaced in candidates:
+            if time.monotonic() > deadline:
+                return False
+            solver = base.copy()
+            for other in displaced:
+                o = self.sessions[other]
+                o_day, o_start, o_end, o_location = self.position[other]
+                solver.release(o_day, solver.interval_bits(o_start, o_end), o_location, o['lecturer_id'],
+                               o['level_id'], o['dept_ids'], o['Group_Type'], o['group_number'])
+            start = self.times[first]
+            solver.occupy(day, solver.interval_bits(start, start + duration), location_id, session['lecturer_id'],
+                          session['level_id'], session['dept_ids'], session['Group_Type'], session['group_number'])
+            new_positions = {}
+            for other in sorted(displaced, key=lambda i: (-len(self.sessions[i]['dept_ids']), -self.sessions[i]['duration'])):
+                slot, _ = solver.place(self.sessions[other], prefer=self.position[other][:2])
+                if slot is None:
+                    break
+                new_positions[other] = (slot[0], slot[1], slot[1] + self.sessions[other]['duration'], slot[2])
+            else:
+                self.position[index] = (day, start, start + duration, location_id)
+                self.position.update(new_positions)
+                moved.update(displaced)
+                return True
+        return False
 
+    def quality(self, settings=None):
+        """(عقوبة TimetableScorer قبل، بعد) للحصص التي بقي لها موعد، أو None بدون numpy"""
+        kept = [i for i in range(len(self.sessions)) if i not in self.unplaced]
         try:
-            cursor = conn.cursor()
-
-            # الحصول على بيانات الموعد المراد حذفه
-            appointments = self.schedule_data[self.current_schedule_key]['schedule'].get(day, [])
-            target_appt = next((a for a in appointments if a['start'] == start_time), None)
-
-            if not target_appt:
-                return
-
-            group_to_delete = target_appt['group']
-
-            # 1. حذف الموعد من جدول schedule
-            query = """
-                DELETE FROM schedule
-                WHERE group_id IN (
-                    SELECT g.group_id
-                    FROM groups g
-                    JOIN department d ON g.Department_ID = d.Department_ID
-                    JOIN levels lv ON g.Levels_ID = lv.Levels_ID
-                    JOIN courses c ON g.Course_ID = c.Course_ID
-                    JOIN lecturer lec ON g.Lecturer_ID = lec.Lecturer_ID
-                    WHERE d.Department_name = ?
-                    AND lv.Levels_name = ?
-                    AND c.Course_name = ?
-                    AND lec.F_name + ' ' + lec.L_name = ?
-                    AND g.Group_Type = ?
-            """
-            params = [
-                self.schedule_data[self.current_schedule_key]['dept'],
-                self.schedule_data[self.current_schedule_key]['year'],
-                group_to_delete['subject'],
-                group_to_delete['instructor'],
-                group_to_delete['Group_Type']
-            ]
-
-            if group_to_delete['Group_Type'] == 'practical':
-                query += " AND g.Group_Number = ?"
-                params.append(group_to_delete.get('group_number', 1))
-
-            query += ")"
-            cursor.execute(query, params)
-
-            if group_to_delete['Group_Type'] == 'lecture':
-                for dept in group_to_delete['departments']:
-                    delete_practical_query = """
-                        DELETE FROM groups
-                        WHERE Course_ID = (SELECT Course_ID FROM courses WHERE Course_name = ?)
-                        AND Department_ID = (SELECT Department_ID FROM department WHERE Department_name = ?)
-                        AND Levels_ID = (SELECT Levels_ID FROM levels WHERE Levels_name = ?)
-                        AND Group_Type = 'practical'
-                    """
-                    cursor.execute(delete_practical_query, [
-                        group_to_delete['subject'],
-                        dept,
-                        group_to_delete['year_level']
-                    ])
-
-            delete_group_query = """
-                DELETE FROM groups
-                WHERE Course_ID = (SELECT Course_ID FROM courses WHERE Course_name = ?)
-                AND Lecturer_ID = (SELECT Lecturer_ID FROM lecturer WHERE F_name + ' ' + L_name = ?)
-                AND Levels_ID = (SELECT Levels_ID FROM levels WHERE Levels_name = ?)
-                AND Group_Type = ?
-            """
-            params = [
-                group_to_delete['subject'],
-                group_to_delete['instructor'],
-                group_to_delete['year_level'],
-                group_to_delete['Group_Type']
-            ]
+            scorer = TimetableScorer([self.sessions[i] for i in kept], self.rooms, self.days, self.times, settings)
+        except ImportError:
+            return None
+        before = [(self.sessions[i]['day'], self.sessions[i]['start'], self.sessions[i]['end'],
+                   self.sessions[i]['location_id']) for i in kept]
+        return scorer.score(*scorer.encode(before)), scorer.score(*scorer.encode([self.position[i] for i in kept]))
+
+    def run(self, time_limit=5, max_eject=2):
+        """(moves, failed, stats): moves = [(session, (day, start, end, Location_ID) الجديد)]، failed = [(session, السبب)]"""
+        started = time.monotonic()
+        deadline = started + time_limit
+        affected = [i for i in range(len(self.sessions)) if self.violates(i)]
+        moved = set(affected)
+
+        solver = self.solver_without(set(affected))
+        stuck = []
+        for i in sorted(affected, key=lambda i: (-len(self.sessions[i]['dept_ids']), -self.sessions[i]['duration'])):
+            session = self.sessions[i]
+            slot, reasons = solver.place(session, prefer=(session['day'], session['start']))
+            if slot is None:
+                self.unplaced.add(i)
+                stuck.append((i, reasons))
+            else:
+                self.position[i] = (slot[0], slot[1], slot[1] + session['duration'], slot[2])
 
-            if group_to_delete['Group_Type'] == 'practical':
-                delete_group_query += " AND Group_Number = ?"
-                params.append(group_to_delete.get('group_number', 1))
+        failed = []
+        for i, reasons in stuck:
+            if self.eject(i, moved, max_eject, deadline):
+                self.unplaced.discard(i)
+            else:
+                failed.append((self.sessions[i], solver.describe_reasons(self.sessions[i], reasons)))
+
+        moves = [(self.sessions[i], self.position[i]) for i in sorted(moved)
+                 if i not in self.unplaced and self.position[i] != (self.sessions[i]['day'], self.sessions[i]['start'],
+                                                                  self.sessions[i]['end'], self.sessions[i]['location_id'])]
+        stats = {'affected': len(affected), 'displaced': len(moved) - len(affected),
+                 'elapsed': time.monotonic() - started, 'timed_out': time.monotonic() > deadline}
+        return moves, failed, stats
+
+
+class VirtualList(tk.Frame):
+    """قائمة على Canvas ترسم الصفوف الظاهرة فقط --> آلاف العناصر بدون بطء"""
+    def __init__(self, parent, font=("Traditional Arabic", 14), on_select=None, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.font = font
+        self.on_select = on_select
+        self.items = []  # [(display_text, payload)]
+        self.selected_index = None
+        self.row_height = tk.font.Font(font=font).metrics('linespace') + 6
+
+        scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.yview)
+        scrollbar.pack(side=tk.LEFT, fill=tk.Y)
+        self.canvas = tk.Canvas(self, bg="white", highlightthickness=0, yscrollcommand=scrollbar.set)
+        self.canvas.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True)
+
+        self.canvas.bind("<Configure>", lambda e: self.redraw())
+        self.canvas.bind("<Button-1>", self.on_click)
+        self.canvas.bind("<MouseWheel>", lambda e: self.yview('scroll', -1 * (e.delta // 120), 'units'))
+        self.canvas.bind("<Button-4>", lambda e: self.yview('scroll', -1, 'units'))
+        self.canvas.bind("<Button-5>", lambda e: self.yview('scroll', 1, 'units'))
+
+    def set_items(self, items):
+        """استبدال العناصر (مرتبة مسبقاً)؛ التحديد يبقى لو العنصر ما زال موجوداً"""
+        selected = self.selected()
+        self.items = items
+        self.selected_index = None
+        if selected is not None:
+            for i, (_, payload) in enumerate(items):
+                if payload is selected:
+                    self.selected_index = i
+                    break
+        self.canvas.configure(scrollregion=(0, 0, 0, len(items) * self.row_height))
+        if self.selected_index is None:
+            self.canvas.yview_moveto(0)
+        self.redraw()
+
+    def selected(self):
+        if self.selected_index is None or self.selected_index >= len(self.items):
+            return None
+        return self.items[self.selected_index][1]
 
-            cursor.execute(delete_group_query, params)
+    def yview(self, *args):
+        self.canvas.yview(*args)
+        self.redraw()
 
-            conn.commit()
+    def redraw(self):
+        canvas = self.canvas
+        canvas.delete('row')
+        if not self.items:
+            return
+        width = canvas.winfo_width()
+        top = canvas.canvasy(0)
+        first = max(0, int(top // self.row_height))
+        last = min(len(self.items), int((top + canvas.winfo_height()) // self.row_height) + 1)
+        for i in range(first, last):
+            y = i * self.row_height
+            if i == self.selected_index:
+                canvas.create_rectangle(0, y, width, y + self.row_height,
+                                        fill="#cce4f7", outline="", tags='row')
+            canvas.create_text(width - 5, y + self.row_height / 2, text=self.items[i][0],
+                               anchor='e', font=self.font, tags='row')
+
+    def on_click(self, event):
+        index = int(self.canvas.canvasy(event.y) // self.row_height)
+        if 0 <= index < len(self.items):
+            self.selected_index = index
+            self.redraw()
+            if self.on_select:
+                self.on_select(self.items[index][1])
 
-            groups_to_remove = [g for g in self.groups_data
-                                if g['subject'] == group_to_delete['subject'] and
-                                g['year_level'] == group_to_delete['year_level'] and
-                                g['instructor'] == group_to_delete['instructor'] and
-                                g['Group_Type'] == group_to_delete['Group_Type'] and
-                                (g.get('group_number') == group_to_delete.get('group_number', 1) if group_to_delete['Group_Type'] == 'practical' else True)]
-
-            for g in groups_to_remove:
-                if g in self.groups_data:
-                    self.groups_data.remove(g)
-
-            for schedule_key, schedule_info in self.schedule_data.items():
-                for d, appointments in schedule_info['schedule'].items():
-                    schedule_info['schedule'][d] = [
-                        appt for appt in appointments
-                        if not (appt['group']['subject'] == group_to_delete['subject'] and
-                                appt['group']['year_level'] == group_to_delete['year_level'] and
-                                appt['group']['instructor'] == group_to_delete['instructor'] and
-                                appt['group']['Group_Type'] == group_to_delete['Group_Type'] and
-                                (appt['group'].get('group_number') == group_to_delete.get('group_number', 1) if group_to_delete['Group_Type'] == 'practical' else True))
-                    ]
-
-            self.data_manager.schedule_data = self.schedule_data
-            self.create_schedule_table()
-            self.filter_groups()
-            messagebox.showinfo("نجاح", "تم حذف الموعد والمجموعة بنجاح")
 
-        except pyodbc.Error as e:
-            conn.rollback()
-            messagebox.showerror("خطأ في قاعدة البيانات", f"فشل حذف الموعد: {str(e)}")
-        finally:
-            conn.close()
-            
-# Entering schedules
-class SchedulePlacerPage(BasePage):
-    def __init__(self, parent, return_callback, groups_data):
+class GroupsCreation(BasePage):
+    """Class for the schedule entry page"""
+    def __init__(self, parent, return_callback):
         super().__init__(parent, return_callback)
         self.data_manager = DataManager()
-        self.groups_data = groups_data
-        self.schedule_data = self.data_manager.schedule_data or {} 
-        self.selected_group = None
-        self.filtered_groups_data = []
-        self.current_schedule_key = None
-        self.edit_mode = False
+        self.groups = self.data_manager.groups_data
+        self.group_entries = []     # [(sort_key, display_text, group)] مرتبة
+        self.group_index = SearchIndex()  # id(group) -> نص العرض
+        self.filtered_entries = []
+        self.last_search_term = ''
+        self.filter_job = None
+        self.editing_group_index = None
+        self.original_group_data = None
+        self.db = Database()
+        
+        # القوائم المرجعية تُملأ بعد تحميلها في الخلفية (load_reference_lists)
+        self.year_levels = []
+        self.departments = []
+        self.instructors = []
+        self.subjects = []
+         
+        self.practical_groups_count_container = None
+        self.practical_instructor_container = None
+        self.dept_groups_count_spinboxes = {}
+        
+        self.setup_ui()
+        self.load_reference_lists()
+        self.load_groups_from_db()
 
-        self.SERVER = '.'
-        self.DATABASE = 'project'
-        self.locations = []
+    # قيم افتراضية في حالة فشل الاتصال: (المستويات، الأقسام، المحاضرين، المواد)
+    FALLBACK_LISTS = (
+        ["الأولى", "الثانية", "الثالثة", "الرابعة"],
+        ["الرياضيات", "الحاسب علوم", "فيزياءوعلوم الحاسب"],
+        ['هبة', 'رجب'],
+        ['عربي', 'انجليزي', 'فيزياء', 'كيمياء'],
+    )
+
+    def load_reference_lists(self):
+        """تحميل المستويات والأقسام والمحاضرين والمواد (من الذاكرة بعد أول مرة) في الخلفية"""
+        def work():
+            cache = ReferenceCache()
+            return cache.names('Levels'), cache.names('Department'), cache.names('Lecturer'), cache.names('Courses')
+
+        def failed(e):
+            messagebox.showerror("خطأ", f"فشل تحميل المستويات والأقسام والمحاضرين والمواد: {str(e)}")
+            self.apply_reference_lists(self.FALLBACK_LISTS)
+
+        self.run_in_background(work, self.apply_reference_lists, failed, message="جاري تحميل القوائم...")
+
+    def apply_reference_lists(self, lists):
+        self.year_levels, self.departments, self.instructors, self.subjects = (list(names) for names in lists)
+        self.year_combobox['values'] = self.year_levels
+        self.subject_entry['values'] = self.subjects
+        self.instructor_entry['values'] = self.instructors
+        for combobox in self.dept_comboboxes:
+            combobox['values'] = self.departments
+        if self.dept_groups_count_spinboxes:
+            self.update_practical_instructors_ui(self.instructors)
 
-        # تغيير من pack إلى grid للإطار الرئيسي
-        self.grid_rowconfigure(0, weight=1)  # الصف العلوي (المحتوى) يتمدد
-        self.grid_columnconfigure(0, weight=1)
+    def setup_ui(self):
         
-        self.main_content = tk.Frame(self)
-        self.main_content.grid(row=0, column=0, sticky="nsew")  # تغيير هنا
+        # Setup use interface
 
-        # تعديل زر العودة ليكون في صف منفصل
-        back_button = ttk.Button(
-            self,  # نضعه مباشرة في النافذة الرئيسية
-            text="العودة للرئيسية",
-            command=self.return_callback,
-            style='Rounded.TButton',
-            width= 20
+        top_frame = tk.LabelFrame(
+            self,
+            text=" اضافة مجموعة",
+            padx=10,
+            pady=10,
+            labelanchor='ne',
+            bg="white",  # Background color
+            bd=2,  # Border width
+            relief=tk.SOLID,  # Border style
+            fg="black",
+            font=('Arial', 15)
         )
-        back_button.grid(row=1, column=0, pady=20)  # تغيير هنا
+        top_frame.pack(fill="both", padx=20, pady=10, side="right")
         
-        self.setup_ui()
-        self.load_locations_from_db()
-        self.load_schedules_from_db()
-        self.load_initial_data()
+        # Create a canvas and scrollbar
+        canvas = tk.Canvas(top_frame, bg="white", highlightthickness=0)
+        scrollbar = ttk.Scrollbar(top_frame, orient=tk.VERTICAL, command=canvas.yview)
+    
+        # Pack scrollbar first so it doesn't move
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        canvas.configure(yscrollcommand=scrollbar.set)
+    
+        # Create an inner frame to hold all widgets
+        inner_frame = tk.Frame(canvas, bg="white")
+        canvas.create_window((0, 0), window=inner_frame, anchor="nw")
         
-
-    def connect_db(self):
-        try:
-            # الحصول على إعدادات الاتصال من الصفحة الرئيسية
-            main_page = self.master.master if isinstance(self.master, tk.Toplevel) else self.master
-            if hasattr(main_page, 'db_server') and hasattr(main_page, 'db_name'):
-                self.SERVER = main_page.db_server
-                self.DATABASE = main_page.db_name
-            
-            conn = pyodbc.connect(
-                f'DRIVER={{SQL Server}};SERVER={self.SERVER};'
-                f'DATABASE={self.DATABASE};Trusted_Connection=yes;'
-                )
-            return conn
-        except pyodbc.Error as e:
-            messagebox.showerror("خطأ في الاتصال", f"فشل الاتصال بقاعدة البيانات:\n{str(e)}")
-            return None
-        except Exception as e:
-            messagebox.showerror("خطأ", f"حدث خطأ غير متوقع: {str(e)}")
-            return None
+        def configure_scrollregion(event):
+            canvas.itemconfig("all", width=event.width)
+            canvas.configure(scrollregion=canvas.bbox("all"))
         
-    def setup_ui(self):
-        #Label frame for department and 
-        selection_frame = ttk.LabelFrame(self.main_content, text="اختيار القسم والسنة الدراسية", padding=(10, 10), labelanchor="ne")
-        selection_frame.grid(row=0, column=0, sticky="ew", padx=20, pady=10)  # تغيير هنا
-
-        selection_row = tk.Frame(selection_frame)
-        selection_row.pack(fill=tk.X, pady=5)  # يمكن تركها pack لأنها داخل إطار آخر
+        
+        canvas.bind("<Configure>", configure_scrollregion)
+        inner_frame.bind("<Configure>", configure_scrollregion)
+    
+        # Department container - now in inner_frame instead of top_frame
+        self.dept_container = tk.Frame(inner_frame, bg="white")
+        self.dept_container.pack(fill=tk.X, padx=5, pady=5, anchor='e')
 
-        # select the departmrnt
-        tk.Label(selection_row, text=": القسم",font=('Arial', 12, 'bold')).pack(side=tk.RIGHT, padx=5)
-        self.dept_combobox = ttk.Combobox(selection_row, 
-                                        values=self.get_unique_departments(), 
-                                        state="readonly",
-                                        width=25)
-        self.dept_combobox.pack(side=tk.RIGHT, padx=10)
-        self.dept_combobox.bind("<<ComboboxSelected>>", self.on_dept_year_change)
+        # Department Row
+        self.dept_comboboxes = []
+        self.add_dept_row()
 
-        # select the year
-        tk.Label(selection_row, text=": السنة الدراسية").pack(side=tk.RIGHT, padx=5)
-        self.year_combobox = ttk.Combobox(selection_row, 
-                                        values=self.get_unique_year_levels(), 
-                                        state="readonly",
-                                        width=25)
-        self.year_combobox.pack(side=tk.RIGHT, padx=10)
-        self.year_combobox.bind("<<ComboboxSelected>>", self.on_dept_year_change)
+        # Add more than one department
+        self.add_dept_btn = ttk.Button(inner_frame, text="إضافة قسم",command=lambda: [self.add_dept_row(), canvas.configure(scrollregion=canvas.bbox("all"))])
+        # self.add_dept_btn = ttk.Button(inner_frame, text="إضافة قسم", command=self.add_dept_row)
+        self.add_dept_btn.pack(pady=(0, 5), padx=5, anchor='e')
 
-        group_frame = ttk.LabelFrame(self.main_content, text="اختيار المجموعة والمكان والوقت", padding=(10, 10), labelanchor="ne")
-        group_frame.grid(row=1, column=0, sticky="ew", padx=20, pady=10)  # تغيير هنا
+        # Year
+        year_frame = tk.Frame(inner_frame, bg="white")
+        year_frame.pack(fill=tk.X, pady=5)
+        tk.Label(year_frame, text=": المستوي", font=('Arial Unicode MS', 12, 'bold'), bg="white").pack(side=tk.RIGHT, padx=5)
+        self.year_combobox = ttk.Combobox(year_frame, values=self.year_levels, width=32, state="readonly", style="Custom.TCombobox")
+        self.year_combobox.pack(side=tk.RIGHT, fill=tk.X, expand=False, padx=10)
 
-        group_row = tk.Frame(group_frame)
+        # Subject
+        subject_frame = tk.Frame(inner_frame, bg="white")
+        subject_frame.pack(fill=tk.X, pady=5)
+        tk.Label(subject_frame, text=": المادة", font=('Arial Unicode MS', 12, 'bold'), bg="white").pack(side=tk.RIGHT, padx=5)
+        self.subject_entry = ttk.Combobox(subject_frame, values=self.subjects, justify='right', width=32, state="readonly", style="Custom.TCombobox")
+        self.subject_entry.pack(side=tk.RIGHT, fill=tk.X, expand=False, padx=25, pady=10)
+    
+        # lecturer
+        lecturer_frame = tk.Frame(inner_frame, bg="white")
+        lecturer_frame.pack(fill=tk.X, pady=5)
+        tk.Label(
+            lecturer_frame, 
+            text=": المحاضر",
+            bg="white",
+            fg="black",
+            font=('Arial', 12, 'bold')
+        ).pack(side=tk.RIGHT, padx=5)
+        self.instructor_entry = ttk.Combobox(lecturer_frame, justify='right', values=self.instructors, width=32, state='readonly', style="Custom.TCombobox")
+        self.instructor_entry.pack(side=tk.RIGHT, fill=tk.X, expand=False, padx=15, pady=15)
+    
+        # Hours input
+        self.setup_hours_inputs(inner_frame)
+        
+        
+
+
+       # combobox style
+        style = ttk.Style()
+        style.theme_use('clam')
+        style.configure("Custom.TCombobox",
+                    padding=5)  
+        
+
+        # Adding groups control buttons
+        btn_frame = tk.Frame(inner_frame,bg="white")
+        btn_frame.pack(pady=5, anchor='e')
+
+        self.add_group_btn = ttk.Button(btn_frame, text="إضافة مجموعة", command=self.add_group)
+        self.add_group_btn.pack(side=tk.RIGHT, padx=5)
+        
+        groups_frame = tk.LabelFrame(
+            self,
+            text=" المجموعات الموجودة",
+            bg="white",
+            fg="black",
+            bd=2,
+            relief="solid",
+            labelanchor="ne",
+            padx=10, 
+            pady=10,
+            font=('Arial', 15)
+        )
+        groups_frame.pack(pady=20, padx=20, fill="both", expand=True)
+
+        # Search bar
+        search_frame = tk.Frame(groups_frame , bg="white")
+        search_frame.pack(fill=tk.X, padx=5, pady=5)
+
+        tk.Label(search_frame, text=": بحث", bg="white").pack(side=tk.RIGHT, padx=5)
+        self.group_search_entry = ttk.Entry(search_frame, justify='right')
+        self.group_search_entry.pack(side=tk.RIGHT, padx=5, fill=tk.X, expand=True)
+        self.group_search_entry.bind("<KeyRelease>", self.schedule_group_filter)
+
+        # groups list (يرسم الصفوف الظاهرة فقط)
+        self.group_list = VirtualList(groups_frame, bg="white")
+        self.group_list.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+
+        # delete button
+        btn_frame = tk.Frame(groups_frame,bg="white")
+        btn_frame.pack(pady=5, anchor='e')
+
+        delete_btn = ttk.Button(btn_frame, text="حذف المحدد", command=self.delete_group_with_warning)
+        delete_btn.pack(side=tk.RIGHT, padx=5)
+        
+        # Return to main page button 
+        back_button = ttk.Button(
+            self, 
+            text="العودة للرئيسية", 
+            command=self.return_callback,
+            style='Rounded.TButton'
+        )
+        back_button.pack(pady=20)
+        
+
+
+    def delete_group_with_warning(self):
+        """عرض تحذير قبل الحذف"""
+        group_to_delete = self.group_list.selected()
+        if group_to_delete is None:
+            messagebox.showerror("خطأ", "الرجاء تحديد مجموعة للحذف!")
+            return
+        
+        # عرض تحذير عام أولاً
+        warning_msg = "سيتم حذف هذه المجموعة من قاعدة البيانات وجميع الجداول المرتبطة بها!\n"
+        warning_msg += f"المادة: {group_to_delete['subject']}\n"
+        warning_msg += f"المحاضر: {group_to_delete['instructor']}\n"
+        warning_msg += f"النوع: {'نظرية' if group_to_delete['Group_Type'] == 'lecture' else 'عملي'}"
+        
+        if group_to_delete['Group_Type'] == 'practical':
+            warning_msg += f" (المجموعة {group_to_delete.get('group_number', 1)})"
+
+        def checked(schedules):
+            message = warning_msg
+            if schedules:
+                message += "\n\nمواعيدها موجودة في جداول:\n" + "\n".join(f"- {dept} - {level}" for dept, level in schedules)
+            if messagebox.askyesno("تحذير مهم", message + "\n\nهل تريد الاستمرار في الحذف؟"):
+                self.delete_group()
+
+        self.check_group_in_schedules(group_to_delete, checked)
+            
+    def setup_hours_inputs(self, parent_frame):
+        # spinbox style
+        style = ttk.Style()
+        style.theme_use('clam')
+
+        style.configure("Large.TSpinbox", 
+                    padding=4,
+                    arrowsize=15,
+                    bordercolor="gray",  # Add border for better visibility
+                    relief="solid",      # Border style
+                    font=('Arial', 10)) # Ensures consistent text size
+
+        hours_frame = tk.Frame(parent_frame, bg="white")
+        hours_frame.pack(fill=tk.X, pady=5)
+
+        # theory hours
+        theory_frame = tk.Frame(hours_frame, bg="white")
+        theory_frame.pack(side=tk.RIGHT, padx=5)
+        tk.Label(theory_frame, text=" ساعات النظري", font=('Arial Unicode MS', 11, 'bold'), bg="white").pack(side=tk.RIGHT)
+        self.theory_hours = ttk.Spinbox(theory_frame, from_=1, to=10, width=5, style="Large.TSpinbox")
+        self.theory_hours.set(1)
+        self.theory_hours.pack(side=tk.RIGHT, padx=5)
+
+        # practical hours
+        practical_frame = tk.Frame(hours_frame, bg="white")
+        practical_frame.pack(side=tk.RIGHT, padx=5)
+        tk.Label(practical_frame, text=" ساعات العملي", font=('Arial Unicode MS', 11, 'bold'), bg="white").pack(side=tk.RIGHT)
+        self.practical_hours = ttk.Spinbox(practical_frame, from_=0, to=4, width=5, style="Large.TSpinbox")
+        self.practical_hours.set(0)
+        self.practical_hours.pack(side=tk.RIGHT)
+
+        # تم إزالة حقل عدد المجموعات العام (practical_groups_count) لأنه لم يعد مستخدمًا
+        # حيث تم استبداله بعدد مجموعات لكل قسم في dept_groups_count_spinboxes
+
+        # ربط الأحداث
+        self.practical_hours.bind("<KeyRelease>", self.toggle_practical_fields)
+        self.practical_hours.bind("<ButtonRelease>", self.toggle_practical_fields)
+
+    def toggle_practical_fields(self, event=None):
+        # التحقق من وجود الحاويات
+        if not hasattr(self, 'practical_groups_count_container') or not hasattr(self, 'practical_instructor_container'):
+            return
+
+        # إخفاء الحاويات القديمة
+        self.practical_groups_count_container.pack_forget()
+        for widget in self.practical_groups_count_container.winfo_children():
+            widget.destroy()
+        
+        self.practical_instructor_container.pack_forget()
+        for widget in self.practical_instructor_container.winfo_children():
+            widget.destroy()
+
+        try:
+            practical_hours = int(self.practical_hours.get())
+            if practical_hours > 0:
+                # إنشاء واجهة عدد المجموعات لكل قسم
+                tk.Label(
+                    self.practical_groups_count_container,
+                    text="عدد المجموعات العملي لكل قسم:",
+                    bg="white",
+                    font=('Arial Unicode MS', 11, 'bold')
+                ).pack(anchor='e', padx=5, pady=5)
+                
+                groups_count_frame = tk.Frame(self.practical_groups_count_container, bg="white")
+                groups_count_frame.pack(fill=tk.X, padx=5, pady=5, anchor='e')
+                
+                self.dept_groups_count_spinboxes = {}
+                
+                for dept_cb in self.dept_comboboxes:
+                    dept = dept_cb.get()
+                    if not dept:
+                        continue
+                    
+                    dept_frame = tk.Frame(groups_count_frame, bg="white")
+                    dept_frame.pack(fill=tk.X, pady=2, anchor='e')
+                    
+                    tk.Label(dept_frame, text=f"{dept}:", bg="white").pack(side=tk.RIGHT, padx=5)
+                    spinbox = ttk.Spinbox(dept_frame, from_=1, to=20, width=5, style="Large.TSpinbox")
+                    spinbox.set(1)
+                    spinbox.pack(side=tk.RIGHT, padx=5)
+                    self.dept_groups_count_spinboxes[dept] = spinbox
+                
+                self.practical_groups_count_container.pack(fill=tk.X, pady=5)
+                
+                for spinbox in self.dept_groups_count_spinboxes.values():
+                    spinbox.bind("<KeyRelease>", lambda e: self.update_practical_instructors_ui(self.instructors))
+                    spinbox.bind("<ButtonRelease>", lambda e: self.update_practical_instructors_ui(self.instructors))
+                
+                self.update_practical_instructors_ui(self.instructors)
+        
+        except ValueError:
+            self.practical_groups_count_container.pack_forget()
+            self.practical_instructor_container.pack_forget()
+
+    # دالة جديدة: تحديث واجهة محاضري العملي
+    def update_practical_instructors_ui(self, instructors_list):
+        for widget in self.practical_instructor_container.winfo_children():
+            widget.destroy()
+        
+        for dept, spinbox in self.dept_groups_count_spinboxes.items():
+            try:
+                groups_count = int(spinbox.get())
+            except ValueError:
+                groups_count = 1
+            
+            dept_frame = tk.LabelFrame(
+                self.practical_instructor_container,
+                text=f"محاضر العملي - {dept}",
+                padx=5,
+                pady=5,
+                bg="white", 
+                fg="black",
+                bd=2,
+                relief="solid",
+                labelanchor="ne", 
+                font=('Arial', 10)
+            )
+            dept_frame.pack(fill=tk.X, pady=5, padx=5, anchor='e')
+            
+            for group_num in range(1, groups_count + 1):
+                group_frame = tk.Frame(dept_frame, bg="white")
+                group_frame.pack(fill=tk.X, pady=2)
+                
+                tk.Label(group_frame, text=f"محاضر المجموعة {group_num}:", bg="white").pack(side=tk.RIGHT, padx=5)
+                entry = ttk.Combobox(group_frame, values=instructors_list, state="readonly", width=32, style="Custom.TCombobox")
+                entry.pack(side=tk.RIGHT, fill=tk.X, expand=True, padx=5)
+        
+        self.practical_instructor_container.pack(fill=tk.X, pady=5)
+
+    def get_practical_instructors(self):
+        practical_instructors = {}
+        try:
+            if int(self.practical_hours.get()) > 0:
+                # لكل قسم في dept_groups_count_spinboxes
+                for dept, spinbox in self.dept_groups_count_spinboxes.items():
+                    try:
+                        groups_count = int(spinbox.get())
+                    except ValueError:
+                        groups_count = 1
+                    
+                    practical_instructors[dept] = []
+                    
+                    # البحث عن إطار القسم المناسب
+                    found = False
+                    for dept_frame in self.practical_instructor_container.winfo_children():
+                        if isinstance(dept_frame, tk.LabelFrame) and dept_frame.cget('text').endswith(dept):
+                            found = True
+                            entry_frames = [child for child in dept_frame.winfo_children() if isinstance(child, tk.Frame)]
+                            
+                            for group_num in range(groups_count):
+                                if group_num < len(entry_frames):
+                                    entry = entry_frames[group_num].winfo_children()[1]  # حقل Combobox
+                                    instructor = entry.get().strip()
+                                    if not instructor: 
+                                        raise ValueError(f"يجب إدخال محاضر العملي للمجموعة {group_num+1} في قسم {dept}")
+                                    
+                                    if instructor not in self.instructors:
+                                        raise ValueError(f"المحاضر {instructor} غير موجود في قائمة المحاضرين")
+                                        
+                                    practical_instructors[dept].append(instructor)
+                                else:
+                                    practical_instructors[dept].append("")
+                            break
+                    
+                    if not found:
+                        raise ValueError(f"لم يتم العثور على واجهة المحاضرين للقسم {dept}")
+        
+        except (ValueError, IndexError) as e:
+            raise ValueError(str(e))
+        
+        return practical_instructors
+
+    # def add_group(self):
+    #     """إضافة مجموعة جديدة مع الربط الصحيح بين المادة والأقسام"""
+    #     try:
+    #         selected_depts = [cb.get() for cb in self.dept_comboboxes if cb.get()]
+    #         if not selected_depts:
+    #             raise ValueError("يجب اختيار قسم واحد على الأقل")
+
+    #         year_level = self.year_combobox.get()
+    #         instructor = self.instructor_entry.get().strip()
+    #         subject = self.subject_entry.get().strip()
+    #         theory_hours = int(self.theory_hours.get())
+    #         practical_hours = int(self.practical_hours.get())
+    #         practical_groups_count = int(self.practical_groups_count.get()) if practical_hours > 0 else 1
+
+    #         if not all([year_level, instructor, subject]):
+    #             raise ValueError("جميع الحقول المميزة بعلامة (*) مطلوبة")
+
+    #         self.validate_group_uniqueness(selected_depts, year_level, subject, theory_hours, practical_hours)
+
+    #         practical_instructors = self.get_practical_instructors() if practical_hours > 0 else {}
+
+    #         conn = self.connect_db()
+    #         if not conn:
+    #             raise ValueError("فشل الاتصال بقاعدة البيانات")
+
+    #         cursor = conn.cursor()
+
+    #         try:
+    #             cursor.execute("SELECT Course_ID FROM Courses WHERE Course_name=?", (subject,))
+    #             course_id = cursor.fetchone()[0]
+
+    #             cursor.execute("SELECT Lecturer_ID FROM Lecturer WHERE F_name + ' ' + L_name=?", (instructor,))
+    #             lecturer_id = cursor.fetchone()[0]
+
+    #             cursor.execute("SELECT Levels_ID FROM Levels WHERE Levels_name=?", (year_level,))
+    #             level_id = cursor.fetchone()[0]
+
+    #             cursor.execute("""
+    #                 INSERT INTO Groups (
+    #                     Department_ID, Levels_ID, Course_ID, Lecturer_ID,
+    #                     Theory_Hours, Practical_Hours, Practical_Groups_Count, Group_Type
+    #                 ) VALUES (?, ?, ?, ?, ?, ?, ?, 'lecture')
+    #             """, (self.get_department_id(selected_depts[0]), level_id, course_id, lecturer_id,
+    #                 theory_hours, practical_hours, practical_groups_count))
+
+    #             for dept_name in selected_depts:
+    #                 dept_id = self.get_department_id(dept_name)
+                    
+    #                 cursor.execute("""
+    #                     SELECT 1 FROM Course_Department 
+    #                     WHERE Course_ID = ? AND Department_ID = ?
+    #                 """, (course_id, dept_id))
+                    
+    #                 if not cursor.fetchone():
+    #                     cursor.execute("""
+    #                         INSERT INTO Course_Department (Course_ID, Department_ID) 
+    #                         VALUES (?, ?)
+    #                     """, (course_id, dept_id))
+
+    #             if practical_hours > 0:
+    #                 for dept_name, instructors in practical_instructors.items():
+    #                     dept_id = self.get_department_id(dept_name)
+    #                     for group_num, instructor_name in enumerate(instructors, 1):
+    #                         cursor.execute("""
+    #                             INSERT INTO Groups (
+    #                                 Department_ID, Levels_ID, Course_ID, Lecturer_ID,
+    #                                 Theory_Hours, Practical_Hours, Group_Number, Group_Type
+    #                             ) VALUES (?, ?, ?, ?, 0, ?, ?, 'practical')
+    #                         """, (dept_id, level_id, course_id, 
+    #                             self.get_lecturer_id(instructor_name),
+    #                             practical_hours, group_num))
+
+    #             conn.commit()
+
+    #             self.update_ui_after_add(
+    #                 selected_depts, year_level, instructor, subject,
+    #                 theory_hours, practical_hours, practical_instructors,
+    #                 practical_groups_count
+    #             )
+
+    #             messagebox.showinfo("نجاح", "تمت إضافة المجموعة وربطها بالأقسام بنجاح")
+
+    #         except pyodbc.Error as e:
+    #             conn.rollback()
+    #             raise ValueError(f"خطأ في قاعدة البيانات: {str(e)}")
+    #         finally:
+    #             conn.close()
+
+    #     except ValueError as e:
+    #         messagebox.showerror("خطأ", str(e))
+    #     except Exception as e:
+    #         messagebox.showerror("خطأ غير متوقع", f"حدث خطأ: {str(e)}")
+
+    def add_group(self):
+        """إضافة مجموعة جديدة مع الربط الصحيح بين المادة والأقسام (الحفظ في الخلفية)"""
+        try:
+            selected_depts = [cb.get() for cb in self.dept_comboboxes if cb.get()]
+            if not selected_depts:
+                raise ValueError("يجب اختيار قسم واحد على الأقل")
+
+            year_level = self.year_combobox.get()
+            instructor = self.instructor_entry.get().strip()
+            subject = self.subject_entry.get().strip()
+            theory_hours = int(self.theory_hours.get())
+            practical_hours = int(self.practical_hours.get())
+
+            if not all([year_level, instructor, subject]):
+                raise ValueError("جميع الحقول المميزة بعلامة (*) مطلوبة")
+
+            # احصل على عدد المجموعات لكل قسم من الواجهة الجديدة
+            dept_groups_count = {}
+            if practical_hours > 0:
+                for dept, spinbox in self.dept_groups_count_spinboxes.items():
+                    try:
+                        groups_count = int(spinbox.get())
+                        dept_groups_count[dept] = groups_count
+                    except ValueError:
+                        raise ValueError(f"عدد المجموعات غير صالح للقسم {dept}")
+
+            practical_instructors = self.get_practical_instructors() if practical_hours > 0 else {}
+            for dept_name, instructors in practical_instructors.items():
+                # التأكد من تطابق عدد المحاضرين مع عدد المجموعات
+                if len(instructors) != dept_groups_count.get(dept_name, 1):
+                    raise ValueError(f"عدد المحاضرين لا يتطابق مع عدد المجموعات للقسم {dept_name}")
+
+        except ValueError as e:
+            messagebox.showerror("خطأ", str(e))
+            return
+        except Exception as e:
+            messagebox.showerror("خطأ غير متوقع", f"حدث خطأ: {str(e)}")
+            return
+
+        def work():
+            self.validate_group_uniqueness(selected_depts, year_level, subject, theory_hours, practical_hours)
+
+            # الحصول على معرفات المواد والمحاضرين والمستويات والأقسام مقدماً
+            cache = ReferenceCache()
+            course_id = cache.id_of('Courses', subject)
+            if course_id is None:
+                raise ValueError(f"المادة {subject} غير موجودة في قاعدة البيانات")
+
+            level_id = cache.id_of('Levels', year_level)
+            if level_id is None:
+                raise ValueError(f"المستوى {year_level} غير موجود في قاعدة البيانات")
+
+            lecturer_names = [instructor] + [name for names in practical_instructors.values() for name in names]
+            lecturer_ids = {}
+            for name in lecturer_names:
+                lecturer_ids[name] = cache.id_of('Lecturer', name)
+                if lecturer_ids[name] is None:
+                    raise ValueError(f"المحاضر {name} غير موجود في قاعدة البيانات")
+
+            dept_ids = {}
+            for dept_name in selected_depts:
+                dept_ids[dept_name] = cache.id_of('Department', dept_name)
+                if dept_ids[dept_name] is None:
+                    raise ValueError(f"القسم {dept_name} غير موجود في قاعدة البيانات")
+
+            # المجموعة النظرية (لا يوجد عدد مجموعات في هذه النسخة) + العملي لكل قسم
+            practical_rows = [(dept_ids[dept_name], level_id, course_id, lecturer_ids[instructor_name],
+                               practical_hours, group_num)
+                              for dept_name, instructors in practical_instructors.items()
+                              for group_num, instructor_name in enumerate(instructors, 1)]
+            self.db.add_course_groups(
+                (dept_ids[selected_depts[0]], level_id, course_id, lecturer_ids[instructor], theory_hours, practical_hours),
+                course_id, [dept_ids[d] for d in selected_depts], practical_rows)
+
+        def added(_):
+            self.add_group_btn.config(state='normal')
+            # تحديث واجهة المستخدم بعد الإضافة
+            self.update_ui_after_add(
+                selected_depts, year_level, instructor, subject,
+                theory_hours, practical_hours, practical_instructors,
+                dept_groups_count
+            )
+            messagebox.showinfo("نجاح", "تمت إضافة المجموعة وربطها بالأقسام بنجاح")
+
+        def failed(e):
+            self.add_group_btn.config(state='normal')
+            if isinstance(e, ValueError):
+                messagebox.showerror("خطأ", str(e))
+            elif isinstance(e, DB_ERRORS):
+                messagebox.showerror("خطأ", f"خطأ في قاعدة البيانات: {str(e)}")
+            else:
+                messagebox.showerror("خطأ غير متوقع", f"حدث خطأ: {str(e)}")
+
+        # منع الإضافة المكررة قبل رجوع الطلب
+        self.add_group_btn.config(state='disabled')
+        self.run_in_background(work, added, failed, message="جاري إضافة المجموعة...")
+
+    # def get_department_id(self, dept_name):
+    #     conn = self.connect_db()
+    #     try:
+    #         cursor = conn.cursor()
+    #         cursor.execute("SELECT Department_ID FROM Department WHERE Department_name=?", (dept_name,))
+    #         result = cursor.fetchone()
+    #         if result:
+    #             return result[0]
+    #         else:
+    #             raise ValueError(f"القسم {dept_name} غير موجود في قاعدة البيانات")
+    #     finally:
+    #         conn.close()
+
+    def get_department_id(self, department_name):
+        try:
+            return ReferenceCache().id_of('Department', department_name)
+        except Exception as e:
+            messagebox.showerror("خطأ", f"حدث خطأ في جلب معرف القسم: {str(e)}")
+            return None
+
+    def get_lecturer_id(self, lecturer_name):
+        lecturer_id = ReferenceCache().id_of('Lecturer', lecturer_name)
+        if lecturer_id is None:
+            # ربما أضيف من جهاز آخر بعد تحميل الذاكرة
+            lecturer_id = Database().get_lecturer_id(lecturer_name)
+        if lecturer_id is None:
+            raise ValueError(f"المحاضر {lecturer_name} غير موجود في قاعدة البيانات")
+        return lecturer_id
+
+    def validate_group_uniqueness(self, selected_depts, year_level, subject, theory_hours, practical_hours):
+        """يعمل في الخلفية (بدون Tk): ValueError لو المادة مضافة مسبقاً لأحد الأقسام في نفس المستوى"""
+        cache = ReferenceCache()
+        dept_ids = [cache.id_of('Department', dept) for dept in selected_depts]
+        existing = set(self.db.get_lecture_departments(cache.id_of('Levels', year_level),
+                                                       cache.id_of('Courses', subject), dept_ids))
+
+        for dept in selected_depts:
+            if dept in existing:
+                raise ValueError(f"المادة {subject} مضافه بالفعل للقسم {dept} والمستوى {year_level}")
+
+    def update_groups_list(self, new_groups):
+        """طريقة مركزية لتحديث قائمة المجموعات"""
+        self.groups = new_groups
+        self.refresh_group_list()
+        self.data_manager.groups_data = self.groups
+
+    def update_ui_after_add(self, departments, year_level, instructor, subject,
+                        theory_hours, practical_hours, practical_instructors,
+                        practical_groups_count):
+        lecture_group = {
+            'departments': departments,
+            'year_level': year_level,
+            'instructor': instructor,
+            'subject': subject,
+            'theory_hours': theory_hours,
+            'practical_hours': practical_hours,
+            'practical_instructors': practical_instructors,
+            'Group_Type': 'lecture',
+            'duration': theory_hours,
+            'practical_groups_count': practical_groups_count
+        }
+        
+        self.groups.append(lecture_group)
+        added = [lecture_group]
+        
+        if practical_hours > 0:
+            for dept, instructors in practical_instructors.items():
+                for group_num, instructor in enumerate(instructors, start=1):
+                    practical_group = {
+                        'departments': [dept],
+                        'year_level': year_level,
+                        'instructor': instructor,
+                        'subject': subject,
+                        'theory_hours': 0,
+                        'practical_hours': practical_hours,
+                        'practical_instructors': {},
+                        'Group_Type': 'practical',
+                        'duration': practical_hours,
+                        'group_number': group_num
+                    }
+                    self.groups.append(practical_group)
+                    added.append(practical_group)
+
+        self.clear_input_fields()  # يمسح نص البحث أيضاً
+        self.insert_group_entries(added)
+
+    # display the grous --> practical or theory
+    def format_group_display(self, group):
+        depts = "، ".join(group['departments'])
+        
+        if group['Group_Type'] == 'practical':
+            group_num = f" (المجموعة {group.get('group_number', 1)})" if 'group_number' in group else ""
+            return f"{depts} | {group['year_level']} | {group['subject']} | عملي{group_num} | {group['instructor']} | {group['practical_hours']}ساعة"
+        else:
+            return f"{depts} | {group['year_level']} | {group['subject']} | {group['instructor']} | {group['theory_hours']}ساعة"
+        
+    def validate_departments(self, selected_depts):
+        """التحقق من عدم تكرار الأقسام"""
+        if len(selected_depts) != len(set(selected_depts)):
+            raise ValueError("لا يمكن اختيار نفس القسم أكثر من مرة")
+        if not selected_depts:
+            raise ValueError("يجب اختيار قسم واحد على الأقل")
+        return True
+
+    def check_duplicate_departments(self, event=None):
+        try:
+            selected_depts = []
+            for cb in self.dept_comboboxes:
+                dept = cb.get()
+                if dept:
+                    selected_depts.append(dept)
+            
+            if len(selected_depts) != len(set(selected_depts)):
+                messagebox.showerror("خطأ", "لا يمكن اختيار نفس القسم أكثر من مرة")
+                # Reset the last changed combobox
+                if event:
+                    event.widget.set('')
+        except Exception:
+            pass  
+    
+    def clear_input_fields(self):
+        # Clear department selection (keep at least one row)
+        for widget in self.dept_container.winfo_children():
+            widget.destroy()
+        self.dept_comboboxes = []
+        self.add_dept_row()
+        
+        # Clear other fields
+        self.year_combobox.set('')
+        self.subject_entry.set('')
+        self.instructor_entry.set('')
+        self.theory_hours.set(1)
+        self.practical_hours.set(0)
+        # self.practical_groups_count.set(1)
+        self.toggle_practical_fields()
+        self.group_search_entry.delete(0, tk.END)
+
+    @staticmethod
+    def group_sort_key(group):
+        return (group['departments'][0] if group['departments'] else '', group['year_level'], group['instructor'])
+
+    def make_group_entry(self, group):
+        display_text = self.format_group_display(group)
+        self.group_index.add(id(group), display_text)
+        return (self.group_sort_key(group), display_text, group)
+
+    def schedule_group_filter(self, event=None):
+        """تأجيل الفلترة حتى يتوقف المستخدم عن الكتابة"""
+        if self.filter_job:
+            self.after_cancel(self.filter_job)
+        self.filter_job = self.after(150, self.apply_group_filter)
+
+    def apply_group_filter(self):
+        self.filter_job = None
+        search_term = self.group_search_entry.get().strip().lower()
+        if not search_term:
+            self.filtered_entries = self.group_entries
+        else:
+            # نص يكمل السابق --> نتائجه جزء من النتائج السابقة
+            if self.last_search_term and search_term.startswith(self.last_search_term):
+                source = self.filtered_entries
+            else:
+                source = self.group_entries
+            # الفهرس يطابق بداية الكلمات بعد توحيد الحروف العربية؛ الترتيب بالأفضلية ثم ترتيب القائمة
+            scores = self.group_index.scores(search_term, keys=None if source is self.group_entries
+                                             else [id(e[2]) for e in source])
+            matches = [e for e in source if id(e[2]) in scores]
+            matches.sort(key=lambda e: (-scores[id(e[2])], e[0]))
+            self.filtered_entries = matches
+        self.last_search_term = search_term
+        self.group_list.set_items([(e[1], e[2]) for e in self.filtered_entries])
+
+    def insert_group_entries(self, groups):
+        """إدراج مجموعات جديدة في مكانها المرتب بدون إعادة بناء القائمة"""
+        keys = [e[0] for e in self.group_entries]
+        for group in groups:
+            entry = self.make_group_entry(group)
+            index = bisect.bisect_right(keys, entry[0])
+            keys.insert(index, entry[0])
+            self.group_entries.insert(index, entry)
+        self.last_search_term = None
+        self.apply_group_filter()
+
+    def refresh_group_list(self):
+        self.group_index.clear()
+        entries = [self.make_group_entry(group) for group in self.groups]
+        entries.sort(key=lambda e: e[0])
+        self.group_entries = entries
+        self.last_search_term = None
+        self.apply_group_filter()
+
+    # add more than one department ---> row
+    def add_dept_row(self):
+        row_frame = tk.Frame(self.dept_container,bg="white")
+        row_frame.pack(fill=tk.X, pady=2, anchor='e')
+        
+        # Add "القسم" label before the combobox
+        tk.Label(row_frame, text=": القسم",font=('Arial Unicode MS', 11,'bold'),bg="white").pack(side=tk.RIGHT, padx=5)
+        
+        dept_combobox = ttk.Combobox(row_frame, values=self.departments, state="readonly",width=32,style="Custom.TCombobox")
+        dept_combobox.pack(side=tk.RIGHT, padx=5)
+        dept_combobox.bind("<<ComboboxSelected>>", self.check_duplicate_departments)
+        self.dept_comboboxes.append(dept_combobox)
+        
+        # Only show delete button for additional rows (not the first one)
+        if len(self.dept_comboboxes) > 1:
+            remove_btn = ttk.Button(row_frame, text="حذف", 
+                                 command=lambda: self.remove_depart_row(row_frame, dept_combobox))
+            remove_btn.pack(side=tk.RIGHT, padx=5)
+
+    def remove_depart_row(self, row_frame, combobox):
+        """Remove a department row"""
+        if len(self.dept_comboboxes) > 1:
+            row_frame.destroy()
+            self.dept_comboboxes.remove(combobox)
+            # Update practical instructors UI if needed
+            if int(self.practical_hours.get()) > 0:
+                self.toggle_practical_fields()
+
+    def load_groups_from_db(self):
+        """تحميل المجموعات من قاعدة البيانات مع الأقسام الإضافية (في الخلفية)"""
+        def loaded(result):
+            rows, course_departments = result
+            self.groups = self.build_groups(rows, course_departments)
+            self.refresh_group_list()
+            self.data_manager.groups_data = self.groups
+
+        def failed(e):
+            if isinstance(e, DB_ERRORS):
+                messagebox.showerror("خطأ في قاعدة البيانات", f"فشل تحميل المجموعات: {str(e)}")
+            else:
+                messagebox.showerror("خطأ", f"فشل الاتصال بقاعدة البيانات: {str(e)}")
+
+        self.run_in_background(self.db.get_group_rows, loaded, failed, message="جاري تحميل المجموعات...")
+
+    @staticmethod
+    def build_groups(rows, course_departments):
+        """صفوف Groups + {Course_ID: [أقسام]} --> قواميس group_data (بدون أي استعلام إضافي)"""
+        # مدرسي العملي لكل (مادة, مستوى) مرتبين برقم المجموعة
+        practicals = {}
+        for group in rows:
+            if group[8] == 'practical':
+                practicals.setdefault((group[10], group[11]), []).append(group)
+
+        groups = []
+        for group in rows:
+            if group[8] == 'lecture':
+                departments = course_departments.get(group[10]) or [group[3]]
+            else:
+                departments = [group[3]]
+
+            group_data = {
+                'departments': departments,
+                'year_level': group[2],
+                'instructor': group[4],
+                'subject': group[1],
+                'theory_hours': group[5],
+                'practical_hours': group[6],
+                'Group_Type': group[8],
+                'duration': group[5] if group[8] == 'lecture' else group[6],
+                'group_number': group[7] if group[8] == 'practical' else None,
+                'practical_groups_count': group[9] if group[8] == 'lecture' else None,
+                'practical_instructors': {},
+                'group_id': group[0],
+                'course_id': group[10],
+                'level_id': group[11],
+                'lecturer_id': group[12],
+                'dept_id': group[13]
+            }
+
+            if group[8] == 'lecture':
+                practical_instructors = {}
+                for row in sorted(practicals.get((group[10], group[11]), []), key=lambda r: r[7] or 0):
+                    practical_instructors.setdefault(row[3], []).append(row[4])
+                group_data['practical_instructors'] = practical_instructors
+
+            groups.append(group_data)
+        return groups
+
+    def check_group_in_schedules(self, group, on_done):
+        """الجداول [(القسم، المستوى)] التي فيها المجموعة --> on_done(rows) بعد الاستعلام في الخلفية"""
+        def work():
+            course_id, level_id, lecturer_id = resolve_group_ids(group)
+            # المحاضرة بلا رقم --> كل صفوفها، والعملي --> نفس رقم المجموعة فقط
+            group_number = group.get('group_number') if group['Group_Type'] != 'lecture' else None
+            return self.db.get_group_schedules(course_id, level_id, lecturer_id, group['Group_Type'], group_number)
+
+        def failed(e):
+            messagebox.showerror("خطأ في قاعدة البيانات", f"فشل التحقق من الجداول: {str(e)}")
+            on_done([])
+
+        self.run_in_background(work, on_done, failed, message="جاري التحقق من الجداول...")
+
+    def delete_group(self):
+        """حذف مجموعة مع حذف جميع علاقاتها في Course_Department"""
+        group_to_delete = self.group_list.selected()
+        if group_to_delete is None:
+            messagebox.showerror("خطأ", "الرجاء تحديد مجموعة للحذف!")
+            return
+
+        # تأكيد الحذف
+        confirm_msg = f"هل أنت متأكد من حذف المجموعة التالية؟\n\n"
+        confirm_msg += f"المادة: {group_to_delete['subject']}\n"
+        confirm_msg += f"المستوى: {group_to_delete['year_level']}\n"
+        confirm_msg += f"الأقسام: {', '.join(group_to_delete['departments'])}"
+        
+        if not messagebox.askyesno("تأكيد الحذف", confirm_msg):
+            return
+
+        def work():
+            cache = ReferenceCache()
+            self.db.delete_course_groups(cache.id_of('Courses', group_to_delete['subject']),
+                                         cache.id_of('Levels', group_to_delete['year_level']))
+
+        def deleted(_):
+            self.groups = [g for g in self.groups if not (
+                g['subject'] == group_to_delete['subject'] and 
+                g['year_level'] == group_to_delete['year_level']
+            )]
+            self.data_manager.groups_data = self.groups
+
+            # حذف بدون إعادة ترتيب
+            remaining = {id(g) for g in self.groups}
+            for entry in self.group_entries:
+                if id(entry[2]) not in remaining:
+                    self.group_index.remove(id(entry[2]))
+            self.group_entries = [e for e in self.group_entries if id(e[2]) in remaining]
+            self.last_search_term = None
+            self.apply_group_filter()
+            messagebox.showinfo("نجاح", "تم الحذف بنجاح مع جميع العلاقات المرتبطة")
+
+        self.run_in_background(work, deleted, lambda e: messagebox.showerror("خطأ", f"فشل الحذف: {str(e)}"),
+                               message="جاري الحذف...")
+            
+# Entering schedules
+class SchedulePlacerPage(BasePage):
+    def __init__(self, parent, return_callback, groups_data):
+        super().__init__(parent, return_callback)
+        self.data_manager = DataManager()
+        self.groups_data = groups_data
+        self.schedule_data = self.data_manager.schedule_data or {} 
+        self.selected_group = None
+        self.filtered_groups_data = []
+        self.current_schedule_key = None
+        self.edit_mode = False
+
+        self.locations = []
+        self.location_details = {}
+        self.schedules_loaded = False
+        self.schedules_load_time = None
+        self.schedule_index = ScheduleIndex()
+        self.sync_request = None
+        self.occupancy_request = None  # آخر طلب لإشغال المكان المختار
+        self.db = Database()
+
+        # تغيير من pack إلى grid للإطار الرئيسي
+        self.grid_rowconfigure(0, weight=1)  # الصف العلوي (المحتوى) يتمدد
+        self.grid_columnconfigure(0, weight=1)
+        
+        self.main_content = tk.Frame(self)
+        self.main_content.grid(row=0, column=0, sticky="nsew")  # تغيير هنا
+
+        # تعديل زر العودة ليكون في صف منفصل
+        back_button = ttk.Button(
+            self,  # نضعه مباشرة في النافذة الرئيسية
+            text="العودة للرئيسية",
+            command=self.return_callback,
+            style='Rounded.TButton',
+            width= 20
+        )
+        back_button.grid(row=1, column=0, pady=20)  # تغيير هنا
+        
+        self.setup_ui()
+        self.load_locations_from_db()
+        self.load_schedules_from_db()
+        self.load_initial_data()
+        # مستخدمون آخرون يعدلون الجداول بالتوازي --> مزامنة المتغير فقط عند تحرك رمز التغيير
+        self.start_change_polling(lambda: self.data_manager.schedule_sync_mark,
+                                  lambda mark: self.sync_schedule_changes())
+        
+
+    def connect_db(self):
+        try:
+            # اتصال من المجمع المشترك (إعداداته تأتي من الصفحة الرئيسية)
+            return ConnectionPool().acquire()
+        except DB_ERRORS as e:
+            messagebox.showerror("خطأ في الاتصال", f"فشل الاتصال بقاعدة البيانات:\n{str(e)}")
+            return None
+        except Exception as e:
+            messagebox.showerror("خطأ", f"حدث خطأ غير متوقع: {str(e)}")
+            return None
+        
+    def setup_ui(self):
+        #Label frame for department and 
+        selection_frame = ttk.LabelFrame(self.main_content, text="اختيار القسم والسنة الدراسية", padding=(10, 10), labelanchor="ne")
+        selection_frame.grid(row=0, column=0, sticky="ew", padx=20, pady=10)  # تغيير هنا
+
+        selection_row = tk.Frame(selection_frame)
+        selection_row.pack(fill=tk.X, pady=5)  # يمكن تركها pack لأنها داخل إطار آخر
+
+        # select the departmrnt
+        tk.Label(selection_row, text=": القسم",font=('Arial', 12, 'bold')).pack(side=tk.RIGHT, padx=5)
+        self.dept_combobox = ttk.Combobox(selection_row, 
+                                        values=self.get_unique_departments(), 
+                                        state="readonly",
+                                        width=25)
+        self.dept_combobox.pack(side=tk.RIGHT, padx=10)
+        self.dept_combobox.bind("<<ComboboxSelected>>", self.on_dept_year_change)
+
+        # select the year
+        tk.Label(selection_row, text=": السنة الدراسية").pack(side=tk.RIGHT, padx=5)
+        self.year_combobox = ttk.Combobox(selection_row, 
+                                        values=self.get_unique_year_levels(), 
+                                        state="readonly",
+                                        width=25)
+        self.year_combobox.pack(side=tk.RIGHT, padx=10)
+        self.year_combobox.bind("<<ComboboxSelected>>", self.on_dept_year_change)
+
+        group_frame = ttk.LabelFrame(self.main_content, text="اختيار المجموعة والمكان والوقت", padding=(10, 10), labelanchor="ne")
+        group_frame.grid(row=1, column=0, sticky="ew", padx=20, pady=10)  # تغيير هنا
+
+        group_row = tk.Frame(group_frame)
         group_row.pack(fill=tk.X, pady=5)
 
         # select group
@@ -1366,8 +3521,23 @@ class SchedulePlacerPage(BasePage):
         self.duration_combobox.pack(side=tk.RIGHT, padx=10)
 
         # Schedule edit button ---> not working yet
-        self.edit_button = ttk.Button(group_frame, text="تعديل الجدول", command=self.toggle_edit_mode)
-        self.edit_button.pack(pady=5)
+        buttons_row = tk.Frame(group_frame)
+        buttons_row.pack(pady=5)
+        self.edit_button = ttk.Button(buttons_row, text="تعديل الجدول", command=self.toggle_edit_mode)
+        self.edit_button.pack(side=tk.RIGHT, padx=5)
+        ttk.Button(buttons_row, text="الأوقات والأماكن المتاحة", command=self.show_free_slots).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(buttons_row, text="توزيع تلقائي", command=self.auto_schedule).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(buttons_row, text="إصلاح الجدول", command=self.repair_schedule).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(buttons_row, text="جودة الجدول", command=self.show_timetable_quality).pack(side=tk.RIGHT, padx=5)
+
+        # مفتاح ألوان طبقات التعارض + تفاصيل الخلية تحت المؤشر
+        legend_row = tk.Frame(group_frame)
+        legend_row.pack(fill=tk.X)
+        for kind, label in self.CONFLICT_LABELS:
+            tk.Label(legend_row, text=label, bg=self.CONFLICT_COLORS[kind], padx=6).pack(side=tk.RIGHT, padx=3)
+        tk.Label(legend_row, text="أكثر من تعارض", bg="#f1948a", padx=6).pack(side=tk.RIGHT, padx=3)
+        self.conflict_status = tk.Label(group_frame, text="", justify='right', anchor='e', fg="#7b241c")
+        self.conflict_status.pack(fill=tk.X)
 
         self.table_container = tk.Frame(self.main_content)
         self.table_container.grid(row=2, column=0, sticky="nsew", padx=20, pady=10)
@@ -1380,26 +3550,18 @@ class SchedulePlacerPage(BasePage):
         # Check if comboboxes exist
         if not hasattr(self, 'dept_combobox') or not hasattr(self, 'year_combobox'):
             return
-            
-        conn = self.connect_db()
-        try:
-            cursor = conn.cursor()
-            
-            # load departs
-            cursor.execute("SELECT Department_name FROM Department")
-            departments = [row[0] for row in cursor.fetchall()]
+
+        def work():
+            return self.db.get_departments(), self.db.get_levels()
+
+        def apply(result):
+            departments, year_levels = result
             self.dept_combobox['values'] = departments
-            
-            # load years
-            cursor.execute("SELECT Levels_name FROM Levels")
-            year_levels = [row[0] for row in cursor.fetchall()]
             self.year_combobox['values'] = year_levels
-            
-        except pyodbc.Error as e:
-            messagebox.showerror("خطأ", f"تعذر تحميل البيانات الأولية: {str(e)}")
-        finally:
-            if conn:
-                conn.close()
+
+        self.run_in_background(
+            work, apply,
+            on_error=lambda e: messagebox.showerror("خطأ", f"تعذر تحميل البيانات الأولية: {str(e)}"))
 
     # not working yet ---> need edit           
     def toggle_edit_mode(self):
@@ -1460,83 +3622,28 @@ class SchedulePlacerPage(BasePage):
         self.group_combobox['values'] = display_list
         
     def is_place_reserved(self, place, day, start, end, current_group=None):
-        """التحقق من تعارض المكان مع تحسينات الأداء والمنطق"""
+        """التحقق من تعارض المكان من فهرس المواعيد المحملة (قاعدة البيانات تحسم عند الحفظ)"""
         if not place or not day or not start or not end:
             return False
 
-        # check conflicts ---> local data
-        for schedule_key, schedule_info in self.schedule_data.items():
-            # theory for more than one depart check
-            if (current_group and current_group['Group_Type'] == 'lecture' and 
-                len(current_group['departments']) > 1 and
-                schedule_key != self.current_schedule_key):
-                continue
-                
-            for existing_day, appointments in schedule_info.get('schedule', {}).items():
-                if existing_day != day:
-                    continue
-                    
-                for appt in appointments:
-                    if appt['place'] == place and not (end <= appt['start'] or start >= appt['end']):
-                        # except the participated theory lectures
-                        if (current_group and current_group['Group_Type'] == 'lecture' and
-                            appt['group']['Group_Type'] == 'lecture' and
-                            appt['group']['subject'] == current_group['subject'] and
-                            appt['group']['instructor'] == current_group['instructor']):
-                            return False
-                        return True
-
-        # db check conflicts
-        conn = None
-        cursor = None
         try:
-            conn = self.connect_db()
-            if not conn:
+            location_id = ReferenceCache().id_of('Location', place)
+            if location_id is None:
                 return False
-                
-            cursor = conn.cursor()
-            
-            query = """
-                SELECT COUNT(*) 
-                FROM schedule sch
-                JOIN location loc ON sch.location_id = loc.location_id
-                WHERE loc.Location_name = ?
-                AND sch.day = ?
-                AND NOT (sch.end_time <= ? OR sch.start_time >= ?)
-            """
-            
+
             # if the lecture was participated --- > skip conflict error
+            course_id = lecturer_id = None
             if current_group and current_group['Group_Type'] == 'lecture':
-                query += """
-                    AND NOT EXISTS (
-                        SELECT 1 FROM groups g
-                        JOIN courses c ON g.Course_ID = c.Course_ID
-                        JOIN lecturer lec ON g.Lecturer_ID = lec.Lecturer_ID
-                        WHERE g.group_id = sch.group_id
-                        AND c.Course_name = ?
-                        AND lec.F_name + ' ' + lec.L_name = ?
-                        AND g.Group_Type = 'lecture'
-                    )
-                """
-                cursor.execute(query, (place, day, start, end, 
-                                    current_group['subject'], current_group['instructor']))
-            else:
-                cursor.execute(query, (place, day, start, end))
-                
-            conflict_count = cursor.fetchone()[0]
-            return conflict_count > 0
+                course_id, _, lecturer_id = resolve_group_ids(current_group)
+
+            if self.schedules_loaded:
+                return bool(self.schedule_index.place_conflicts(location_id, day, start, end, course_id, lecturer_id))
+            # الجداول لم تُحمّل بعد --> السؤال من قاعدة البيانات
+            return self.db.count_room_conflicts(location_id, day, start, end, course_id, lecturer_id) > 0
             
-        except pyodbc.Error as e:
+        except Exception as e:
             messagebox.showerror("خطأ", f"تعذر التحقق من التعارضات في قاعدة البيانات: {str(e)}")
             return True 
-        finally:
-            try:
-                if cursor:
-                    cursor.close()
-                if conn:
-                    conn.close()
-            except Exception:
-                pass
 
 
     def create_schedule_table(self):
@@ -1569,11 +3676,13 @@ class SchedulePlacerPage(BasePage):
         )
         header_label.grid(row=0, column=total_columns, sticky="nsew")
 
-        for idx, time in enumerate(self.times[:-1]):
+        for idx, hour in enumerate(self.times[:-1]):
             col = 10 - idx
-            tk.Label(self.table_frame, text=f"{time+1}:00 - {time}:00", 
+            tk.Label(self.table_frame, text=f"{hour+1}:00 - {hour}:00", 
                     bg='#d3d3d3', relief="groove").grid(row=0, column=col, sticky="nsew")
 
+        self.empty_cells = {}
+
         # Days + empty cells
         for row_idx, day in enumerate(self.days, 1):
             # Day label
@@ -1589,31 +3698,7 @@ class SchedulePlacerPage(BasePage):
             )
             day_label.grid(row=row_idx, column=total_columns, sticky="nsew")
 
-            # Empty cells for each time slot
-            for col in range(total_columns):
-                start_time = self.times[col]
-                end_time = self.times[col + 1]
-
-                # Get current place selection
-                current_place = self.place_combobox.get()
-
-                # Only show conflict if there's a place selected and it's reserved
-                place_conflict = False
-                if current_place:
-                    place_conflict = self.is_place_reserved(current_place, day, start_time, end_time)
-
-                cell_bg = "#ffcccc" if place_conflict else "white"
-
-                cell = tk.Label(
-                    self.table_frame,
-                    bg=cell_bg,
-                    relief="solid",
-                    width=15,
-                    height=3
-                )
-                cell.grid(row=row_idx, column=col, sticky="nsew")
-                if not self.edit_mode:
-                    cell.bind("<Button-1>", lambda e, r=row_idx, c=col: self.place_group(r, c))
+            self.create_empty_cells(row_idx, day)
 
         # Configure grid weights for resizing
         for col in range(total_columns + 1):
@@ -1624,121 +3709,210 @@ class SchedulePlacerPage(BasePage):
         # Load saved schedule for current dept/year
         self.load_saved_schedule()
 
+        # إشغال المكان المختار للأسبوع كله في رحلة واحدة + طبقات المجموعة المختارة
+        self.refresh_table_conflicts()
+
         # Bind place combobox change to refresh the table
         self.place_combobox.bind("<<ComboboxSelected>>", lambda e: self.refresh_table_conflicts())
 
+    def create_empty_cells(self, row_idx, day):
+        """Empty cells for each time slot of one day"""
+        for col in range(len(self.times) - 1):
+            cell = tk.Label(
+                self.table_frame,
+                bg="white",
+                relief="solid",
+                width=15,
+                height=3,
+                font=('Arial', 8),
+                fg="#7b241c"
+            )
+            cell.grid(row=row_idx, column=col, sticky="nsew")
+            self.empty_cells[(day, col)] = cell
+            cell.bind("<Enter>", lambda e, d=day, c=col: self.show_cell_conflicts(d, c))
+            cell.bind("<Leave>", lambda e: self.conflict_status.config(text=""))
+            if not self.edit_mode:
+                cell.bind("<Button-1>", lambda e, r=row_idx, c=col: self.place_group(r, c))
+
+    def redraw_schedule_days(self, days):
+        """إعادة بناء صفوف أيام معينة فقط (بدون هدم الجدول كله)"""
+        total_columns = len(self.times) - 1
+        for day in days:
+            if day not in self.days:
+                continue
+            row_idx = self.days.index(day) + 1
+            for widget in self.table_frame.grid_slaves(row=row_idx):
+                if int(widget.grid_info()['column']) != total_columns:
+                    widget.destroy()
+            self.create_empty_cells(row_idx, day)
+        self.load_saved_schedule(days)
+
     def refresh_table_conflicts(self):
         """Refresh the conflict highlighting when place selection changes"""
+        self.place_matrix = None  # إشغال المكان السابق لا يخص المكان الجديد
+        self.apply_conflict_overlay()
+        self.refresh_place_occupancy()
+
+    CONFLICT_LABELS = (('room', "المكان محجوز"), ('lecturer', "المحاضر مشغول"), ('cohort', "الطلاب لديهم موعد"))
+    CONFLICT_COLORS = {'room': "#ffcccc", 'lecturer': "#ffd59e", 'cohort': "#e8daef"}
+
+    def group_cohort(self, group):
+        """(معرفات الأقسام، معرف المستوى) لطلاب المجموعة --> المحاضرة المشتركة تخص كل أقسامها"""
+        if group['Group_Type'] == 'lecture' and len(group['departments']) > 1:
+            department_ids = [ReferenceCache().id_of('Department', name) for name in group['departments']]
+        else:
+            department_ids = [group.get('dept_id')]
+        return department_ids, resolve_group_ids(group)[1]
+
+    def cell_conflicts(self, day, col):
+        """{'room'|'lecturer'|'cohort': [مواعيد متعارضة]} للخلية من فهارس الذاكرة (بدون SQL)"""
+        group = self.selected_group
+        conflicts = {'room': [], 'lecturer': [], 'cohort': []}
+        if not group or not self.schedules_loaded:
+            return conflicts
+        start, end = self.times[col], self.times[col + 1]
+        course_id, _, lecturer_id = resolve_group_ids(group)
+
+        location_id = ReferenceCache().id_of('Location', self.place_combobox.get()) if self.place_combobox.get() else None
+        if location_id is not None:
+            shared = group['Group_Type'] == 'lecture'
+            conflicts['room'] = self.schedule_index.place_conflicts(
+                location_id, day, start, end, course_id if shared else None, lecturer_id if shared else None)
+        conflicts['lecturer'] = self.schedule_index.lecturer_conflicts(lecturer_id, day, start, end)
+        conflicts['cohort'] = self.schedule_index.cohort_conflicts(*self.group_cohort(group), day, start, end, group)
+        return conflicts
+
+    def apply_conflict_overlay(self, days=None):
+        """تلوين الخلايا الفارغة: بدون مجموعة --> إشغال المكان؛ مع مجموعة --> طبقات المكان/المحاضر/الطلاب"""
+        if not getattr(self, 'empty_cells', None):
+            return
+        for (day, col), cell in self.empty_cells.items():
+            if days is not None and day not in days:
+                continue
+            if not self.selected_group:
+                cell.config(bg=self.occupancy_color(getattr(self, 'place_matrix', None), day, col), text="")
+                continue
+            conflicts = self.cell_conflicts(day, col)
+            active = [kind for kind, _ in self.CONFLICT_LABELS if conflicts[kind]]
+            if not active:
+                bg = "white"
+            elif len(active) == 1:
+                bg = self.CONFLICT_COLORS[active[0]]
+            else:
+                bg = "#f1948a"  # أكثر من نوع تعارض
+            cell.config(bg=bg, text="\n".join(label for kind, label in self.CONFLICT_LABELS if kind in active))
+
+    def show_cell_conflicts(self, day, col):
+        """تفاصيل تعارضات الخلية تحت المؤشر"""
+        conflicts = self.cell_conflicts(day, col)
+        details = []
+        for kind, label in self.CONFLICT_LABELS:
+            for appt in conflicts[kind]:
+                details.append(f"{label}: {appt['group']['subject']} - {appt['group']['instructor']} "
+                               f"({appt['place']}، {appt['start']}-{appt['end']})")
+        self.conflict_status.config(text="\n".join(dict.fromkeys(details)))
+
+    def refresh_place_occupancy(self, days=None):
+        """جلب مصفوفة إشغال المكان المختار (يوم × ساعة) في الخلفية ثم إعادة تلوين الخلايا (days=None --> كلها)"""
         current_place = self.place_combobox.get()
-        
-        for row_idx, day in enumerate(self.days, 1):
-            for col in range(len(self.times)-1):
-                start_time = self.times[col]
-                end_time = self.times[col + 1]
-                
-                # Check if current place is reserved at this time
-                place_conflict = False
-                if current_place:
-                    place_conflict = self.is_place_reserved(current_place, day, start_time, end_time)
-                
-                # Update cell color
-                for widget in self.table_frame.grid_slaves(row=row_idx, column=col):
-                    if widget.cget('bg') not in ['#d4edda', '#d4e6f1']:  # Don't change occupied cells
-                        widget.config(bg="#ffcccc" if place_conflict else "white")
+        location_id = ReferenceCache().id_of('Location', current_place) if current_place else None
+        if self.occupancy_request is not None:
+            self.occupancy_request.cancel()  # تغير المكان قبل رجوع الطلب السابق
+            self.occupancy_request = None
+        if location_id is None:
+            self.place_matrix = None
+            self.apply_conflict_overlay(days)
+            return
+
+        def loaded(matrix):
+            if self.place_combobox.get() != current_place:
+                return
+            self.place_matrix = matrix
+            self.apply_conflict_overlay(days)
 
-    def filter_groups(self):
+        def failed(e):
+            if self.place_combobox.get() != current_place:
+                return
+            self.show_status(f"تعذر تحميل إشغال المكان: {e}", error=True)
+            if self.schedules_loaded:
+                # تعذر الاستعلام --> نكتفي بفهرس المواعيد المحملة (بدون قاعدة البيانات)
+                self.place_matrix = {
+                    day: [Database.OCCUPIED if self.schedule_index.place_conflicts(location_id, day, start, end)
+                          else Database.FREE
+                          for start, end in zip(self.times, self.times[1:])]
+                    for day in self.days
+                }
+            else:
+                self.place_matrix = None  # لا فهرس بعد --> الخلايا بدون تلوين
+            self.apply_conflict_overlay(days)
+
+        self.occupancy_request = DataService().submit(
+            self, lambda: self.db.get_week_occupancy(self.days, self.times, location_id=location_id), loaded, failed)
+
+    def occupancy_color(self, occupancy, day, col):
+        if not occupancy:
+            return "white"
+        state = occupancy[day][col]
+        if state == Database.OCCUPIED:
+            return "#ffcccc"
+        if state == Database.SHAREABLE:
+            return "#ffe5b4"  # محاضرة مشتركة --> يمكن إضافة قسم آخر لها
+        return "white"
+
+    def filter_groups(self, on_done=None):
+        """تحميل المجموعات غير الموزعة للقسم/السنة في الخلفية ثم ملء القائمة (on_done بعد الملء)"""
         selected_dept = self.dept_combobox.get()
         selected_year = self.year_combobox.get()
 
         if not selected_dept or not selected_year:
             return
 
-        conn = self.connect_db()
-        try:
-            cursor = conn.cursor()
-            
-            cursor.execute("SELECT Department_ID FROM Department WHERE Department_name = ?", (selected_dept,))
-            dept_id = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT Levels_ID FROM Levels WHERE Levels_name = ?", (selected_year,))
-            level_id = cursor.fetchone()[0]
-            
-            query = """
-                SELECT 
-                    g.Group_ID,
-                    c.Course_name,
-                    lec.F_name + ' ' + lec.L_name AS lecturer_name,
-                    g.Group_Type,
-                    g.Group_Number,
-                    d.Department_name,
-                    lv.Levels_name,
-                    g.Department_ID,
-                    g.Levels_ID,
-                    g.Theory_Hours,
-                    g.Practical_Hours,
-                    c.Course_ID,
-                    g.Lecturer_ID
-                FROM Groups g
-                JOIN Courses c ON g.Course_ID = c.Course_ID
-                JOIN Lecturer lec ON g.Lecturer_ID = lec.Lecturer_ID
-                JOIN Department d ON g.Department_ID = d.Department_ID
-                JOIN Levels lv ON g.Levels_ID = lv.Levels_ID
-                WHERE d.Department_name = ? 
-                AND lv.Levels_name = ?
-                AND g.Levels_ID = ?
-                AND NOT EXISTS (
-                    SELECT 1 FROM Schedule s 
-                    WHERE s.Group_ID = g.Group_ID
-                    AND s.Department_ID = ?
-                )
-            """
-            cursor.execute(query, (selected_dept, selected_year, level_id, dept_id))
-            groups = cursor.fetchall()
-            
-            self.filtered_groups_data = []
-            for group in groups:
-                group_data = {
-                    'group_id': group[0],
-                    'subject': group[1],
-                    'instructor': group[2],
-                    'Group_Type': group[3],
-                    'group_number': group[4],
-                    'departments': [group[5]],
-                    'year_level': group[6],
-                    'dept_id': group[7],
-                    'level_id': group[8],
-                    'theory_hours': int(group[9]) if group[9] else 1,
-                    'practical_hours': int(group[10]) if group[10] else 1,
-                    'course_id': group[11],
-                    'lecturer_id': group[12],
-                    'is_shared': False
-                }
-                
-                if group[3] == 'lecture':
-                    cursor.execute("""
-                        SELECT COUNT(*) 
-                        FROM Course_Department 
-                        WHERE Course_ID = ?
-                    """, (group[11],))
-                    if cursor.fetchone()[0] > 1:
-                        group_data['is_shared'] = True
-                        cursor.execute("""
-                            SELECT d.Department_name 
-                            FROM Course_Department cd
-                            JOIN Department d ON cd.Department_ID = d.Department_ID
-                            WHERE cd.Course_ID = ?
-                        """, (group[11],))
-                        group_data['departments'] = [row[0] for row in cursor.fetchall()]
-                
-                self.filtered_groups_data.append(group_data)
-            
+        dept_id = ReferenceCache().id_of('Department', selected_dept)
+        level_id = ReferenceCache().id_of('Levels', selected_year)
+
+        def loaded(groups):
+            if (self.dept_combobox.get(), self.year_combobox.get()) != (selected_dept, selected_year):
+                return  # تغير القسم/السنة أثناء التحميل --> طلب أحدث سيملأ القائمة
+            self.filtered_groups_data = self.build_filtered_groups(groups)
             self.update_group_combobox()
-            
-        except pyodbc.Error as e:
+            if on_done:
+                on_done()
+
+        def failed(e):
             messagebox.showerror("خطأ", f"تعذر تحميل المجموعات: {str(e)}")
-        finally:
-            if conn:
-                conn.close()
+
+        # رحلة واحدة: المجموعات غير الموزعة + أقسام المادة المشتركة
+        self.run_in_background(lambda: self.db.get_unscheduled_groups(dept_id, level_id), loaded,
+                               on_error=failed, message="جاري تحميل المجموعات...")
+
+    @staticmethod
+    def build_filtered_groups(groups):
+        """صفوف get_unscheduled_groups --> قواميس المجموعات التي تستخدمها الصفحة"""
+        filtered_groups_data = []
+        for group in groups:
+            group_data = {
+                'group_id': group[0],
+                'subject': group[1],
+                'instructor': group[2],
+                'Group_Type': group[3],
+                'group_number': group[4],
+                'departments': [group[5]],
+                'year_level': group[6],
+                'dept_id': group[7],
+                'level_id': group[8],
+                'theory_hours': int(group[9]) if group[9] else 1,
+                'practical_hours': int(group[10]) if group[10] else 1,
+                'course_id': group[11],
+                'lecturer_id': group[12],
+                'is_shared': False
+            }
+
+            if group[3] == 'lecture' and (group[13] or 0) > 1:
+                group_data['is_shared'] = True
+                group_data['departments'] = group[14].split(Database.NAME_SEPARATOR)
+
+            filtered_groups_data.append(group_data)
+        return filtered_groups_data
 
     def on_dept_year_change(self, event=None):
         """عند تغيير القسم أو السنة الدراسية"""
@@ -1758,6 +3932,7 @@ class SchedulePlacerPage(BasePage):
             }
         
         self.current_schedule_key = new_schedule_key
+        self.selected_group = None  # المجموعات تتغير مع القسم/السنة
         
         self.filter_groups()
         
@@ -1765,32 +3940,13 @@ class SchedulePlacerPage(BasePage):
 
     def handle_practical_groups(self, group):
         """إدارة المجموعات العملية حسب القواعد المحددة"""
-        conn = self.connect_db()
-        try:
-            cursor = conn.cursor()
-            
-            # check practicals num
-            query = """
-                SELECT COUNT(*) 
-                FROM Groups
-                WHERE Course_ID = ?
-                AND Department_ID = ?
-                AND Group_Type = 'practical'
-            """
-            cursor.execute(query, (group['course_id'], group['dept_id']))
-            practical_count = cursor.fetchone()[0]
-            
-            if practical_count > 1:
-                # same time ---> different places
-                self.allow_concurrent_practicals = True
-            else:
-                self.allow_concurrent_practicals = False
-                
-        except pyodbc.Error as e:
-            messagebox.showerror("خطأ", f"تعذر التحقق من المجموعات العملية: {str(e)}")
-        finally:
-            if conn:
-                conn.close()
+        def counted(practical_count):
+            # same time ---> different places
+            self.allow_concurrent_practicals = practical_count > 1
+
+        self.run_in_background(
+            lambda: self.db.count_practical_groups(group['course_id'], group['dept_id']), counted,
+            lambda e: messagebox.showerror("خطأ", f"تعذر التحقق من المجموعات العملية: {str(e)}"))
 
 
     def select_group(self, event):
@@ -1824,6 +3980,9 @@ class SchedulePlacerPage(BasePage):
             if self.selected_group['Group_Type'] == 'practical':
                 self.handle_practical_groups(self.selected_group)
 
+            # طبقات التعارض للمجموعة الجديدة (من الذاكرة فقط)
+            self.apply_conflict_overlay()
+
     def is_group_already_scheduled(self, group_id, dept_id):
         """Check if this group is already scheduled in the current week for this department"""
         if not self.current_schedule_key:
@@ -1838,6 +3997,10 @@ class SchedulePlacerPage(BasePage):
         return False
 
     def place_group(self, row, col):
+        if not self.schedules_loaded:
+            messagebox.showwarning("تحذير", "جاري تحميل الجداول، يرجى الانتظار")
+            return
+
         if not self.selected_group:
             messagebox.showwarning("تحذير", "يرجى اختيار مجموعة أولاً")
             return
@@ -1866,17 +4029,357 @@ class SchedulePlacerPage(BasePage):
                 messagebox.showwarning("تحذير", "هذه المجموعة مضافوة بالفعل في الجدول!")
                 return
 
-            save_success = self.save_schedule(day, start_time, end_time, place, self.selected_group)
-            
-            if save_success:
+            group = self.selected_group
+
+            def saved():
                 # delete group from list
-                self.remove_group_from_filtered_data(self.selected_group['group_id'])
-                self.group_combobox.set('')
+                self.remove_group_from_filtered_data(group['group_id'])
+                if self.selected_group is group:
+                    self.group_combobox.set('')
+                    self.selected_group = None
 
                 self.refresh_schedule_table()
+
+            self.save_schedule(day, start_time, end_time, place, group, saved)
         except ValueError:
             messagebox.showerror("خطأ", "بيانات غير صالحة")
             
+    def show_free_slots(self):
+        """كل المواعيد الممكنة للمجموعة المختارة: تلوين الجدول + قائمة مرتبة بملاءمة السعة"""
+        if not self.schedules_loaded:
+            messagebox.showwarning("تحذير", "جاري تحميل الجداول، يرجى الانتظار")
+            return
+        if not self.selected_group:
+            messagebox.showwarning("تحذير", "يرجى اختيار مجموعة أولاً")
+            return
+
+        group = self.selected_group
+        duration = int(self.duration_combobox.get() or 1)
+        group_size = expected_group_size(group)
+        rooms = [(details['id'], name, details['capacity']) for name, details in self.location_details.items()]
+        try:
+            slots = find_free_slots(self.schedule_data, group, rooms, self.days, self.times, duration, group_size)
+        except ImportError:
+            messagebox.showerror("خطأ", "المكتبات المطلوبة غير مثبتة. قم بتثبيت:\n"
+                                "pip install numpy")
+            return
+
+        if not slots:
+            messagebox.showinfo("الأوقات المتاحة", "لا توجد أوقات متاحة لهذه المجموعة")
+            return
+
+        # تلوين الخلايا التي يمكن أن تغطيها المجموعة في مكان واحد على الأقل
+        free_cells = set()
+        for slot in slots:
+            first = self.times.index(slot['start'])
+            free_cells.update((slot['day'], col) for col in range(first, first + duration))
+        for row_idx, day in enumerate(self.days, 1):
+            for col in range(len(self.times) - 1):
+                if (day, col) not in free_cells:
+                    continue
+                for widget in self.table_frame.grid_slaves(row=row_idx, column=col):
+                    if widget.cget('bg') not in ['#d4edda', '#d4e6f1']:
+                        widget.config(bg="#c8f7c5")
+
+        window = tk.Toplevel(self)
+        window.title(f"الأوقات المتاحة - {group['subject']} (حوالي {group_size} طالب)")
+        window.geometry("560x420")
+        tree = ttk.Treeview(window, columns=('capacity', 'place', 'time', 'day'), show='headings')
+        for column, title, width in (('capacity', 'السعة', 80), ('place', 'المكان', 180),
+                                     ('time', 'الوقت', 120), ('day', 'اليوم', 100)):
+            tree.heading(column, text=title)
+            tree.column(column, width=width, anchor='center')
+        tree.tag_configure('small', foreground='#b03a2e')
+        scrollbar = ttk.Scrollbar(window, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.LEFT, fill=tk.Y)
+        tree.pack(fill=tk.BOTH, expand=True)
+
+        for index, slot in enumerate(slots):
+            tree.insert("", tk.END, iid=str(index), tags=() if slot['fits'] else ('small',), values=(
+                slot['capacity'] or '-', slot['place'], f"{slot['start']}:00 - {slot['end']}:00", slot['day']))
+
+        def place_selected(event=None):
+            selected = tree.selection()
+            if not selected:
+                return
+            slot = slots[int(selected[0])]
+            window.destroy()
+            self.place_combobox.set(slot['place'])
+            # place_group تستقبل خلية النهاية
+            self.place_group(self.days.index(slot['day']) + 1, self.times.index(slot['end']) - 1)
+
+        tree.bind("<Double-1>", place_selected)
+        ttk.Button(window, text="وضع المجموعة في الموعد المحدد", command=place_selected).pack(pady=5)
+
+    def auto_schedule(self):
+        """توزيع كل المجموعات غير الموزعة (كل الأقسام والمستويات) ثم حفظها في معاملة واحدة"""
+        if not self.schedules_loaded:
+            messagebox.showwarning("تحذير", "جاري تحميل الجداول، يرجى الانتظار")
+            return
+        if not messagebox.askyesno("توزيع تلقائي", "سيتم توزيع كل المجموعات غير الموزعة في كل الأقسام والمستويات "
+                                                   "على الأيام والأماكن المتاحة دون تغيير المواعيد الحالية.\nمتابعة؟"):
+            return
+
+        settings = read_scheduling_settings()
+        progress = queue.Queue()
+
+        def work():
+            group_rows, course_departments, fixed, mark = self.db.get_solver_problem()
+            sessions = build_solver_sessions(group_rows, course_departments, settings)
+            # عدة عمليات بترتيبات وبذور مختلفة؛ أول حل كامل يوقف الباقي
+            placements, unplaced, stats = solve_portfolio(
+                self.db.get_locations(), fixed, sessions, workers=settings['solver_workers'],
+                restarts=settings['solver_restarts'], time_limit=settings['solver_time_limit'],
+                progress=lambda *message: progress.put(message))
+            return placements, unplaced, mark, stats
+
+        def show_progress():
+            if request.done or request.cancelled:
+                return
+            latest = None
+            while not progress.empty():
+                latest = progress.get_nowait()
+            if latest is not None and self.loading_label is not None:
+                seed, attempt, _, best_unplaced = latest
+                self.loading_label.config(text=f"جاري التوزيع التلقائي... العامل {seed + 1} - المحاولة {attempt} "
+                                               f"- أفضل نتيجة: {best_unplaced} مجموعة بدون موعد")
+            self.after(200, show_progress)
+
+        request = self.run_in_background(work, self.confirm_auto_schedule,
+                                         timeout=settings['solver_time_limit'] + 120,
+                                         message="جاري التوزيع التلقائي...")
+        show_progress()
+
+    def confirm_auto_schedule(self, result):
+        placements, unplaced, mark, stats = result
+        summary = (f"{stats['attempts']} محاولة على {stats['workers']} عملية في {stats['elapsed']:.1f} ث")
+        if not placements:
+            if unplaced:
+                self.show_status(f"التوزيع التلقائي: تعذر توزيع {len(unplaced)} مجموعة ({summary})")
+                self.show_unplaced_groups(unplaced)
+            else:
+                messagebox.showinfo("توزيع تلقائي", "لا توجد مجموعات غير موزعة")
+            return
+        if not messagebox.askyesno("توزيع تلقائي", f"تم إيجاد مواعيد لـ {len(placements)} مجموعة "
+                                                   f"وتعذر توزيع {len(unplaced)}.\n{summary}\nحفظ النتيجة؟"):
+            return
+
+        def saved(count):
+            messagebox.showinfo("نجاح", f"تم حفظ {count} موعد")
+            self.load_schedules_from_db()
+            self.filter_groups()
+            if unplaced:
+                self.show_unplaced_groups(unplaced)
+
+        def failed(error):
+            if isinstance(error, ValueError):
+                messagebox.showerror("خطأ", str(error))
+            else:
+                self.show_background_error(error)
+
+        self.run_in_background(lambda: self.db.save_placements(placements, mark), saved,
+                               on_error=failed, message="جاري حفظ التوزيع...")
+
+    def show_unplaced_groups(self, unplaced):
+        """المجموعات التي تعذر توزيعها مع السبب"""
+        window = tk.Toplevel(self)
+        window.title(f"مجموعات تعذر توزيعها ({len(unplaced)})")
+        window.geometry("760x420")
+        tree = ttk.Treeview(window, columns=('reason', 'group'), show='headings')
+        tree.heading('reason', text='السبب')
+        tree.heading('group', text='المجموعة')
+        tree.column('reason', width=380, anchor='e')
+        tree.column('group', width=360, anchor='e')
+        scrollbar = ttk.Scrollbar(window, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.LEFT, fill=tk.Y)
+        tree.pack(fill=tk.BOTH, expand=True)
+        for session, reason in unplaced:
+            tree.insert("", tk.END, values=(reason, session['label']))
+
+    def show_timetable_quality(self):
+        """تفصيل عقوبات القيود المرنة للجدول الحالي لكل الأقسام (أقل = أفضل)"""
+        if not self.schedules_loaded:
+            messagebox.showwarning("تحذير", "جاري تحميل الجداول، يرجى الانتظار")
+            return
+        settings = read_scheduling_settings()
+        rooms = [(details['id'], name, details['capacity']) for name, details in self.location_details.items()]
+        try:
+            sessions, positions = scoring_sessions_from_schedule(self.schedule_data, settings)
+            if not sessions:
+                messagebox.showinfo("جودة الجدول", "لا توجد مواعيد في الجدول")
+                return
+            scorer = TimetableScorer(sessions, rooms, self.days, self.times, settings)
+            rows, total = scorer.breakdown(*scorer.encode(positions))
+        except ImportError:
+            messagebox.showerror("خطأ", "المكتبات المطلوبة غير مثبتة. قم بتثبيت:\n"
+                                "pip install numpy")
+            return
+
+        window = tk.Toplevel(self)
+        window.title(f"جودة الجدول: {total:.1f} ({len(sessions)} موعد)")
+        window.geometry("720x260")
+        tree = ttk.Treeview(window, columns=('penalty', 'weight', 'value', 'metric'), show='headings')
+        for column, text, width in (('penalty', 'العقوبة', 100), ('weight', 'الوزن', 80),
+                                    ('value', 'القيمة', 120), ('metric', 'المقياس', 400)):
+            tree.heading(column, text=text)
+            tree.column(column, width=width, anchor='e')
+        tree.tag_configure('total', font=('Arial', 10, 'bold'))
+        for label, value, weight, penalty in rows:
+            tree.insert("", tk.END, values=(f"{penalty:.1f}", weight, f"{value:g}", label))
+        tree.insert("", tk.END, tags=('total',), values=(f"{total:.1f}", "", "", "المجموع (أقل = أفضل)"))
+        tree.pack(fill=tk.BOTH, expand=True)
+
+    REPAIR_KINDS = (("مكان مغلق", 'room'), ("محاضر غير متاح", 'lecturer'), ("وقت غير متاح للجميع", 'slot'))
+
+    def repair_schedule(self):
+        """إغلاق مكان أو محاضر أو وقت ثم نقل أقل عدد ممكن من المواعيد (معاينة قبل الحفظ)"""
+        if not self.schedules_loaded:
+            messagebox.showwarning("تحذير", "جاري تحميل الجداول، يرجى الانتظار")
+            return
+
+        teachers = {name: lecturer_id for lecturer_id, name in self.db.get_teachers()}
+        window = tk.Toplevel(self)
+        window.title("إصلاح الجدول")
+        window.resizable(False, False)
+
+        def field(label, values, width=28):
+            row = tk.Frame(window)
+            row.pack(fill=tk.X, padx=10, pady=4)
+            tk.Label(row, text=label, width=10, anchor='e').pack(side=tk.RIGHT)
+            combobox = ttk.Combobox(row, values=values, state="readonly", width=width)
+            combobox.pack(side=tk.RIGHT, padx=5)
+            return combobox
+
+        kind_combobox = field("التغيير:", [label for label, _ in self.REPAIR_KINDS])
+        entity_combobox = field("المكان/المحاضر:", [])
+        day_combobox = field("اليوم:", ["كل الأيام"] + self.days)
+        start_combobox = field("من الساعة:", self.times[:-1], width=6)
+        end_combobox = field("إلى الساعة:", self.times[1:], width=6)
+        day_combobox.set("كل الأيام")
+        start_combobox.set(self.times[0])
+        end_combobox.set(self.times[-1])
+
+        def kind_changed(event=None):
+            kind = dict(self.REPAIR_KINDS)[kind_combobox.get()]
+            entity_combobox.set('')
+            if kind == 'room':
+                entity_combobox.config(values=sorted(self.location_details), state="readonly")
+            elif kind == 'lecturer':
+                entity_combobox.config(values=sorted(teachers), state="readonly")
+            else:
+                entity_combobox.config(values=[], state="disabled")
+
+        kind_combobox.bind("<<ComboboxSelected>>", kind_changed)
+        kind_combobox.set(self.REPAIR_KINDS[0][0])
+        kind_changed()
+
+        def preview():
+            kind = dict(self.REPAIR_KINDS)[kind_combobox.get()]
+            entity = entity_combobox.get()
+            if kind != 'slot' and not entity:
+                messagebox.showwarning("تحذير", "يرجى اختيار المكان أو المحاضر", parent=window)
+                return
+            start, end = int(start_combobox.get()), int(end_combobox.get())
+            if start >= end:
+                messagebox.showerror("خطأ", "وقت البداية يجب أن يكون قبل وقت النهاية", parent=window)
+                return
+            constraint = {
+                'kind': kind,
+                'id': self.location_details[entity]['id'] if kind == 'room' else teachers.get(entity),
+                'days': None if day_combobox.get() == "كل الأيام" else [day_combobox.get()],
+                'start': start,
+                'end': end,
+            }
+            window.destroy()
+            self.preview_repair(constraint)
+
+        ttk.Button(window, text="معاينة", command=preview).pack(pady=10)
+
+    def preview_repair(self, constraint):
+        settings = read_scheduling_settings()
+
+        def work():
+            rows, mark = self.db.get_repair_problem()
+            sessions = build_repair_sessions(rows, settings)
+            repair = TimetableRepair(sessions, self.db.get_locations(), constraint, self.days, self.times)
+            moves, failed, stats = repair.run(time_limit=settings['repair_time_limit'])
+            return moves, failed, mark, repair.quality(settings), stats
+
+        self.run_in_background(work, self.show_repair_preview,
+                               timeout=settings['repair_time_limit'] + 60, message="جاري البحث عن أقل تغيير...")
+
+    def show_repair_preview(self, result):
+        """الفرق قبل/بعد لكل موعد سيتغير؛ المواعيد التي لم تجد بديلاً تعود لقائمة غير الموزعة"""
+        moves, failed, mark, quality, stats = result
+        if not moves and not failed:
+            messagebox.showinfo("إصلاح الجدول", "لا توجد مواعيد تتأثر بهذا التغيير")
+            return
+        summary = (f"{stats['affected']} موعد يخالف التغيير، {stats['displaced']} موعد آخر أُزيح لإفساح المكان، "
+                   f"{len(failed)} بدون موعد بديل - في {stats['elapsed']:.1f} ث")
+        if stats['timed_out']:
+            summary += " (انتهت المهلة قبل تجربة كل البدائل)"
+
+        window = tk.Toplevel(self)
+        title = f"معاينة الإصلاح: {len(moves)} نقل، {len(failed)} إلغاء"
+        if quality is not None:
+            title += f" | عقوبة الجودة: {quality[0]:.1f} ← {quality[1]:.1f}"
+        window.title(title)
+        window.geometry("980x460")
+        places = {details['id']: name for name, details in self.location_details.items()}
+        tree = ttk.Treeview(window, columns=('new', 'old', 'group'), show='headings')
+        tree.heading('new', text='الموعد الجديد')
+        tree.heading('old', text='الموعد الحالي')
+        tree.heading('group', text='المجموعة')
+        tree.column('new', width=300, anchor='e')
+        tree.column('old', width=260, anchor='e')
+        tree.column('group', width=400, anchor='e')
+        tree.tag_configure('removed', background='#ffd6d6')
+        scrollbar = ttk.Scrollbar(window, orient=tk.VERTICAL, command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+
+        def slot_text(day, start, end, location_id, place=None):
+            return f"{day} {start}-{end} | {place or places.get(location_id, location_id)}"
+
+        for session, (day, start, end, location_id) in moves:
+            tree.insert("", tk.END, values=(
+                slot_text(day, start, end, location_id),
+                slot_text(session['day'], session['start'], session['end'], session['location_id'], session['place']),
+                session['label']))
+        for session, reason in failed:
+            tree.insert("", tk.END, tags=('removed',), values=(
+                f"إلغاء الموعد ({reason})",
+                slot_text(session['day'], session['start'], session['end'], session['location_id'], session['place']),
+                session['label']))
+
+        tk.Label(window, text=summary, anchor='e').pack(side=tk.TOP, fill=tk.X, padx=10, pady=5)
+
+        def apply():
+            window.destroy()
+
+            def applied(counts):
+                moved, removed = counts
+                messagebox.showinfo("نجاح", f"تم نقل {moved} موعد وإلغاء {removed}")
+                self.load_schedules_from_db()
+                self.filter_groups()
+
+            def failed_to_apply(error):
+                if isinstance(error, ValueError):
+                    messagebox.showerror("خطأ", str(error))
+                else:
+                    self.show_background_error(error)
+
+            self.run_in_background(lambda: self.db.apply_repair(moves, [session for session, _ in failed], mark),
+                                   applied, on_error=failed_to_apply, message="جاري حفظ الإصلاح...")
+
+        buttons = tk.Frame(window)
+        buttons.pack(side=tk.BOTTOM, pady=5)
+        ttk.Button(buttons, text="تطبيق", command=apply).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(buttons, text="إلغاء", command=window.destroy).pack(side=tk.RIGHT, padx=5)
+        scrollbar.pack(side=tk.LEFT, fill=tk.Y)
+        tree.pack(fill=tk.BOTH, expand=True)
+
     def remove_group_from_filtered_data(self, group_id):
         if not group_id:
             return
@@ -1917,224 +4420,303 @@ class SchedulePlacerPage(BasePage):
                 group['Group_Type'] == 'lecture' and 
                 dept in group['departments']):
                 self.filtered_groups_data.remove(group)
-        self.update_group_combobox()
-        
-    def load_locations_from_db(self):
-        conn = None
-        cursor = None
-        try:
-            conn = self.connect_db()
-            if not conn:
-                return []
+        self.update_group_combobox()
+        
+    def load_locations_from_db(self):
+        self.run_in_background(self.db.get_locations, self.apply_locations,
+                               on_error=self.on_locations_error, message="جاري تحميل الأماكن...")
 
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT COUNT(*) 
-                FROM INFORMATION_SCHEMA.TABLES 
-                WHERE TABLE_NAME = 'Location'
-            """)
-            table_exists = cursor.fetchone()[0] > 0
-            
-            if not table_exists:
-                messagebox.showerror("خطأ", "جدول الأماكن غير موجود في قاعدة البيانات")
-                return []
+    def apply_locations(self, rows):
+        self.locations = [row[1] for row in rows]
+        self.location_details = {row[1]: {'id': row[0], 'capacity': row[2]} for row in rows}
+        self.place_combobox['values'] = self.locations
 
-            cursor.execute("""
-                SELECT 
-                    Location_ID,
-                    Location_name,
-                    ISNULL(capacity, 0) as capacity
-                FROM Location 
-                ORDER BY Location_ID
-            """)
-            
-            self.locations = []
-            location_details = {} 
-            for row in cursor:
-                self.locations.append(row[1])
-                location_details[row[1]] = {
-                    'id': row[0],
-                    'capacity': row[2]
-                }
+        if not self.locations:
+            messagebox.showwarning("تنبيه", "لم يتم إضافة أي أماكن بعد!")
+            self.place_combobox.set('')
 
-            self.place_combobox['values'] = self.locations
-            
-            if not self.locations:
-                messagebox.showwarning("تنبيه", "لم يتم إضافة أي أماكن بعد!")
-                self.place_combobox.set('')
-                
-            return self.locations
-            
-        except pyodbc.Error as e:
+    def on_locations_error(self, e):
+        if isinstance(e, ValueError):
+            messagebox.showerror("خطأ", str(e))
+        elif isinstance(e, DB_ERRORS):
             error_msg = f"فشل تحميل الأماكن:\n{str(e)}"
             if "Invalid column name" in str(e):
                 error_msg += "\nهيكل جدول الأماكن غير متوافق مع التطبيق"
             messagebox.showerror("خطأ في قاعدة البيانات", error_msg)
-            return []
-        except Exception as e:
+        else:
             messagebox.showerror("خطأ غير متوقع", f"حدث خطأ أثناء تحميل الأماكن: {str(e)}")
-            return []
-        finally:
-            try:
-                if cursor:
-                    cursor.close()
-                if conn:
-                    conn.close()
-            except Exception as e:
-                print(f"Warning: Error closing resources - {str(e)}")
-            self.place_combobox.update()
 
 
+    def schedule_sync_key(self):
+        # تغيّر القاعدة أو أي تعديل على الجداول المرجعية (أسماء، مواد مشتركة) --> تحميل كامل
+        return db_backend().key(), ReferenceCache().version
+
     def load_schedules_from_db(self):
-        """تحميل الجداول من قاعدة البيانات مع معالجة المواد المشتركة"""
-        conn = None
-        try:
-            conn = self.connect_db()
-            if not conn:
-                messagebox.showerror("خطأ", "فشل الاتصال بقاعدة البيانات")
-                return
-                
-            cursor = conn.cursor()
-            
-            self.schedule_data = {}
-            self.data_manager.schedule_data = self.schedule_data
-            
-            query = """
-                SELECT 
-                    d.Department_name,
-                    d.Department_ID,
-                    lv.Levels_name,
-                    sch.day,
-                    sch.start_time,
-                    sch.end_time,
-                    loc.Location_name,
-                    c.Course_name,
-                    lec.F_name + ' ' + lec.L_name AS lecturer_name,
-                    gr.Group_Type,
-                    gr.Group_Number,
-                    gr.Group_ID,
-                    c.Course_ID
-                FROM schedule sch
-                JOIN groups gr ON sch.group_id = gr.group_id
-                JOIN department d ON sch.Department_ID = d.Department_ID
-                JOIN levels lv ON gr.Levels_ID = lv.Levels_ID
-                JOIN courses c ON gr.Course_ID = c.Course_ID
-                JOIN lecturer lec ON gr.Lecturer_ID = lec.Lecturer_ID
-                JOIN location loc ON sch.location_id = loc.location_id
-                ORDER BY d.Department_name, lv.Levels_name, sch.day, sch.start_time
-            """
-            
-            cursor.execute(query)
-            schedules = cursor.fetchall()
-            
-            if not schedules:
-                print("لا توجد جداول محفوظة في قاعدة البيانات")
+        """تحميل الجداول: المواعيد المتغيرة فقط لو عندنا نسخة متزامنة، وإلا تحميل كامل (استعلامان)"""
+        self.schedules_loaded = False
+        sync_key = self.schedule_sync_key()
+        since = self.data_manager.schedule_sync_mark
+        if self.data_manager.schedule_sync_key != sync_key:
+            since = None
+
+        def work():
+            started = time.perf_counter()
+            if since is not None:
+                delta = self.db.get_schedule_changes(since)
+                if delta is not None:
+                    return 'delta', delta, sync_key, time.perf_counter() - started
+            rows, shared, mark = self.db.get_schedule_rows()
+            schedule_data = self.build_schedule_data(rows, shared)
+            return 'full', (schedule_data, len(rows), mark), sync_key, time.perf_counter() - started
+
+        self.run_in_background(work, self.apply_schedules,
+                               on_error=self.on_schedules_error, message="جاري تحميل الجداول...")
+
+    def on_schedules_error(self, e):
+        self.schedules_loaded = True
+        messagebox.showerror("خطأ", f"فشل تحميل الجداول:\n{str(e)}")
+
+    def apply_schedules(self, result):
+        kind, payload, sync_key, self.schedules_load_time = result
+        if kind == 'delta':
+            changed_ids, rows, shared, mark = payload
+            # الدمج هنا (خيط الواجهة) لأن schedule_data قد تكون تعدلت أثناء الجلب
+            self.merge_schedule_delta(self.schedule_data, changed_ids, rows, shared)
+            self.data_manager.own_schedule_ids -= changed_ids
+            self.show_status(f"تمت مزامنة {len(changed_ids)} موعد متغير في {self.schedules_load_time * 1000:.0f} ms")
+        else:
+            self.schedule_data, count, mark = payload
+            self.data_manager.own_schedule_ids.clear()
+            if not count:
+                self.show_status("لا توجد جداول محفوظة في قاعدة البيانات")
+            else:
+                self.show_status(f"تم تحميل {count} موعد من قاعدة البيانات في {self.schedules_load_time * 1000:.0f} ms")
+
+        self.data_manager.schedule_data = self.schedule_data
+        self.data_manager.schedule_sync_mark = mark
+        self.data_manager.schedule_sync_key = sync_key if mark is not None else None
+        self.schedule_index.rebuild(self.schedule_data)
+        self.schedules_loaded = True
+        self.create_schedule_table()
+
+    @staticmethod
+    def merge_schedule_delta(schedule_data, changed_ids, rows, shared, index=None):
+        """تطبيق المواعيد المتغيرة على schedule_data في مكانها (ومعها index لو أُعطي)
+
+        يرجع {(مفتاح القسم/المستوى، اليوم)} التي تغيرت --> لتحديث خلاياها فقط
+        """
+        touched = set()
+        if not changed_ids:
+            return touched
+        # المواعيد المحفوظة من هذا الجهاز ليس لها schedule_id بعد --> تُستبدل بنسختها من القاعدة
+        fresh = {(row[0], row[2], row[3], row[11], row[4], row[5]) for row in rows}
+
+        for key, info in schedule_data.items():
+            for day, appointments in info['schedule'].items():
+                kept = []
+                for a in appointments:
+                    if (a.get('schedule_id') in changed_ids
+                            or (a.get('schedule_id') is None
+                                and (info['dept'], info['year'], day, a['group'].get('group_id'),
+                                     a['start'], a['end']) in fresh)):
+                        touched.add((key, day))
+                        if index is not None:
+                            index.remove(day, a)
+                    else:
+                        kept.append(a)
+                appointments[:] = kept
+
+        for key, info in SchedulePlacerPage.build_schedule_data(rows, shared).items():
+            target = schedule_data.setdefault(key, {'dept': info['dept'], 'year': info['year'], 'schedule': {}})
+            for day, appointments in info['schedule'].items():
+                touched.add((key, day))
+                if index is not None:
+                    for appt in appointments:
+                        index.add(day, appt)
+                target['schedule'].setdefault(day, []).extend(appointments)
+                target['schedule'][day].sort(key=lambda a: a['start'])
+        return touched
+
+    def sync_schedule_changes(self):
+        """جلب ما غيره المستخدمون الآخرون بعد آخر مزامنة (بدون إعادة تحميل الصفحة)"""
+        since = self.data_manager.schedule_sync_mark
+        if not self.schedules_loaded or since is None:
+            return
+        if self.sync_request is not None and not (self.sync_request.done or self.sync_request.cancelled):
+            return
+        if self.data_manager.schedule_sync_key != self.schedule_sync_key():
+            self.load_schedules_from_db()
+            return
+
+        def apply(delta):
+            if self.data_manager.schedule_sync_mark != since:
+                return  # تحميل آخر سبقنا
+            if delta is None:
+                self.load_schedules_from_db()  # تغييرات كثيرة أو سجل أُعيد إنشاؤه
                 return
-                
-            for schedule in schedules:
-                dept = schedule[0]
-                dept_id = schedule[1]
-                year = schedule[2]
-                key = f"{dept}_{year}"
-                
-                if key not in self.schedule_data:
-                    self.schedule_data[key] = {
-                        'dept': dept,
-                        'year': year,
-                        'schedule': {}
-                    }
-                    
-                day = schedule[3]
-                if day not in self.schedule_data[key]['schedule']:
-                    self.schedule_data[key]['schedule'][day] = []
-                    
+            changed_ids, rows, shared, mark = delta
+            touched = self.merge_schedule_delta(self.schedule_data, changed_ids, rows, shared, self.schedule_index)
+            self.data_manager.schedule_sync_mark = mark
+            self.data_manager.own_schedule_ids -= changed_ids
+            if touched:
+                self.show_status(f"تمت مزامنة {len(changed_ids)} موعد غيره مستخدم آخر")
+                self.refresh_changed_cells(touched)
+
+        self.sync_request = DataService().submit(
+            self, lambda: self.db.get_schedule_changes(since), apply,
+            lambda e: self.show_status(f"تعذر مزامنة تغييرات الجداول: {e}", error=True))
+
+    def refresh_changed_cells(self, touched):
+        """إعادة رسم أيام القسم/المستوى المعروض التي تغيرت فقط + طبقات التعارض لأيام التغيير"""
+        if not self.current_schedule_key or not getattr(self, 'empty_cells', None):
+            return
+        days = {day for key, day in touched if key == self.current_schedule_key}
+        if days:
+            self.redraw_schedule_days(days)
+            # المجموعات غير الموزعة قد تغيرت أيضاً
+            selected_id = self.selected_group.get('group_id') if self.selected_group else None
+
+            def groups_refreshed():
+                # المجموعة المختارة وزعها مستخدم آخر
+                if (self.selected_group and self.selected_group.get('group_id') == selected_id
+                        and all(g.get('group_id') != selected_id for g in self.filtered_groups_data)):
+                    self.selected_group = None
+                    self.group_combobox.set('')
+                    self.refresh_table_conflicts()
+
+            self.filter_groups(groups_refreshed)
+        # المكان والمحاضر مشتركان بين الأقسام --> تغيير في قسم آخر قد يلون خلايا هذا الجدول
+        self.apply_conflict_overlay({day for _, day in touched})
+        if not self.selected_group and self.place_combobox.get():
+            self.refresh_place_occupancy({day for _, day in touched})
+
+    @staticmethod
+    def build_schedule_data(rows, shared):
+        schedule_data = {}
+        for schedule in rows:
+            dept = schedule[0]
+            dept_id = schedule[1]
+            year = schedule[2]
+            key = f"{dept}_{year}"
+
+            if key not in schedule_data:
+                schedule_data[key] = {
+                    'dept': dept,
+                    'year': year,
+                    'schedule': {}
+                }
+
+            day = schedule[3]
+            if day not in schedule_data[key]['schedule']:
+                schedule_data[key]['schedule'][day] = []
+
+            if schedule[9] == 'practical':
+                departments = [dept]
                 is_shared = False
-                if schedule[9] == 'lecture':
-                    cursor.execute("SELECT COUNT(*) FROM Course_Department WHERE Course_ID = ?", (schedule[12],))
-                    is_shared = cursor.fetchone()[0] > 1
-                
-                departments = [dept] if schedule[9] == 'practical' else self.get_shared_departments(schedule[12])
-                
-                self.schedule_data[key]['schedule'][day].append({
-                    'start': schedule[4],
-                    'end': schedule[5],
-                    'place': schedule[6],
-                    'group': {
-                        'subject': schedule[7],
-                        'instructor': schedule[8],
-                        'Group_Type': schedule[9],
-                        'group_number': schedule[10],
-                        'group_id': schedule[11],
-                        'departments': departments,
-                        'year_level': year,
-                        'dept_id': dept_id,
-                        'course_id': schedule[12],
-                        'is_shared': is_shared
-                    }
-                })
-                
-            print("تم تحميل الجداول بنجاح من قاعدة البيانات")
-            
-        except pyodbc.Error as e:
-            messagebox.showerror("خطأ", f"فشل تحميل الجداول:\n{str(e)}")
-        finally:
-            if conn:
-                conn.close()
+            else:
+                departments = shared.get(schedule[12], [])
+                is_shared = len(departments) > 1
+
+            schedule_data[key]['schedule'][day].append({
+                'start': schedule[4],
+                'end': schedule[5],
+                'place': schedule[6],
+                'schedule_id': schedule[16],
+                'group': {
+                    'subject': schedule[7],
+                    'instructor': schedule[8],
+                    'Group_Type': schedule[9],
+                    'group_number': schedule[10],
+                    'group_id': schedule[11],
+                    'departments': departments,
+                    'year_level': year,
+                    'dept_id': dept_id,
+                    'course_id': schedule[12],
+                    'level_id': schedule[13],
+                    'lecturer_id': schedule[14],
+                    'location_id': schedule[15],
+                    'is_shared': is_shared
+                }
+            })
+        return schedule_data
 
     def delete_appointment_and_group(self, day, appt):
         if not messagebox.askyesno("تأكيد الحذف", "هل أنت متأكد من حذف هذا الموعد؟"):
             return
 
-        conn = None
-        try:
-            conn = self.connect_db()
-            cursor = conn.cursor()
-            
-            # حذف من قاعدة البيانات
-            delete_query = """
-                DELETE FROM Schedule 
-                WHERE Group_ID = ? 
-                AND day = ? 
-                AND start_time = ? 
-                AND end_time = ?
-            """
-            cursor.execute(delete_query, (
-                appt['group']['group_id'],
-                day,
-                appt['start'],
-                appt['end']
-            ))
-            
-            # تحديث البيانات المحلية
-            schedule_key = f"{self.dept_combobox.get()}_{self.year_combobox.get()}"
-            if schedule_key in self.schedule_data and day in self.schedule_data[schedule_key]['schedule']:
-                self.schedule_data[schedule_key]['schedule'][day] = [
-                    a for a in self.schedule_data[schedule_key]['schedule'][day] 
-                    if not (a['start'] == appt['start'] and a['end'] == appt['end'])
-                ]
+        def deleted(_):
+            # تحديث البيانات المحلية ---> الحذف في قاعدة البيانات يشمل كل أقسام المحاضرة المشتركة
+            for schedule_info in self.schedule_data.values():
+                appointments = schedule_info['schedule'].get(day)
+                if not appointments:
+                    continue
+                kept = []
+                for a in appointments:
+                    if (a['group'].get('group_id') == appt['group']['group_id']
+                            and a['start'] == appt['start'] and a['end'] == appt['end']):
+                        self.schedule_index.remove(day, a)
+                    else:
+                        kept.append(a)
+                appointments[:] = kept
             
             # إرجاع المجموعة للقائمة المتاحة
             group_data = appt['group']
             self.filtered_groups_data.append(group_data)
             self.update_group_combobox()
             
-            conn.commit()
             messagebox.showinfo("نجاح", "تم حذف الموعد بنجاح")
             
             # تحديث الجدول
             self.refresh_schedule_table()
-            
-        except pyodbc.Error as e:
-            if conn:
-                conn.rollback()
-            messagebox.showerror("خطأ في قاعدة البيانات", f"فشل حذف الموعد: {str(e)}")
-        except Exception as e:
-            if conn:
-                conn.rollback()
-            messagebox.showerror("خطأ غير متوقع", f"حدث خطأ غير متوقع: {str(e)}")
-        finally:
-            if conn:
-                conn.close()
+
+        self.run_in_background(
+            lambda: self.db.delete_schedule(appt['group']['group_id'], day, appt['start'], appt['end']),
+            deleted,
+            lambda e: messagebox.showerror("خطأ في قاعدة البيانات", f"فشل حذف الموعد: {str(e)}"),
+            message="جاري الحذف...")
+
+    def has_local_conflicts(self, day, start, end, place, location_id, group):
+        course_id, _, lecturer_id = resolve_group_ids(group)
+        lecturer_conflicts = self.schedule_index.lecturer_conflicts(lecturer_id, day, start, end)
+        if lecturer_conflicts:
+            conflict_details = "\n".join(
+                f"- {a['group']['subject']} في {a['place']} ({'، '.join(a['group']['departments'])}) - {day} {a['start']}-{a['end']}"
+                for a in lecturer_conflicts
+            )
+            messagebox.showerror("تعارض في مواعيد المحاضر", f"المحاضر {group['instructor']} لديه مواعيد متضاربة:\n{conflict_details}")
+            return True
+
+        shared = group['Group_Type'] == 'lecture'
+        if self.schedule_index.place_conflicts(location_id, day, start, end,
+                                               course_id if shared else None, lecturer_id if shared else None):
+            messagebox.showerror("تعارض في المكان", f"المكان {place} محجوز بالفعل في هذا الوقت")
+            return True
+
+        cohort_conflicts = self.schedule_index.cohort_conflicts(*self.group_cohort(group), day, start, end, group)
+        if cohort_conflicts:
+            conflict_details = "\n".join(
+                f"- {a['group']['subject']} ({'، '.join(a['group']['departments'])}) - {day} {a['start']}-{a['end']}"
+                for a in cohort_conflicts
+            )
+            messagebox.showerror("تعارض لطلاب القسم", f"طلاب {group['year_level']} لديهم موعد في نفس الوقت:\n{conflict_details}")
+            return True
+        return False
+
+    def show_placement_conflicts(self, group, place, conflicts):
+        """رسالة واحدة بكل التعارضات التي رفض بها الخادم الحجز"""
+        titles = {
+            'lecturer': f"المحاضر {group['instructor']} لديه مواعيد متضاربة:",
+            'room': f"المكان {place} محجوز بالفعل في هذا الوقت:",
+            'cohort': f"طلاب {group['year_level']} لديهم موعد في نفس الوقت:",
+            'stale': "عدّل مستخدم آخر هذه المواعيد بعد آخر تحديث للعرض، سيتم تحديث الجدول ثم أعد المحاولة:",
+        }
+        sections = []
+        for kind, title in titles.items():
+            rows = [row for row in conflicts if row[0] == kind]
+            if rows:
+                sections.append(title + "\n" + "\n".join(
+                    f"- {row[4]} في {row[5]} (قسم {row[3]}) - {row[6]} {row[7]}-{row[8]}" for row in rows))
+        messagebox.showerror("تعارض في الموعد", "\n\n".join(sections))
 
     def update_shared_courses(self):
         # update data of participated lectures between departs
@@ -2173,247 +4755,117 @@ class SchedulePlacerPage(BasePage):
                                 appt['group']['departments'] = departments
                                 appt['group']['is_shared'] = True
                                 
-        except pyodbc.Error as e:
+        except DB_ERRORS as e:
             messagebox.showerror("خطأ", f"فشل تحديث المواد المشتركة:\n{str(e)}")
         finally:
             if conn:
                 conn.close()
                 
-    def get_shared_departments(self, course_id):
-        conn = self.connect_db()
-        try:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT d.Department_name 
-                FROM Course_Department cd
-                JOIN Department d ON cd.Department_ID = d.Department_ID
-                WHERE cd.Course_ID = ?
-            """, (course_id,))
-            return [row[0] for row in cursor.fetchall()]
-        except pyodbc.Error as e:
-            messagebox.showerror("خطأ", f"تعذر جلب الأقسام المشتركة: {str(e)}")
-            return []
-        finally:
-            if conn:
-                conn.close()
+    def save_schedule(self, day, start, end, place, group, on_saved=None):
+        """حفظ الموعد في قاعدة البيانات مع معالجة المواد المشتركة بين الأقسام
 
-    def save_schedule(self, day, start, end, place, group):
-        """حفظ الموعد في قاعدة البيانات مع معالجة المواد المشتركة بين الأقسام"""
+        الحفظ في الخلفية؛ on_saved() تُستدعى بعد نجاحه وتحديث الجدول المحلي
+        """
         if not all([day, start, end, place, group]):
             messagebox.showerror("خطأ", "بيانات غير مكتملة!")
-            return False
-
-        try:
-            # check day and time ----> have problem that the time un tables is reversed in the db
-            if start >= end:
-                messagebox.showerror("خطأ", "وقت البداية يجب أن يكون قبل وقت النهاية")
-                return False
-
-            if day not in self.days:
-                messagebox.showerror("خطأ", f"اليوم يجب أن يكون من: {', '.join(self.days)}")
-                return False
-
-            conn = self.connect_db()
-            if not conn:
-                return False
-
-            cursor = conn.cursor()
-
-            # get place id
-            cursor.execute("SELECT Location_ID FROM Location WHERE Location_name = ?", (place,))
-            location_result = cursor.fetchone()
-            if not location_result:
-                messagebox.showerror("خطأ", "المكان المحدد غير موجود في قاعدة البيانات!")
-                conn.close()
-                return False
-            location_id = location_result[0]
-
-            # check conflicts
-            lecturer_conflict_query = """
-                SELECT 
-                    s.schedule_id,
-                    c.Course_name,
-                    l.Location_name,
-                    s.day,
-                    s.start_time,
-                    s.end_time,
-                    d.Department_name
-                FROM Schedule s
-                JOIN Groups g ON s.Group_ID = g.Group_ID
-                JOIN Courses c ON g.Course_ID = c.Course_ID
-                JOIN Location l ON s.Location_ID = l.Location_ID
-                JOIN Department d ON s.Department_ID = d.Department_ID
-                WHERE g.Lecturer_ID = ?
-                AND s.day = ?
-                AND NOT (s.end_time <= ? OR s.start_time >= ?)
-            """
-
-            conflict_check_query = """
-                SELECT 
-                    s.schedule_id,
-                    c.Course_name,
-                    lec.F_name + ' ' + lec.L_name AS lecturer_name,
-                    l.Location_name,
-                    s.day,
-                    s.start_time,
-                    s.end_time
-                FROM Schedule s
-                JOIN Groups g ON s.Group_ID = g.Group_ID
-                JOIN Courses c ON g.Course_ID = c.Course_ID
-                JOIN Lecturer lec ON g.Lecturer_ID = lec.Lecturer_ID
-                JOIN Location l ON s.Location_ID = l.Location_ID
-                WHERE l.Location_name = ?
-                AND s.day = ?
-                AND NOT (s.end_time <= ? OR s.start_time >= ?)
-            """
-
-            # check conflicts before adding group
-            conflicts_detected = False
+            return
 
-            # participated lectures
-            if group.get('is_shared', False) and group['Group_Type'] == 'lecture':
-                shared_departments = self.get_shared_departments(group['course_id'])
-                
-                # lecturer conflict check
-                cursor.execute(lecturer_conflict_query, (group['lecturer_id'], day, start, end))
-                lecturer_conflicts = cursor.fetchall()
-                if lecturer_conflicts:
-                    conflict_details = "\n".join(
-                        f"- {row[1]} في {row[2]} (قسم {row[6]}) - {row[3]} {row[4]}-{row[5]}"
-                        for row in lecturer_conflicts
-                    )
-                    messagebox.showerror("تعارض في مواعيد المحاضر", f"المحاضر {group['instructor']} لديه مواعيد متضاربة:\n{conflict_details}")
-                    conflicts_detected = True
-
-                # place conflicts check ---> for all departs
-                if not conflicts_detected:
-                    for dept_name in shared_departments:
-                        cursor.execute("SELECT Department_ID FROM Department WHERE Department_name = ?", (dept_name,))
-                        dept_result = cursor.fetchone()
-                        if not dept_result:
-                            continue
+        # check day and time ----> have problem that the time un tables is reversed in the db
+        if start >= end:
+            messagebox.showerror("خطأ", "وقت البداية يجب أن يكون قبل وقت النهاية")
+            return
 
-                        cursor.execute(conflict_check_query, (place, day, start, end))
-                        if cursor.fetchall():
-                            messagebox.showerror("تعارض في المكان", f"المكان {place} محجوز بالفعل في هذا الوقت")
-                            conflicts_detected = True
-                            break
+        if day not in self.days:
+            messagebox.showerror("خطأ", f"اليوم يجب أن يكون من: {', '.join(self.days)}")
+            return
 
-            # not participated groups
-            else:
-                # lecturer conflict check
-                cursor.execute(lecturer_conflict_query, (group['lecturer_id'], day, start, end))
-                lecturer_conflicts = cursor.fetchall()
-                if lecturer_conflicts:
-                    conflict_details = "\n".join(
-                        f"- {row[1]} في {row[2]} (قسم {row[6]}) - {row[3]} {row[4]}-{row[5]}"
-                        for row in lecturer_conflicts
-                    )
-                    messagebox.showerror("تعارض في مواعيد المحاضر", f"المحاضر {group['instructor']} لديه مواعيد متضاربة:\n{conflict_details}")
-                    conflicts_detected = True
-
-                # place conflict check
-                if not conflicts_detected:
-                    cursor.execute(conflict_check_query, (place, day, start, end))
-                    if cursor.fetchall():
-                        messagebox.showerror("تعارض في المكان", f"المكان {place} محجوز بالفعل في هذا الوقت")
-                        conflicts_detected = True
-
-            # if conflict ---> dont save
-            if conflicts_detected:
-                conn.rollback()
-                conn.close()
-                return False
+        # get place id
+        location_id = ReferenceCache().id_of('Location', place)
+        if location_id is None:
+            messagebox.showerror("خطأ", "المكان المحدد غير موجود في قاعدة البيانات!")
+            return
 
-            # add if no conflicts
-            insert_query = """
-                INSERT INTO Schedule 
-                (Department_ID, Group_ID, Location_ID, day, start_time, end_time)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """
+        # فحص سريع من فهرس المواعيد المحملة قبل الذهاب للخادم
+        if self.schedules_loaded and self.has_local_conflicts(day, start, end, place, location_id, group):
+            return
 
-            # adding participated lectures
-            if group.get('is_shared', False) and group['Group_Type'] == 'lecture':
-                shared_departments = self.get_shared_departments(group['course_id'])
-                for dept_name in shared_departments:
-                    cursor.execute("SELECT Department_ID FROM Department WHERE Department_name = ?", (dept_name,))
-                    dept_result = cursor.fetchone()
-                    if not dept_result:
-                        continue
-                    dept_id = dept_result[0]
+        # الفحص والإدراج لكل الأقسام وحدة واحدة على الخادم ---> لا يمر حجز متزامن بينهما
+        is_shared_lecture = group.get('is_shared', False) and group['Group_Type'] == 'lecture'
+        # علامة مزامنة العرض --> الخادم يرفض الحجز لو غيّر مستخدم آخر نفس الموارد بعدها
+        since = self.data_manager.schedule_sync_mark
+        known_ids = tuple(self.data_manager.own_schedule_ids)
+
+        def placed(result):
+            conflicts, inserted = result
+            if conflicts:
+                self.show_placement_conflicts(group, place, conflicts)
+                if any(row[0] == 'stale' for row in conflicts):
+                    self.sync_schedule_changes()
+                return
 
-                    cursor.execute(insert_query, (dept_id, group['group_id'], location_id, day, start, end))
+            self.data_manager.own_schedule_ids.update(row[0] for row in inserted)
 
-                    year = group['year_level']
+            if is_shared_lecture:
+                year = group['year_level']
+                for schedule_id, dept_id, dept_name in inserted:
                     schedule_key = f"{dept_name}_{year}"
                     if schedule_key not in self.schedule_data:
                         self.schedule_data[schedule_key] = {'dept': dept_name, 'year': year, 'schedule': {}}
                     if day not in self.schedule_data[schedule_key]['schedule']:
                         self.schedule_data[schedule_key]['schedule'][day] = []
                     
-                    self.schedule_data[schedule_key]['schedule'][day].append({
+                    appt = {
                         'start': start,
                         'end': end,
                         'place': place,
+                        'schedule_id': schedule_id,
                         'group': {
                             **group,
                             'departments': [dept_name],
                             'dept_id': dept_id,
                             'location_id': location_id
                         }
-                    })
+                    }
+                    self.schedule_data[schedule_key]['schedule'][day].append(appt)
+                    self.schedule_index.add(day, appt)
 
             else:
-                cursor.execute(insert_query, (group['dept_id'], group['group_id'], location_id, day, start, end))
-                self.update_local_schedule(day, start, end, place, group)
+                self.update_local_schedule(day, start, end, place, group, inserted[0][0] if inserted else None)
 
-            conn.commit()
             messagebox.showinfo("نجاح", "تم حفظ الموعد بنجاح")
-            return True
-
-        except pyodbc.Error as e:
-            if 'conn' in locals() and conn:
-                conn.rollback()
-            error_msg = "خطأ في قاعدة البيانات: "
-            if '2627' in str(e):
-                error_msg += "هذا الموعد مسجل بالفعل"
+            if on_saved:
+                on_saved()
+
+        def failed(e):
+            if isinstance(e, DB_ERRORS):
+                error_msg = "خطأ في قاعدة البيانات: "
+                if db_backend().is_duplicate_error(e):
+                    error_msg += "هذا الموعد مسجل بالفعل"
+                else:
+                    error_msg += str(e)
+                messagebox.showerror("خطأ", error_msg)
+            elif isinstance(e, TimeoutError):
+                self.show_background_error(e)
             else:
-                error_msg += str(e)
-            messagebox.showerror("خطأ", error_msg)
-            return False
-        except Exception as e:
-            if 'conn' in locals() and conn:
-                conn.rollback()
-            messagebox.showerror("خطأ غير متوقع", f"حدث خطأ غير متوقع: {str(e)}")
-            return False
-        finally:
-            try:
-                if 'cursor' in locals() and cursor:
-                    cursor.close()
-                if 'conn' in locals() and conn:
-                    conn.close()
-            except Exception as e:
-                print(f"حدث خطأ أثناء إغلاق الاتصال: {str(e)}")
+                messagebox.showerror("خطأ غير متوقع", f"حدث خطأ غير متوقع: {str(e)}")
+
+        self.run_in_background(
+            lambda: self.db.place_schedule(group['group_id'], group['dept_id'], location_id, day, start, end,
+                                           is_shared_lecture, since, known_ids),
+            placed, failed, message="جاري الحفظ...")
 
     def get_current_dept_id(self):
         selected_dept = self.dept_combobox.get()
         if not selected_dept:
             return None
             
-        conn = self.connect_db()
         try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT Department_ID FROM Department WHERE Department_name = ?", (selected_dept,))
-            result = cursor.fetchone()
-            return result[0] if result else None
-        except pyodbc.Error as e:
+            return ReferenceCache().id_of('Department', selected_dept)
+        except DB_ERRORS as e:
             messagebox.showerror("خطأ", f"تعذر الحصول على معرف القسم: {str(e)}")
             return None
-        finally:
-            if conn:
-                conn.close()
 
-    def load_saved_schedule(self):
+    def load_saved_schedule(self, days=None):
         if not self.current_schedule_key:
             return
 
@@ -2421,6 +4873,8 @@ class SchedulePlacerPage(BasePage):
         
         schedule_info = self.schedule_data.get(self.current_schedule_key, {})
         for day, appointments in schedule_info.get('schedule', {}).items():
+            if days is not None and day not in days:
+                continue
             for appt in appointments:
                 if (appt['group']['Group_Type'] == 'lecture' and 
                     current_dept in appt['group']['departments']):
@@ -2461,15 +4915,12 @@ class SchedulePlacerPage(BasePage):
             print(f"Error creating cell: {e}")
 
     def get_location_id(self, location_name):
-        conn = self.connect_db()
-        try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT Location_ID FROM Location WHERE Location_name=?", (location_name,))
-            return cursor.fetchone()[0]
-        finally:
-            conn.close()
+        location_id = ReferenceCache().id_of('Location', location_name)
+        if location_id is None:
+            raise ValueError(f"المكان {location_name} غير موجود في قاعدة البيانات")
+        return location_id
 
-    def update_local_schedule(self, day, start, end, place, group):
+    def update_local_schedule(self, day, start, end, place, group, schedule_id=None):
         schedule_key = f"{self.dept_combobox.get()}_{self.year_combobox.get()}"
         
         if schedule_key not in self.schedule_data:
@@ -2482,12 +4933,15 @@ class SchedulePlacerPage(BasePage):
         if day not in self.schedule_data[schedule_key]['schedule']:
             self.schedule_data[schedule_key]['schedule'][day] = []
         
-        self.schedule_data[schedule_key]['schedule'][day].append({
+        appt = {
             'start': start,
             'end': end,
             'place': place,
+            'schedule_id': schedule_id,
             'group': group
-        })
+        }
+        self.schedule_data[schedule_key]['schedule'][day].append(appt)
+        self.schedule_index.add(day, appt)
         
         self.data_manager.schedule_data = self.schedule_data
 
@@ -2525,16 +4979,14 @@ class DataEntryPage(tk.Frame):
         super().__init__(parent)
         self.parent = parent
         self.return_callback = return_callback
+        self.search_indexes = {}  # table -> (SearchIndex, {id: row}) يُحدَّث مع كل تحديث للجدول
+        self.refresh_tokens = {}  # table -> رمز آخر تحديث مطلوب
         
         # إعدادات التصميم
         self.BG_COLOR = "#f0f4f7"
         self.BUTTON_COLOR = "#3E546B"
         self.ACCENT_COLOR = "#2980b9"
         
-        # إعدادات قاعدة البيانات
-        self.SERVER = '.'
-        self.DATABASE = 'project'
-        
         self.setup_ui()
         self.setup_style()
     
@@ -2825,28 +5277,16 @@ class DataEntryPage(tk.Frame):
         return tree
     
     def load_levels(self, combobox):
-        conn = self.connect_db()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                cursor.execute("SELECT Levels_name FROM Levels")
-                combobox['values'] = [row[0] for row in cursor.fetchall()]
-            except Exception as e:
-                messagebox.showerror("خطأ", f"فشل تحميل المستويات: {str(e)}")
-            finally:
-                conn.close()
+        try:
+            combobox['values'] = ReferenceCache().names('Levels')
+        except Exception as e:
+            messagebox.showerror("خطأ", f"فشل تحميل المستويات: {str(e)}")
     
     def load_departments(self, combobox):
-        conn = self.connect_db()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                cursor.execute("SELECT Department_name FROM Department")
-                combobox['values'] = [row[0] for row in cursor.fetchall()]
-            except Exception as e:
-                messagebox.showerror("خطأ", f"فشل تحميل الأقسام: {str(e)}")
-            finally:
-                conn.close()
+        try:
+            combobox['values'] = ReferenceCache().names('Department')
+        except Exception as e:
+            messagebox.showerror("خطأ", f"فشل تحميل الأقسام: {str(e)}")
     
     def fill_entries_from_selection(self, tree, entries):
         selected = tree.selection()
@@ -2902,230 +5342,106 @@ class DataEntryPage(tk.Frame):
             else:
                 entry.delete(0, tk.END)
     
-    def connect_db(self):
+    def update_department_comboboxes(self):
         try:
-            # الحصول على إعدادات الاتصال من الصفحة الرئيسية
-            main_page = self.master.master if isinstance(self.master, tk.Toplevel) else self.master
-            if hasattr(main_page, 'db_server') and hasattr(main_page, 'db_name'):
-                server = main_page.db_server
-                database = main_page.db_name
-            else:
-                server = '.'
-                database = 'project'
+            departments = ReferenceCache().names('Department')
             
-            conn = pyodbc.connect(
-                f'DRIVER={{SQL Server}};SERVER={server};'
-                f'DATABASE={database};Trusted_Connection=yes;'
-                )
-            return conn
-        except pyodbc.Error as e:
-            messagebox.showerror("خطأ في الاتصال", f"فشل الاتصال بقاعدة البيانات:\n{str(e)}")
-            return None
+            # تحديث Combobox الأقسام في جميع النوافذ
+            for tab in self.tabs.values():
+                for child in tab.winfo_children():
+                    if isinstance(child, ttk.Frame):
+                        for entry in child.winfo_children():
+                            if isinstance(entry, ttk.Combobox) and 'Department_ID' in str(entry):
+                                entry['values'] = departments
         except Exception as e:
-            messagebox.showerror("خطأ", f"حدث خطأ غير متوقع: {str(e)}")
-            return None
-    
-    def get_level_id(self, level_name):
-        conn = self.connect_db()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                cursor.execute("SELECT Levels_ID FROM Levels WHERE Levels_name=?", (level_name,))
-                result = cursor.fetchone()
-                return result[0] if result else None
-            except Exception as e:
-                messagebox.showerror("خطأ", f"فشل الحصول على رقم المستوى: {str(e)}")
-                return None
-            finally:
-                conn.close()
-        return None
-    
-    def get_department_id(self, department_name):
-        conn = self.connect_db()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                cursor.execute("SELECT Department_ID FROM Department WHERE Department_name=?", (department_name,))
-                result = cursor.fetchone()
-                return result[0] if result else None
-            except Exception as e:
-                messagebox.showerror("خطأ", f"فشل الحصول على رقم القسم: {str(e)}")
-                return None
-            finally:
-                conn.close()
-        return None
-    
-    def update_department_comboboxes(self):
-        conn = self.connect_db()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                cursor.execute("SELECT Department_name FROM Department")
-                departments = [row[0] for row in cursor.fetchall()]
-                
-                # تحديث Combobox الأقسام في جميع النوافذ
-                for tab in self.tabs.values():
-                    for child in tab.winfo_children():
-                        if isinstance(child, ttk.Frame):
-                            for entry in child.winfo_children():
-                                if isinstance(entry, ttk.Combobox) and 'Department_ID' in str(entry):
-                                    entry['values'] = departments
-            except Exception as e:
-                print(f"حدث خطأ أثناء تحديث الأقسام: {str(e)}")
-            finally:
-                conn.close()
+            print(f"حدث خطأ أثناء تحديث الأقسام: {str(e)}")
     
     # ========== دوال البحث ==========
     
-    def search_courses(self):
-        search_term = self.search_entry_courses.get().strip()
-        if not search_term:
-            self.generic_refresh('Courses', self.tree_courses)
-            return
-        conn = self.connect_db()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT C.Course_ID, C.Course_name, C.code, 
-                           CASE WHEN C.Lecture_hours IS NULL THEN 'None' ELSE CAST(C.Lecture_hours AS varchar) END,
-                           L.Levels_name,
-                           CASE WHEN C.Practical_hours IS NULL THEN 'None' ELSE CAST(C.Practical_hours AS varchar) END,
-                           CASE WHEN C.Exercise_hours IS NULL THEN 'None' ELSE CAST(C.Exercise_hours AS varchar) END
-                    FROM Courses C
-                    JOIN Levels L ON C.Levels_ID = L.Levels_ID
-                    WHERE C.Course_name LIKE ? OR C.code LIKE ? OR C.Course_ID LIKE ?
-                """, (f'%{search_term}%', f'%{search_term}%', f'%{search_term}%'))
-                
-                self.tree_courses.delete(*self.tree_courses.get_children())
-                rows = cursor.fetchall()
-                if not rows:
-                    messagebox.showinfo("بحث", "لا توجد نتائج مطابقة للبحث")
-                for row in rows:
-                    self.tree_courses.insert("", tk.END, values=[str(item) for item in row])
-            except Exception as e:
-                messagebox.showerror("خطأ", f"فشل البحث: {str(e)}")
-            finally:
-                conn.close()
-    
-    def search_departments(self):
-        search_term = self.search_entry_department.get().strip()
-        if not search_term:
-            self.generic_refresh('Department', self.tree_department)
-            return
-        
-        conn = self.connect_db()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT Department_ID, Department_name 
-                    FROM Department
-                    WHERE Department_name LIKE ? OR Department_ID LIKE ?
-                """, (f'%{search_term}%', f'%{search_term}%'))
-                
-                self.tree_department.delete(*self.tree_department.get_children())
-                rows = cursor.fetchall()
-                if not rows:
-                    messagebox.showinfo("بحث", "لا توجد نتائج مطابقة للبحث")
-                for row in rows:
-                    self.tree_department.insert("", tk.END, values=[str(item) for item in row])
-            except Exception as e:
-                messagebox.showerror("خطأ", f"فشل البحث: {str(e)}")
-            finally:
-                conn.close()
+    # أعمدة الصف التي يبحث فيها كل جدول (نفس ترتيب generic_refresh)
+    SEARCH_COLUMNS = {
+        'Courses': (1, 2, 0),      # الاسم، الرمز، الرقم
+        'Department': (1, 0),
+        'Lecturer': (1, 2, 0),     # الاسم الكامل، القسم، الرقم
+        'Location': (1, 0),
+    }
+
+    def search_table(self, table_name, tree, search_entry):
+        """بحث في الذاكرة عبر فهرس الجدول (توحيد الحروف العربية + بداية الكلمات) مرتباً بالأفضلية"""
+        search_term = search_entry.get().strip()
+        if not search_term or table_name not in self.search_indexes:
+            self.generic_refresh(table_name, tree)
+            if not search_term or table_name not in self.search_indexes:
+                return
+        index, rows = self.search_indexes[table_name]
+
+        tree.delete(*tree.get_children())
+        keys = index.search(search_term)
+        if not keys:
+            messagebox.showinfo("بحث", "لا توجد نتائج مطابقة للبحث")
+        for key in keys:
+            tree.insert("", tk.END, values=[str(item) for item in rows[key]])
+
+    def search_courses(self):
+        self.search_table('Courses', self.tree_courses, self.search_entry_courses)
+    
+    def search_departments(self):
+        self.search_table('Department', self.tree_department, self.search_entry_department)
     
     def search_lecturers(self):
-        search_term = self.search_entry_lecturer.get().strip()
-        if not search_term:
-            self.generic_refresh('Lecturer', self.tree_lecturer)
-            return
-        
-        conn = self.connect_db()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT L.Lecturer_ID, L.F_name + ' ' + L.L_name AS Full_name, D.Department_name
-                    FROM Lecturer L
-                    JOIN Department D ON L.Department_ID = D.Department_ID
-                    WHERE L.F_name LIKE ? OR L.L_name LIKE ? OR D.Department_name LIKE ? OR L.Lecturer_ID LIKE ?
-                """, (f'%{search_term}%', f'%{search_term}%', f'%{search_term}%', f'%{search_term}%'))
-                
-                self.tree_lecturer.delete(*self.tree_lecturer.get_children())
-                rows = cursor.fetchall()
-                if not rows:
-                    messagebox.showinfo("بحث", "لا توجد نتائج مطابقة للبحث")
-                for row in rows:
-                    self.tree_lecturer.insert("", tk.END, values=[str(item) for item in row])
-            except Exception as e:
-                messagebox.showerror("خطأ", f"فشل البحث: {str(e)}")
-            finally:
-                conn.close()
+        self.search_table('Lecturer', self.tree_lecturer, self.search_entry_lecturer)
     
     def search_locations(self):
-        search_term = self.search_entry_place.get().strip()
-        if not search_term:
-            self.generic_refresh('Location', self.tree_place)
+        self.search_table('Location', self.tree_place, self.search_entry_place)
+
+    def update_search_index(self, table_name, rows):
+        columns = self.SEARCH_COLUMNS.get(table_name)
+        if columns is None:
             return
-        
-        conn = self.connect_db()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT Location_ID, Location_name, capacity
-                    FROM Location
-                    WHERE Location_name LIKE ? OR Location_ID LIKE ?
-                """, (f'%{search_term}%', f'%{search_term}%'))
-                
-                self.tree_place.delete(*self.tree_place.get_children())
-                rows = cursor.fetchall()
-                if not rows:
-                    messagebox.showinfo("بحث", "لا توجد نتائج مطابقة للبحث")
-                for row in rows:
-                    self.tree_place.insert("", tk.END, values=[str(item) for item in row])
-            except Exception as e:
-                messagebox.showerror("خطأ", f"فشل البحث: {str(e)}")
-            finally:
-                conn.close()
+        index, _ = self.search_indexes.get(table_name, (SearchIndex(), None))
+        by_id = {row[0]: row for row in rows}
+        # الصفوف التي لم يتغير نصها لا يُعاد فهرستها
+        index.sync((row[0], ' '.join(str(row[c]) for c in columns)) for row in rows)
+        self.search_indexes[table_name] = (index, by_id)
     
     # ========== دوال العمليات الأساسية ==========
     
     def generic_refresh(self, table_name, tree):
-        conn = self.connect_db()
-        if conn:
-            try:
-                cursor = conn.cursor()
-                if table_name == 'Lecturer':
-                    cursor.execute("""
-                        SELECT L.Lecturer_ID, L.F_name + ' ' + L.L_name AS Full_name, D.Department_name
-                        FROM Lecturer L
-                        JOIN Department D ON L.Department_ID = D.Department_ID
-                    """)
-                elif table_name == 'Courses':
-                    cursor.execute("""
-                        SELECT C.Course_ID, C.Course_name, C.code, 
-                               CASE WHEN C.Lecture_hours IS NULL THEN 'None' ELSE CAST(C.Lecture_hours AS varchar) END,
-                               L.Levels_name,
-                               CASE WHEN C.Practical_hours IS NULL THEN 'None' ELSE CAST(C.Practical_hours AS varchar) END,
-                               CASE WHEN C.Exercise_hours IS NULL THEN 'None' ELSE CAST(C.Exercise_hours AS varchar) END
-                        FROM Courses C
-                        JOIN Levels L ON C.Levels_ID = L.Levels_ID
-                    """)
-                elif table_name == 'Department':
-                    cursor.execute("SELECT Department_ID, Department_name FROM Department")
-                else:
-                    cursor.execute(f"SELECT * FROM {table_name}")
-                
-                tree.delete(*tree.get_children())
-                rows = cursor.fetchall()
-                for row in rows:
-                    tree.insert("", tk.END, values=[str(item) for item in row])
-            except Exception as e:
-                messagebox.showerror("خطأ", f"فشل التحديث: {str(e)}")
-            finally:
-                conn.close()
+        if table_name == 'Lecturer':
+            query = f"""
+                SELECT L.Lecturer_ID, {db_backend().full_name('L')} AS Full_name, D.Department_name
+                FROM Lecturer L
+                JOIN Department D ON L.Department_ID = D.Department_ID
+            """
+        elif table_name == 'Courses':
+            query = """
+                SELECT C.Course_ID, C.Course_name, C.code, 
+                       CASE WHEN C.Lecture_hours IS NULL THEN 'None' ELSE CAST(C.Lecture_hours AS varchar) END,
+                       L.Levels_name,
+                       CASE WHEN C.Practical_hours IS NULL THEN 'None' ELSE CAST(C.Practical_hours AS varchar) END,
+                       CASE WHEN C.Exercise_hours IS NULL THEN 'None' ELSE CAST(C.Exercise_hours AS varchar) END
+                FROM Courses C
+                JOIN Levels L ON C.Levels_ID = L.Levels_ID
+            """
+        elif table_name == 'Department':
+            query = "SELECT Department_ID, Department_name FROM Department"
+        else:
+            query = f"SELECT * FROM {table_name}"
+
+        # آخر تحديث لكل جدول هو الذي يُعرض لو رجعت النتائج بترتيب مختلف
+        token = object()
+        self.refresh_tokens[table_name] = token
+
+        def loaded(rows):
+            if self.refresh_tokens.get(table_name) is not token:
+                return
+            tree.delete(*tree.get_children())
+            for row in rows:
+                tree.insert("", tk.END, values=[str(item) for item in row])
+            self.update_search_index(table_name, rows)
+
+        DataService().submit(self, lambda: Database().fetchall(query), loaded,
+                             lambda e: messagebox.showerror("خطأ", f"فشل التحديث: {str(e)}"))
     
     def generic_operation(self, table_name, entries, tree, fields, operation, record_id=None):
         if table_name == 'Department' and operation == 'add':
@@ -3140,204 +5456,808 @@ class DataEntryPage(tk.Frame):
         }
         pk = id_columns.get(table_name, 'id')
 
-        conn = self.connect_db()
-        if not conn:
+        values, value_fields = [], []
+        if operation in ['add', 'update'] and fields:
+            for field, entry in entries.items():
+                val = entry.get() if isinstance(entry, (ttk.Entry, ttk.Combobox)) else ''
+                
+                if not val and field in ['Course_ID', 'Lecturer_ID', 'Location_ID']:
+                    messagebox.showerror("خطأ", f"الحقل {fields[field]} مطلوب")
+                    return
+                
+                # معالجة خاصة لجميع أنواع الساعات
+                if field in ['Lecture_hours', 'Practical_hours', 'Exercise_hours']:
+                    if val == '0':
+                        val = None
+                    else:
+                        try:
+                            val = int(val) if val else None
+                        except ValueError:
+                            messagebox.showerror("خطأ", f"قيمة غير صالحة لـ {fields[field]}")
+                            return
+                elif field in ['Course_ID', 'Lecturer_ID', 'Location_ID', 'capacity']:
+                    try:
+                        val = int(val) if val else 0
+                    except ValueError:
+                        messagebox.showerror("خطأ", f"قيمة غير صالحة لـ {fields[field]}")
+                        return
+                values.append(val)
+                value_fields.append(field)
+
+        def work():
+            # أسماء المستوى والقسم --> معرفات (من الذاكرة، أو القاعدة أول مرة)
+            resolved = list(values)
+            for i, field in enumerate(value_fields):
+                if field == 'Levels_ID':
+                    resolved[i] = ReferenceCache().id_of('Levels', resolved[i])
+                    if resolved[i] is None:
+                        raise ValueError("المستوى المحدد غير موجود")
+                elif field == 'Department_ID' and table_name != 'Department':
+                    resolved[i] = ReferenceCache().id_of('Department', resolved[i])
+                    if resolved[i] is None:
+                        raise ValueError("القسم المحدد غير موجود")
+            Database().save_record(table_name, pk, list(fields or ()), resolved, operation, record_id)
+
+        def saved(_):
+            ReferenceCache().invalidate(table_name)
+            messagebox.showinfo("نجاح", "تم تنفيذ العملية بنجاح")
+            
+            self.generic_refresh(table_name, tree)
+            if entries:
+                self.clear_entries(entries)
+
+        def failed(e):
+            if isinstance(e, ValueError):
+                messagebox.showerror("خطأ", str(e))
+            elif isinstance(e, DB_ERRORS):
+                messagebox.showerror("خطأ في قاعدة البيانات", f"فشل العملية: {str(e)}")
+            else:
+                messagebox.showerror("خطأ", f"حدث خطأ غير متوقع: {str(e)}")
+
+        DataService().submit(self, work, saved, failed)
+    
+    def add_department(self):
+        dept_id = self.department_entries['Department_ID'].get()
+        dept_name = self.department_entries['Department_name'].get()
+        
+        if not dept_id or not dept_name:
+            messagebox.showerror("خطأ", "جميع الحقول مطلوبة!")
+            return
+        
+        try:
+            dept_id = int(dept_id)
+        except ValueError:
+            messagebox.showerror("خطأ", "رقم القسم يجب أن يكون رقماً صحيحاً")
+            return
+
+        def added(inserted):
+            if not inserted:
+                messagebox.showerror("خطأ", "رقم القسم موجود مسبقاً!")
+                return
+            ReferenceCache().invalidate('Department')
+            messagebox.showinfo("نجاح", "تمت إضافة القسم بنجاح")
+            
+            # تحديث الجدول
+            self.generic_refresh('Department', self.tree_department)
+            self.clear_entries(self.department_entries)
+            
+            # تحديث Combobox الأقسام في الخلفية
+            self.after(100, self.update_department_comboboxes)
+
+        DataService().submit(self, lambda: Database().add_department(dept_id, dept_name), added,
+                             lambda e: messagebox.showerror("خطأ في قاعدة البيانات", f"فشل الإضافة: {str(e)}"))
+    
+    def update_handler(self, table_name, entries, tree, fields):
+        selected = tree.selection()
+        if not selected:
+            messagebox.showwarning("تحذير", "الرجاء اختيار عنصر من الجدول")
+            return
+        record_id = tree.item(selected[0], 'values')[0]
+        self.generic_operation(table_name, entries, tree, fields, 'update', record_id)
+    
+    def delete_handler(self, table_name, tree):
+        selected = tree.selection()
+        if not selected:
+            messagebox.showwarning("تحذير", "الرجاء اختيار عنصر من الجدول")
             return
+        if messagebox.askyesno("تأكيد الحذف", "هل أنت متأكد من الحذف؟"):
+            record_id = tree.item(selected[0], 'values')[0]
+            self.generic_operation(table_name, None, tree, None, 'delete', record_id)
+    
+    def on_key_press(self, event):
+        if event.keysym == 'Delete':
+            current_tab = self.notebook.index(self.notebook.select())
+            tab_name = list(self.tabs.keys())[current_tab]
+            if tab_name == 'Courses':
+                self.delete_handler('Courses', self.tree_courses)
+            elif tab_name == 'Department':
+                self.delete_handler('Department', self.tree_department)
+            elif tab_name == 'Lecturer':
+                self.delete_handler('Lecturer', self.tree_lecturer)
+            elif tab_name == 'Location':
+                self.delete_handler('Location', self.tree_place)
+                
+                
+                
+# Class of show table page
+def read_scheduling_settings(path='config.ini'):
+    config = configparser.ConfigParser()
+    config.read(path)
+    return {
+        'lecture_group_size': config.getint('SCHEDULING', 'LECTURE_GROUP_SIZE', fallback=60),
+        'practical_group_size': config.getint('SCHEDULING', 'PRACTICAL_GROUP_SIZE', fallback=25),
+        'change_poll_seconds': config.getfloat('SCHEDULING', 'CHANGE_POLL_SECONDS', fallback=5),
+        'solver_workers': config.getint('SCHEDULING', 'SOLVER_WORKERS', fallback=os.cpu_count() or 1),
+        'solver_restarts': config.getint('SCHEDULING', 'SOLVER_RESTARTS', fallback=20),
+        'solver_time_limit': config.getfloat('SCHEDULING', 'SOLVER_TIME_LIMIT', fallback=60),
+        'repair_time_limit': config.getfloat('SCHEDULING', 'REPAIR_TIME_LIMIT', fallback=5),
+        'lecturer_daily_hours': config.getint('SCHEDULING', 'LECTURER_DAILY_HOURS', fallback=6),
+        'late_hour': config.getint('SCHEDULING', 'LATE_HOUR', fallback=16)
+    }
+
+
+def read_db_settings(path='config.ini'):
+    """قراءة إعدادات الاتصال من config.ini (نفس الملف الذي تقرأه الصفحة الرئيسية)"""
+    config = configparser.ConfigParser()
+    config.read(path)
+    return {
+        'backend': config.get('DATABASE', 'BACKEND', fallback='sqlserver').strip().lower(),
+        'server': config.get('DATABASE', 'SERVER', fallback='.'),
+        'database': config.get('DATABASE', 'DATABASE', fallback='project'),
+        'sqlite_path': config.get('DATABASE', 'SQLITE_PATH', fallback='timetable.db'),
+        'pool_size': config.getint('DATABASE', 'POOL_SIZE', fallback=5),
+        'slow_query_ms': config.getfloat('DATABASE', 'SLOW_QUERY_MS', fallback=200),
+        'slow_query_log': config.get('DATABASE', 'SLOW_QUERY_LOG', fallback='slow_queries.log')
+    }
+
+
+class Database:
+    """Headless repository for the named timetable queries (no Tk dependency)"""
+    NAME_SEPARATOR = '|'  # فاصل أسماء الأقسام المجمعة بـ string_agg
+    def __init__(self, config_path='config.ini'):
+        self.pool = ConnectionPool()
+        if not self.pool.configured:
+            settings = read_db_settings(config_path)
+            self.pool.configure(make_backend(settings), max_size=settings['pool_size'])
+            QueryStats().configure(settings['slow_query_ms'], settings['slow_query_log'])
+
+    def fetchall(self, query, params=()):
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            return cursor.fetchall()
+        finally:
+            conn.close()
+
+    def fetchone(self, query, params=()):
+        rows = self.fetchall(query, params)
+        return rows[0] if rows else None
+
+    # ========== القوائم المرجعية ==========
+
+    def get_departments(self):
+        return sorted(name.strip() for name in ReferenceCache().names('Department'))
+
+    def get_levels(self):
+        return ReferenceCache().names('Levels')
+
+    def get_teachers(self):
+        """[(Lecturer_ID, full_name)] مرتبة بالاسم"""
+        return sorted(((row[0], row[1]) for row in ReferenceCache().rows('Lecturer')), key=lambda row: row[1])
+
+    def get_places(self):
+        return sorted(ReferenceCache().names('Location'))
+
+    def get_department_id(self, department_name):
+        return ReferenceCache().id_of('Department', department_name)
+
+    def get_lecturer_id(self, full_name):
+        """بحث بالاسم الكامل عبر العمود المفهرس Lecturer.Full_name"""
+        row = self.fetchone(f"SELECT Lecturer_ID FROM Lecturer WHERE {db_backend().full_name()} = ?", (full_name.strip(),))
+        return row[0] if row else None
+
+    # ========== التعارضات (بالمعرفات فقط) ==========
+
+    def count_room_conflicts(self, location_id, day, start, end, shared_course_id=None, shared_lecturer_id=None):
+        """عدد المواعيد المتداخلة في المكان؛ المحاضرة المشتركة لنفس المادة والمحاضر لا تُعد تعارضاً"""
+        query = """
+            SELECT COUNT(*) 
+            FROM Schedule sch
+            WHERE sch.Location_ID = ?
+            AND sch.day = ?
+            AND NOT (sch.end_time <= ? OR sch.start_time >= ?)
+        """
+        params = [location_id, day, start, end]
+        if shared_course_id is not None:
+            query += """
+                AND NOT EXISTS (
+                    SELECT 1 FROM Groups g
+                    WHERE g.Group_ID = sch.Group_ID
+                    AND g.Course_ID = ?
+                    AND g.Lecturer_ID = ?
+                    AND g.Group_Type = 'lecture'
+                )
+            """
+            params += [shared_course_id, shared_lecturer_id]
+        return self.fetchone(query, params)[0]
+
+    def place_schedule(self, group_id, department_id, location_id, day, start, end, shared=False,
+                       since=None, known_ids=()):
+        """(conflicts, inserted): فحص وإدراج ذري على الخادم؛ inserted = [(Schedule_ID, Department_ID, Department_name)]
+
+        مع since (علامة مزامنة العرض) يُرفض الحجز بتعارضات 'stale' لو غيّر مستخدم آخر نفس الموارد بعدها
+        """
+        conn = self.pool.acquire()
+        try:
+            rows = db_backend().place_schedule(conn, group_id, department_id, location_id, day, start, end, shared,
+                                               since, known_ids)
+        finally:
+            conn.close()
+        conflicts = self.merge_conflict_rows(row for row in rows if row[0] != 'inserted')
+        inserted = [(row[1], row[2], row[3]) for row in rows if row[0] == 'inserted']
+        return conflicts, inserted
+
+    @staticmethod
+    def merge_conflict_rows(rows):
+        """صف واحد لكل (نوع التعارض، مادة، مكان، موعد)
+
+        المحاضرة المشتركة محجوزة بصف لكل قسم --> نفس التعارض يتكرر لكل قسم؛ الأقسام تُجمع في صف أول ظهور
+        """
+        merged = {}
+        for row in rows:
+            row = tuple(row)
+            key = (row[0],) + row[4:9]
+            first = merged.get(key)
+            if first is None:
+                merged[key] = row
+            elif row[3] not in first[3].split("، "):
+                merged[key] = first[:3] + (f"{first[3]}، {row[3]}",) + first[4:]
+        return list(merged.values())
+
+    # حالات خلايا مصفوفة الإشغال
+    FREE, OCCUPIED, SHAREABLE = 0, 1, 2
+
+    def get_week_occupancy(self, days, times, location_id=None, lecturer_id=None,
+                           department_id=None, level_id=None):
+        """{day: [حالة لكل فترة بين times[i] و times[i+1]]} لمكان أو محاضر أو قسم/مستوى في استعلام واحد
+
+        SHAREABLE: كل ما يشغل الخلية محاضرات نظرية لمواد مشتركة بين أكثر من قسم
+        """
+        filters, params = [], []
+        if location_id is not None:
+            filters.append("s.Location_ID = ?")
+            params.append(location_id)
+        if lecturer_id is not None:
+            filters.append("g.Lecturer_ID = ?")
+            params.append(lecturer_id)
+        if department_id is not None:
+            filters.append("s.Department_ID = ?")
+            params.append(department_id)
+        if level_id is not None:
+            filters.append("g.Levels_ID = ?")
+            params.append(level_id)
+        if not filters:
+            raise ValueError("يجب تحديد مكان أو محاضر أو قسم")
+
+        rows = self.fetchall(f"""
+            SELECT s.day, s.start_time, s.end_time,
+                   CASE WHEN g.Group_Type = 'lecture' AND (
+                        SELECT COUNT(*) FROM Course_Department cd WHERE cd.Course_ID = g.Course_ID
+                   ) > 1 THEN 1 ELSE 0 END AS shareable
+            FROM Schedule s
+            JOIN Groups g ON s.Group_ID = g.Group_ID
+            WHERE {' AND '.join(filters)}
+        """, params)
+
+        matrix = {day: [self.FREE] * (len(times) - 1) for day in days}
+        for day, start, end, shareable in rows:
+            cells = matrix.get(day)
+            if cells is None:
+                continue
+            state = self.SHAREABLE if shareable else self.OCCUPIED
+            for col in range(len(times) - 1):
+                if start < times[col + 1] and end > times[col] and cells[col] != self.OCCUPIED:
+                    cells[col] = state
+        return matrix
+
+    def get_locations(self):
+        """[(Location_ID, Location_name, capacity)] - ValueError لو جدول الأماكن غير موجود"""
+        try:
+            return ReferenceCache().rows('Location')
+        except DB_ERRORS:
+            row = self.fetchone(db_backend().table_exists_query(), ('Location',))
+            if row and row[0] == 0:
+                raise ValueError("جدول الأماكن غير موجود في قاعدة البيانات")
+            raise
+
+    def get_group_rows(self):
+        """كل المجموعات + {Course_ID: [أسماء الأقسام]} في استعلامين على نفس الاتصال"""
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT 
+                    g.Group_ID, 
+                    c.Course_name, 
+                    l.Levels_name, 
+                    d.Department_name,
+                    {db_backend().full_name('lec')} AS Lecturer_Name,
+                    g.Theory_Hours, 
+                    g.Practical_Hours, 
+                    g.Group_Number,
+                    g.Group_Type,
+                    g.Practical_Groups_Count,
+                    g.Course_ID,
+                    g.Levels_ID,
+                    g.Lecturer_ID,
+                    g.Department_ID
+                FROM Groups g
+                JOIN Courses c ON g.Course_ID = c.Course_ID
+                JOIN Levels l ON g.Levels_ID = l.Levels_ID
+                JOIN Lecturer lec ON g.Lecturer_ID = lec.Lecturer_ID
+                JOIN Department d ON g.Department_ID = d.Department_ID
+                ORDER BY g.Group_Type, c.Course_name, l.Levels_name
+            """)
+            rows = cursor.fetchall()
+            return rows, self.get_course_departments(cursor)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def get_course_departments(cursor, course_ids=None):
+        """{Course_ID: [Department_name]} لكل المواد (أو لمجموعة مواد) في رحلة واحدة"""
+        query = """
+            SELECT cd.Course_ID, d.Department_name 
+            FROM Course_Department cd
+            JOIN Department d ON cd.Department_ID = d.Department_ID
+        """
+        params = ()
+        if course_ids is not None:
+            course_ids = list(dict.fromkeys(course_ids))
+            if not course_ids:
+                return {}
+            query += f" WHERE cd.Course_ID IN ({','.join('?' * len(course_ids))})"
+            params = course_ids
+        cursor.execute(query + " ORDER BY cd.Course_ID, cd.Department_ID", params)
+        course_departments = {}
+        for course_id, department_name in cursor.fetchall():
+            course_departments.setdefault(course_id, []).append(department_name)
+        return course_departments
+
+    def get_unscheduled_groups(self, department_id, level_id):
+        """مجموعات القسم/المستوى غير الموزعة، ومعها عدد وأسماء أقسام المادة (آخر عمودين)"""
+        backend = db_backend()
+        query = f"""
+            SELECT 
+                g.Group_ID,
+                c.Course_name,
+                {backend.full_name('lec')} AS lecturer_name,
+                g.Group_Type,
+                g.Group_Number,
+                d.Department_name,
+                lv.Levels_name,
+                g.Department_ID,
+                g.Levels_ID,
+                g.Theory_Hours,
+                g.Practical_Hours,
+                c.Course_ID,
+                g.Lecturer_ID,
+                sd.dept_count,
+                sd.dept_names
+            FROM Groups g
+            JOIN Courses c ON g.Course_ID = c.Course_ID
+            JOIN Lecturer lec ON g.Lecturer_ID = lec.Lecturer_ID
+            JOIN Department d ON g.Department_ID = d.Department_ID
+            JOIN Levels lv ON g.Levels_ID = lv.Levels_ID
+            LEFT JOIN (
+                SELECT cd.Course_ID,
+                       COUNT(*) AS dept_count,
+                       {backend.string_agg('sd_d.Department_name', self.NAME_SEPARATOR)} AS dept_names
+                FROM Course_Department cd
+                JOIN Department sd_d ON cd.Department_ID = sd_d.Department_ID
+                GROUP BY cd.Course_ID
+            ) sd ON sd.Course_ID = g.Course_ID
+            WHERE g.Department_ID = ? 
+            AND g.Levels_ID = ?
+            AND NOT EXISTS (
+                SELECT 1 FROM Schedule s 
+                WHERE s.Group_ID = g.Group_ID
+                AND s.Department_ID = ?
+            )
+        """
+        return self.fetchall(query, (department_id, level_id, department_id))
+
+    def get_solver_problem(self):
+        """(المجموعات غير الموزعة في كل الأقسام، {Course_ID: [Department_ID]}، المواعيد الثابتة، علامة المزامنة)"""
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            mark = self.get_change_mark(cursor)
+            cursor.execute(f"""
+                SELECT g.Group_ID, c.Course_name, {db_backend().full_name('lec')}, g.Group_Type, g.Group_Number,
+                       g.Department_ID, d.Department_name, g.Levels_ID, lv.Levels_name,
+                       g.Theory_Hours, g.Practical_Hours, g.Course_ID, g.Lecturer_ID
+                FROM Groups g
+                JOIN Courses c ON g.Course_ID = c.Course_ID
+                JOIN Lecturer lec ON g.Lecturer_ID = lec.Lecturer_ID
+                JOIN Department d ON g.Department_ID = d.Department_ID
+                JOIN Levels lv ON g.Levels_ID = lv.Levels_ID
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM Schedule s
+                    WHERE s.Group_ID = g.Group_ID
+                    AND s.Department_ID = g.Department_ID
+                )
+                ORDER BY g.Group_ID
+            """)
+            group_rows = cursor.fetchall()
+            cursor.execute("SELECT Course_ID, Department_ID FROM Course_Department ORDER BY Course_ID, Department_ID")
+            course_departments = {}
+            for course_id, department_id in cursor.fetchall():
+                course_departments.setdefault(course_id, []).append(department_id)
+            cursor.execute("""
+                SELECT s.day, s.start_time, s.end_time, s.Location_ID, g.Lecturer_ID, g.Levels_ID,
+                       s.Department_ID, g.Group_Type, g.Group_Number
+                FROM Schedule s JOIN Groups g ON s.Group_ID = g.Group_ID
+            """)
+            return group_rows, course_departments, cursor.fetchall(), mark
+        finally:
+            conn.close()
+
+    def save_placements(self, placements, since=None):
+        """إدراج نتيجة التوزيع التلقائي كلها في معاملة واحدة مقفلة --> عدد صفوف Schedule المضافة
+
+        placements: [(session, day, start, end, Location_ID)]. أي تغيير بعد since يرفض الكل (ValueError)
+        لأن الحل بُني على لقطة الكلية كاملة.
+        """
+        backend = db_backend()
+        rows = [(dept_id, session['group_id'], location_id, day, start, end)
+                for session, day, start, end, location_id in placements
+                for dept_id in session['dept_ids']]
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            backend.begin_placement(conn, cursor)
+            if since is not None and backend.schema_version >= 3:
+                cursor.execute("SELECT COUNT(*) FROM Schedule_Changes WHERE Change_ID > ?", (since,))
+                if cursor.fetchone()[0]:
+                    raise ValueError("عدّل مستخدم آخر الجداول أثناء التوزيع التلقائي، أعد التشغيل")
+            backend.executemany(cursor, """
+                INSERT INTO Schedule (Department_ID, Group_ID, Location_ID, day, start_time, end_time)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, rows)
+            conn.commit()
+            return len(rows)
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def get_repair_problem(self):
+        """(كل صفوف Schedule مع بيانات المجموعة والأسماء، علامة المزامنة) لإصلاح الجدول"""
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            mark = self.get_change_mark(cursor)
+            cursor.execute(f"""
+                SELECT s.Schedule_ID, s.Group_ID, s.Department_ID, s.Location_ID, s.day, s.start_time, s.end_time,
+                       g.Lecturer_ID, g.Levels_ID, g.Group_Type, g.Group_Number, g.Course_ID,
+                       c.Course_name, {db_backend().full_name('lec')}, d.Department_name, lv.Levels_name, loc.Location_name
+                FROM Schedule s
+                JOIN Groups g ON s.Group_ID = g.Group_ID
+                JOIN Courses c ON g.Course_ID = c.Course_ID
+                JOIN Lecturer lec ON g.Lecturer_ID = lec.Lecturer_ID
+                JOIN Department d ON s.Department_ID = d.Department_ID
+                JOIN Levels lv ON g.Levels_ID = lv.Levels_ID
+                JOIN Location loc ON s.Location_ID = loc.Location_ID
+                ORDER BY s.Schedule_ID
+            """)
+            return cursor.fetchall(), mark
+        finally:
+            conn.close()
+
+    def apply_repair(self, moves, removals=(), since=None):
+        """نقل الحصص (moves = [(session, (day, start, end, Location_ID))]) وحذف removals في معاملة واحدة مقفلة"""
+        backend = db_backend()
+        updates = [(day, start, end, location_id, schedule_id)
+                   for session, (day, start, end, location_id) in moves
+                   for schedule_id in session['schedule_ids']]
+        deletes = [(schedule_id,) for session in removals for schedule_id in session['schedule_ids']]
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            backend.begin_placement(conn, cursor)
+            if since is not None and backend.schema_version >= 3:
+                cursor.execute("SELECT COUNT(*) FROM Schedule_Changes WHERE Change_ID > ?", (since,))
+                if cursor.fetchone()[0]:
+                    raise ValueError("عدّل مستخدم آخر الجداول بعد المعاينة، أعد المعاينة")
+            backend.executemany(cursor, """
+                UPDATE Schedule SET day = ?, start_time = ?, end_time = ?, Location_ID = ?
+                WHERE Schedule_ID = ?
+            """, updates)
+            backend.executemany(cursor, "DELETE FROM Schedule WHERE Schedule_ID = ?", deletes)
+            conn.commit()
+            return len(updates), len(deletes)
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def delete_schedule(self, group_id, day, start, end):
+        """حذف موعد مجموعة (كل أقسام المحاضرة المشتركة) --> عدد الصفوف المحذوفة"""
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                DELETE FROM Schedule 
+                WHERE Group_ID = ? 
+                AND day = ? 
+                AND start_time = ? 
+                AND end_time = ?
+            """, (group_id, day, start, end))
+            conn.commit()
+            return cursor.rowcount
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def count_practical_groups(self, course_id, department_id):
+        row = self.fetchone("""
+            SELECT COUNT(*) 
+            FROM Groups
+            WHERE Course_ID = ?
+            AND Department_ID = ?
+            AND Group_Type = 'practical'
+        """, (course_id, department_id))
+        return row[0]
+
+    # ========== المجموعات والبيانات الأساسية (صفحات الإدخال) ==========
+
+    def get_lecture_departments(self, level_id, course_id, department_ids):
+        """أسماء الأقسام (من department_ids) التي لها محاضرة نظرية للمادة في المستوى"""
+        if not department_ids:
+            return []
+        rows = self.fetchall(f"""
+            SELECT d.Department_name FROM Groups g
+            JOIN Department d ON g.Department_ID = d.Department_ID
+            WHERE g.Levels_ID = ?
+            AND g.Course_ID = ?
+            AND g.Department_ID IN ({','.join('?' * len(department_ids))})
+            AND g.Group_Type = 'lecture'
+        """, (level_id, course_id, *department_ids))
+        return [row[0] for row in rows]
+
+    def add_course_groups(self, lecture, course_id, department_ids, practical_rows):
+        """المجموعة النظرية + ربط المادة بالأقسام + المجموعات العملية في معاملة واحدة
+
+        lecture: (Department_ID, Levels_ID, Course_ID, Lecturer_ID, Theory_Hours, Practical_Hours)
+        practical_rows: [(Department_ID, Levels_ID, Course_ID, Lecturer_ID, Practical_Hours, Group_Number)]
+        """
+        backend = db_backend()
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO Groups (
+                    Department_ID, Levels_ID, Course_ID, Lecturer_ID,
+                    Theory_Hours, Practical_Hours, Group_Type
+                ) VALUES (?, ?, ?, ?, ?, ?, 'lecture')
+            """, lecture)
+
+            # الروابط الموجودة مسبقاً في استعلام واحد
+            cursor.execute("SELECT Department_ID FROM Course_Department WHERE Course_ID = ?", (course_id,))
+            linked = {row[0] for row in cursor.fetchall()}
+            backend.executemany(cursor, """
+                INSERT INTO Course_Department (Course_ID, Department_ID)
+                VALUES (?, ?)
+            """, [(course_id, department_id) for department_id in department_ids if department_id not in linked])
+
+            backend.executemany(cursor, """
+                INSERT INTO Groups (
+                    Department_ID, Levels_ID, Course_ID, Lecturer_ID,
+                    Theory_Hours, Practical_Hours, Group_Number, Group_Type
+                ) VALUES (?, ?, ?, ?, 0, ?, ?, 'practical')
+            """, practical_rows)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def get_group_schedules(self, course_id, level_id, lecturer_id, group_type, group_number=None):
+        """[(Department_name, Levels_name)] للجداول التي فيها مواعيد المجموعة؛ group_number=None --> كل الأرقام"""
+        return self.fetchall("""
+            SELECT DISTINCT d.Department_name, lv.Levels_name
+            FROM Schedule s
+            JOIN Groups g ON s.Group_ID = g.Group_ID
+            JOIN Department d ON g.Department_ID = d.Department_ID
+            JOIN Levels lv ON g.Levels_ID = lv.Levels_ID
+            WHERE g.Course_ID = ?
+            AND g.Levels_ID = ?
+            AND g.Lecturer_ID = ?
+            AND g.Group_Type = ?
+            AND (g.Group_Number = ? OR ? IS NULL)
+        """, (course_id, level_id, lecturer_id, group_type, group_number, group_number))
+
+    def delete_course_groups(self, course_id, level_id):
+        """حذف مجموعات المادة في المستوى (العملي ثم النظري) ومواعيدها وروابط المادة بالأقسام في معاملة واحدة"""
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM Course_Department WHERE Course_ID = ?", (course_id,))
+            cursor.execute("""
+                DELETE FROM Schedule
+                WHERE Group_ID IN (
+                    SELECT Group_ID FROM Groups
+                    WHERE Course_ID = ? AND Levels_ID = ?
+                )
+            """, (course_id, level_id))
+            for group_type in ('practical', 'lecture'):
+                cursor.execute("""
+                    DELETE FROM Groups
+                    WHERE Course_ID = ? AND Levels_ID = ?
+                    AND Group_Type = ?
+                """, (course_id, level_id, group_type))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
 
+    def save_record(self, table_name, key_column, columns, values, operation, record_id=None):
+        """إضافة/تعديل/حذف سجل في جدول أساسي (operation: 'add' / 'update' / 'delete')"""
+        if operation == 'add':
+            query = f"INSERT INTO {table_name} ({','.join(columns)}) VALUES ({','.join('?' * len(values))})"
+            params = list(values)
+        elif operation == 'update':
+            query = f"UPDATE {table_name} SET {', '.join(f'{column}=?' for column in columns)} WHERE {key_column}=?"
+            params = list(values) + [record_id]
+        else:
+            query = f"DELETE FROM {table_name} WHERE {key_column}=?"
+            params = [record_id]
+        conn = self.pool.acquire()
         try:
             cursor = conn.cursor()
-            values = []
-            if operation in ['add', 'update'] and fields:
-                for field, entry in entries.items():
-                    val = entry.get() if isinstance(entry, (ttk.Entry, ttk.Combobox)) else ''
-                    
-                    if not val and field in ['Course_ID', 'Lecturer_ID', 'Location_ID']:
-                        messagebox.showerror("خطأ", f"الحقل {fields[field]} مطلوب")
-                        return
-                    
-                    # معالجة خاصة لجميع أنواع الساعات
-                    if field in ['Lecture_hours', 'Practical_hours', 'Exercise_hours']:
-                        if val == '0':
-                            val = None
-                        else:
-                            try:
-                                val = int(val) if val else None
-                            except ValueError:
-                                messagebox.showerror("خطأ", f"قيمة غير صالحة لـ {fields[field]}")
-                                return
-                    elif field == 'Levels_ID':
-                        level_name = val
-                        level_id = self.get_level_id(level_name)
-                        if level_id is None:
-                            messagebox.showerror("خطأ", "المستوى المحدد غير موجود")
-                            return
-                        val = level_id
-                    elif field == 'Department_ID' and table_name != 'Department':
-                        dept_name = val
-                        dept_id = self.get_department_id(dept_name)
-                        if dept_id is None:
-                            messagebox.showerror("خطأ", "القسم المحدد غير موجود")
-                            return
-                        val = dept_id
-                    else:
-                        if field in ['Course_ID', 'Lecturer_ID', 'Location_ID', 'capacity']:
-                            try:
-                                val = int(val) if val else 0
-                            except ValueError:
-                                messagebox.showerror("خطأ", f"قيمة غير صالحة لـ {fields[field]}")
-                                return
-                    values.append(val)
-
-            if operation == 'add' and fields:
-                placeholders = ','.join(['?'] * len(values))
-                columns = ','.join(fields.keys())
-                query = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
-                cursor.execute(query, values)
-                
-            elif operation == 'update' and fields:
-                set_clause = ', '.join([f"{k}=?" for k in fields.keys()])
-                values.append(record_id)
-                cursor.execute(f"UPDATE {table_name} SET {set_clause} WHERE {pk}=?", values)
-                
-            elif operation == 'delete':
-                cursor.execute(f"DELETE FROM {table_name} WHERE {pk}=?", (record_id,))
-                
+            if operation == 'delete' or columns:
+                cursor.execute(query, params)
             conn.commit()
-            messagebox.showinfo("نجاح", "تم تنفيذ العملية بنجاح")
-            
-            self.generic_refresh(table_name, tree)
-            if entries:
-                self.clear_entries(entries)
-                
-        except pyodbc.Error as e:
+        except BaseException:
             conn.rollback()
-            messagebox.showerror("خطأ في قاعدة البيانات", f"فشل العملية: {str(e)}")
-        except Exception as e:
-            messagebox.showerror("خطأ", f"حدث خطأ غير متوقع: {str(e)}")
+            raise
         finally:
-            if conn:
-                conn.close()
-    
-    def add_department(self):
-        dept_id = self.department_entries['Department_ID'].get()
-        dept_name = self.department_entries['Department_name'].get()
-        
-        if not dept_id or not dept_name:
-            messagebox.showerror("خطأ", "جميع الحقول مطلوبة!")
-            return
-        
-        try:
-            dept_id = int(dept_id)
-        except ValueError:
-            messagebox.showerror("خطأ", "رقم القسم يجب أن يكون رقماً صحيحاً")
-            return
-        
-        conn = self.connect_db()
-        if not conn:
-            return
-        
+            conn.close()
+
+    def add_department(self, department_id, department_name):
+        """إضافة قسم --> False لو الرقم موجود مسبقاً"""
+        conn = self.pool.acquire()
         try:
             cursor = conn.cursor()
-            
-            # التحقق من عدم وجود القسم مسبقاً
-            cursor.execute("SELECT 1 FROM Department WHERE Department_ID=?", (dept_id,))
+            cursor.execute("SELECT 1 FROM Department WHERE Department_ID=?", (department_id,))
             if cursor.fetchone():
-                messagebox.showerror("خطأ", "رقم القسم موجود مسبقاً!")
-                return
-                
+                return False
             cursor.execute(
                 "INSERT INTO Department (Department_ID, Department_name) VALUES (?, ?)",
-                (dept_id, dept_name)
+                (department_id, department_name)
             )
             conn.commit()
-            messagebox.showinfo("نجاح", "تمت إضافة القسم بنجاح")
-            
-            # تحديث الجدول
-            self.generic_refresh('Department', self.tree_department)
-            self.clear_entries(self.department_entries)
-            
-            # تحديث Combobox الأقسام في الخلفية
-            self.after(100, self.update_department_comboboxes)
-            
-        except pyodbc.Error as e:
+            return True
+        except BaseException:
             conn.rollback()
-            messagebox.showerror("خطأ في قاعدة البيانات", f"فشل الإضافة: {str(e)}")
+            raise
         finally:
-            if conn:
-                conn.close()
-    
-    def update_handler(self, table_name, entries, tree, fields):
-        selected = tree.selection()
-        if not selected:
-            messagebox.showwarning("تحذير", "الرجاء اختيار عنصر من الجدول")
-            return
-        record_id = tree.item(selected[0], 'values')[0]
-        self.generic_operation(table_name, entries, tree, fields, 'update', record_id)
-    
-    def delete_handler(self, table_name, tree):
-        selected = tree.selection()
-        if not selected:
-            messagebox.showwarning("تحذير", "الرجاء اختيار عنصر من الجدول")
-            return
-        if messagebox.askyesno("تأكيد الحذف", "هل أنت متأكد من الحذف؟"):
-            record_id = tree.item(selected[0], 'values')[0]
-            self.generic_operation(table_name, None, tree, None, 'delete', record_id)
-    
-    def on_key_press(self, event):
-        if event.keysym == 'Delete':
-            current_tab = self.notebook.index(self.notebook.select())
-            tab_name = list(self.tabs.keys())[current_tab]
-            if tab_name == 'Courses':
-                self.delete_handler('Courses', self.tree_courses)
-            elif tab_name == 'Department':
-                self.delete_handler('Department', self.tree_department)
-            elif tab_name == 'Lecturer':
-                self.delete_handler('Lecturer', self.tree_lecturer)
-            elif tab_name == 'Location':
-                self.delete_handler('Location', self.tree_place)
-                
-                
-                
-# Class of show table page
-class Database:
-    def __init__(self):
-        # الحصول على إعدادات الاتصال من الصفحة الرئيسية
-        root = tk.Tk()  # الحصول على النافذة الرئيسية
-        root.withdraw()  # إخفاء النافذة
-        
-        for widget in root.winfo_children():
-            if isinstance(widget, MainPage):
-                main_page = widget
-                break
-        else:
-            main_page = None
-            
-        if main_page and hasattr(main_page, 'db_server') and hasattr(main_page, 'db_name'):
-            server = main_page.db_server
-            database = main_page.db_name
-        else:
-            server = '.'
-            database = 'project'
-            
-        self.connection = pyodbc.connect(
-            f'DRIVER={{SQL Server}};'
-            f'SERVER={server};'
-            f'DATABASE={database};'
-        )
-        self.cursor = self.connection.cursor()
-    
-    def __del__(self):
-        self.connection.close()
+            conn.close()
+
+    MAX_DELTA_ROWS = 500  # أكثر من ذلك --> تحميل كامل أسرع
+
+    @staticmethod
+    def schedule_rows_query(where=""):
+        return f"""
+            SELECT 
+                d.Department_name,
+                d.Department_ID,
+                lv.Levels_name,
+                sch.day,
+                sch.start_time,
+                sch.end_time,
+                loc.Location_name,
+                c.Course_name,
+                {db_backend().full_name('lec')} AS lecturer_name,
+                gr.Group_Type,
+                gr.Group_Number,
+                gr.Group_ID,
+                c.Course_ID,
+                gr.Levels_ID,
+                gr.Lecturer_ID,
+                sch.Location_ID,
+                sch.Schedule_ID
+            FROM schedule sch
+            JOIN groups gr ON sch.group_id = gr.group_id
+            JOIN department d ON sch.Department_ID = d.Department_ID
+            JOIN levels lv ON gr.Levels_ID = lv.Levels_ID
+            JOIN courses c ON gr.Course_ID = c.Course_ID
+            JOIN lecturer lec ON gr.Lecturer_ID = lec.Lecturer_ID
+            JOIN location loc ON sch.location_id = loc.location_id
+            {where}
+            ORDER BY d.Department_name, lv.Levels_name, sch.day, sch.start_time
+        """
+
+    @staticmethod
+    def get_change_mark(cursor):
+        """آخر Change_ID في سجل التغييرات (None لو السجل غير موجود)"""
+        if db_backend().schema_version < 3:
+            return None
+        cursor.execute("SELECT MAX(Change_ID) FROM Schedule_Changes")
+        return cursor.fetchone()[0] or 0
+
+    def current_change_mark(self):
+        """رمز التغيير الحالي على الخادم (استعلام MAX واحد على المفتاح) --> للمراقبة الدورية"""
+        conn = self.pool.acquire()
+        try:
+            return self.get_change_mark(conn.cursor())
+        finally:
+            conn.close()
+
+    def get_schedule_rows(self):
+        """صفوف Schedule كاملة + {Course_ID: [أسماء الأقسام]} + علامة المزامنة"""
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            # العلامة قبل الصفوف: أي تغيير بينهما سيُعاد تطبيقه في المزامنة التالية
+            mark = self.get_change_mark(cursor)
+            cursor.execute(self.schedule_rows_query())
+            rows = cursor.fetchall()
+            # خريطة مادة -> أقسام مرة واحدة لكل المحاضرات
+            shared = self.get_course_departments(cursor) if any(row[9] == 'lecture' for row in rows) else {}
+            return rows, shared, mark
+        finally:
+            conn.close()
+
+    def get_schedule_changes(self, since):
+        """(changed_ids, rows, shared, mark) للمواعيد التي تغيرت بعد since؛ None --> يلزم تحميل كامل"""
+        conn = self.pool.acquire()
+        try:
+            cursor = conn.cursor()
+            mark = self.get_change_mark(cursor)
+            if mark is None or mark < since:
+                return None  # قاعدة بيانات أخرى أو سجل أُعيد إنشاؤه
+            if mark == since:
+                return set(), [], {}, mark
+
+            cursor.execute("""
+                SELECT DISTINCT Schedule_ID FROM Schedule_Changes
+                WHERE Change_ID > ? AND Change_ID <= ?
+            """, (since, mark))
+            changed_ids = [row[0] for row in cursor.fetchall()]
+            if len(changed_ids) > self.MAX_DELTA_ROWS:
+                return None
+
+            # الصفوف الموجودة حالياً فقط؛ الباقي حُذف
+            placeholders = ','.join('?' * len(changed_ids))
+            cursor.execute(self.schedule_rows_query(f"WHERE sch.Schedule_ID IN ({placeholders})"), changed_ids)
+            rows = cursor.fetchall()
+            lecture_courses = [row[12] for row in rows if row[9] == 'lecture']
+            shared = self.get_course_departments(cursor, lecture_courses) if lecture_courses else {}
+            return set(changed_ids), rows, shared, mark
+        finally:
+            conn.close()
+
+    # ========== الجداول ==========
 
     def get_study_schedule(self, department_id, level_id):
-        query = """
+        query = f"""
         SELECT 
             s.day, 
             s.start_time, 
             s.end_time,
             c.Course_name AS subject,
             loc.Location_name AS place,
-            l.F_name + ' ' + l.L_name AS instructor,
+            {db_backend().full_name('l')} AS instructor,
             g.Group_Type
         FROM Schedule s
         JOIN Groups g ON s.Group_ID = g.Group_ID
@@ -3349,8 +6269,58 @@ class Database:
         WHERE d.Department_ID = ? AND lvl.Levels_ID = ?
         ORDER BY s.day, s.start_time
         """
-        self.cursor.execute(query, (department_id, level_id))
-        return self.cursor.fetchall()
+        return self.fetchall(query, (department_id, level_id))
+
+    def get_place_schedule(self, location_id):
+        query = f"""
+        SELECT 
+            s.day, 
+            s.start_time, 
+            s.end_time,
+            c.Course_name AS subject,
+            loc.Location_name AS place,
+            {db_backend().string_agg('d.Department_name', ' + ')} AS departments,
+            {db_backend().full_name('l')} AS instructor,
+            g.Group_Type,
+            lvl.Levels_name AS level
+        FROM Schedule s
+        JOIN Groups g ON s.Group_ID = g.Group_ID
+        JOIN Courses c ON g.Course_ID = c.Course_ID
+        JOIN Lecturer l ON g.Lecturer_ID = l.Lecturer_ID
+        JOIN Location loc ON s.Location_ID = loc.Location_ID
+        JOIN Department d ON s.Department_ID = d.Department_ID
+        JOIN Levels lvl ON g.Levels_ID = lvl.Levels_ID
+        WHERE s.Location_ID = ?
+        GROUP BY s.day, s.start_time, s.end_time, c.Course_name, 
+                loc.Location_name, {db_backend().full_name('l')}, g.Group_Type, lvl.Levels_name
+        ORDER BY s.day, s.start_time
+        """
+        return self.fetchall(query, (location_id,))
+
+    def get_teacher_schedule(self, teacher_id):
+        query = f"""
+        SELECT 
+            s.day, 
+            s.start_time, 
+            s.end_time,
+            c.Course_name AS subject,
+            loc.Location_name AS place,
+            {db_backend().string_agg('d.Department_name', ' + ')} AS departments,
+            lvl.Levels_name AS level,
+            g.Group_Type
+        FROM Schedule s
+        JOIN Groups g ON s.Group_ID = g.Group_ID
+        JOIN Courses c ON g.Course_ID = c.Course_ID
+        JOIN Lecturer l ON g.Lecturer_ID = l.Lecturer_ID
+        JOIN Location loc ON s.Location_ID = loc.Location_ID
+        JOIN Department d ON s.Department_ID = d.Department_ID
+        JOIN Levels lvl ON g.Levels_ID = lvl.Levels_ID
+        WHERE l.Lecturer_ID = ?
+        GROUP BY s.day, s.start_time, s.end_time, c.Course_name, 
+                loc.Location_name, lvl.Levels_name, g.Group_Type
+        ORDER BY s.day, s.start_time
+        """
+        return self.fetchall(query, (teacher_id,))
     
 class StudyTablesPage(BasePage):
     """Class for viewing study tables"""
@@ -3362,6 +6332,12 @@ class StudyTablesPage(BasePage):
         resized_image = original_image.resize((40, 40))
         self.image = ImageTk.PhotoImage(resized_image)
 
+        # مستودع الاستعلامات (بدون نافذة Tk مخفية لكل استعلام)
+        self.db = Database()
+        self.search_request = None
+        self.last_search = None  # (work, on_success) للعرض الحالي
+        self.view_mark = None    # رمز التغيير وقت جلب العرض الحالي
+
         # search name  
         self.result_title_label = None  
         self.current_search_result = "" 
@@ -3372,6 +6348,8 @@ class StudyTablesPage(BasePage):
             'place': None
         }
         self.setup_ui()
+        # جدول معروض وغيّر مستخدم آخر المواعيد --> إعادة استعلام العرض الحالي فقط
+        self.start_change_polling(lambda: self.view_mark, lambda mark: self.refresh_current_view())
 
     def setup_ui(self):
         buttons_frame = tk.Frame(self, bg=MAIN_PAGE_BUTTONS_HOVER)
@@ -3477,6 +6455,7 @@ class StudyTablesPage(BasePage):
         for widget in self.main_frame.winfo_children():
             widget.destroy()
         self.current_mode = 'study'
+        self.last_search = self.view_mark = None
 
         self.main_frame.grid_columnconfigure((0, 1, 2, 3), weight=1)
 
@@ -3539,6 +6518,7 @@ class StudyTablesPage(BasePage):
         for widget in self.main_frame.winfo_children():
             widget.destroy()
         self.current_mode = 'teacher'
+        self.last_search = self.view_mark = None
 
         self.teacher_var = tk.StringVar(value="اختر المحاضر")
         teachers = self.get_teachers_from_db()
@@ -3580,16 +6560,11 @@ class StudyTablesPage(BasePage):
 
     def get_teachers_from_db(self):
         try:
-            db = Database()
-            query = "SELECT Lecturer_ID, F_name + ' ' + L_name AS full_name FROM Lecturer ORDER BY full_name"
-            db.cursor.execute(query)
-            teachers = [f"{row[1]} (ID:{row[0]})" for row in db.cursor.fetchall()]
+            teachers = [f"{name} (ID:{lecturer_id})" for lecturer_id, name in self.db.get_teachers()]
             return teachers if teachers else ["لا يوجد محاضرون مسجلون"]
         except Exception as e:
             messagebox.showerror("خطأ", f"حدث خطأ في جلب قائمة المحاضرين: {str(e)}")
             return ["خطأ في جلب البيانات"]
-        finally:
-            db.connection.close()
 
 
     def format_teacher_schedule_data(self, db_data):
@@ -3619,6 +6594,7 @@ class StudyTablesPage(BasePage):
         for widget in self.main_frame.winfo_children():
             widget.destroy()
         self.current_mode = 'place'
+        self.last_search = self.view_mark = None
 
         # إنشاء ComboBox لعرض قائمة الأماكن
         self.place_var = tk.StringVar(value="اختر المكان")
@@ -3666,38 +6642,26 @@ class StudyTablesPage(BasePage):
 
     def get_places_from_db(self):
         try:
-            db = Database()
-            query = "SELECT Location_name FROM Location ORDER BY Location_name"
-            db.cursor.execute(query)
-            places = [row[0] for row in db.cursor.fetchall()]
+            places = self.db.get_places()
             return places if places else ["لا توجد أماكن متاحة"]
         except Exception as e:
             messagebox.showerror("خطأ", f"حدث خطأ في جلب الأماكن: {str(e)}")
             return ["خطأ في جلب البيانات"]
-        finally:
-            db.connection.close()
 
     def get_level_id(self, level_name):
-        levels = {
-            "المستوي الأول": 1,
-            "المستوي الثاني": 2,
-            "المستوي الثالث": 3,
-            "المستوي الرابع": 4
-        }
-        return levels.get(level_name)
+        try:
+            return ReferenceCache().id_of('Levels', level_name)
+        except Exception as e:
+            messagebox.showerror("خطأ", f"فشل الحصول على رقم المستوى: {str(e)}")
+            return None
     
     def get_departments_from_db(self):
         try:
-            db = Database()
-            query = "SELECT Department_name FROM Department ORDER BY Department_name"
-            db.cursor.execute(query)
-            departments = [row[0].strip() for row in db.cursor.fetchall()]  # استخدام strip() لإزالة أي مسافات زائدة
+            departments = self.db.get_departments()
             return departments if departments else ["لا يوجد أقسام"]
         except Exception as e:
             messagebox.showerror("خطأ", f"حدث خطأ في جلب الأقسام: {str(e)}")
             return ["خطأ في جلب البيانات"]
-        finally:
-            db.connection.close()
 
     def format_schedule_data(self, db_data):
         formatted = {}
@@ -3723,16 +6687,10 @@ class StudyTablesPage(BasePage):
 
     def get_department_id(self, department_name):
         try:
-            db = Database()
-            query = "SELECT Department_ID FROM Department WHERE Department_name = ?"
-            db.cursor.execute(query, (department_name.strip(),))  # استخدام strip() للتأكد من عدم وجود مسافات زائدة
-            result = db.cursor.fetchone()
-            return result[0] if result else None
+            return self.db.get_department_id(department_name)
         except Exception as e:
             messagebox.showerror("خطأ", f"حدث خطأ في البحث عن القسم: {str(e)}")
             return None
-        finally:
-            db.connection.close()
 
     def search_schedule(self):
         department = self.department_var.get().strip()
@@ -3742,25 +6700,26 @@ class StudyTablesPage(BasePage):
             messagebox.showwarning("خطأ", "يرجى اختيار جميع الخيارات قبل البحث")
             return
         
-        department_id = self.get_department_id(department)
         level_id = self.get_level_id(year)
-        
-        if department_id is None:
-            messagebox.showwarning("خطأ", f"لا يمكن العثور على القسم: {department}")
-            return
-            
         if level_id is None:
             messagebox.showwarning("خطأ", f"المستوى المحدد غير صالح: {year}")
             return
-            
-        current_frame = self.table_frames['study']
-        for widget in current_frame.winfo_children():
-            widget.destroy()
-            
-        try:
-            db = Database()
-            schedule_data = db.get_study_schedule(department_id, level_id)
-            
+
+        def work():
+            department_id = self.db.get_department_id(department)
+            if department_id is None:
+                return None
+            return self.db.get_study_schedule(department_id, level_id)
+
+        def show(schedule_data):
+            if schedule_data is None:
+                messagebox.showwarning("خطأ", f"لا يمكن العثور على القسم: {department}")
+                return
+
+            current_frame = self.table_frames['study']
+            for widget in current_frame.winfo_children():
+                widget.destroy()
+
             self.update_result_title(f"جدول {department} - {year}")
 
             if schedule_data:
@@ -3769,61 +6728,58 @@ class StudyTablesPage(BasePage):
                 self.create_real_schedule_table(current_frame, formatted_data)
             else:
                 messagebox.showinfo("لا توجد بيانات", "لا يوجد جدول لهذا القسم والسنة")
-                
-        except Exception as e:
-            messagebox.showerror("خطأ", f"حدث خطأ في جلب البيانات: {str(e)}")
-            
+
+        self.start_search(work, show)
         self.reset_dropdowns()
 
+    def start_search(self, work, on_success):
+        """بحث واحد فقط في الخلفية - البحث الجديد يلغي السابق"""
+        if self.search_request is not None and not self.search_request.done:
+            self.search_request.cancel()
+            self.hide_loading()
+        self.last_search = (work, on_success)
+
+        def run():
+            # الرمز قبل البيانات: أي تغيير بينهما يعيد الاستعلام في الفحص التالي
+            return self.db.current_change_mark(), work()
+
+        def show(result):
+            self.view_mark, data = result
+            on_success(data)
+
+        self.search_request = self.run_in_background(run, show, message="جاري البحث...")
+
+    def refresh_current_view(self):
+        if self.last_search is None:
+            return
+        if self.search_request is not None and not (self.search_request.done or self.search_request.cancelled):
+            return
+        self.start_search(*self.last_search)
+
     def search_place_schedule(self):
         place = self.place_var.get().strip()
         if place == "اختر المكان" or not place:
             messagebox.showwarning("خطأ", "يرجى اختيار مكان من القائمة")
             return
         
-        self.update_result_title(f"جدول المكان: {place}")
-        current_frame = self.table_frames['place']
-        for widget in current_frame.winfo_children():
-            widget.destroy()
-            
-        try:
-            db = Database()
-            query = """
-            SELECT 
-                s.day, 
-                s.start_time, 
-                s.end_time,
-                c.Course_name AS subject,
-                loc.Location_name AS place,
-                STRING_AGG(d.Department_name, ' + ') AS departments,
-                l.F_name + ' ' + l.L_name AS instructor,
-                g.Group_Type,
-                lvl.Levels_name AS level
-            FROM Schedule s
-            JOIN Groups g ON s.Group_ID = g.Group_ID
-            JOIN Courses c ON g.Course_ID = c.Course_ID
-            JOIN Lecturer l ON g.Lecturer_ID = l.Lecturer_ID
-            JOIN Location loc ON s.Location_ID = loc.Location_ID
-            JOIN Department d ON s.Department_ID = d.Department_ID
-            JOIN Levels lvl ON g.Levels_ID = lvl.Levels_ID
-            WHERE loc.Location_name = ?
-            GROUP BY s.day, s.start_time, s.end_time, c.Course_name, 
-                    loc.Location_name, l.F_name, l.L_name, g.Group_Type, lvl.Levels_name
-            ORDER BY s.day, s.start_time
-            """
-            db.cursor.execute(query, (place,))
-            schedule_data = db.cursor.fetchall()
-            
+        def show(schedule_data):
+            self.update_result_title(f"جدول المكان: {place}")
+            current_frame = self.table_frames['place']
+            for widget in current_frame.winfo_children():
+                widget.destroy()
+
             if schedule_data:
                 formatted_data = self.format_place_schedule_data(schedule_data)
                 self.create_real_schedule_table(current_frame, formatted_data, is_place_search=True)
             else:
                 messagebox.showinfo("لا توجد بيانات", f"لا يوجد جدول للمكان {place}")
-                
-        except Exception as e:
-            messagebox.showerror("خطأ", f"حدث خطأ في جلب البيانات: {str(e)}")
-        finally:
-            db.connection.close()
+
+        location_id = ReferenceCache().id_of('Location', place)
+        if location_id is None:
+            messagebox.showwarning("خطأ", f"المكان غير موجود: {place}")
+            return
+
+        self.start_search(lambda: self.db.get_place_schedule(location_id), show)
 
     def format_place_schedule_data(self, db_data):
         formatted = {}
@@ -3862,49 +6818,20 @@ class StudyTablesPage(BasePage):
             messagebox.showerror("خطأ", "لا يمكن تحديد المحاضر")
             return
         
-        self.update_result_title(f"جدول المحاضر: {teacher_name}")
-        
-        current_frame = self.table_frames['teacher']
-        for widget in current_frame.winfo_children():
-            widget.destroy()
-            
-        try:
-            db = Database()
-            query = """
-            SELECT 
-                s.day, 
-                s.start_time, 
-                s.end_time,
-                c.Course_name AS subject,
-                loc.Location_name AS place,
-                STRING_AGG(d.Department_name, ' + ') AS departments,
-                lvl.Levels_name AS level,
-                g.Group_Type
-            FROM Schedule s
-            JOIN Groups g ON s.Group_ID = g.Group_ID
-            JOIN Courses c ON g.Course_ID = c.Course_ID
-            JOIN Lecturer l ON g.Lecturer_ID = l.Lecturer_ID
-            JOIN Location loc ON s.Location_ID = loc.Location_ID
-            JOIN Department d ON s.Department_ID = d.Department_ID
-            JOIN Levels lvl ON g.Levels_ID = lvl.Levels_ID
-            WHERE l.Lecturer_ID = ?
-            GROUP BY s.day, s.start_time, s.end_time, c.Course_name, 
-                    loc.Location_name, lvl.Levels_name, g.Group_Type
-            ORDER BY s.day, s.start_time
-            """
-            db.cursor.execute(query, (teacher_id,))
-            schedule_data = db.cursor.fetchall()
-            
+        def show(schedule_data):
+            self.update_result_title(f"جدول المحاضر: {teacher_name}")
+
+            current_frame = self.table_frames['teacher']
+            for widget in current_frame.winfo_children():
+                widget.destroy()
+
             if schedule_data:
                 formatted_data = self.format_teacher_schedule_data(schedule_data)
                 self.create_real_schedule_table(current_frame, formatted_data, is_teacher_search=True)
             else:
                 messagebox.showinfo("لا توجد بيانات", "لا يوجد جدول لهذا المحاضر")
-                
-        except Exception as e:
-            messagebox.showerror("خطأ", f"حدث خطأ في جلب البيانات: {str(e)}")
-        finally:
-            db.connection.close()
+
+        self.start_search(lambda: self.db.get_teacher_schedule(teacher_id), show)
 
     def create_real_schedule_table(self, parent, schedule_data, is_place_search=False, is_teacher_search=False):
         table_frame = tk.Frame(parent, bg="#edede9")
@@ -4177,7 +7104,10 @@ class MainPage:
         self.main.minsize(900, 700)
         self.main.resizable(True, True)
         self.main.title("برنامج إدارة الجداول الدراسية")
-        self.main.iconbitmap("damiettaIcon.ico")
+        try:
+            self.main.iconbitmap("damiettaIcon.ico")
+        except tk.TclError:
+            pass  # ملفات .ico غير مدعومة على Linux
         
         
         # Initialize Data Manager
@@ -4200,12 +7130,34 @@ class MainPage:
         self.config = configparser.ConfigParser()
         try:
             self.config.read('config.ini')
-            self.db_server = self.config.get('DATABASE', 'SERVER', fallback='.')
-            self.db_name = self.config.get('DATABASE', 'DATABASE', fallback='project')
+            settings = read_db_settings('config.ini')
         except Exception as e:
             messagebox.showerror("خطأ", f"فشل تحميل ملف الإعدادات: {str(e)}")
-            self.db_server = '.'
-            self.db_name = 'project'
+            settings = {'backend': 'sqlserver', 'server': '.', 'database': 'project',
+                        'sqlite_path': 'timetable.db', 'pool_size': 5,
+                        'slow_query_ms': 200, 'slow_query_log': 'slow_queries.log'}
+
+        self.db_backend = settings['backend']
+        self.db_server = settings['server']
+        self.db_name = settings['database']
+        self.db_path = settings['sqlite_path']
+        ConnectionPool().configure(make_backend(settings), max_size=settings['pool_size'])
+        QueryStats().configure(settings['slow_query_ms'], settings['slow_query_log'])
+
+        # أول اتصال يطبق الـ migrations --> في الخلفية حتى لا تتأخر النافذة
+        DataService().submit(self.main, lambda: ConnectionPool().acquire().close(),
+                             lambda _: self.on_database_ready(), self.on_database_error)
+
+    def on_database_ready(self):
+        error = ConnectionPool().backend.migration_error
+        if error is not None:
+            messagebox.showwarning("قاعدة البيانات", f"تم الاتصال لكن تعذر تحديث هيكل قاعدة البيانات:\n{str(error)}\n"
+                                                    "سيعمل البرنامج بدون بعض التحسينات (التفاصيل في إحصائيات الاستعلامات)")
+
+    def on_database_error(self, error):
+        QueryStats().warning("Database not ready: %s", error)
+        messagebox.showerror("خطأ في الاتصال", f"تعذر الاتصال بقاعدة البيانات:\n{str(error)}\n"
+                                               "تحقق من إعدادات الاتصال")
         
         
         
@@ -4284,7 +7236,12 @@ class MainPage:
         """عرض نافذة إعدادات الاتصال بقاعدة البيانات"""
         settings_window = tk.Toplevel(self.main)
         settings_window.title("إعدادات الاتصال بقاعدة البيانات")
-        settings_window.geometry("400x200")
+        settings_window.geometry("400x420")
+
+        tk.Label(settings_window, text="نوع قاعدة البيانات:").pack(pady=5)
+        backend_combo = ttk.Combobox(settings_window, values=['sqlserver', 'sqlite'], state="readonly")
+        backend_combo.set(self.db_backend)
+        backend_combo.pack(fill='x', padx=20)
     
         tk.Label(settings_window, text="اسم السيرفر:").pack(pady=5)
         server_entry = ttk.Entry(settings_window)
@@ -4295,20 +7252,40 @@ class MainPage:
         db_entry = ttk.Entry(settings_window)
         db_entry.insert(0, self.db_name)
         db_entry.pack(fill='x', padx=20)
-        
+
+        tk.Label(settings_window, text="ملف SQLite:").pack(pady=5)
+        path_entry = ttk.Entry(settings_window)
+        path_entry.insert(0, self.db_path)
+        path_entry.pack(fill='x', padx=20)
+
+        # إحصائيات مجمع الاتصالات
+        tk.Label(settings_window, text=ConnectionPool().stats_text(), justify='right', fg="gray").pack(pady=5)
+        ttk.Button(settings_window, text="إحصائيات الاستعلامات", command=self.show_query_stats).pack()
         
         def save_settings():
             try:
+                self.db_backend = backend_combo.get()
                 self.db_server = server_entry.get().strip()
                 self.db_name = db_entry.get().strip()
-
-                self.config['DATABASE'] = {
-                    'SERVER': self.db_server,
-                    'DATABASE': self.db_name
-                    }
+                self.db_path = path_entry.get().strip()
+
+                if not self.config.has_section('DATABASE'):
+                    self.config.add_section('DATABASE')
+                self.config['DATABASE']['BACKEND'] = self.db_backend
+                self.config['DATABASE']['SERVER'] = self.db_server
+                self.config['DATABASE']['DATABASE'] = self.db_name
+                self.config['DATABASE']['SQLITE_PATH'] = self.db_path
                 with open('config.ini', 'w') as configfile:
                     self.config.write(configfile)
 
+                # إعادة الاتصال بالسيرفر الجديد لكل الصفحات
+                ConnectionPool().configure(make_backend({
+                    'backend': self.db_backend,
+                    'server': self.db_server,
+                    'database': self.db_name,
+                    'sqlite_path': self.db_path
+                }))
+
                 messagebox.showinfo("تم الحفظ", "تم حفظ الإعدادات بنجاح")
                 settings_window.destroy()
             except Exception as e:
@@ -4316,6 +7293,31 @@ class MainPage:
 
         ttk.Button(settings_window, text="حفظ", command=save_settings).pack(pady=10)
      
+    def show_query_stats(self):
+        """أبطأ الاستعلامات (حسب الوقت الكلي) لكل صفحة"""
+        stats_window = tk.Toplevel(self.main)
+        stats_window.title("إحصائيات الاستعلامات")
+        stats_window.geometry("800x500")
+
+        text = tk.Text(stats_window, wrap='none', font=('Consolas', 10))
+        text.pack(fill='both', expand=True, padx=10, pady=10)
+
+        def refresh():
+            text.config(state='normal')
+            text.delete('1.0', tk.END)
+            text.insert(tk.END, QueryStats().summary_text())
+            text.config(state='disabled')
+
+        def reset():
+            QueryStats().reset()
+            refresh()
+
+        buttons = tk.Frame(stats_window)
+        buttons.pack(pady=5)
+        ttk.Button(buttons, text="تحديث", command=refresh).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(buttons, text="تصفير", command=reset).pack(side=tk.RIGHT, padx=5)
+        refresh()
+
     def show_schedule_entry_page(self):
         """Show the schedule entry page"""
         self.main_frame.pack_forget()
@@ -4355,6 +7357,11 @@ class MainPage:
             self.study_tables_page.pack_forget()
         if self.schedule_placer_page:
             self.schedule_placer_page.pack_forget()
+
+        # لا نسلم نتائج استعلامات لصفحات غير ظاهرة
+        for page in (self.schedule_entry_page, self.study_tables_page, self.schedule_placer_page):
+            if isinstance(page, BasePage):
+                page.cancel_background_work()
             
         self.main_frame.pack(expand=True, fill="both")
         self.main.geometry("900x600")
@@ -4366,6 +7373,10 @@ class MainPage:
         self.main_frame.pack_forget()
         
         groups_data = self.data_manager.groups_data 
+
+        if self.schedule_placer_page:
+            self.schedule_placer_page.cancel_background_work()
+            self.schedule_placer_page.destroy()
         
         self.schedule_placer_page = SchedulePlacerPage(
             self.main, 
@@ -4381,7 +7392,178 @@ class MainPage:
         
     def run(self):
         self.main.mainloop()
+        DataService().shutdown()
+        ConnectionPool().close_all()
+
+def build_synthetic_catalog(conn, departments=12, lecturers=300, courses=600, locations=80, seed=7, scheduled=True):
+    """كتالوج وهمي بحجم كلية كاملة لقياس الأداء (scheduled=False --> مجموعات بدون مواعيد للتوزيع التلقائي)"""
+    import random
+    rng = random.Random(seed)
+    days = ["السبت", "الأحد", "الإثنين", "الثلاثاء", "الأربعاء", "الخميس"]
+    cursor = conn.cursor()
+    cursor.executemany("INSERT INTO Department (Department_ID, Department_name) VALUES (?, ?)",
+                       [(i, f"قسم {i}") for i in range(1, departments + 1)])
+    cursor.executemany("INSERT INTO Lecturer (Lecturer_ID, F_name, L_name, Department_ID) VALUES (?, ?, ?, ?)",
+                       [(i, f"محاضر{i}", f"عائلة{i}", rng.randint(1, departments)) for i in range(1, lecturers + 1)])
+    cursor.executemany("INSERT INTO Courses (Course_ID, Course_name, code, Lecture_hours, Levels_ID, Practical_hours, Exercise_hours) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                       [(i, f"مادة {i}", f"C{i}", 2, rng.randint(1, 4), rng.choice([0, 2]), None) for i in range(1, courses + 1)])
+    cursor.executemany("INSERT INTO Location (Location_ID, Location_name, capacity) VALUES (?, ?, ?)",
+                       [(i, f"قاعة {i}", rng.choice([30, 60, 120, 200])) for i in range(1, locations + 1)])
+
+    for course_id in range(1, courses + 1):
+        depts = rng.sample(range(1, departments + 1), rng.choice([1, 1, 2, 3]))
+        level = rng.randint(1, 4)
+        cursor.executemany("INSERT INTO Course_Department (Course_ID, Department_ID) VALUES (?, ?)",
+                           [(course_id, d) for d in depts])
+        cursor.execute("""INSERT INTO Groups (Department_ID, Levels_ID, Course_ID, Lecturer_ID, Theory_Hours, Practical_Hours, Group_Type)
+                          VALUES (?, ?, ?, ?, 2, 2, 'lecture')""", (depts[0], level, course_id, rng.randint(1, lecturers)))
+        lecture_id = cursor.lastrowid
+        day, start, room = rng.choice(days), rng.randint(8, 17), rng.randint(1, locations)
+        if scheduled:
+            cursor.executemany("INSERT INTO Schedule (Department_ID, Group_ID, Location_ID, day, start_time, end_time) VALUES (?, ?, ?, ?, ?, ?)",
+                               [(d, lecture_id, room, day, start, start + 2) for d in depts])
+        for dept in depts:
+            for number in (1, 2):
+                cursor.execute("""INSERT INTO Groups (Department_ID, Levels_ID, Course_ID, Lecturer_ID, Theory_Hours, Practical_Hours, Group_Number, Group_Type)
+                                  VALUES (?, ?, ?, ?, 0, 2, ?, 'practical')""", (dept, level, course_id, rng.randint(1, lecturers), number))
+                day, start = rng.choice(days), rng.randint(8, 17)
+                if not scheduled:
+                    continue
+                cursor.execute("INSERT INTO Schedule (Department_ID, Group_ID, Location_ID, day, start_time, end_time) VALUES (?, ?, ?, ?, ?, ?)",
+                               (dept, cursor.lastrowid, rng.randint(1, locations), day, start, start + 2))
+    conn.commit()
+
+
+class NoAlterSqliteBackend(SqliteBackend):
+    """SQLite كمستخدم SQL Server بلا صلاحية ALTER: إنشاء Lecturer.Full_name يفشل والباقي يعمل"""
+    def full_name_column_sql(self):
+        raise sqlite3.OperationalError("ALTER TABLE permission denied (simulated)")
+
+
+def benchmark_queries(db, repeat=5):
+    """{اسم الاستعلام: أفضل زمن بالمللي ثانية}"""
+    days = ["السبت", "الأحد", "الإثنين", "الثلاثاء", "الأربعاء", "الخميس", "الجمعة"]
+    cases = {
+        'get_schedule_rows (placer load)': db.get_schedule_rows,
+        'get_group_rows (groups page load)': db.get_group_rows,
+        'get_unscheduled_groups x12 depts': lambda: [db.get_unscheduled_groups(d, 1) for d in range(1, 13)],
+        'get_study_schedule x12 depts': lambda: [db.get_study_schedule(d, 1) for d in range(1, 13)],
+        'get_teacher_schedule x20': lambda: [db.get_teacher_schedule(t) for t in range(1, 21)],
+        'get_place_schedule x20': lambda: [db.get_place_schedule(p) for p in range(1, 21)],
+        'count_room_conflicts 77-cell grid': lambda: [db.count_room_conflicts(5, day, t, t + 1)
+                                                    for day in days for t in range(8, 19)],
+        'get_week_occupancy (same grid, 1 query)': lambda: db.get_week_occupancy(days, list(range(8, 20)), location_id=5),
+        'get_lecturer_id x50': lambda: [db.get_lecturer_id(f"محاضر{i} عائلة{i}") for i in range(1, 51)],
+    }
+    results = {}
+    for name, case in cases.items():
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            case()
+            elapsed = (time.perf_counter() - started) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = best
+    return results
+
+
+def run_solver_benchmark(departments=50, seeds=8, restarts=3, path=None):
+    """زمن محفظة الحل بعدد عمليات متزايد لنفس العمل (seeds × restarts) على كتالوج وهمي بدون مواعيد"""
+    path = path or os.path.join(tempfile.mkdtemp(), 'solver_benchmark.db')
+    if os.path.exists(path):
+        os.remove(path)
+    backend = SqliteBackend(path)
+    conn = backend.connect()
+    backend.prepare(conn)
+    build_synthetic_catalog(conn, departments=departments, lecturers=25 * departments, courses=50 * departments,
+                            locations=7 * departments, scheduled=False)
+    conn.close()
+    ConnectionPool().configure(backend)
+    db = Database()
+    group_rows, course_departments, fixed, _ = db.get_solver_problem()
+    sessions = build_solver_sessions(group_rows, course_departments)
+    rooms = db.get_locations()
+    ConnectionPool().close_all()
+
+    print(f"catalog: {path} | {departments} departments, {len(sessions)} sessions, {len(rooms)} rooms")
+    print(f"{'workers':>8} {'seconds':>9} {'speedup':>8} {'unplaced':>9}")
+    counts, baseline = [], None
+    workers = 1
+    while workers <= (os.cpu_count() or 1):
+        counts.append(workers)
+        workers *= 2
+    for workers in counts:
+        placements, unplaced, stats = solve_portfolio(rooms, fixed, sessions, workers=workers, seeds=seeds,
+                                                      restarts=restarts)
+        baseline = baseline or stats['elapsed']
+        print(f"{workers:8} {stats['elapsed']:9.2f} {baseline / stats['elapsed']:7.1f}x {len(unplaced):9}")
+
+    try:
+        settings = read_scheduling_settings()
+        scoring, positions = scoring_sessions_from_fixed(fixed, settings)
+        scoring += [session for session, *_ in placements]
+        positions += [(day, start, end, location_id) for _, day, start, end, location_id in placements]
+        scorer = TimetableScorer(scoring, rooms, settings=settings)
+    except ImportError:
+        print("scoring: numpy is not installed")
+        return
+    arrays = scorer.encode(positions)
+    calls = 1000
+    started = time.perf_counter()
+    for _ in range(calls):
+        scorer.penalties(*arrays)
+    elapsed = (time.perf_counter() - started) / calls
+    print(f"scoring: {len(scoring)} sessions, {elapsed * 1e6:.0f} µs per timetable, score {scorer.score(*arrays):.1f}")
+
+
+def run_benchmark(path=None):
+    """قياس استعلامات تحميل الصفحات قبل وبعد فهارس الـ migrations على كتالوج SQLite وهمي"""
+    path = path or os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+    if os.path.exists(path):
+        os.remove(path)
+    backend = SqliteBackend(path)
+    conn = backend.connect()
+    backend.prepare(conn, target_version=0)  # الجداول فقط بدون أي migration
+    build_synthetic_catalog(conn)
+    ConnectionPool().configure(backend)
+    db = Database()
+
+    before = benchmark_queries(db)
+    applied = SchemaMigrator(backend).migrate(conn)
+    conn.execute("ANALYZE")
+    conn.commit()
+    after = benchmark_queries(db)
+    conn.close()
+
+    # نفس الكتالوج بدون صلاحية ALTER: Full_name يُتخطى والفهارس وباقي الـ migrations تُطبق
+    fallback_path = path + '.no_alter.db'
+    if os.path.exists(fallback_path):
+        os.remove(fallback_path)
+    fallback_backend = NoAlterSqliteBackend(fallback_path)
+    conn = fallback_backend.connect()
+    fallback_backend.prepare(conn, target_version=0)
+    build_synthetic_catalog(conn)
+    fallback_applied = SchemaMigrator(fallback_backend).migrate(conn)
+    conn.execute("ANALYZE")
+    conn.commit()
+    ConnectionPool().configure(fallback_backend)
+    fallback = benchmark_queries(db)
+    conn.close()
+    ConnectionPool().close_all()
+
+    print(f"catalog: {path} | migrations applied: {applied} | without ALTER: {fallback_applied}")
+    print(f"{'query':40} {'before ms':>10} {'after ms':>10} {'speedup':>8} {'no ALTER':>10}")
+    for name in before:
+        print(f"{name:40} {before[name]:10.2f} {after[name]:10.2f} {before[name] / max(after[name], 1e-6):7.1f}x"
+              f" {fallback[name]:10.2f}")
+    return before, after, fallback
+
 
 if __name__ == "__main__":
-    app = MainPage()
-    app.run()
+    if "--benchmark" in sys.argv:
+        run_benchmark()
+    elif "--solver-benchmark" in sys.argv:
+        run_solver_benchmark()
+    else:
+        app = MainPage()
+        app.run()